@@ -0,0 +1,50 @@
+// Shared helpers for bench/*.bench.js.
+//
+// Benches that write to Postgres run against the Supabase project in .env
+// (VITE_SUPABASE_URL + SUPABASE_SERVICE_ROLE_KEY, migrations applied). They
+// refuse to start unless BENCH_ALLOW_WRITES=true, only touch rows of a fresh
+// "bench-…" tenant and delete them at the end. Use a scratch project.
+
+export const envInt = (name, fallback) => parseInt(Deno.env.get(name) || '', 10) || fallback;
+
+const rate = (n, ms) => `${Math.round(n / (ms / 1000)).toLocaleString('en-US')}/s`;
+
+/** One result line: name, count, elapsed, rate and free text. */
+export function report(name, n, ms, extra = '') {
+  console.log(`${name.padEnd(44)} ${String(n).padStart(6)} en ${ms.toFixed(0).padStart(6)} ms  ${rate(n, ms).padStart(10)} ${extra}`);
+}
+
+/** Time an async fn: { value, ms } */
+export async function timed(fn) {
+  const t = performance.now();
+  const value = await fn();
+  return { value, ms: performance.now() - t };
+}
+
+export function check(ok, message) {
+  console.log(`${ok ? '✅' : '❌'} ${message}`);
+  if (!ok) Deno.exitCode = 1;
+  return ok;
+}
+
+/** Tenant id no real row uses: bench-<label>-<8 hex> */
+export function benchTenantId(label) {
+  return `bench-${label}-${crypto.randomUUID().slice(0, 8)}`;
+}
+
+/**
+ * Service-role client for the project in .env. Exits when the bench was not
+ * explicitly allowed to write.
+ */
+export async function connectBenchDb() {
+  if (Deno.env.get('BENCH_ALLOW_WRITES') !== 'true') {
+    console.error('❌ Este bench escribe en la base de datos de .env. Usa un proyecto de pruebas y BENCH_ALLOW_WRITES=true');
+    Deno.exit(2);
+  }
+  if (!Deno.env.get('SUPABASE_SERVICE_ROLE_KEY')) {
+    console.error('❌ SUPABASE_SERVICE_ROLE_KEY no está definido');
+    Deno.exit(2);
+  }
+  const { createUnifiedClient } = await import('../../../lib/unified-custom-sdk-supabase.js');
+  return createUnifiedClient({ entitiesPath: new URL('../src/Entities', import.meta.url).pathname });
+}
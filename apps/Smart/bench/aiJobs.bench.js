@@ -0,0 +1,136 @@
+// AI result cache and async job polling against local stubs (no model calls).
+//
+//   deno task bench:ai
+//   BENCH_LLM_LATENCY_MS=8000 deno task bench:ai
+//
+// No database and no provider keys: Gemini/OpenAI are bench/llmStub.js (each
+// model call takes BENCH_LLM_LATENCY_MS, default 4000) and Supabase is a stub
+// without the 028 RPCs, so the cache and the jobs run from memory. /ai/invoke
+// and /ai/job are served by the real handlers behind the real rate limiter,
+// with /ai/job answering like an instance that does not own the job (stored
+// status, no long-poll):
+//   cache  — InvokeLLM twice with the same file_urls: one model call
+//   antes  — what waitForAiJob did: poll again as soon as the answer comes
+//            back, until the job ends or the rate limiter answers 429
+//   ahora  — InvokeLLM({ async: true }) polling with backoff
+// Checks the async result arrives with a handful of polls and no 429.
+
+import { envInt, report, timed, check } from './_bench.js';
+import { startLlmStub } from './llmStub.js';
+
+const LATENCY_MS = envInt('BENCH_LLM_LATENCY_MS', 4000);
+const PROMPT = 'Extrae las partidas de esta orden de compra';
+
+// ── Stubs: model providers and a Supabase without ai_job/ai_result_cache ──
+
+const llm = startLlmStub({ port: 0, latencyMs: LATENCY_MS });
+
+const supabase = Deno.serve({ port: 0, onListen: () => {} }, async (req) => {
+  await req.body?.cancel();
+  const { pathname } = new URL(req.url);
+  if (pathname.startsWith('/rest/v1/rpc/')) {
+    return Response.json({ code: 'PGRST202', message: `Could not find the function ${pathname.slice(13)}` }, { status: 404 });
+  }
+  return Response.json([]);
+});
+
+// ── Functions server: real handlers, /ai/job as a non-owner instance ──
+
+let phase = 'cache';  // rate-limit bucket per phase (x-forwarded-for)
+const polls = { antes: 0, ahora: 0 };
+const limited = { antes: 0, ahora: 0 };
+
+const functions = Deno.serve({ port: 0, onListen: () => {} }, async (req) => {
+  const path = new URL(req.url).pathname;
+  const headers = new Headers(req.headers);
+  headers.set('x-forwarded-for', phase);
+  const rl = checkRateLimit(path, new Request(req.url, { headers }));
+  if (path === '/ai/job' && phase in polls) polls[phase]++;
+  if (!rl.allowed) {
+    await req.body?.cancel();
+    if (phase in limited) limited[phase]++;
+    return Response.json({ data: { error: 'Too many requests' } }, { status: 429, headers: { 'Retry-After': String(rl.retryAfter) } });
+  }
+  if (path === '/ai/invoke') return invokeLLMHandler(req);
+  if (path === '/ai/job') {
+    const { job_id: jobId } = await req.json();
+    return aiJobHandler(new Request(req.url, { method: 'POST', body: JSON.stringify({ job_id: jobId, wait_ms: 0 }) }));
+  }
+  return Response.json({ error: 'not found' }, { status: 404 });
+});
+
+// Read at import time by invokeLLM.js, _aiCache.js and the SDK
+Deno.env.set('GEMINI_API_KEY', 'stub');
+Deno.env.set('OPENAI_API_KEY', 'stub');
+Deno.env.set('GEMINI_API_BASE_URL', llm.url);
+Deno.env.set('OPENAI_BASE_URL', `${llm.url}/v1`);
+Deno.env.set('VITE_SUPABASE_URL', `http://localhost:${supabase.addr.port}`);
+Deno.env.set('VITE_SUPABASE_ANON_KEY', 'bench-anon-key');
+Deno.env.set('SUPABASE_SERVICE_ROLE_KEY', 'bench-service-key');
+Deno.env.set('VITE_FUNCTION_URL', `http://localhost:${functions.addr.port}`);
+Deno.env.set('AI_CACHE_PERSIST', 'false');
+Deno.env.set('DENO_ENV', 'production'); // quiet SDK logs
+const { invokeLLMHandler } = await import('../src/Functions/invokeLLM.js');
+const { aiJobHandler } = await import('../src/Functions/aiJob.js');
+const { checkRateLimit } = await import('../src/Functions/_rateLimit.js');
+const { createUnifiedClient } = await import('../../../lib/unified-custom-sdk-supabase.js');
+const { InvokeLLM } = createUnifiedClient().integrations.Core;
+
+const fileUrl = (name) => `${llm.url}/sample/${name}`;
+
+// ── antes: the previous waitForAiJob loop ────────────────────────────
+
+async function oldWaitForAiJob(job) {
+  let current = job;
+  while (current.status === 'queued' || current.status === 'running') {
+    const response = await fetch(`${Deno.env.get('VITE_FUNCTION_URL')}/ai/job`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ job_id: job.job_id, wait_ms: 20000 }),
+    });
+    if (!response.ok) {
+      await response.body?.cancel();
+      throw new Error(`AI job ${job.job_id} failed: ${response.statusText}`);
+    }
+    current = await response.json();
+  }
+  return current.result;
+}
+
+console.log(`🤖 Bench IA: modelo stub ${LATENCY_MS} ms por llamada · /ai/job sin long-poll (otra instancia)\n`);
+
+try {
+  // cache: same file twice → one model call
+  const first = await timed(() => InvokeLLM({ prompt: PROMPT, file_urls: [fileUrl('orden-1.pdf')] }));
+  const second = await timed(() => InvokeLLM({ prompt: PROMPT, file_urls: [fileUrl('orden-1.pdf')] }));
+  report('cache  1ª llamada', 1, first.ms);
+  report('cache  mismo archivo otra vez', 1, second.ms);
+  check(llm.stats.openai === 1 && JSON.stringify(first.value) === JSON.stringify(second.value),
+    `mismo file_url dos veces: ${llm.stats.openai} llamada(s) al modelo`);
+
+  // antes: tight polling loop
+  phase = 'antes';
+  const oldJob = await (await fetch(`${Deno.env.get('VITE_FUNCTION_URL')}/ai/invoke`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ prompt: PROMPT, file_urls: [fileUrl('orden-2.pdf')], async: true }),
+  })).json();
+  const before = await timed(() => oldWaitForAiJob(oldJob).then(() => null, (error) => error));
+  report('antes  polls sin espera', polls.antes, before.ms,
+    before.value ? `→ 429 (${limited.antes}), el job no llega al cliente` : 'terminó');
+
+  // ahora: InvokeLLM with backoff
+  phase = 'ahora';
+  const after = await timed(() => InvokeLLM({ prompt: PROMPT, file_urls: [fileUrl('orden-3.pdf')], async: true }));
+  report('ahora  polls con backoff', polls.ahora, after.ms, `x${(polls.antes / Math.max(polls.ahora, 1)).toFixed(0)} menos polls`);
+
+  console.log('');
+  check(after.value === first.value, `InvokeLLM({ async: true }) devuelve el resultado del job (${after.value})`);
+  check(limited.ahora === 0, `ahora: ${limited.ahora} respuestas 429`);
+  const maxPolls = Math.ceil(Math.log(LATENCY_MS / 1000 + 1) / Math.log(1.5)) + 2;
+  check(polls.ahora <= maxPolls, `ahora: ${polls.ahora} polls para un job de ${LATENCY_MS} ms (máx. ${maxPolls})`);
+} finally {
+  await Promise.all([llm.shutdown(), supabase.shutdown(), functions.shutdown()]);
+}
+// _aiJobs.js and _rateLimit.js keep GC intervals running
+Deno.exit(Deno.exitCode);
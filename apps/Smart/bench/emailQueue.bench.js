@@ -0,0 +1,228 @@
+// Throughput of the email path: render + queue + send 10k pickup reminders.
+//
+//   deno task bench:email
+//   BENCH_EMAILS=50000 RESEND_STUB_LATENCY_MS=80 deno task bench:email
+//
+// No database: base44 is an in-memory fake that implements what the path
+// uses (AppSettings / EmailTemplate filter, CommunicationQueue.bulkCreate and
+// the email_template_version_get / email_queue_lease / email_queue_complete
+// RPCs). Resend is bench/resendStub.js with RESEND_STUB_LATENCY_MS per request
+// (default 50, roughly what api.resend.com answers in).
+
+import { startResendStub } from './resendStub.js';
+
+const EMAILS = parseInt(Deno.env.get('BENCH_EMAILS') || '10000', 10);
+const PAGE_SIZE = 500; // updateOrderCountdowns page
+const LATENCY_MS = parseInt(Deno.env.get('RESEND_STUB_LATENCY_MS') || '50', 10);
+const SEQUENTIAL_SAMPLE = 200;
+
+const stub = startResendStub({ port: 0, latencyMs: LATENCY_MS });
+
+// _emailQueue.js reads its config at import time
+Deno.env.set('RESEND_API_BASE_URL', stub.url);
+Deno.env.set('RESEND_API_KEY', 'bench');
+const { renderTemplatedEmail, buildTemplatedEmailMessages, invalidateEmailTemplates } = await import('../src/Functions/emailTemplateRuntime.js');
+const { enqueueEmails, drainEmailQueue, getEmailQueueMetrics } = await import('../src/Functions/_emailQueue.js');
+
+// ── Fake base44 ──────────────────────────────────────────────────────
+
+const TENANT_ID = 'bench-tenant';
+
+const settings = [
+  {
+    slug: 'email-templates-config',
+    tenant_id: TENANT_ID,
+    payload: {
+      templates: [{
+        id: 'tpl_pickup_15',
+        name: 'Recordatorio de recogida (15 días)',
+        event_type: 'pickup_reminder_15',
+        enabled: true,
+        is_default: true,
+        send_to: 'customer',
+        header_title: 'Tu equipo te espera, {{customer_name}}',
+        header_subtitle: 'Orden {{order_number}}',
+        main_message: 'Hola {{customer_name}}, tu {{device_info}} lleva {{days_elapsed}} días listo para recoger.',
+        alert_title: 'Recordatorio',
+        alert_message: 'Quedan {{days_remaining}} días antes de que la orden pase a almacenaje.',
+        show_next_steps: true,
+        next_steps_items: ['Trae tu recibo {{order_number}}', 'Paga el balance de ${{balance}}'],
+        show_hours: true,
+        show_warranty: true,
+        warranty_type: 'repairs',
+        show_review_request: true,
+        show_phone_contact: true,
+        show_whatsapp_contact: true,
+      }],
+    },
+  },
+  {
+    slug: 'app-main-settings',
+    tenant_id: TENANT_ID,
+    payload: {
+      business_name: 'Bench Repair',
+      business_phone: '787-555-0100',
+      business_whatsapp: '7875550100',
+      business_address: 'Calle 1, San Juan',
+      google_review_link: 'https://g.page/r/bench',
+      hours_monday: '9:00 AM - 6:00 PM',
+      hours_friday: '9:00 AM - 6:00 PM',
+      hours_saturday: '9:00 AM - 1:00 PM',
+    },
+  },
+  {
+    slug: 'business-branding',
+    tenant_id: TENANT_ID,
+    payload: { logo_url: 'https://example.com/logo.png', warranty_repairs: '90 días en piezas y mano de obra.' },
+  },
+];
+
+function createFakeBase44() {
+  const queue = new Map();
+  let nextId = 0;
+
+  const rpcs = {
+    email_template_version_get: () => 1,
+    email_queue_lease: ({ p_owner, p_limit, p_lease_seconds }) => {
+      const now = Date.now();
+      const leased = [];
+      for (const row of queue.values()) {
+        if (leased.length >= p_limit) break;
+        if (row.status !== 'pending' || row.next_attempt_at > now || row.leased_until > now) continue;
+        row.leased_until = now + p_lease_seconds * 1000;
+        row.lease_owner = p_owner;
+        row.attempts++;
+        leased.push({ ...row });
+      }
+      return leased;
+    },
+    email_queue_complete: ({ p_owner, p_results }) => {
+      for (const r of p_results) {
+        const row = queue.get(r.id);
+        if (!row || row.lease_owner !== p_owner) continue;
+        row.lease_owner = null;
+        row.leased_until = 0;
+        row.last_error = r.error;
+        if (!r.error) {
+          row.status = 'sent';
+          row.provider_id = r.provider_id;
+        } else if (r.retry_at) {
+          row.next_attempt_at = Date.parse(r.retry_at);
+        } else {
+          row.status = 'failed';
+        }
+      }
+      return p_results.length;
+    },
+  };
+
+  const base44 = {
+    asServiceRole: {
+      rpc: async (name, params) => rpcs[name](params),
+      entities: {
+        AppSettings: {
+          filter: async ({ slug }) => settings.filter((s) => slug.$in.includes(s.slug)),
+        },
+        EmailTemplate: { filter: async () => [] },
+        CommunicationQueue: {
+          bulkCreate: async (rows) => {
+            for (const row of rows) {
+              const id = `cq_${++nextId}`;
+              queue.set(id, { ...row, id, attempts: 0, next_attempt_at: 0, leased_until: 0, lease_owner: null });
+            }
+          },
+        },
+      },
+    },
+  };
+  return { base44, queue };
+}
+
+function makeOrder(i) {
+  return {
+    order_number: `WO-${String(i).padStart(6, '0')}`,
+    customer_name: `Cliente ${i}`,
+    customer_email: `cliente${i}@example.com`,
+    device_info: 'iPhone 14 Pro',
+    amount: 189.99,
+    balance: 89.99,
+    total_paid: 100,
+    days_elapsed: 15,
+    days_remaining: 15,
+    tenant_id: TENANT_ID,
+  };
+}
+
+const orders = Array.from({ length: EMAILS }, (_, i) => makeOrder(i + 1));
+const rate = (n, ms) => `${Math.round(n / (ms / 1000)).toLocaleString('en-US')}/s`;
+const report = (name, n, ms, extra = '') => {
+  console.log(`${name.padEnd(44)} ${String(n).padStart(6)} en ${ms.toFixed(0).padStart(6)} ms  ${rate(n, ms).padStart(10)} ${extra}`);
+};
+
+console.log(`📧 Bench email: ${EMAILS} recordatorios pickup_reminder_15 · Resend stub ${LATENCY_MS} ms/request\n`);
+
+// ── 1. Render ────────────────────────────────────────────────────────
+{
+  const { base44 } = createFakeBase44();
+  await renderTemplatedEmail(base44, { event_type: 'pickup_reminder_15', order_data: orders[0] }); // warm-up
+
+  let t = performance.now();
+  let bytes = 0;
+  for (const order of orders) {
+    bytes += (await renderTemplatedEmail(base44, { event_type: 'pickup_reminder_15', order_data: order })).html.length;
+  }
+  report('render (compilado una vez por tenant)', EMAILS, performance.now() - t, `${(bytes / EMAILS / 1024).toFixed(1)} KB/email`);
+
+  // What every send paid before: load config + build the whole HTML
+  t = performance.now();
+  for (const order of orders) {
+    invalidateEmailTemplates();
+    await renderTemplatedEmail(base44, { event_type: 'pickup_reminder_15', order_data: order });
+  }
+  report('render (recompilando en cada email)', EMAILS, performance.now() - t);
+}
+
+// ── 2. Render + queue + send ─────────────────────────────────────────
+{
+  invalidateEmailTemplates();
+  const { base44, queue } = createFakeBase44();
+  const requestsBefore = stub.stats.requests;
+
+  const t = performance.now();
+  for (let i = 0; i < orders.length; i += PAGE_SIZE) {
+    const messages = [];
+    for (const order of orders.slice(i, i + PAGE_SIZE)) {
+      messages.push(...await buildTemplatedEmailMessages(base44, { event_type: 'pickup_reminder_15', order_data: order }));
+    }
+    await enqueueEmails(base44, messages, { drain: false });
+  }
+  const queuedMs = performance.now() - t;
+  report(`render + encolar (páginas de ${PAGE_SIZE})`, queue.size, queuedMs);
+
+  const processed = await drainEmailQueue(base44);
+  const totalMs = performance.now() - t;
+  const sent = [...queue.values()].filter((row) => row.status === 'sent').length;
+  const { batch_size, concurrency } = getEmailQueueMetrics();
+  report('envío por la cola (batch Resend)', processed, totalMs - queuedMs,
+    `${stub.stats.requests - requestsBefore} requests · batch ${batch_size} × ${concurrency}`);
+  report('total render + encolar + enviar', sent, totalMs);
+  if (sent !== EMAILS) console.error(`❌ enviados ${sent} de ${EMAILS}`);
+}
+
+// ── 3. Before: one awaited /emails per email ─────────────────────────
+{
+  const { base44 } = createFakeBase44();
+  const t = performance.now();
+  for (const order of orders.slice(0, SEQUENTIAL_SAMPLE)) {
+    const rendered = await renderTemplatedEmail(base44, { event_type: 'pickup_reminder_15', order_data: order });
+    await fetch(`${stub.url}/emails`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'Authorization': 'Bearer bench' },
+      body: JSON.stringify({ from: 'Bench <bench@example.com>', to: [order.customer_email], subject: rendered.subject, html: rendered.html }),
+    }).then((res) => res.json());
+  }
+  const ms = performance.now() - t;
+  report('secuencial /emails (antes)', SEQUENTIAL_SAMPLE, ms, `→ ~${((ms / SEQUENTIAL_SAMPLE) * EMAILS / 1000).toFixed(0)} s para ${EMAILS}`);
+}
+
+await stub.shutdown();
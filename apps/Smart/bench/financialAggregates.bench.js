@@ -0,0 +1,196 @@
+// Financial views before/after the daily rollups (022_financial_aggregates.sql).
+//
+//   BENCH_ALLOW_WRITES=true deno task bench:fin
+//   BENCH_ROWS=20000 BENCH_ALLOW_WRITES=true deno task bench:fin
+//
+// Seeds BENCH_ROWS sales (default 100k), half as many transactions and a
+// tenth as many cash drawer movements over the last 365 days under a bench
+// tenant (see _bench.js), then for a 30-day and a 365-day range compares:
+//   antes  — what getRevenueByMethod / getExpensesByCategory did: newest 5000
+//            rows per table, filtered and summed in JS
+//   ahora  — the fin_* RPCs on the rollups (_financialAggregates.js)
+// and checks the RPC totals against an exact JS sum over every row.
+
+import { envInt, report, timed, check, benchTenantId, connectBenchDb } from './_bench.js';
+import { fetchSalesSummary, fetchRevenueByMethod, fetchLedgerSummary } from '../src/Functions/_financialAggregates.js';
+
+const ROWS = envInt('BENCH_ROWS', 100000);
+const DAY_MS = 24 * 60 * 60 * 1000;
+const METHODS = ['cash', 'card', 'ath_movil', 'transfer'];
+const CATEGORIES = ['parts', 'rent', 'utilities', 'payroll', 'other_expense'];
+
+const base44 = await connectBenchDb();
+const { Sale, Transaction, CashDrawerMovement } = base44.asServiceRole.entities;
+const tenantId = benchTenantId('fin');
+
+// ── Seed ─────────────────────────────────────────────────────────────
+
+const cents = (max) => Math.round(Math.random() * max * 100) / 100;
+const daysAgo = (i, n) => new Date(Date.now() - (i / n) * 365 * DAY_MS).toISOString();
+
+function makeSale(i) {
+  const total = cents(500);
+  const mixed = i % 10 === 0;
+  const cash = cents(total);
+  return {
+    tenant_id: tenantId,
+    created_date: daysAgo(i, ROWS),
+    sale_number: `BENCH-${i}`,
+    employee: 'bench',
+    items: [{ name: `Producto ${i % 50}`, quantity: 1 + (i % 3), price: cents(100) }],
+    subtotal: total,
+    total,
+    payment_method: mixed ? 'mixed' : METHODS[i % METHODS.length],
+    payment_details: mixed ? { methods: [{ method: 'cash', amount: cash }, { method: 'card', amount: total - cash }] } : null,
+    voided: i % 50 === 0,
+  };
+}
+
+const makeTransaction = (i, n) => ({
+  tenant_id: tenantId,
+  created_date: daysAgo(i, n),
+  type: i % 3 === 0 ? 'expense' : 'revenue',
+  category: i % 3 === 0 ? CATEGORIES[i % CATEGORIES.length] : 'repair_payment',
+  amount: cents(300),
+});
+
+const makeMovement = (i, n) => ({
+  tenant_id: tenantId,
+  created_date: daysAgo(i, n),
+  drawer_id: 'bench',
+  employee: 'bench',
+  type: i % 2 === 0 ? 'expense' : 'deposit',
+  amount: cents(80),
+});
+
+async function seed(entity, n, make) {
+  const rows = Array.from({ length: n }, (_, i) => make(i, n));
+  const { ms } = await timed(() => entity.bulkCreate(rows, { returning: false, batchSize: 1000 }));
+  report(`seed ${entity.tableName}`, n, ms);
+}
+
+// ── Aggregations ─────────────────────────────────────────────────────
+
+function inRange(row, from, to) {
+  const d = new Date(row.created_date);
+  return d >= new Date(from + 'T00:00:00.000Z') && d <= new Date(to + 'T23:59:59.999Z');
+}
+
+// Same rules as the old handlers (and as the rollup triggers)
+function aggregateSales(sales, from, to) {
+  const byMethod = {};
+  let total = 0;
+  let count = 0;
+  for (const sale of sales) {
+    if (sale.voided || !inRange(sale, from, to)) continue;
+    count++;
+    total += sale.total || 0;
+    if (sale.payment_method === 'mixed' && sale.payment_details?.methods) {
+      for (const m of sale.payment_details.methods) byMethod[m.method || 'unknown'] = (byMethod[m.method || 'unknown'] || 0) + (m.amount || 0);
+    } else {
+      const method = sale.payment_method || 'unknown';
+      byMethod[method] = (byMethod[method] || 0) + (sale.total || 0);
+    }
+  }
+  return { count, total, byMethod };
+}
+
+function aggregateExpenses(transactions, movements, from, to) {
+  const byCategory = {};
+  let count = 0;
+  for (const tx of transactions) {
+    if (tx.type !== 'expense' || !inRange(tx, from, to)) continue;
+    byCategory[tx.category || 'other_expense'] = (byCategory[tx.category || 'other_expense'] || 0) + (tx.amount || 0);
+    count++;
+  }
+  for (const mov of movements) {
+    if (mov.type !== 'expense' || !inRange(mov, from, to)) continue;
+    byCategory.cash_drawer_expense = (byCategory.cash_drawer_expense || 0) + (mov.amount || 0);
+    count++;
+  }
+  return { count, byCategory };
+}
+
+async function before(from, to) {
+  const scope = { tenant_id: tenantId };
+  const [sales, transactions, movements] = await Promise.all([
+    Sale.filter(scope, '-created_date', 5000),
+    Transaction.filter(scope, '-created_date', 5000),
+    CashDrawerMovement.filter(scope, '-created_date', 5000),
+  ]);
+  return { ...aggregateSales(sales, from, to), expenses: aggregateExpenses(transactions, movements, from, to) };
+}
+
+async function readAll(entity, fields) {
+  const rows = [];
+  for await (const page of entity.stream({ tenant_id: tenantId }, { pageSize: 1000, fields })) rows.push(...page);
+  return rows;
+}
+
+async function after(from, to) {
+  const [summary, byMethod, ledger] = await Promise.all([
+    fetchSalesSummary(base44, tenantId, from, to),
+    fetchRevenueByMethod(base44, tenantId, from, to),
+    fetchLedgerSummary(base44, tenantId, from, to),
+  ]);
+  const byCategory = {};
+  let count = 0;
+  for (const row of ledger) {
+    if (row.type !== 'expense') continue;
+    const category = row.source === 'cash_drawer_movement' ? 'cash_drawer_expense' : (row.category || 'other_expense');
+    byCategory[category] = (byCategory[category] || 0) + row.amount;
+    count += row.row_count;
+  }
+  return { count: summary.sales_count, total: summary.sales_total, byMethod, expenses: { count, byCategory } };
+}
+
+const near = (a, b) => Math.abs((a || 0) - (b || 0)) < 0.01;
+const sameMap = (a, b) => Object.keys({ ...a, ...b }).every((k) => near(a[k], b[k]));
+
+// ── Run ──────────────────────────────────────────────────────────────
+
+console.log(`📊 Bench agregados financieros: ${ROWS} ventas · tenant ${tenantId}\n`);
+
+try {
+  await seed(Sale, ROWS, makeSale);
+  await seed(Transaction, Math.round(ROWS / 2), makeTransaction);
+  await seed(CashDrawerMovement, Math.round(ROWS / 10), makeMovement);
+
+  const exactRows = await timed(async () => ({
+    sales: await readAll(Sale, ['id', 'created_date', 'total', 'payment_method', 'payment_details', 'voided']),
+    transactions: await readAll(Transaction, ['id', 'created_date', 'type', 'category', 'amount']),
+    movements: await readAll(CashDrawerMovement, ['id', 'created_date', 'type', 'amount']),
+  }));
+  const all = exactRows.value;
+  report('lectura completa (referencia exacta)', all.sales.length + all.transactions.length + all.movements.length, exactRows.ms);
+
+  const today = new Date().toISOString().split('T')[0];
+  for (const days of [30, 365]) {
+    const from = new Date(Date.now() - (days - 1) * DAY_MS).toISOString().split('T')[0];
+    console.log(`\n── ${days} días (${from} → ${today})`);
+
+    const exact = {
+      ...aggregateSales(all.sales, from, today),
+      expenses: aggregateExpenses(all.transactions, all.movements, from, today),
+    };
+
+    const old = await timed(() => before(from, today));
+    report('antes: 5000 filas/tabla + JS', old.value.count, old.ms, `total ${old.value.total.toFixed(2)}`);
+    const now = await timed(() => after(from, today));
+    report('ahora: RPC sobre rollups', now.value.count, now.ms, `total ${now.value.total.toFixed(2)} · ${(old.ms / now.ms).toFixed(1)}x`);
+
+    check(now.value.count === exact.count && near(now.value.total, exact.total), `ventas = exacto (${exact.count}, ${exact.total.toFixed(2)})`);
+    check(sameMap(now.value.byMethod, exact.byMethod), 'ingresos por método = exacto');
+    check(now.value.expenses.count === exact.expenses.count && sameMap(now.value.expenses.byCategory, exact.expenses.byCategory), 'gastos por categoría = exacto');
+    if (old.value.count !== exact.count) {
+      console.log(`   antes contaba ${old.value.count} de ${exact.count} ventas (tope de 5000 filas)`);
+    }
+  }
+} finally {
+  const { ms } = await timed(() => Promise.all([
+    Sale.deleteMany({ tenant_id: tenantId }),
+    Transaction.deleteMany({ tenant_id: tenantId }),
+    CashDrawerMovement.deleteMany({ tenant_id: tenantId }),
+  ]));
+  console.log(`\n🧹 filas del bench borradas (${ms.toFixed(0)} ms)`);
+}
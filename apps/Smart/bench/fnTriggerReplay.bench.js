@@ -0,0 +1,155 @@
+// Fn-trigger queue replay before/after leasing (024_fn_trigger_queue.sql).
+//
+//   BENCH_ALLOW_WRITES=true deno task bench:fntrigger
+//   BENCH_EVENTS=10000 BENCH_WORKERS=8 BENCH_ALLOW_WRITES=true deno task bench:fntrigger
+//
+// Replays a burst of fn_trigger_event rows for a bench table (update events
+// over a few hundred records) with one entity rule that calls a local stub
+// function (BENCH_FN_LATENCY_MS per call, default 20):
+//   antes  — what /processFnTriggerEvents did: 50 pending events per cron
+//            call, rules re-read and the event marked one by one. Only
+//            BENCH_BASELINE_EVENTS (default 200) are replayed, it is slow
+//   ahora  — BENCH_WORKERS (default 4) instances draining the queue with
+//            leased batches at the same time
+// Checks every event was delivered exactly once and closed without error.
+// Use a scratch project: the queue and rules are shared by every tenant.
+
+import { envInt, report, timed, check, connectBenchDb } from './_bench.js';
+
+const EVENTS = envInt('BENCH_EVENTS', 2000);
+const BASELINE_EVENTS = envInt('BENCH_BASELINE_EVENTS', 200);
+const WORKERS = envInt('BENCH_WORKERS', 4);
+const LATENCY_MS = envInt('BENCH_FN_LATENCY_MS', 20);
+const RECORDS = 300;
+const OLD_CRON_INTERVAL_S = 120;
+
+// ── Stub function: counts deliveries per event ───────────────────────
+
+const deliveries = new Map();
+const stub = Deno.serve({ port: 0, onListen: () => {} }, async (req) => {
+  const { data } = await req.json();
+  deliveries.set(data.seq, (deliveries.get(data.seq) || 0) + 1);
+  await new Promise((resolve) => setTimeout(resolve, LATENCY_MS));
+  return Response.json({ ok: true });
+});
+
+// Read by processFnTriggerEvents.js at import time
+Deno.env.set('VITE_FUNCTION_URL', `http://localhost:${stub.addr.port}`);
+Deno.env.set('DENO_ENV', 'production');
+const base44 = await connectBenchDb();
+const { processFnTriggerEventsHandler, getFnTriggerMetrics } = await import('../src/Functions/processFnTriggerEvents.js');
+const { FnTriggerEvent, FnTriggerRule } = base44.asServiceRole.entities;
+
+const suffix = crypto.randomUUID().slice(0, 8);
+const tables = { before: `bench_replay_old_${suffix}`, after: `bench_replay_${suffix}` };
+const toEntityName = (table) => table.split('_').map((s) => s.charAt(0).toUpperCase() + s.slice(1).toLowerCase()).join('');
+
+function makeEvents(table, n) {
+  return Array.from({ length: n }, (_, seq) => ({
+    table_name: table,
+    event_type: 'update',
+    new_record: { id: `rec-${seq % RECORDS}`, seq },
+    old_record: { id: `rec-${seq % RECORDS}` },
+  }));
+}
+
+// ── antes: the previous handler, one event at a time ─────────────────
+
+async function oldCronCall() {
+  const events = await FnTriggerEvent.filter({ processed_at: { $null: true } }, 'created_at', 50);
+  for (const ev of events) {
+    const rules = await FnTriggerRule.filter({
+      automation_type: 'entity',
+      is_active: true,
+      is_archived: false,
+      entity_name: toEntityName(ev.table_name),
+    });
+    let lastError = null;
+    for (const r of rules) {
+      const res = await fetch(`${Deno.env.get('VITE_FUNCTION_URL')}/${r.function_name}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ event: { type: 'update' }, data: ev.new_record, old_data: ev.old_record }),
+      });
+      if (!res.ok) lastError = (await res.text()).slice(0, 500);
+      else await res.body?.cancel();
+      await FnTriggerRule.update(r.id, { last_run_at: new Date().toISOString(), total_runs: (r.total_runs || 0) + 1 });
+    }
+    await FnTriggerEvent.update(ev.id, { processed_at: new Date().toISOString(), error: lastError });
+  }
+  return events.length;
+}
+
+// ── ahora: WORKERS instances calling the leasing handler ─────────────
+
+const cronHeaders = Deno.env.get('CRON_SECRET') ? { 'x-cron-secret': Deno.env.get('CRON_SECRET') } : {};
+
+async function drainInstance() {
+  for (;;) {
+    const res = await processFnTriggerEventsHandler(new Request('http://bench.local/processFnTriggerEvents', { headers: cronHeaders }));
+    const body = await res.json();
+    if (!res.ok) throw new Error(body.error);
+    if (body.processed === 0) return;
+  }
+}
+
+async function checkClosed(table, n, label) {
+  let closed = 0;
+  let failed = 0;
+  for await (const rows of FnTriggerEvent.stream({ table_name: table }, { fields: ['id', 'processed_at', 'error'] })) {
+    closed += rows.filter((r) => r.processed_at).length;
+    failed += rows.filter((r) => r.error).length;
+  }
+  check(closed === n && failed === 0, `${label}: ${closed} de ${n} eventos cerrados, ${failed} con error`);
+}
+
+function checkDelivered(n, label) {
+  const counts = [...deliveries.values()];
+  const duplicated = counts.filter((c) => c > 1).length;
+  check(deliveries.size === n && duplicated === 0,
+    `${label}: ${deliveries.size} de ${n} eventos entregados, ${duplicated} entregados más de una vez`);
+  deliveries.clear();
+}
+
+console.log(`🔁 Bench replay fn-trigger: ${EVENTS} eventos · ${WORKERS} instancias · función stub ${LATENCY_MS} ms (antes: ${BASELINE_EVENTS} eventos)\n`);
+
+const rules = [];
+try {
+  for (const table of Object.values(tables)) {
+    rules.push(await FnTriggerRule.create({
+      name: `bench replay ${table}`,
+      automation_type: 'entity',
+      entity_name: toEntityName(table),
+      function_name: 'benchReplay',
+      event_types: ['update'],
+      is_active: true,
+      is_archived: false,
+    }));
+  }
+
+  await FnTriggerEvent.bulkCreate(makeEvents(tables.before, BASELINE_EVENTS), { returning: false });
+  let calls = 0;
+  const before = await timed(async () => {
+    while ((await oldCronCall()) > 0) calls++;
+  });
+  report('antes  50 eventos por llamada, uno a uno', BASELINE_EVENTS, before.ms,
+    `${calls} llamadas de cron = ${((calls * OLD_CRON_INTERVAL_S) / 60).toFixed(0)} min de cola a ${OLD_CRON_INTERVAL_S}s`);
+  checkDelivered(BASELINE_EVENTS, 'antes');
+  await checkClosed(tables.before, BASELINE_EVENTS, 'antes');
+
+  await FnTriggerEvent.bulkCreate(makeEvents(tables.after, EVENTS), { returning: false });
+  const after = await timed(() => Promise.all(Array.from({ length: WORKERS }, drainInstance)));
+  const m = getFnTriggerMetrics();
+  report(`ahora  lotes con lease × ${WORKERS} instancias`, EVENTS, after.ms,
+    `${m.batches} lotes · x${((before.ms / BASELINE_EVENTS) / (after.ms / EVENTS)).toFixed(0)}`);
+  checkDelivered(EVENTS, 'ahora');
+  await checkClosed(tables.after, EVENTS, 'ahora');
+  check(m.rule_cache_reloads <= 2, `reglas leídas ${m.rule_cache_reloads} veces para ${m.batches} lotes`);
+} finally {
+  await Promise.all([
+    ...Object.values(tables).map((table) => FnTriggerEvent.deleteMany({ table_name: table })),
+    ...rules.map((r) => FnTriggerRule.delete(r.id)),
+  ]);
+  await stub.shutdown();
+  console.log('\n🧹 filas del bench borradas');
+}
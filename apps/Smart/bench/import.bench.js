@@ -0,0 +1,86 @@
+// Bulk writes before/after batching (bulkCreate, importEntities).
+//
+//   BENCH_ALLOW_WRITES=true deno task bench:import
+//   BENCH_ROWS=50000 BENCH_ALLOW_WRITES=true deno task bench:import
+//
+// Customers under bench tenants (see _bench.js):
+//   antes  — what bulkCreate/importEntities did: create() row by row. Only
+//            BENCH_BASELINE_ROWS rows (default 300) are timed, it is slow
+//   ahora  — bulkCreate of BENCH_ROWS rows (default 20000) in multi-row
+//            INSERTs, and importEntities of the same rows as a CSV file with
+//            quoted commas, newlines and "" escapes, parsed as a stream
+// Checks every row landed exactly once and that CSV fields survive the trip.
+
+import { envInt, report, timed, check, benchTenantId, connectBenchDb } from './_bench.js';
+
+const ROWS = envInt('BENCH_ROWS', 20000);
+const BASELINE_ROWS = envInt('BENCH_BASELINE_ROWS', 300);
+
+const base44 = await connectBenchDb();
+const { Customer } = base44.asServiceRole.entities;
+const tenants = {
+  row: benchTenantId('imp-row'),
+  bulk: benchTenantId('imp-bulk'),
+  csv: benchTenantId('imp-csv'),
+};
+
+const makeCustomer = (tenantId, i) => ({
+  tenant_id: tenantId,
+  name: `Cliente ${i}`,
+  phone: `787${String(i).padStart(7, '0')}`,
+  email: `cliente${i}@bench.local`,
+  notes: i % 7 === 0 ? `Referido por "Tienda ${i % 13}", Bayamón\nllamar tarde` : `nota ${i}`,
+});
+
+function toCsv(rows) {
+  const columns = Object.keys(rows[0]);
+  const cell = (v) => (/[",\n\r]/.test(String(v)) ? `"${String(v).replaceAll('"', '""')}"` : String(v));
+  return [columns.join(','), ...rows.map((r) => columns.map((c) => cell(r[c])).join(','))].join('\r\n') + '\r\n';
+}
+
+async function countRows(tenantId) {
+  let n = 0;
+  for await (const rows of Customer.stream({ tenant_id: tenantId }, { fields: ['id'] })) n += rows.length;
+  return n;
+}
+
+console.log(`📥 Bench importación: ${ROWS} filas (antes: ${BASELINE_ROWS} filas una a una)\n`);
+
+try {
+  // antes: one create() per row
+  const baselineRows = Array.from({ length: BASELINE_ROWS }, (_, i) => makeCustomer(tenants.row, i));
+  const before = await timed(async () => {
+    for (const row of baselineRows) await Customer.create(row);
+  });
+  report('antes  create() fila a fila', BASELINE_ROWS, before.ms,
+    `≈ ${((before.ms / BASELINE_ROWS) * ROWS / 1000).toFixed(0)} s para ${ROWS}`);
+
+  // ahora: bulkCreate
+  const bulkRows = Array.from({ length: ROWS }, (_, i) => makeCustomer(tenants.bulk, i));
+  const bulk = await timed(() => Customer.bulkCreate(bulkRows, { returning: false }));
+  report('ahora  bulkCreate', ROWS, bulk.ms, `x${((before.ms / BASELINE_ROWS) / (bulk.ms / ROWS)).toFixed(0)}`);
+
+  // ahora: importEntities from a CSV file
+  const csvRows = Array.from({ length: ROWS }, (_, i) => makeCustomer(tenants.csv, i));
+  const file = new File([toCsv(csvRows)], 'clientes.csv', { type: 'text/csv' });
+  const imported = await timed(() => Customer.importEntities(file));
+  report('ahora  importEntities (CSV en streaming)', ROWS, imported.ms,
+    `${(file.size / 1024 / 1024).toFixed(1)} MB · x${((before.ms / BASELINE_ROWS) / (imported.ms / ROWS)).toFixed(0)}`);
+
+  console.log('');
+  check(imported.value.imported === ROWS && !imported.value.errors,
+    `importEntities: ${imported.value.imported} importadas, ${imported.value.errors?.length ?? 0} errores`);
+  const [rowCount, bulkCount, csvCount] = await Promise.all([tenants.row, tenants.bulk, tenants.csv].map(countRows));
+  check(rowCount === BASELINE_ROWS, `create(): ${rowCount} de ${BASELINE_ROWS} filas`);
+  check(bulkCount === ROWS, `bulkCreate: ${bulkCount} de ${ROWS} filas`);
+  check(csvCount === ROWS, `importEntities: ${csvCount} de ${ROWS} filas`);
+
+  const sample = [0, 7, 14, ROWS - 1].filter((i) => i < ROWS);
+  const stored = await Customer.filter({ tenant_id: tenants.csv, email: sample.map((i) => csvRows[i].email) });
+  const byEmail = new Map(stored.map((c) => [c.email, c]));
+  const intact = sample.every((i) => byEmail.get(csvRows[i].email)?.notes === csvRows[i].notes);
+  check(intact, 'CSV: comillas, comas y saltos de línea llegan intactos');
+} finally {
+  await Promise.all(Object.values(tenants).map((tenantId) => Customer.deleteMany({ tenant_id: tenantId })));
+  console.log('\n🧹 filas del bench borradas');
+}
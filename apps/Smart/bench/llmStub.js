@@ -0,0 +1,73 @@
+// Local stand-in for the Gemini and OpenAI APIs used by the AI endpoints.
+// Point the functions server at it with GEMINI_API_BASE_URL / OPENAI_BASE_URL:
+//
+//   deno run --allow-net --allow-env bench/llmStub.js
+//   GEMINI_API_KEY=stub OPENAI_API_KEY=stub \
+//   GEMINI_API_BASE_URL=http://localhost:9999 OPENAI_BASE_URL=http://localhost:9999/v1 \
+//   ./start-functions-server.sh
+//
+// LLM_STUB_LATENCY_MS  delay per model call (default 0)
+// Serves:
+//   POST …:generateContent   Gemini, answers '{"amount": 1, "confidence": "high"}'
+//   POST /v1/chat/completions OpenAI, answers '{"items": []}'
+//   POST /v1/files            OpenAI upload, answers { id: 'file-stub' }
+//   GET  /sample/<name>       a small file to use in file_urls (same name → same bytes)
+// GET /stats returns the counters.
+
+/**
+ * Start the stub. Returns { url, stats, shutdown() }.
+ */
+export function startLlmStub({ port = 9999, latencyMs = 0 } = {}) {
+  const stats = { requests: 0, gemini: 0, openai: 0, files: 0, samples: 0 };
+
+  const server = Deno.serve({ port, onListen: () => {} }, async (req) => {
+    const { pathname } = new URL(req.url);
+    if (req.method === 'GET' && pathname === '/stats') return Response.json(stats);
+    if (req.method === 'GET' && pathname.startsWith('/sample/')) {
+      stats.samples++;
+      const name = decodeURIComponent(pathname.slice('/sample/'.length));
+      return new Response(new TextEncoder().encode(`%PDF-stub ${name}\n`.repeat(256)), {
+        headers: { 'Content-Type': 'application/pdf' },
+      });
+    }
+    if (req.method !== 'POST') return Response.json({ message: 'not found' }, { status: 404 });
+
+    stats.requests++;
+    await req.arrayBuffer();
+    if (latencyMs > 0) await new Promise((resolve) => setTimeout(resolve, latencyMs));
+
+    if (pathname.includes(':generateContent')) {
+      stats.gemini++;
+      return Response.json({ candidates: [{ content: { parts: [{ text: '{"amount": 1, "confidence": "high"}' }] } }] });
+    }
+    if (pathname.endsWith('/chat/completions')) {
+      stats.openai++;
+      return Response.json({
+        id: `stub-${stats.openai}`,
+        object: 'chat.completion',
+        created: Math.floor(Date.now() / 1000),
+        model: 'gpt-4o',
+        choices: [{ index: 0, message: { role: 'assistant', content: '{"items": []}' }, finish_reason: 'stop' }],
+      });
+    }
+    if (pathname.endsWith('/files')) {
+      stats.files++;
+      return Response.json({ id: 'file-stub', object: 'file' });
+    }
+    return Response.json({ message: 'not found' }, { status: 404 });
+  });
+
+  return {
+    url: `http://localhost:${server.addr.port}`,
+    stats,
+    shutdown: () => server.shutdown(),
+  };
+}
+
+if (import.meta.main) {
+  const stub = startLlmStub({
+    port: parseInt(Deno.env.get('LLM_STUB_PORT') || '9999', 10),
+    latencyMs: parseInt(Deno.env.get('LLM_STUB_LATENCY_MS') || '0', 10),
+  });
+  console.log(`🤖 LLM stub en ${stub.url} (Gemini :generateContent, OpenAI /v1/chat/completions, /v1/files · GET /sample/<nombre>, /stats)`);
+}
@@ -0,0 +1,121 @@
+// Per-request identity under concurrency (runWithRequestAuth + client pool).
+//
+//   deno task bench:auth
+//   BENCH_REQUESTS=10000 BENCH_USERS=1000 deno task bench:auth
+//
+// No database: Supabase is a local stub (auth/v1/user, the users lookup and
+// an rpc that echoes the bearer token it received). BENCH_REQUESTS simulated
+// requests from BENCH_USERS different users run at once, with random delays
+// between awaits so their continuations interleave, and a client pool far
+// smaller than the number of users so per-token clients are evicted all the
+// time. Every request must only ever see its own identity:
+//   - auth.me() of a client from createClientFromRequest
+//   - rpc() of that client, and of a client built without a token (request
+//     context only, as helper modules do)
+//   - asServiceRole.rpc() always with the service key, also after evictions
+// Requests without a token must resolve to the service user.
+
+import { envInt, report, timed, check } from './_bench.js';
+
+const REQUESTS = envInt('BENCH_REQUESTS', 2000);
+const USERS = envInt('BENCH_USERS', 300);
+const POOL_SIZE = 16;
+const SERVICE_KEY = 'bench-service-key';
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+const jitter = () => sleep(Math.random() * 4);
+const bearer = (req) => (req.headers.get('Authorization') || '').replace(/^Bearer\s+/i, '');
+
+// ── Supabase stub ────────────────────────────────────────────────────
+
+const userOf = (token) => Number(/^tok-(\d+)$/.exec(token)?.[1] ?? NaN);
+
+const stub = Deno.serve({ port: 0, onListen: () => {} }, async (req) => {
+  const url = new URL(req.url);
+  await jitter();
+
+  if (url.pathname === '/auth/v1/user') {
+    const i = userOf(bearer(req));
+    if (Number.isNaN(i)) return Response.json({ message: 'invalid token' }, { status: 401 });
+    return Response.json({ id: `auth-${i}`, email: `user${i}@bench.local` });
+  }
+
+  if (url.pathname === '/rest/v1/users' && req.method === 'GET') {
+    const authId = url.searchParams.get('auth_id')?.replace(/^eq\./, '');
+    const i = Number(/^auth-(\d+)$/.exec(authId || '')?.[1] ?? NaN);
+    if (Number.isNaN(i)) return Response.json([]);
+    return Response.json([{ id: `user-${i}`, auth_id: authId, email: `user${i}@bench.local`, tenant_id: `tenant-${i}`, role: 'user' }]);
+  }
+
+  if (url.pathname === '/rest/v1/rpc/bench_whoami') {
+    await req.body?.cancel();
+    return Response.json(bearer(req));
+  }
+
+  return Response.json([]);
+});
+
+Deno.env.set('VITE_SUPABASE_URL', `http://localhost:${stub.addr.port}`);
+Deno.env.set('VITE_SUPABASE_ANON_KEY', 'bench-anon-key');
+Deno.env.set('SUPABASE_SERVICE_ROLE_KEY', SERVICE_KEY);
+Deno.env.set('SUPABASE_CLIENT_POOL_SIZE', String(POOL_SIZE));
+Deno.env.set('DENO_ENV', 'production'); // quiet SDK logs
+const { runWithRequestAuth, createClientFromRequest, createUnifiedClient, getClientPoolStats } =
+  await import('../../../lib/unified-custom-sdk-supabase.js');
+
+// ── Requests ─────────────────────────────────────────────────────────
+
+function simulateRequest(n) {
+  // Every 10th request has no token (cron / internal calls)
+  const i = n % 10 === 9 ? null : Math.floor(Math.random() * USERS);
+  const token = i === null ? null : `tok-${i}`;
+  const req = new Request('http://bench.local/fn', { headers: token ? { Authorization: `Bearer ${token}` } : {} });
+
+  return runWithRequestAuth(token, async () => {
+    const base44 = createClientFromRequest(req);
+    await jitter();
+    const me = await base44.auth.me();
+    await jitter();
+    const [rpc, helperRpc, serviceRpc] = await Promise.all([
+      base44.rpc('bench_whoami'),
+      createUnifiedClient().rpc('bench_whoami'), // no explicit token: request context only
+      base44.asServiceRole.rpc('bench_whoami'),
+    ]);
+    await jitter();
+    const meAgain = await base44.auth.me(); // per-token user cache
+    return { i, token, me, meAgain, rpc, helperRpc, serviceRpc };
+  }).catch((error) => ({ i, token, error }));
+}
+
+console.log(`🔐 Bench identidad por request: ${REQUESTS} requests concurrentes · ${USERS} usuarios · pool ${POOL_SIZE}\n`);
+
+const { value: results, ms } = await timed(() => Promise.all(Array.from({ length: REQUESTS }, (_, n) => simulateRequest(n))));
+report('requests concurrentes', REQUESTS, ms);
+
+// me() answers "service-user" when it cannot validate a token (stub
+// unreachable): counted as a failed request, not as a leak
+const leaks = { me: 0, rpc: 0, helperRpc: 0, serviceRpc: 0 };
+let failed = 0;
+for (const r of results) {
+  const expectedId = r.i === null ? 'service-user' : `user-${r.i}`;
+  const expectedToken = r.token ?? SERVICE_KEY;
+  if (r.error || (r.i !== null && [r.me?.id, r.meAgain?.id].includes('service-user'))) {
+    failed++;
+    continue;
+  }
+  if (r.me?.id !== expectedId || r.meAgain?.id !== expectedId) leaks.me++;
+  if (r.rpc !== expectedToken) leaks.rpc++;
+  if (r.helperRpc !== expectedToken) leaks.helperRpc++;
+  if (r.serviceRpc !== SERVICE_KEY) leaks.serviceRpc++;
+}
+if (failed > 0) console.log(`⚠️ ${failed} requests fallaron contra el stub (red), no cuentan como fugas`);
+
+const pool = getClientPoolStats();
+check(leaks.me === 0, `auth.me() devuelve siempre al usuario del request (${leaks.me} fugas)`);
+check(leaks.rpc === 0, `rpc() del cliente usa el token del request (${leaks.rpc} fugas)`);
+check(leaks.helperRpc === 0, `rpc() sin token explícito usa el contexto del request (${leaks.helperRpc} fugas)`);
+check(leaks.serviceRpc === 0, `asServiceRole.rpc() usa siempre la service key (${leaks.serviceRpc} errores)`);
+check(pool.clients.evictions > 0 && pool.shared >= 1,
+  `pool por token con expulsiones (${pool.clients.evictions}); clientes compartidos fuera del LRU (${pool.shared})`);
+
+await stub.shutdown();
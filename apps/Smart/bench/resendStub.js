@@ -0,0 +1,70 @@
+// Local stand-in for the Resend API (POST /emails, POST /emails/batch).
+// Point the functions server at it with RESEND_API_BASE_URL:
+//
+//   deno run --allow-net --allow-env bench/resendStub.js
+//   RESEND_API_BASE_URL=http://localhost:9998 RESEND_API_KEY=stub ./start-functions-server.sh
+//
+// RESEND_STUB_LATENCY_MS  delay per request (default 0)
+// RESEND_STUB_FAIL_RATE   fraction of requests answered 429 (default 0)
+// Recipients containing "invalid" are rejected with 422, like a bad address.
+// GET /stats returns the counters.
+
+const BATCH_LIMIT = 100;
+
+/**
+ * Start the stub. Returns { url, stats, shutdown() }.
+ */
+export function startResendStub({ port = 9998, latencyMs = 0, failRate = 0 } = {}) {
+  const stats = { requests: 0, single: 0, batch: 0, emails: 0, rate_limited: 0, rejected: 0 };
+  let nextId = 0;
+
+  const server = Deno.serve({ port, onListen: () => {} }, async (req) => {
+    const { pathname } = new URL(req.url);
+    if (req.method === 'GET' && pathname === '/stats') return Response.json(stats);
+    if (req.method !== 'POST' || (pathname !== '/emails' && pathname !== '/emails/batch')) {
+      return Response.json({ message: 'not found' }, { status: 404 });
+    }
+
+    stats.requests++;
+    const body = await req.json().catch(() => null);
+    if (latencyMs > 0) await new Promise((resolve) => setTimeout(resolve, latencyMs));
+
+    if (failRate > 0 && Math.random() < failRate) {
+      stats.rate_limited++;
+      return Response.json({ name: 'rate_limit_exceeded', message: 'Too many requests' }, { status: 429, headers: { 'Retry-After': '1' } });
+    }
+
+    const messages = pathname === '/emails' ? [body] : body;
+    if (!Array.isArray(messages) || messages.length === 0 || messages.length > BATCH_LIMIT) {
+      stats.rejected++;
+      return Response.json({ name: 'validation_error', message: `batch must have 1-${BATCH_LIMIT} emails` }, { status: 422 });
+    }
+    if (messages.some((m) => !m?.from || !m?.subject || !m?.to?.length || [].concat(m.to).some((to) => String(to).includes('invalid')))) {
+      stats.rejected++;
+      return Response.json({ name: 'validation_error', message: 'Invalid `to` field' }, { status: 422 });
+    }
+
+    stats.emails += messages.length;
+    if (pathname === '/emails') {
+      stats.single++;
+      return Response.json({ id: `stub_${++nextId}` });
+    }
+    stats.batch++;
+    return Response.json({ data: messages.map(() => ({ id: `stub_${++nextId}` })) });
+  });
+
+  return {
+    url: `http://localhost:${server.addr.port}`,
+    stats,
+    shutdown: () => server.shutdown(),
+  };
+}
+
+if (import.meta.main) {
+  const stub = startResendStub({
+    port: parseInt(Deno.env.get('RESEND_STUB_PORT') || '9998', 10),
+    latencyMs: parseInt(Deno.env.get('RESEND_STUB_LATENCY_MS') || '0', 10),
+    failRate: parseFloat(Deno.env.get('RESEND_STUB_FAIL_RATE') || '0'),
+  });
+  console.log(`📧 Resend stub en ${stub.url} (POST /emails, /emails/batch · GET /stats)`);
+}
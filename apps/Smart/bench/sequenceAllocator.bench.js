@@ -0,0 +1,75 @@
+// Concurrency check for allocate_sequence_numbers (023_sequence_allocator.sql).
+//
+//   BENCH_ALLOW_WRITES=true deno task bench:seq
+//   BENCH_CALLS=1000 BENCH_ALLOW_WRITES=true deno task bench:seq
+//
+// Under a bench tenant (see _bench.js) that already has a sale POS-00042:
+//   1. the first allocation seeds the counter from the real table (→ 43)
+//   2. BENCH_CALLS allocations fired at once (default 500, every tenth one a
+//      block of 5, as imports reserve) must yield every number exactly once,
+//      with no gaps
+// and the same for 'order' starting from an empty table.
+
+import { envInt, report, timed, check, benchTenantId, connectBenchDb } from './_bench.js';
+import { allocateSequenceNumbers } from '../src/Functions/_sequenceAllocator.js';
+
+const CALLS = envInt('BENCH_CALLS', 500);
+const SEEDED_SALE = 42;
+
+const base44 = await connectBenchDb();
+const { Sale, SequenceCounter } = base44.asServiceRole.entities;
+const tenantId = benchTenantId('seq');
+
+async function burst(sequenceType) {
+  const sizes = Array.from({ length: CALLS }, (_, i) => (i % 10 === 9 ? 5 : 1));
+  const { value: blocks, ms } = await timed(() => Promise.all(
+    sizes.map((n) => allocateSequenceNumbers(base44, tenantId, sequenceType, n))
+  ));
+  const numbers = blocks.flatMap((b) => b.numbers);
+  report(`${CALLS} llamadas simultáneas (${sequenceType})`, numbers.length, ms, `${blocks[0].numbers[0]} …`);
+  return { blocks, sizes };
+}
+
+function checkBlocks(label, blocks, sizes, start) {
+  const expected = sizes.reduce((a, b) => a + b, 0);
+  const seen = new Map();
+  for (const block of blocks) {
+    for (let n = block.first; n <= block.last; n++) seen.set(n, (seen.get(n) || 0) + 1);
+  }
+  const duplicates = [...seen.values()].filter((c) => c > 1).length;
+  const min = Math.min(...seen.keys());
+  const max = Math.max(...seen.keys());
+  check(blocks.every((b, i) => b.last - b.first + 1 === sizes[i]), `${label}: cada bloque tiene el tamaño pedido`);
+  check(duplicates === 0, `${label}: sin duplicados (${duplicates})`);
+  check(min === start && max === start + expected - 1 && seen.size === expected,
+    `${label}: sin huecos (${min}…${max}, ${seen.size} de ${expected})`);
+}
+
+console.log(`🔢 Bench asignador de secuencias: ${CALLS} llamadas concurrentes · tenant ${tenantId}\n`);
+
+try {
+  await Sale.create({
+    tenant_id: tenantId,
+    sale_number: `POS-${String(SEEDED_SALE).padStart(5, '0')}`,
+    items: [],
+    subtotal: 0,
+    total: 0,
+    payment_method: 'cash',
+    employee: 'bench',
+  });
+
+  const first = await allocateSequenceNumbers(base44, tenantId, 'sale', 1);
+  check(first.first === SEEDED_SALE + 1, `primer uso sembrado desde sale: ${first.numbers[0]}`);
+
+  const sales = await burst('sale');
+  checkBlocks('sale', sales.blocks, sales.sizes, SEEDED_SALE + 2);
+
+  const orders = await burst('order');
+  checkBlocks('order', orders.blocks, orders.sizes, 1);
+} finally {
+  await Promise.all([
+    Sale.deleteMany({ tenant_id: tenantId }),
+    SequenceCounter.deleteMany({ tenant_id: tenantId }),
+  ]);
+  console.log('\n🧹 filas del bench borradas');
+}
@@ -0,0 +1,404 @@
+-- ================================================================
+-- 022_financial_aggregates.sql
+-- Agregados financieros server-side para getKPIs / getRevenueByMethod /
+-- getExpensesByCategory.
+--
+-- Antes: cada endpoint bajaba las 5000 filas más recientes de sale /
+-- transaction / cash_drawer_movement y filtraba + sumaba en JS. Lento, y
+-- silenciosamente incorrecto en cuanto un tenant pasa de 5000 filas.
+--
+-- Ahora: tablas de rollup diario mantenidas incrementalmente por triggers
+-- (INSERT/UPDATE/DELETE) + funciones RPC que solo leen los días del rango.
+-- El costo de una consulta depende del número de días pedidos, no del
+-- historial del tenant.
+--
+-- Convenciones:
+--   * day = fecha UTC de created_at (mismo corte que el código JS previo,
+--     que usaba date_from + 'T00:00:00.000Z').
+--   * tenant_id '' = filas sin tenant (tenant_id IS NULL en la tabla origen),
+--     porque tenant_id forma parte de la PK del rollup.
+--   * p_tenant_id NULL en las RPC = todos los tenants.
+-- Safe to run multiple times (IF NOT EXISTS / OR REPLACE).
+-- ================================================================
+
+-- ── Rollup tables ───────────────────────────────────────────────
+
+-- Ventas no anuladas por día: cantidad y total
+CREATE TABLE IF NOT EXISTS "public"."fin_daily_sales" (
+  tenant_id   text    NOT NULL DEFAULT '',
+  day         date    NOT NULL,
+  sales_count bigint  NOT NULL DEFAULT 0,
+  sales_total numeric NOT NULL DEFAULT 0,
+  PRIMARY KEY (tenant_id, day)
+);
+
+-- Ventas no anuladas por día y método de pago (ventas "mixed" desglosadas
+-- desde payment_details.methods). row_count = aportes; un método con total 0
+-- sigue apareciendo en la respuesta, como en el JS previo.
+CREATE TABLE IF NOT EXISTS "public"."fin_daily_revenue_by_method" (
+  tenant_id      text    NOT NULL DEFAULT '',
+  day            date    NOT NULL,
+  payment_method text    NOT NULL,
+  amount         numeric NOT NULL DEFAULT 0,
+  row_count      bigint  NOT NULL DEFAULT 0,
+  PRIMARY KEY (tenant_id, day, payment_method)
+);
+
+-- Productos vendidos (sale.items) por día
+CREATE TABLE IF NOT EXISTS "public"."fin_daily_products" (
+  tenant_id    text    NOT NULL DEFAULT '',
+  day          date    NOT NULL,
+  product_name text    NOT NULL,
+  qty          numeric NOT NULL DEFAULT 0,
+  total        numeric NOT NULL DEFAULT 0,
+  row_count    bigint  NOT NULL DEFAULT 0,
+  PRIMARY KEY (tenant_id, day, product_name)
+);
+
+-- transaction + cash_drawer_movement por día, tipo y categoría
+-- source: 'transaction' | 'cash_drawer_movement' (movimientos no tienen
+-- categoría → category = '')
+CREATE TABLE IF NOT EXISTS "public"."fin_daily_ledger" (
+  tenant_id text    NOT NULL DEFAULT '',
+  day       date    NOT NULL,
+  source    text    NOT NULL,
+  type      text    NOT NULL,
+  category  text    NOT NULL DEFAULT '',
+  amount    numeric NOT NULL DEFAULT 0,
+  row_count bigint  NOT NULL DEFAULT 0,
+  PRIMARY KEY (tenant_id, day, source, type, category)
+);
+
+-- row_count llegó después de la primera versión de este archivo;
+-- fin_rebuild_rollups() (abajo) lo recalcula
+ALTER TABLE "public"."fin_daily_revenue_by_method" ADD COLUMN IF NOT EXISTS row_count bigint NOT NULL DEFAULT 0;
+ALTER TABLE "public"."fin_daily_products"          ADD COLUMN IF NOT EXISTS row_count bigint NOT NULL DEFAULT 0;
+
+-- Índices para consultas por rango cuando p_tenant_id es NULL (todos)
+CREATE INDEX IF NOT EXISTS fin_daily_sales_day_idx             ON "public"."fin_daily_sales" (day);
+CREATE INDEX IF NOT EXISTS fin_daily_revenue_by_method_day_idx ON "public"."fin_daily_revenue_by_method" (day);
+CREATE INDEX IF NOT EXISTS fin_daily_products_day_idx          ON "public"."fin_daily_products" (day);
+CREATE INDEX IF NOT EXISTS fin_daily_ledger_day_idx            ON "public"."fin_daily_ledger" (day);
+
+-- RLS: solo service role (las RPC de abajo son SECURITY DEFINER)
+ALTER TABLE "public"."fin_daily_sales"             ENABLE ROW LEVEL SECURITY;
+ALTER TABLE "public"."fin_daily_revenue_by_method" ENABLE ROW LEVEL SECURITY;
+ALTER TABLE "public"."fin_daily_products"          ENABLE ROW LEVEL SECURITY;
+ALTER TABLE "public"."fin_daily_ledger"            ENABLE ROW LEVEL SECURITY;
+
+-- ── Incremental maintenance ─────────────────────────────────────
+
+-- Aplica (s = +1) o revierte (s = -1) la contribución de una venta
+CREATE OR REPLACE FUNCTION fin_rollup_sale_row(r "public"."sale", s numeric)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  d date := (r.created_at AT TIME ZONE 'UTC')::date;
+  t text := COALESCE(r.tenant_id, '');
+  m jsonb;
+  item jsonb;
+  qty numeric;
+  price numeric;
+BEGIN
+  IF COALESCE(r.voided, false) THEN
+    RETURN;
+  END IF;
+
+  INSERT INTO "public"."fin_daily_sales" AS f (tenant_id, day, sales_count, sales_total)
+  VALUES (t, d, s, s * COALESCE(r.total, 0))
+  ON CONFLICT (tenant_id, day) DO UPDATE
+    SET sales_count = f.sales_count + EXCLUDED.sales_count,
+        sales_total = f.sales_total + EXCLUDED.sales_total;
+
+  IF r.payment_method = 'mixed' AND jsonb_typeof(r.payment_details -> 'methods') = 'array' THEN
+    FOR m IN SELECT value FROM jsonb_array_elements(r.payment_details -> 'methods') LOOP
+      INSERT INTO "public"."fin_daily_revenue_by_method" AS f (tenant_id, day, payment_method, amount, row_count)
+      VALUES (
+        t, d,
+        COALESCE(NULLIF(m ->> 'method', ''), 'unknown'),
+        s * CASE WHEN jsonb_typeof(m -> 'amount') = 'number' THEN (m ->> 'amount')::numeric ELSE 0 END,
+        s
+      )
+      ON CONFLICT (tenant_id, day, payment_method) DO UPDATE
+        SET amount = f.amount + EXCLUDED.amount,
+            row_count = f.row_count + EXCLUDED.row_count;
+    END LOOP;
+  ELSE
+    INSERT INTO "public"."fin_daily_revenue_by_method" AS f (tenant_id, day, payment_method, amount, row_count)
+    VALUES (t, d, COALESCE(NULLIF(r.payment_method, ''), 'unknown'), s * COALESCE(r.total, 0), s)
+    ON CONFLICT (tenant_id, day, payment_method) DO UPDATE
+      SET amount = f.amount + EXCLUDED.amount,
+          row_count = f.row_count + EXCLUDED.row_count;
+  END IF;
+
+  IF jsonb_typeof(r.items) = 'array' THEN
+    FOR item IN SELECT value FROM jsonb_array_elements(r.items) LOOP
+      -- Mismo criterio que el JS previo: quantity || 1, price || 0
+      qty := CASE WHEN jsonb_typeof(item -> 'quantity') = 'number'
+                  THEN NULLIF((item ->> 'quantity')::numeric, 0) END;
+      qty := COALESCE(qty, 1);
+      price := CASE WHEN jsonb_typeof(item -> 'price') = 'number'
+                    THEN (item ->> 'price')::numeric ELSE 0 END;
+      INSERT INTO "public"."fin_daily_products" AS f (tenant_id, day, product_name, qty, total, row_count)
+      VALUES (t, d, COALESCE(NULLIF(item ->> 'name', ''), 'Sin nombre'), s * qty, s * price * qty, s)
+      ON CONFLICT (tenant_id, day, product_name) DO UPDATE
+        SET qty = f.qty + EXCLUDED.qty,
+            total = f.total + EXCLUDED.total,
+            row_count = f.row_count + EXCLUDED.row_count;
+    END LOOP;
+  END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION fin_rollup_ledger_row(
+  p_tenant_id text, p_created_at timestamptz, p_source text,
+  p_type text, p_category text, p_amount numeric, s numeric
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO "public"."fin_daily_ledger" AS f (tenant_id, day, source, type, category, amount, row_count)
+  VALUES (
+    COALESCE(p_tenant_id, ''), (p_created_at AT TIME ZONE 'UTC')::date, p_source,
+    COALESCE(p_type, ''), COALESCE(p_category, ''), s * COALESCE(p_amount, 0), s
+  )
+  ON CONFLICT (tenant_id, day, source, type, category) DO UPDATE
+    SET amount = f.amount + EXCLUDED.amount,
+        row_count = f.row_count + EXCLUDED.row_count;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION fin_sale_rollup_trigger_fn()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  -- Updates que no tocan columnas agregadas (notas, cliente, etc.) no cuestan nada
+  IF TG_OP = 'UPDATE'
+     AND (OLD.created_at, OLD.tenant_id, OLD.total, OLD.payment_method, OLD.payment_details, OLD.items, OLD.voided)
+         IS NOT DISTINCT FROM
+         (NEW.created_at, NEW.tenant_id, NEW.total, NEW.payment_method, NEW.payment_details, NEW.items, NEW.voided) THEN
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM fin_rollup_sale_row(OLD, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM fin_rollup_sale_row(NEW, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION fin_transaction_rollup_trigger_fn()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  IF TG_OP = 'UPDATE'
+     AND (OLD.created_at, OLD.tenant_id, OLD.type, OLD.category, OLD.amount)
+         IS NOT DISTINCT FROM
+         (NEW.created_at, NEW.tenant_id, NEW.type, NEW.category, NEW.amount) THEN
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM fin_rollup_ledger_row(OLD.tenant_id, OLD.created_at, 'transaction', OLD.type, OLD.category, OLD.amount, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM fin_rollup_ledger_row(NEW.tenant_id, NEW.created_at, 'transaction', NEW.type, NEW.category, NEW.amount, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION fin_cash_movement_rollup_trigger_fn()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  IF TG_OP = 'UPDATE'
+     AND (OLD.created_at, OLD.tenant_id, OLD.type, OLD.amount)
+         IS NOT DISTINCT FROM
+         (NEW.created_at, NEW.tenant_id, NEW.type, NEW.amount) THEN
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM fin_rollup_ledger_row(OLD.tenant_id, OLD.created_at, 'cash_drawer_movement', OLD.type, '', OLD.amount, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM fin_rollup_ledger_row(NEW.tenant_id, NEW.created_at, 'cash_drawer_movement', NEW.type, '', NEW.amount, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS fin_rollup_trg ON "public"."sale";
+CREATE TRIGGER fin_rollup_trg
+  AFTER INSERT OR UPDATE OR DELETE ON "public"."sale"
+  FOR EACH ROW EXECUTE FUNCTION fin_sale_rollup_trigger_fn();
+
+DROP TRIGGER IF EXISTS fin_rollup_trg ON "public"."transaction";
+CREATE TRIGGER fin_rollup_trg
+  AFTER INSERT OR UPDATE OR DELETE ON "public"."transaction"
+  FOR EACH ROW EXECUTE FUNCTION fin_transaction_rollup_trigger_fn();
+
+DROP TRIGGER IF EXISTS fin_rollup_trg ON "public"."cash_drawer_movement";
+CREATE TRIGGER fin_rollup_trg
+  AFTER INSERT OR UPDATE OR DELETE ON "public"."cash_drawer_movement"
+  FOR EACH ROW EXECUTE FUNCTION fin_cash_movement_rollup_trigger_fn();
+
+-- ── Rebuild / backfill ──────────────────────────────────────────
+-- Recalcula los rollups desde cero (set-based). Se ejecuta una vez aquí y
+-- puede re-ejecutarse si alguna vez se sospecha de drift:
+--   SELECT fin_rebuild_rollups();
+CREATE OR REPLACE FUNCTION fin_rebuild_rollups()
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  LOCK TABLE "public"."sale", "public"."transaction", "public"."cash_drawer_movement" IN SHARE MODE;
+
+  TRUNCATE "public"."fin_daily_sales", "public"."fin_daily_revenue_by_method",
+           "public"."fin_daily_products", "public"."fin_daily_ledger";
+
+  INSERT INTO "public"."fin_daily_sales" (tenant_id, day, sales_count, sales_total)
+  SELECT COALESCE(tenant_id, ''), (created_at AT TIME ZONE 'UTC')::date, count(*), sum(COALESCE(total, 0))
+  FROM "public"."sale"
+  WHERE NOT COALESCE(voided, false)
+  GROUP BY 1, 2;
+
+  INSERT INTO "public"."fin_daily_revenue_by_method" (tenant_id, day, payment_method, amount, row_count)
+  SELECT tenant_id, day, payment_method, sum(amount), count(*)
+  FROM (
+    SELECT COALESCE(s.tenant_id, '') AS tenant_id,
+           (s.created_at AT TIME ZONE 'UTC')::date AS day,
+           COALESCE(NULLIF(m ->> 'method', ''), 'unknown') AS payment_method,
+           CASE WHEN jsonb_typeof(m -> 'amount') = 'number' THEN (m ->> 'amount')::numeric ELSE 0 END AS amount
+    FROM "public"."sale" s
+    CROSS JOIN LATERAL jsonb_array_elements(s.payment_details -> 'methods') AS m
+    WHERE NOT COALESCE(s.voided, false)
+      AND s.payment_method = 'mixed'
+      AND jsonb_typeof(s.payment_details -> 'methods') = 'array'
+    UNION ALL
+    SELECT COALESCE(s.tenant_id, ''),
+           (s.created_at AT TIME ZONE 'UTC')::date,
+           COALESCE(NULLIF(s.payment_method, ''), 'unknown'),
+           COALESCE(s.total, 0)
+    FROM "public"."sale" s
+    WHERE NOT COALESCE(s.voided, false)
+      AND NOT COALESCE(s.payment_method = 'mixed' AND jsonb_typeof(s.payment_details -> 'methods') = 'array', false)
+  ) x
+  GROUP BY 1, 2, 3;
+
+  INSERT INTO "public"."fin_daily_products" (tenant_id, day, product_name, qty, total, row_count)
+  SELECT tenant_id, day, product_name, sum(qty), sum(price * qty), count(*)
+  FROM (
+    SELECT COALESCE(s.tenant_id, '') AS tenant_id,
+           (s.created_at AT TIME ZONE 'UTC')::date AS day,
+           COALESCE(NULLIF(i ->> 'name', ''), 'Sin nombre') AS product_name,
+           COALESCE(CASE WHEN jsonb_typeof(i -> 'quantity') = 'number'
+                         THEN NULLIF((i ->> 'quantity')::numeric, 0) END, 1) AS qty,
+           CASE WHEN jsonb_typeof(i -> 'price') = 'number' THEN (i ->> 'price')::numeric ELSE 0 END AS price
+    FROM "public"."sale" s
+    CROSS JOIN LATERAL jsonb_array_elements(s.items) AS i
+    WHERE NOT COALESCE(s.voided, false)
+      AND jsonb_typeof(s.items) = 'array'
+  ) x
+  GROUP BY 1, 2, 3;
+
+  INSERT INTO "public"."fin_daily_ledger" (tenant_id, day, source, type, category, amount, row_count)
+  SELECT COALESCE(tenant_id, ''), (created_at AT TIME ZONE 'UTC')::date, 'transaction',
+         COALESCE(type, ''), COALESCE(category, ''), sum(COALESCE(amount, 0)), count(*)
+  FROM "public"."transaction"
+  GROUP BY 1, 2, 4, 5;
+
+  INSERT INTO "public"."fin_daily_ledger" (tenant_id, day, source, type, category, amount, row_count)
+  SELECT COALESCE(tenant_id, ''), (created_at AT TIME ZONE 'UTC')::date, 'cash_drawer_movement',
+         COALESCE(type, ''), '', sum(COALESCE(amount, 0)), count(*)
+  FROM "public"."cash_drawer_movement"
+  GROUP BY 1, 2, 4;
+END;
+$$;
+
+SELECT fin_rebuild_rollups();
+
+-- ── Read RPCs ───────────────────────────────────────────────────
+-- Todas reciben un rango de días inclusivo [p_from, p_to] (UTC).
+
+CREATE OR REPLACE FUNCTION fin_sales_summary(p_tenant_id text, p_from date, p_to date)
+RETURNS TABLE (sales_count bigint, sales_total numeric)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  SELECT COALESCE(sum(f.sales_count), 0)::bigint, COALESCE(sum(f.sales_total), 0)
+  FROM "public"."fin_daily_sales" f
+  WHERE (p_tenant_id IS NULL OR f.tenant_id = p_tenant_id)
+    AND f.day BETWEEN p_from AND p_to;
+$$;
+
+CREATE OR REPLACE FUNCTION fin_revenue_by_method(p_tenant_id text, p_from date, p_to date)
+RETURNS TABLE (payment_method text, amount numeric)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  SELECT f.payment_method, sum(f.amount)
+  FROM "public"."fin_daily_revenue_by_method" f
+  WHERE (p_tenant_id IS NULL OR f.tenant_id = p_tenant_id)
+    AND f.day BETWEEN p_from AND p_to
+  GROUP BY f.payment_method
+  HAVING sum(f.row_count) <> 0;
+$$;
+
+CREATE OR REPLACE FUNCTION fin_top_products(p_tenant_id text, p_from date, p_to date, p_limit int DEFAULT 10)
+RETURNS TABLE (name text, qty numeric, total numeric)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  SELECT f.product_name, sum(f.qty), sum(f.total)
+  FROM "public"."fin_daily_products" f
+  WHERE (p_tenant_id IS NULL OR f.tenant_id = p_tenant_id)
+    AND f.day BETWEEN p_from AND p_to
+  GROUP BY f.product_name
+  HAVING sum(f.row_count) <> 0
+  ORDER BY sum(f.total) DESC
+  LIMIT p_limit;
+$$;
+
+CREATE OR REPLACE FUNCTION fin_ledger_summary(p_tenant_id text, p_from date, p_to date)
+RETURNS TABLE (source text, type text, category text, amount numeric, row_count bigint)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  SELECT f.source, f.type, f.category, sum(f.amount), sum(f.row_count)::bigint
+  FROM "public"."fin_daily_ledger" f
+  WHERE (p_tenant_id IS NULL OR f.tenant_id = p_tenant_id)
+    AND f.day BETWEEN p_from AND p_to
+  GROUP BY f.source, f.type, f.category
+  HAVING sum(f.row_count) <> 0;
+$$;
+
+-- Las RPC solo las llama el servidor de funciones (service role)
+DO $$ BEGIN
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION fin_sales_summary(text, date, date) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION fin_revenue_by_method(text, date, date) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION fin_top_products(text, date, date, int) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION fin_ledger_summary(text, date, date) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION fin_rebuild_rollups() FROM PUBLIC, anon, authenticated';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
+DO $$ BEGIN
+  EXECUTE 'GRANT EXECUTE ON FUNCTION fin_sales_summary(text, date, date) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION fin_revenue_by_method(text, date, date) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION fin_top_products(text, date, date, int) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION fin_ledger_summary(text, date, date) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION fin_rebuild_rollups() TO service_role';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
@@ -0,0 +1,195 @@
+-- ================================================================
+-- 023_sequence_allocator.sql
+-- Asignador atómico de números secuenciales (WO-/POS-/RCG-/UNL-/CLT-)
+-- sobre la tabla sequence_counter.
+--
+-- Antes: generateSequenceNumber cargaba hasta 10.000 filas de
+-- order/sale/customer para calcular el máximo en JS, luego hacía una
+-- segunda consulta anti-colisión y devolvía 409 cuando dos cajeros
+-- competían. Se rompía pasado el registro 10.000.
+--
+-- Ahora: un contador por (tenant, sequence_type) en sequence_counter
+-- (period_key = 'global', period_type = 'continuous'), incrementado con un
+-- único UPDATE ... RETURNING. El lock de fila serializa a los llamantes
+-- concurrentes: sin huecos ni duplicados, en O(1).
+--
+--   SELECT * FROM allocate_sequence_numbers('<tenant>', 'sale');      -- 1 número
+--   SELECT * FROM allocate_sequence_numbers('<tenant>', 'customer', 500); -- reserva en lote
+--
+-- tenant NULL = contador global (filas sin tenant).
+-- Safe to run multiple times (IF NOT EXISTS / OR REPLACE).
+-- ================================================================
+
+-- 1. Tipos de secuencia usados por generateSequenceNumber
+ALTER TABLE "public"."sequence_counter" DROP CONSTRAINT IF EXISTS "sequence_counter_sequence_type_check";
+ALTER TABLE "public"."sequence_counter" ADD CONSTRAINT "sequence_counter_sequence_type_check"
+  CHECK ("sequence_type" IN ('invoice', 'order', 'purchase_order', 'refund', 'sale', 'unlock', 'recharge', 'customer'));
+
+-- 2. Un solo contador por (tenant, tipo, periodo).
+--    Consolida duplicados previos conservando el valor más alto.
+DELETE FROM "public"."sequence_counter" sc
+USING "public"."sequence_counter" other
+WHERE COALESCE(sc.tenant_id, '') = COALESCE(other.tenant_id, '')
+  AND sc.sequence_type = other.sequence_type
+  AND sc.period_key = other.period_key
+  AND (COALESCE(sc.current_count, 0), sc.id) < (COALESCE(other.current_count, 0), other.id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS sequence_counter_tenant_type_period_uidx
+  ON "public"."sequence_counter" ((COALESCE(tenant_id, '')), sequence_type, period_key);
+
+-- 3. Prefijo de cada tipo (debe coincidir con generateSequenceNumber.js)
+CREATE OR REPLACE FUNCTION sequence_prefix(p_sequence_type text)
+RETURNS text
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE p_sequence_type
+    WHEN 'order'    THEN 'WO'
+    WHEN 'sale'     THEN 'POS'
+    WHEN 'recharge' THEN 'RCG'
+    WHEN 'unlock'   THEN 'UNL'
+    WHEN 'customer' THEN 'CLT'
+  END;
+$$;
+
+-- 4. Número más alto ya usado en la tabla real (1..99999, mismo criterio que
+--    el código JS previo). Solo se usa al crear o resincronizar un contador.
+CREATE OR REPLACE FUNCTION sequence_seed_max(p_tenant_id text, p_sequence_type text)
+RETURNS bigint
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_table  text;
+  v_column text;
+  v_prefix text := sequence_prefix(p_sequence_type);
+  v_max    bigint;
+BEGIN
+  SELECT t, c INTO v_table, v_column
+  FROM (VALUES
+    ('order',    'order',    'order_number'),
+    ('unlock',   'order',    'order_number'),
+    ('sale',     'sale',     'sale_number'),
+    ('recharge', 'recharge', 'recharge_number'),
+    ('customer', 'customer', 'customer_number')
+  ) AS m(seq, t, c)
+  WHERE m.seq = p_sequence_type;
+
+  IF v_table IS NULL THEN
+    RETURN 0;
+  END IF;
+
+  EXECUTE format(
+    'SELECT max(substring(%1$I FROM $1)::bigint) FROM "public".%2$I
+      WHERE %1$I LIKE $2 AND ($3::text IS NULL OR tenant_id = $3)',
+    v_column, v_table
+  )
+  INTO v_max
+  USING '^' || v_prefix || '-0*([1-9][0-9]{0,4})$', v_prefix || '-%', p_tenant_id;
+
+  RETURN COALESCE(v_max, 0);
+END;
+$$;
+
+-- 4b. Resincroniza los contadores que ya existían. El generador previo nunca
+--     los incrementaba (004_data deja 'unlock' en 1, resetSequenceCounters
+--     creaba filas 'global' sin tenant), así que pueden estar por debajo de
+--     números ya usados; el camino rápido de abajo los incrementaría y
+--     repetiría WO-/UNL-/POS- existentes.
+UPDATE "public"."sequence_counter"
+   SET current_count = GREATEST(COALESCE(current_count, 0), sequence_seed_max(tenant_id, sequence_type))
+ WHERE period_key = 'global';
+
+-- 5. Reserva atómica de p_count números consecutivos.
+--    Devuelve el primero y el último del bloque reservado.
+CREATE OR REPLACE FUNCTION allocate_sequence_numbers(p_tenant_id text, p_sequence_type text, p_count int DEFAULT 1)
+RETURNS TABLE (first_number bigint, last_number bigint, prefix text)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_prefix text := sequence_prefix(p_sequence_type);
+  v_last   bigint;
+  v_seed   bigint;
+BEGIN
+  IF v_prefix IS NULL THEN
+    RAISE EXCEPTION 'Unknown sequence_type: %', p_sequence_type;
+  END IF;
+  IF p_count IS NULL OR p_count < 1 THEN
+    RAISE EXCEPTION 'p_count must be >= 1';
+  END IF;
+
+  -- Camino rápido: el contador ya existe
+  UPDATE "public"."sequence_counter"
+     SET current_count = COALESCE(current_count, 0) + p_count,
+         last_incremented_at = now()::text
+   WHERE COALESCE(tenant_id, '') = COALESCE(p_tenant_id, '')
+     AND sequence_type = p_sequence_type
+     AND period_key = 'global'
+  RETURNING current_count INTO v_last;
+
+  -- Primer uso: sembrar desde el máximo real. Si otra transacción lo crea a
+  -- la vez, ON CONFLICT cae en el incremento normal.
+  IF v_last IS NULL THEN
+    v_seed := sequence_seed_max(p_tenant_id, p_sequence_type);
+    INSERT INTO "public"."sequence_counter" AS sc
+      (tenant_id, sequence_type, period_type, period_key, current_count, last_incremented_at)
+    VALUES
+      (p_tenant_id, p_sequence_type, 'continuous', 'global', v_seed + p_count, now()::text)
+    ON CONFLICT ((COALESCE(tenant_id, '')), sequence_type, period_key) DO UPDATE
+      SET current_count = COALESCE(sc.current_count, 0) + p_count,
+          last_incremented_at = now()::text
+    RETURNING current_count INTO v_last;
+  END IF;
+
+  UPDATE "public"."sequence_counter"
+     SET last_number = v_prefix || '-' || lpad(v_last::text, 5, '0')
+   WHERE COALESCE(tenant_id, '') = COALESCE(p_tenant_id, '')
+     AND sequence_type = p_sequence_type
+     AND period_key = 'global';
+
+  first_number := v_last - p_count + 1;
+  last_number := v_last;
+  prefix := v_prefix;
+  RETURN NEXT;
+END;
+$$;
+
+-- 6. Fija el contador a un valor (p_value NULL = resincronizar con el máximo real).
+--    Usado por resetSequenceCounters y migrateOrderNumbers.
+CREATE OR REPLACE FUNCTION reset_sequence_counter(p_tenant_id text, p_sequence_type text, p_value bigint DEFAULT NULL)
+RETURNS bigint
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_value bigint := COALESCE(p_value, sequence_seed_max(p_tenant_id, p_sequence_type));
+BEGIN
+  IF sequence_prefix(p_sequence_type) IS NULL THEN
+    RAISE EXCEPTION 'Unknown sequence_type: %', p_sequence_type;
+  END IF;
+
+  INSERT INTO "public"."sequence_counter" AS sc
+    (tenant_id, sequence_type, period_type, period_key, current_count, last_incremented_at)
+  VALUES
+    (p_tenant_id, p_sequence_type, 'continuous', 'global', v_value, now()::text)
+  ON CONFLICT ((COALESCE(tenant_id, '')), sequence_type, period_key) DO UPDATE
+    SET current_count = EXCLUDED.current_count,
+        last_incremented_at = EXCLUDED.last_incremented_at;
+
+  RETURN v_value;
+END;
+$$;
+
+-- Solo el servidor de funciones (service role) asigna números
+DO $$ BEGIN
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION sequence_seed_max(text, text) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION allocate_sequence_numbers(text, text, int) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION reset_sequence_counter(text, text, bigint) FROM PUBLIC, anon, authenticated';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
+DO $$ BEGIN
+  EXECUTE 'GRANT EXECUTE ON FUNCTION sequence_seed_max(text, text) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION allocate_sequence_numbers(text, text, int) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION reset_sequence_counter(text, text, bigint) TO service_role';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
@@ -0,0 +1,181 @@
+-- ================================================================
+-- 024_fn_trigger_queue.sql
+-- Cola fn_trigger_event procesable en paralelo por varias instancias.
+--
+-- Antes: processFnTriggerEvents leía 50 eventos cada 120s, consultaba
+-- fn_trigger_rule por cada evento y marcaba processed_at uno a uno.
+-- Dos instancias del servidor procesaban los mismos eventos.
+--
+-- Ahora:
+--   fn_trigger_lease_events()    reserva un lote con FOR UPDATE SKIP LOCKED
+--                                (lease con expiración; si el worker muere,
+--                                el evento vuelve a la cola)
+--   fn_trigger_complete_events() marca processed_at/error del lote en 1 UPDATE
+--   fn_trigger_record_runs()     suma contadores de reglas de forma atómica
+--   fn_trigger_queue_stats()     profundidad de cola, lag y versión de reglas
+--                                (métrica: el worker la refresca cada 15s)
+--   fn_trigger_rules_version()   solo la versión de reglas (1 fila, cada lote)
+--   fn_trigger_rule_version      se incrementa cuando cambia la configuración
+--                                de una regla → invalida la caché del worker
+--
+-- Safe to run multiple times (IF NOT EXISTS / OR REPLACE).
+-- ================================================================
+
+-- 1. Lease columns
+ALTER TABLE "public"."fn_trigger_event" ADD COLUMN IF NOT EXISTS leased_until timestamptz;
+ALTER TABLE "public"."fn_trigger_event" ADD COLUMN IF NOT EXISTS lease_owner text;
+ALTER TABLE "public"."fn_trigger_event" ADD COLUMN IF NOT EXISTS attempts integer NOT NULL DEFAULT 0;
+
+-- 2. Rule configuration version (one row)
+CREATE TABLE IF NOT EXISTS "public"."fn_trigger_rule_version" (
+  id integer PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+  version bigint NOT NULL DEFAULT 0,
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+INSERT INTO "public"."fn_trigger_rule_version" (id, version) VALUES (1, 0)
+ON CONFLICT (id) DO NOTHING;
+ALTER TABLE "public"."fn_trigger_rule_version" ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION fn_trigger_rule_bump_version()
+RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE "public"."fn_trigger_rule_version"
+     SET version = version + 1, updated_at = now()
+   WHERE id = 1;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Solo columnas de configuración: las estadísticas de ejecución
+-- (total_runs, last_run_at, ...) no invalidan la caché.
+DROP TRIGGER IF EXISTS fn_trigger_rule_version_trg ON "public"."fn_trigger_rule";
+CREATE TRIGGER fn_trigger_rule_version_trg
+  AFTER INSERT OR DELETE OR TRUNCATE
+     OR UPDATE OF automation_type, entity_name, event_types, function_name, function_args, is_active, is_archived
+  ON "public"."fn_trigger_rule"
+  FOR EACH STATEMENT EXECUTE FUNCTION fn_trigger_rule_bump_version();
+
+-- 3. Lease a batch. Events that exceeded p_max_attempts are closed with an error.
+CREATE OR REPLACE FUNCTION fn_trigger_lease_events(
+  p_owner text,
+  p_limit int DEFAULT 50,
+  p_lease_seconds int DEFAULT 300,
+  p_max_attempts int DEFAULT 5
+)
+RETURNS SETOF "public"."fn_trigger_event"
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  UPDATE "public"."fn_trigger_event"
+     SET processed_at = now(),
+         error = 'max attempts exceeded',
+         leased_until = NULL,
+         updated_at = now()
+   WHERE processed_at IS NULL
+     AND attempts >= p_max_attempts
+     AND (leased_until IS NULL OR leased_until < now());
+
+  RETURN QUERY
+  UPDATE "public"."fn_trigger_event" e
+     SET leased_until = now() + make_interval(secs => p_lease_seconds),
+         lease_owner = p_owner,
+         attempts = e.attempts + 1,
+         updated_at = now()
+   WHERE e.id IN (
+     SELECT id
+       FROM "public"."fn_trigger_event"
+      WHERE processed_at IS NULL
+        AND (leased_until IS NULL OR leased_until < now())
+      ORDER BY created_at
+      LIMIT p_limit
+      FOR UPDATE SKIP LOCKED
+   )
+  RETURNING e.*;
+END;
+$$;
+
+-- 4. Close a leased batch: p_results = [{ "id": "...", "error": null | "..." }]
+CREATE OR REPLACE FUNCTION fn_trigger_complete_events(p_owner text, p_results jsonb)
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  WITH done AS (
+    UPDATE "public"."fn_trigger_event" e
+       SET processed_at = now(),
+           error = r.error,
+           leased_until = NULL,
+           updated_at = now()
+      FROM jsonb_to_recordset(p_results) AS r(id text, error text)
+     WHERE e.id = r.id
+       AND e.lease_owner = p_owner
+       AND e.processed_at IS NULL
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM done;
+$$;
+
+-- 5. Rule stats: p_runs = [{ "id", "ok": n, "failed": n, "last_ok": bool, "trailing_failures": n }]
+CREATE OR REPLACE FUNCTION fn_trigger_record_runs(p_runs jsonb)
+RETURNS void
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  UPDATE "public"."fn_trigger_rule" fr
+     SET last_run_at = now(),
+         last_run_status = CASE WHEN r.last_ok THEN 'success' ELSE 'failure' END,
+         total_runs = COALESCE(fr.total_runs, 0) + r.ok + r.failed,
+         successful_runs = COALESCE(fr.successful_runs, 0) + r.ok,
+         failed_runs = COALESCE(fr.failed_runs, 0) + r.failed,
+         consecutive_failures = CASE
+           WHEN r.last_ok THEN 0
+           WHEN r.ok > 0 THEN r.trailing_failures
+           ELSE COALESCE(fr.consecutive_failures, 0) + r.trailing_failures
+         END
+    FROM jsonb_to_recordset(p_runs) AS r(id text, ok int, failed int, last_ok boolean, trailing_failures int)
+   WHERE fr.id = r.id;
+$$;
+
+-- 6. Metrics for the worker / health check
+CREATE OR REPLACE FUNCTION fn_trigger_queue_stats()
+RETURNS TABLE (pending bigint, leased bigint, oldest_pending_at timestamptz, lag_seconds numeric, rules_version bigint)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  SELECT
+    count(*) FILTER (WHERE leased_until IS NULL OR leased_until < now()),
+    count(*) FILTER (WHERE leased_until >= now()),
+    min(created_at),
+    COALESCE(EXTRACT(EPOCH FROM now() - min(created_at)), 0)::numeric,
+    (SELECT version FROM "public"."fn_trigger_rule_version" WHERE id = 1)
+  FROM "public"."fn_trigger_event"
+  WHERE processed_at IS NULL;
+$$;
+
+-- 7. Rule version alone: read on every batch without counting the queue
+CREATE OR REPLACE FUNCTION fn_trigger_rules_version()
+RETURNS bigint
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  SELECT version FROM "public"."fn_trigger_rule_version" WHERE id = 1;
+$$;
+
+DO $$ BEGIN
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION fn_trigger_lease_events(text, int, int, int) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION fn_trigger_complete_events(text, jsonb) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION fn_trigger_record_runs(jsonb) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION fn_trigger_queue_stats() FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION fn_trigger_rules_version() FROM PUBLIC, anon, authenticated';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
+DO $$ BEGIN
+  EXECUTE 'GRANT EXECUTE ON FUNCTION fn_trigger_lease_events(text, int, int, int) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION fn_trigger_complete_events(text, jsonb) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION fn_trigger_record_runs(jsonb) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION fn_trigger_queue_stats() TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION fn_trigger_rules_version() TO service_role';
+  EXECUTE 'GRANT SELECT ON "public"."fn_trigger_rule_version" TO service_role';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
@@ -0,0 +1,285 @@
+-- ================================================================
+-- 025_due_jobs.sql
+-- Consultas "solo lo vencido" para updateOrderCountdowns y maintenanceJobs.
+--
+-- Antes: updateOrderCountdowns leía TODAS las órdenes y reescribía
+-- days_remaining de cada una a diario; maintenanceJobs traía AuditLog /
+-- Notification / EmailLog completos para filtrarlos por fecha en JS.
+--
+-- Ahora:
+--   * days_remaining se calcula al leer (started_at + 30 días); el job solo
+--     toca órdenes que cruzaron un umbral de recordatorio y aún no lo enviaron.
+--   * Índices parciales: cada conjunto "pendiente" contiene solo filas vivas,
+--     no el histórico (al marcar el flag la fila sale del índice).
+--   * Borrado / archivado por lotes en un único statement por lote.
+--
+-- Safe to run multiple times (IF NOT EXISTS / OR REPLACE).
+-- ================================================================
+
+-- 1. Índices parciales ------------------------------------------------
+
+CREATE INDEX IF NOT EXISTS order_pickup_countdown_pending_idx
+  ON "public"."order" (created_at)
+  WHERE status = 'ready_for_pickup'
+    AND pickup_countdown ? 'started_at'
+    AND NOT COALESCE((pickup_countdown->>'reminder_3_sent')::boolean, false);
+
+CREATE INDEX IF NOT EXISTS order_warranty_countdown_pending_idx
+  ON "public"."order" (created_at)
+  WHERE status IN ('delivered', 'completed')
+    AND warranty_countdown ? 'started_at'
+    AND NOT COALESCE((warranty_countdown->>'expiry_notice_sent')::boolean, false);
+
+CREATE INDEX IF NOT EXISTS audit_log_unarchived_created_idx
+  ON "public"."audit_log" (created_at)
+  WHERE severity <> 'critical'
+    AND NOT COALESCE((metadata->>'archived')::boolean, false);
+
+CREATE INDEX IF NOT EXISTS notification_read_created_idx
+  ON "public"."notification" (created_at)
+  WHERE is_read = true;
+
+CREATE INDEX IF NOT EXISTS email_log_sent_created_idx
+  ON "public"."email_log" (created_at)
+  WHERE status = 'sent';
+
+-- Solo clientes con loyalty_points desincronizado (casi vacío tras sincronizar)
+CREATE INDEX IF NOT EXISTS customer_loyalty_points_stale_idx
+  ON "public"."customer" (id)
+  WHERE loyalty_points IS DISTINCT FROM floor(COALESCE(total_spent, 0) / 10);
+
+-- 2. Countdowns -------------------------------------------------------
+
+-- Órdenes que cruzaron un umbral (15 / 3 días restantes de pickup,
+-- 15 / 0 de garantía) y no tienen el flag correspondiente.
+-- kind: pickup_reminder_15 | pickup_reminder_3 | pickup_expired |
+--       warranty_check_15 | warranty_expired
+-- stale = el umbral se cruzó hace más de p_grace_days (job caído, datos
+-- antiguos): se marca el flag sin enviar email para no spamear.
+CREATE OR REPLACE FUNCTION order_countdowns_due(p_limit int DEFAULT 500, p_grace_days int DEFAULT 3)
+RETURNS TABLE (
+  id text,
+  kind text,
+  days_remaining int,
+  stale boolean,
+  order_number text,
+  customer_name text,
+  customer_email text,
+  device_brand text,
+  device_model text,
+  initial_problem text
+)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  WITH pickup AS (
+    SELECT o.*, (o.pickup_countdown->>'started_at')::timestamptz AS started
+      FROM "public"."order" o
+     WHERE o.status = 'ready_for_pickup'
+       AND o.pickup_countdown ? 'started_at'
+       AND NOT COALESCE((o.pickup_countdown->>'reminder_3_sent')::boolean, false)
+       AND (
+         (o.pickup_countdown->>'started_at')::timestamptz <= now() - interval '27 days'
+         OR (
+           (o.pickup_countdown->>'started_at')::timestamptz <= now() - interval '15 days'
+           AND NOT COALESCE((o.pickup_countdown->>'reminder_15_sent')::boolean, false)
+         )
+       )
+  ),
+  warranty AS (
+    SELECT o.*, (o.warranty_countdown->>'started_at')::timestamptz AS started
+      FROM "public"."order" o
+     WHERE o.status IN ('delivered', 'completed')
+       AND o.warranty_countdown ? 'started_at'
+       AND NOT COALESCE((o.warranty_countdown->>'expiry_notice_sent')::boolean, false)
+       AND (
+         (o.warranty_countdown->>'started_at')::timestamptz <= now() - interval '30 days'
+         OR (
+           (o.warranty_countdown->>'started_at')::timestamptz <= now() - interval '15 days'
+           AND NOT COALESCE((o.warranty_countdown->>'checkup_15_sent')::boolean, false)
+         )
+       )
+  ),
+  due AS (
+    SELECT p.*,
+           CASE
+             WHEN p.started <= now() - interval '30 days' THEN 'pickup_expired'
+             WHEN p.started <= now() - interval '27 days' THEN 'pickup_reminder_3'
+             ELSE 'pickup_reminder_15'
+           END AS kind,
+           CASE
+             WHEN p.started <= now() - interval '27 days' THEN 27
+             ELSE 15
+           END AS threshold_days
+      FROM pickup p
+    UNION ALL
+    SELECT w.*,
+           CASE
+             WHEN w.started <= now() - interval '30 days' THEN 'warranty_expired'
+             ELSE 'warranty_check_15'
+           END,
+           CASE
+             WHEN w.started <= now() - interval '30 days' THEN 30
+             ELSE 15
+           END
+      FROM warranty w
+  )
+  SELECT d.id,
+         d.kind,
+         GREATEST(0, 30 - floor(EXTRACT(EPOCH FROM now() - d.started) / 86400)::int),
+         d.started < now() - make_interval(days => d.threshold_days + p_grace_days),
+         d.order_number,
+         d.customer_name,
+         d.customer_email,
+         d.device_brand,
+         d.device_model,
+         d.initial_problem
+    FROM due d
+   ORDER BY d.started
+   LIMIT p_limit;
+$$;
+
+-- Merge flags into the countdown objects in one UPDATE.
+-- p_marks = [{ "id": "...", "pickup": { "reminder_15_sent": true }, "warranty": null }]
+CREATE OR REPLACE FUNCTION order_countdowns_mark(p_marks jsonb)
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  WITH done AS (
+    UPDATE "public"."order" o
+       SET pickup_countdown = CASE WHEN m.pickup IS NULL THEN o.pickup_countdown
+                                   ELSE COALESCE(o.pickup_countdown, '{}'::jsonb) || m.pickup END,
+           warranty_countdown = CASE WHEN m.warranty IS NULL THEN o.warranty_countdown
+                                     ELSE COALESCE(o.warranty_countdown, '{}'::jsonb) || m.warranty END,
+           updated_at = now()
+      FROM jsonb_to_recordset(p_marks) AS m(id text, pickup jsonb, warranty jsonb)
+     WHERE o.id = m.id
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM done;
+$$;
+
+-- 3. Maintenance (lotes set-based) -------------------------------------
+
+CREATE OR REPLACE FUNCTION maintenance_archive_audit_logs(p_before timestamptz, p_limit int DEFAULT 1000)
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  WITH batch AS (
+    SELECT id FROM "public"."audit_log"
+     WHERE severity <> 'critical'
+       AND NOT COALESCE((metadata->>'archived')::boolean, false)
+       AND created_at < p_before
+     ORDER BY created_at
+     LIMIT p_limit
+     FOR UPDATE SKIP LOCKED
+  ), done AS (
+    UPDATE "public"."audit_log" a
+       SET metadata = COALESCE(a.metadata, '{}'::jsonb)
+                      || jsonb_build_object('archived', true, 'archived_at', now())
+      FROM batch
+     WHERE a.id = batch.id
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM done;
+$$;
+
+CREATE OR REPLACE FUNCTION maintenance_delete_read_notifications(p_before timestamptz, p_limit int DEFAULT 1000)
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  WITH batch AS (
+    SELECT id FROM "public"."notification"
+     WHERE is_read = true
+       AND created_at < p_before
+     ORDER BY created_at
+     LIMIT p_limit
+     FOR UPDATE SKIP LOCKED
+  ), done AS (
+    DELETE FROM "public"."notification" n
+     USING batch
+     WHERE n.id = batch.id
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM done;
+$$;
+
+CREATE OR REPLACE FUNCTION maintenance_delete_sent_email_logs(p_before timestamptz, p_limit int DEFAULT 1000)
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  WITH batch AS (
+    SELECT id FROM "public"."email_log"
+     WHERE status = 'sent'
+       AND created_at < p_before
+     ORDER BY created_at
+     LIMIT p_limit
+     FOR UPDATE SKIP LOCKED
+  ), done AS (
+    DELETE FROM "public"."email_log" e
+     USING batch
+     WHERE e.id = batch.id
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM done;
+$$;
+
+CREATE OR REPLACE FUNCTION maintenance_orphaned_orders()
+RETURNS TABLE (orphaned bigint, total bigint)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  SELECT count(*) FILTER (WHERE customer_id IS NULL OR btrim(customer_id) = ''),
+         count(*)
+    FROM "public"."order"
+   WHERE deleted = false;
+$$;
+
+-- 1 punto por cada $10 gastados. Por lotes como los anteriores: un solo
+-- UPDATE de toda la tabla bloqueaba a todos los clientes de golpe.
+-- (antes sin parámetros → DROP de la firma vieja)
+DROP FUNCTION IF EXISTS maintenance_sync_loyalty_points();
+CREATE OR REPLACE FUNCTION maintenance_sync_loyalty_points(p_limit int DEFAULT 1000)
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  WITH batch AS (
+    SELECT id FROM "public"."customer"
+     WHERE loyalty_points IS DISTINCT FROM floor(COALESCE(total_spent, 0) / 10)
+     LIMIT p_limit
+     FOR UPDATE SKIP LOCKED
+  ), done AS (
+    UPDATE "public"."customer" c
+       SET loyalty_points = floor(COALESCE(c.total_spent, 0) / 10)
+      FROM batch
+     WHERE c.id = batch.id
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM done;
+$$;
+
+DO $$ BEGIN
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION order_countdowns_due(int, int) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION order_countdowns_mark(jsonb) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION maintenance_archive_audit_logs(timestamptz, int) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION maintenance_delete_read_notifications(timestamptz, int) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION maintenance_delete_sent_email_logs(timestamptz, int) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION maintenance_orphaned_orders() FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION maintenance_sync_loyalty_points(int) FROM PUBLIC, anon, authenticated';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
+DO $$ BEGIN
+  EXECUTE 'GRANT EXECUTE ON FUNCTION order_countdowns_due(int, int) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION order_countdowns_mark(jsonb) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION maintenance_archive_audit_logs(timestamptz, int) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION maintenance_delete_read_notifications(timestamptz, int) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION maintenance_delete_sent_email_logs(timestamptz, int) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION maintenance_orphaned_orders() TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION maintenance_sync_loyalty_points(int) TO service_role';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
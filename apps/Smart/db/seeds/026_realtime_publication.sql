@@ -0,0 +1,44 @@
+-- ================================================================
+-- 026_realtime_publication.sql
+-- Publica en supabase_realtime las tablas que el cliente lee en
+-- dashboards y paneles. La caché de entidades del SDK
+-- (lib/unified-custom-sdk-supabase.js, EntityQueryCache) se suscribe a
+-- estos cambios con UnifiedEntity.subscribe() para invalidar / re-sincronizar
+-- solo las filas afectadas, en lugar de hacer polling con setInterval.
+--
+-- Sin la tabla en la publicación el canal no recibe eventos y la caché
+-- vuelve a revalidar por tiempo (delta por updated_at). El SDK solo trata
+-- como "en vivo" las tablas de esta lista (REALTIME_PUBLISHED_TABLES):
+-- mantener ambas sincronizadas.
+--
+-- communication_queue no se publica a propósito: también es la cola de
+-- salida de emails (029) y cada lease/reintento generaría eventos para todos
+-- los clientes. Las notificaciones in-app se revalidan por polling.
+--
+-- Safe to run multiple times.
+-- ================================================================
+
+DO $$
+DECLARE
+  t text;
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_publication WHERE pubname = 'supabase_realtime') THEN
+    CREATE PUBLICATION supabase_realtime;
+  END IF;
+
+  FOREACH t IN ARRAY ARRAY[
+    'order', 'sale', 'transaction', 'customer', 'notification',
+    'cash_register', 'cash_drawer_movement', 'work_order_event',
+    'product', 'service', 'announcement', 'time_entry'
+  ] LOOP
+    IF to_regclass(format('public.%I', t)) IS NOT NULL
+       AND NOT EXISTS (
+         SELECT 1 FROM pg_publication_tables
+          WHERE pubname = 'supabase_realtime'
+            AND schemaname = 'public'
+            AND tablename = t
+       ) THEN
+      EXECUTE format('ALTER PUBLICATION supabase_realtime ADD TABLE public.%I', t);
+    END IF;
+  END LOOP;
+END $$;
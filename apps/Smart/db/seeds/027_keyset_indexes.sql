@@ -0,0 +1,46 @@
+-- ================================================================
+-- 027_keyset_indexes.sql
+-- Índices para paginación keyset en (created_at, id) —
+-- UnifiedEntity.page() / stream() en lib/unified-custom-sdk-supabase.js.
+--
+-- Cada página es un range scan desde el cursor. PostgREST no expresa
+-- (created_at, id) < ($c, $id), así que el SDK envía el OR equivalente más
+-- una cota redundante sobre created_at que da el inicio del rango en el
+-- índice (el OR solo no lo da):
+--   WHERE tenant_id = $t
+--     AND created_at <= $c
+--     AND (created_at < $c OR (created_at = $c AND id < $id))
+--   ORDER BY created_at DESC, id DESC LIMIT n
+-- (ascendente: >= / > y ORDER BY ... ASC)
+-- en lugar de OFFSET, que recorre y descarta todas las filas anteriores.
+-- Las tablas con tenant_id llevan la columna al frente del índice.
+--
+-- Safe to run multiple times (IF NOT EXISTS).
+-- ================================================================
+
+DO $$
+DECLARE
+  t text;
+BEGIN
+  FOREACH t IN ARRAY ARRAY[
+    'order', 'sale', 'transaction', 'customer', 'audit_log', 'work_order_event',
+    'notification', 'email_log', 'inventory_movement', 'cash_drawer_movement',
+    'time_entry', 'product', 'recharge', 'invoice'
+  ] LOOP
+    CONTINUE WHEN to_regclass(format('public.%I', t)) IS NULL;
+    IF EXISTS (
+      SELECT 1 FROM information_schema.columns
+       WHERE table_schema = 'public' AND table_name = t AND column_name = 'tenant_id'
+    ) THEN
+      EXECUTE format(
+        'CREATE INDEX IF NOT EXISTS %I ON public.%I (tenant_id, created_at, id)',
+        t || '_tenant_created_id_idx', t
+      );
+    ELSE
+      EXECUTE format(
+        'CREATE INDEX IF NOT EXISTS %I ON public.%I (created_at, id)',
+        t || '_created_id_idx', t
+      );
+    END IF;
+  END LOOP;
+END $$;
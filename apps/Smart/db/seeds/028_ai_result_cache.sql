@@ -0,0 +1,152 @@
+-- ================================================================
+-- 028_ai_result_cache.sql
+-- Caché de resultados y jobs de los endpoints de IA
+-- (extractFile, aiExtractExpense, invokeLLM, geminiSummary).
+--
+-- Antes: cada llamada (y cada reintento del usuario) volvía a descargar
+-- el PDF/recibo, lo codificaba en base64 y lo mandaba al modelo, dentro
+-- del request HTTP.
+--
+-- Ahora (ver Functions/_aiCache.js y Functions/_aiJobs.js):
+--   ai_result_cache  resultado por hash de contenido
+--                    sha256(tipo + modelo + prompt + bytes del archivo),
+--                    con expiración y tope de filas (se expulsan las
+--                    menos usadas). La memoria de cada instancia va delante.
+--   ai_job           estado de los jobs asíncronos, para que cualquier
+--                    instancia pueda responder /ai/job.
+--
+-- Solo service_role (RLS sin políticas + EXECUTE revocado a clientes).
+-- Safe to run multiple times (IF NOT EXISTS / OR REPLACE).
+-- ================================================================
+
+-- 1. Tablas -----------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS "public"."ai_result_cache" (
+  key text PRIMARY KEY,
+  kind text NOT NULL,
+  model text,
+  result jsonb NOT NULL,
+  bytes integer NOT NULL DEFAULT 0,
+  hits integer NOT NULL DEFAULT 0,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  last_hit_at timestamptz NOT NULL DEFAULT now(),
+  expires_at timestamptz NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ai_result_cache_expires_idx ON "public"."ai_result_cache" (expires_at);
+CREATE INDEX IF NOT EXISTS ai_result_cache_last_hit_idx ON "public"."ai_result_cache" (last_hit_at);
+ALTER TABLE "public"."ai_result_cache" ENABLE ROW LEVEL SECURITY;
+
+CREATE TABLE IF NOT EXISTS "public"."ai_job" (
+  id uuid PRIMARY KEY,
+  kind text NOT NULL,
+  status text NOT NULL CHECK (status IN ('queued', 'running', 'done', 'error')),
+  result jsonb,
+  error text,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ai_job_updated_idx ON "public"."ai_job" (updated_at);
+ALTER TABLE "public"."ai_job" ENABLE ROW LEVEL SECURITY;
+
+-- 2. Caché ------------------------------------------------------------
+
+-- Lectura: solo filas vigentes; cuenta el hit (orden de expulsión).
+CREATE OR REPLACE FUNCTION ai_cache_get(p_key text)
+RETURNS jsonb
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  UPDATE "public"."ai_result_cache"
+     SET hits = hits + 1,
+         last_hit_at = now()
+   WHERE key = p_key
+     AND expires_at > now()
+  RETURNING result;
+$$;
+
+-- Escritura + limpieza: borra expiradas y, sobre p_max_entries, las
+-- menos usadas recientemente.
+CREATE OR REPLACE FUNCTION ai_cache_put(
+  p_key text,
+  p_kind text,
+  p_model text,
+  p_result jsonb,
+  p_ttl_seconds int DEFAULT 604800,
+  p_max_entries int DEFAULT 20000
+)
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  INSERT INTO "public"."ai_result_cache" (key, kind, model, result, bytes, expires_at)
+  VALUES (p_key, p_kind, p_model, p_result, octet_length(p_result::text),
+          now() + make_interval(secs => p_ttl_seconds))
+  ON CONFLICT (key) DO UPDATE
+     SET result = EXCLUDED.result,
+         bytes = EXCLUDED.bytes,
+         model = EXCLUDED.model,
+         last_hit_at = now(),
+         expires_at = EXCLUDED.expires_at;
+
+  DELETE FROM "public"."ai_result_cache" WHERE expires_at <= now();
+
+  DELETE FROM "public"."ai_result_cache"
+   WHERE key IN (
+     SELECT key FROM "public"."ai_result_cache"
+      ORDER BY last_hit_at DESC
+      OFFSET p_max_entries
+   );
+END;
+$$;
+
+-- 3. Jobs -------------------------------------------------------------
+
+-- Alta / cambio de estado. Los jobs terminados hace más de 1 día se borran.
+CREATE OR REPLACE FUNCTION ai_job_put(
+  p_id uuid,
+  p_kind text,
+  p_status text,
+  p_result jsonb DEFAULT NULL,
+  p_error text DEFAULT NULL
+)
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  INSERT INTO "public"."ai_job" (id, kind, status, result, error)
+  VALUES (p_id, p_kind, p_status, p_result, p_error)
+  ON CONFLICT (id) DO UPDATE
+     SET status = EXCLUDED.status,
+         result = EXCLUDED.result,
+         error = EXCLUDED.error,
+         updated_at = now();
+
+  IF p_status = 'queued' THEN
+    DELETE FROM "public"."ai_job" WHERE updated_at < now() - interval '1 day';
+  END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION ai_job_get(p_id uuid)
+RETURNS SETOF "public"."ai_job"
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  SELECT * FROM "public"."ai_job" WHERE id = p_id;
+$$;
+
+DO $$ BEGIN
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION ai_cache_get(text) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION ai_cache_put(text, text, text, jsonb, int, int) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION ai_job_put(uuid, text, text, jsonb, text) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION ai_job_get(uuid) FROM PUBLIC, anon, authenticated';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
+DO $$ BEGIN
+  EXECUTE 'GRANT EXECUTE ON FUNCTION ai_cache_get(text) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION ai_cache_put(text, text, text, jsonb, int, int) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION ai_job_put(uuid, text, text, jsonb, text) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION ai_job_get(uuid) TO service_role';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
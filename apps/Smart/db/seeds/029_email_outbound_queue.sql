@@ -0,0 +1,310 @@
+-- ================================================================
+-- 029_email_outbound_queue.sql
+-- Plantillas de email compiladas por tenant + cola de salida en
+-- communication_queue.
+--
+-- Antes: emailTemplateRuntime guardaba una sola caché de 5 minutos de
+-- plantillas y branding para todo el proceso (sin tenant), y cada envío
+-- (updateOrderCountdowns, notifyPickupReminder, trialNotificationService)
+-- era un POST a Resend esperado uno por uno.
+--
+-- Ahora (ver Functions/emailTemplateRuntime.js y Functions/_emailQueue.js):
+--   email_template_version     versión por tenant ('' = filas globales);
+--                              los triggers de email_template y de
+--                              app_settings (slugs de email/branding) la
+--                              incrementan → invalida las plantillas
+--                              compiladas de ese tenant.
+--   communication_queue        filas type = 'email' son la cola de salida:
+--                              to_email, intentos, próximo intento y lease.
+--   email_queue_lease()        reserva un lote con FOR UPDATE SKIP LOCKED.
+--   email_queue_complete()     cierra el lote en 1 UPDATE: enviados y
+--                              fallidos definitivos van a email_log; el
+--                              resto se reprograma (backoff).
+--   email_queue_stats()        profundidad de cola y lag.
+--   order_countdowns_due()     devuelve también tenant_id.
+--
+-- Safe to run multiple times (IF NOT EXISTS / OR REPLACE).
+-- ================================================================
+
+-- 1. Versión de plantillas por tenant ---------------------------------
+
+CREATE TABLE IF NOT EXISTS "public"."email_template_version" (
+  tenant_id text PRIMARY KEY,
+  version bigint NOT NULL DEFAULT 0,
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+ALTER TABLE "public"."email_template_version" ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION email_template_bump_version()
+RETURNS TRIGGER AS $$
+DECLARE
+  slugs text[] := ARRAY['email-templates-config', 'app-main-settings', 'business-branding'];
+  tenants text[] := ARRAY[]::text[];
+BEGIN
+  -- app_settings: solo los slugs que usan las plantillas
+  IF TG_TABLE_NAME = 'app_settings'
+     AND NOT COALESCE(NEW.slug = ANY (slugs), false)
+     AND NOT COALESCE(OLD.slug = ANY (slugs), false) THEN
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP <> 'DELETE' THEN tenants := tenants || COALESCE(NEW.tenant_id, ''); END IF;
+  IF TG_OP <> 'INSERT' THEN tenants := tenants || COALESCE(OLD.tenant_id, ''); END IF;
+
+  INSERT INTO "public"."email_template_version" (tenant_id, version)
+  SELECT DISTINCT t, 1 FROM unnest(tenants) AS t
+  ON CONFLICT (tenant_id) DO UPDATE
+     SET version = "public"."email_template_version".version + 1,
+         updated_at = now();
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS email_template_version_trg ON "public"."email_template";
+CREATE TRIGGER email_template_version_trg
+  AFTER INSERT OR UPDATE OR DELETE ON "public"."email_template"
+  FOR EACH ROW EXECUTE FUNCTION email_template_bump_version();
+
+DROP TRIGGER IF EXISTS app_settings_email_template_version_trg ON "public"."app_settings";
+CREATE TRIGGER app_settings_email_template_version_trg
+  AFTER INSERT OR UPDATE OR DELETE ON "public"."app_settings"
+  FOR EACH ROW EXECUTE FUNCTION email_template_bump_version();
+
+-- Versión efectiva de un tenant = la suya + la de las filas globales.
+-- Sin tenant (instalaciones de un solo tenant) = suma de todas.
+CREATE OR REPLACE FUNCTION email_template_version_get(p_tenant_id text DEFAULT NULL)
+RETURNS bigint
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  SELECT COALESCE(sum(version), 0)::bigint
+    FROM "public"."email_template_version"
+   WHERE p_tenant_id IS NULL
+      OR tenant_id IN ('', p_tenant_id);
+$$;
+
+-- 2. Cola de salida ---------------------------------------------------
+
+ALTER TABLE "public"."communication_queue" ADD COLUMN IF NOT EXISTS to_email text;
+ALTER TABLE "public"."communication_queue" ADD COLUMN IF NOT EXISTS from_name text;
+ALTER TABLE "public"."communication_queue" ADD COLUMN IF NOT EXISTS from_email text;
+ALTER TABLE "public"."communication_queue" ADD COLUMN IF NOT EXISTS attempts integer NOT NULL DEFAULT 0;
+ALTER TABLE "public"."communication_queue" ADD COLUMN IF NOT EXISTS next_attempt_at timestamptz NOT NULL DEFAULT now();
+ALTER TABLE "public"."communication_queue" ADD COLUMN IF NOT EXISTS leased_until timestamptz;
+ALTER TABLE "public"."communication_queue" ADD COLUMN IF NOT EXISTS lease_owner text;
+ALTER TABLE "public"."communication_queue" ADD COLUMN IF NOT EXISTS last_error text;
+ALTER TABLE "public"."communication_queue" ADD COLUMN IF NOT EXISTS provider_id text;
+
+-- Solo emails pendientes: al enviarse la fila sale del índice
+CREATE INDEX IF NOT EXISTS communication_queue_email_due_idx
+  ON "public"."communication_queue" (next_attempt_at)
+  WHERE "type" = 'email' AND status = 'pending';
+
+-- Reserva un lote de emails vencidos. Los que agotaron p_max_attempts
+-- (el worker murió con el lease tomado) se cierran como failed.
+CREATE OR REPLACE FUNCTION email_queue_lease(
+  p_owner text,
+  p_limit int DEFAULT 100,
+  p_lease_seconds int DEFAULT 120,
+  p_max_attempts int DEFAULT 5
+)
+RETURNS SETOF "public"."communication_queue"
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  UPDATE "public"."communication_queue"
+     SET status = 'failed',
+         last_error = COALESCE(last_error, 'max attempts exceeded'),
+         leased_until = NULL,
+         updated_at = now()
+   WHERE "type" = 'email'
+     AND status = 'pending'
+     AND attempts >= p_max_attempts
+     AND (leased_until IS NULL OR leased_until < now());
+
+  RETURN QUERY
+  UPDATE "public"."communication_queue" q
+     SET leased_until = now() + make_interval(secs => p_lease_seconds),
+         lease_owner = p_owner,
+         attempts = q.attempts + 1,
+         updated_at = now()
+   WHERE q.id IN (
+     SELECT id
+       FROM "public"."communication_queue"
+      WHERE "type" = 'email'
+        AND status = 'pending'
+        AND next_attempt_at <= now()
+        AND (leased_until IS NULL OR leased_until < now())
+      ORDER BY next_attempt_at
+      LIMIT p_limit
+      FOR UPDATE SKIP LOCKED
+   )
+  RETURNING q.*;
+END;
+$$;
+
+-- Cierra un lote reservado.
+-- p_results = [{ "id", "provider_id", "error": null | "...", "retry_at": null | timestamptz }]
+--   error NULL             → sent
+--   error + retry_at       → pending, reintento en retry_at
+--   error sin retry_at     → failed
+CREATE OR REPLACE FUNCTION email_queue_complete(p_owner text, p_results jsonb)
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  WITH done AS (
+    UPDATE "public"."communication_queue" q
+       SET status = CASE WHEN r.error IS NULL THEN 'sent'
+                         WHEN r.retry_at IS NULL THEN 'failed'
+                         ELSE 'pending' END,
+           sent_at = CASE WHEN r.error IS NULL
+                          THEN to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"')
+                          ELSE q.sent_at END,
+           provider_id = COALESCE(r.provider_id, q.provider_id),
+           last_error = r.error,
+           next_attempt_at = COALESCE(r.retry_at, q.next_attempt_at),
+           leased_until = NULL,
+           lease_owner = NULL,
+           updated_at = now()
+      FROM jsonb_to_recordset(p_results) AS r(id text, provider_id text, error text, retry_at timestamptz)
+     WHERE q.id = r.id
+       AND q.lease_owner = p_owner
+       AND q.status = 'pending'
+    RETURNING q.*
+  ),
+  logged AS (
+    INSERT INTO "public"."email_log"
+      (to_email, from_name, subject, body_html, status, error_message, sent_at, metadata, tenant_id)
+    SELECT d.to_email, d.from_name, COALESCE(d.subject, ''), d.body_html, d.status,
+           d.last_error, d.sent_at, d.meta, d.tenant_id
+      FROM done d
+     WHERE d.status IN ('sent', 'failed')
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM done;
+$$;
+
+CREATE OR REPLACE FUNCTION email_queue_stats()
+RETURNS TABLE (pending bigint, due bigint, leased bigint, oldest_due_at timestamptz, lag_seconds numeric)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  SELECT
+    count(*),
+    count(*) FILTER (WHERE next_attempt_at <= now() AND (leased_until IS NULL OR leased_until < now())),
+    count(*) FILTER (WHERE leased_until >= now()),
+    min(next_attempt_at) FILTER (WHERE next_attempt_at <= now()),
+    COALESCE(EXTRACT(EPOCH FROM now() - min(next_attempt_at) FILTER (WHERE next_attempt_at <= now())), 0)::numeric
+  FROM "public"."communication_queue"
+  WHERE "type" = 'email'
+    AND status = 'pending';
+$$;
+
+-- 3. order_countdowns_due con tenant_id -------------------------------
+-- (cambia el tipo de retorno → DROP + CREATE)
+
+DROP FUNCTION IF EXISTS order_countdowns_due(int, int);
+CREATE OR REPLACE FUNCTION order_countdowns_due(p_limit int DEFAULT 500, p_grace_days int DEFAULT 3)
+RETURNS TABLE (
+  id text,
+  kind text,
+  days_remaining int,
+  stale boolean,
+  order_number text,
+  customer_name text,
+  customer_email text,
+  device_brand text,
+  device_model text,
+  initial_problem text,
+  tenant_id text
+)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+  WITH pickup AS (
+    SELECT o.*, (o.pickup_countdown->>'started_at')::timestamptz AS started
+      FROM "public"."order" o
+     WHERE o.status = 'ready_for_pickup'
+       AND o.pickup_countdown ? 'started_at'
+       AND NOT COALESCE((o.pickup_countdown->>'reminder_3_sent')::boolean, false)
+       AND (
+         (o.pickup_countdown->>'started_at')::timestamptz <= now() - interval '27 days'
+         OR (
+           (o.pickup_countdown->>'started_at')::timestamptz <= now() - interval '15 days'
+           AND NOT COALESCE((o.pickup_countdown->>'reminder_15_sent')::boolean, false)
+         )
+       )
+  ),
+  warranty AS (
+    SELECT o.*, (o.warranty_countdown->>'started_at')::timestamptz AS started
+      FROM "public"."order" o
+     WHERE o.status IN ('delivered', 'completed')
+       AND o.warranty_countdown ? 'started_at'
+       AND NOT COALESCE((o.warranty_countdown->>'expiry_notice_sent')::boolean, false)
+       AND (
+         (o.warranty_countdown->>'started_at')::timestamptz <= now() - interval '30 days'
+         OR (
+           (o.warranty_countdown->>'started_at')::timestamptz <= now() - interval '15 days'
+           AND NOT COALESCE((o.warranty_countdown->>'checkup_15_sent')::boolean, false)
+         )
+       )
+  ),
+  due AS (
+    SELECT p.*,
+           CASE
+             WHEN p.started <= now() - interval '30 days' THEN 'pickup_expired'
+             WHEN p.started <= now() - interval '27 days' THEN 'pickup_reminder_3'
+             ELSE 'pickup_reminder_15'
+           END AS kind,
+           CASE
+             WHEN p.started <= now() - interval '27 days' THEN 27
+             ELSE 15
+           END AS threshold_days
+      FROM pickup p
+    UNION ALL
+    SELECT w.*,
+           CASE
+             WHEN w.started <= now() - interval '30 days' THEN 'warranty_expired'
+             ELSE 'warranty_check_15'
+           END,
+           CASE
+             WHEN w.started <= now() - interval '30 days' THEN 30
+             ELSE 15
+           END
+      FROM warranty w
+  )
+  SELECT d.id,
+         d.kind,
+         GREATEST(0, 30 - floor(EXTRACT(EPOCH FROM now() - d.started) / 86400)::int),
+         d.started < now() - make_interval(days => d.threshold_days + p_grace_days),
+         d.order_number,
+         d.customer_name,
+         d.customer_email,
+         d.device_brand,
+         d.device_model,
+         d.initial_problem,
+         d.tenant_id
+    FROM due d
+   ORDER BY d.started
+   LIMIT p_limit;
+$$;
+
+DO $$ BEGIN
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION email_template_version_get(text) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION email_queue_lease(text, int, int, int) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION email_queue_complete(text, jsonb) FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION email_queue_stats() FROM PUBLIC, anon, authenticated';
+  EXECUTE 'REVOKE EXECUTE ON FUNCTION order_countdowns_due(int, int) FROM PUBLIC, anon, authenticated';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
+DO $$ BEGIN
+  EXECUTE 'GRANT EXECUTE ON FUNCTION email_template_version_get(text) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION email_queue_lease(text, int, int, int) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION email_queue_complete(text, jsonb) TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION email_queue_stats() TO service_role';
+  EXECUTE 'GRANT EXECUTE ON FUNCTION order_countdowns_due(int, int) TO service_role';
+EXCEPTION WHEN undefined_object THEN NULL; END $$;
@@ -0,0 +1,272 @@
+// Content-addressed result cache for the AI endpoints
+// (extractFile, aiExtractExpense, invokeLLM, geminiSummary).
+// Key = sha256 of (kind, model, prompt, file bytes): the same PDF/receipt sent
+// again — a retry, a re-upload under another URL — is answered without calling
+// the model. Two levels:
+//   memory           per-instance LRU, bounded by entries and bytes
+//   ai_result_cache  shared by instances, survives restarts
+//                    (db/seeds/028_ai_result_cache.sql). Best effort: if the
+//                    RPCs fail the cache keeps working from memory.
+// Files are streamed: hashed chunk by chunk while downloading and kept as the
+// received chunks (no concatenated copy); base64 is produced per chunk when a
+// provider needs it.
+
+import { createHash } from 'node:crypto';
+import { createUnifiedClient } from '../../../../lib/unified-custom-sdk-supabase.js';
+
+const envInt = (name, fallback) => parseInt(Deno.env.get(name) || '', 10) || fallback;
+
+const TTL_MS = envInt('AI_CACHE_TTL_HOURS', 168) * 60 * 60 * 1000;
+const MAX_ENTRIES = envInt('AI_CACHE_MAX_ENTRIES', 500);
+const MAX_BYTES = envInt('AI_CACHE_MAX_MB', 32) * 1024 * 1024;
+const DB_MAX_ENTRIES = envInt('AI_CACHE_DB_MAX_ENTRIES', 20000);
+const PERSIST = Deno.env.get('AI_CACHE_PERSIST') !== 'false';
+const DOWNLOAD_TIMEOUT = 60000;
+
+// key -> { value, bytes, expires }; Map order = LRU order
+const memory = new Map();
+let memoryBytes = 0;
+// key -> Promise: identical requests in flight share one model call
+const inflight = new Map();
+
+const stats = { hits: 0, db_hits: 0, misses: 0, joined: 0, evictions: 0, db_errors: 0 };
+
+let serviceClient = null;
+let dbDisabled = !PERSIST;
+
+function db() {
+  if (!serviceClient) serviceClient = createUnifiedClient();
+  return serviceClient.asServiceRole;
+}
+
+function dbFailed(action, error) {
+  stats.db_errors++;
+  // Table/functions missing (028 not applied): stop trying, memory only
+  if (error?.code === 'PGRST202' || error?.code === '42P01' || error?.code === '42883') {
+    dbDisabled = true;
+  }
+  console.warn(`⚠️ ai_result_cache ${action} falló (${error?.message || error})${dbDisabled ? ', solo memoria' : ''}`);
+}
+
+function memoryGet(key) {
+  const entry = memory.get(key);
+  if (!entry) return undefined;
+  if (entry.expires <= Date.now()) {
+    memoryDelete(key);
+    return undefined;
+  }
+  memory.delete(key);
+  memory.set(key, entry);
+  return entry.value;
+}
+
+function memoryDelete(key) {
+  const entry = memory.get(key);
+  if (!entry) return;
+  memory.delete(key);
+  memoryBytes -= entry.bytes;
+}
+
+function memorySet(key, value, bytes, ttlMs) {
+  if (bytes > MAX_BYTES) return;
+  memoryDelete(key);
+  memory.set(key, { value, bytes, expires: Date.now() + ttlMs });
+  memoryBytes += bytes;
+  while (memory.size > MAX_ENTRIES || memoryBytes > MAX_BYTES) {
+    memoryDelete(memory.keys().next().value);
+    stats.evictions++;
+  }
+}
+
+/**
+ * Cache key for a model call. `parts` must hold everything that changes the
+ * answer: kind, model, prompt/schema and the file hash(es).
+ */
+export function aiCacheKey(parts) {
+  return createHash('sha256').update(JSON.stringify(parts)).digest('hex');
+}
+
+/**
+ * Return the cached result for `key`, or run compute() once and store it.
+ * Only successful results are stored (compute throws on failure).
+ * @returns {Promise<{ value: any, cached: 'memory' | 'db' | false }>}
+ */
+export async function withAiCache(key, { kind, model = null, ttlMs = TTL_MS }, compute) {
+  const hit = memoryGet(key);
+  if (hit !== undefined) {
+    stats.hits++;
+    return { value: hit, cached: 'memory' };
+  }
+  const pending = inflight.get(key);
+  if (pending) {
+    stats.joined++;
+    return pending;
+  }
+
+  const promise = (async () => {
+    if (!dbDisabled) {
+      try {
+        const stored = await db().rpc('ai_cache_get', { p_key: key });
+        if (stored != null) {
+          stats.db_hits++;
+          memorySet(key, stored, JSON.stringify(stored).length, ttlMs);
+          return { value: stored, cached: 'db' };
+        }
+      } catch (error) {
+        dbFailed('get', error);
+      }
+    }
+
+    stats.misses++;
+    const value = await compute();
+    memorySet(key, value, JSON.stringify(value).length, ttlMs);
+    if (!dbDisabled) {
+      db().rpc('ai_cache_put', {
+        p_key: key,
+        p_kind: kind,
+        p_model: model,
+        p_result: value,
+        p_ttl_seconds: Math.round(ttlMs / 1000),
+        p_max_entries: DB_MAX_ENTRIES,
+      }).catch((error) => dbFailed('put', error));
+    }
+    return { value, cached: false };
+  })();
+
+  inflight.set(key, promise);
+  try {
+    return await promise;
+  } finally {
+    inflight.delete(key);
+  }
+}
+
+export function getAiCacheStats() {
+  return {
+    entries: memory.size,
+    bytes: memoryBytes,
+    max_entries: MAX_ENTRIES,
+    max_bytes: MAX_BYTES,
+    persistent: !dbDisabled,
+    inflight: inflight.size,
+    ...stats,
+  };
+}
+
+/**
+ * Stream a remote file: sha256 is computed chunk by chunk during the download.
+ * keep = false discards the bytes (hash only — e.g. when the provider fetches
+ * the URL itself).
+ * @returns {Promise<{ chunks: Uint8Array[], size: number, contentType: string, sha256: string }>}
+ */
+export async function fetchFile(url, { maxBytes, accept = null, keep = true, timeoutMs = DOWNLOAD_TIMEOUT } = {}) {
+  const parsed = new URL(url);
+  if (!['http:', 'https:'].includes(parsed.protocol)) {
+    throw new Error('Only http/https URLs are allowed');
+  }
+
+  const controller = new AbortController();
+  const timeoutId = setTimeout(() => controller.abort(), timeoutMs);
+  try {
+    const response = await fetch(url, {
+      signal: controller.signal,
+      headers: accept ? { 'Accept': accept } : undefined,
+    });
+    if (!response.ok) throw new Error(`Failed to fetch URL: ${response.statusText}`);
+
+    const contentType = response.headers.get('Content-Type') || '';
+    const contentLength = response.headers.get('Content-Length');
+    if (contentLength && parseInt(contentLength) > maxBytes) throw new Error('Remote file too large');
+
+    const hash = createHash('sha256');
+    const chunks = [];
+    let size = 0;
+    for await (const chunk of response.body) {
+      size += chunk.length;
+      if (size > maxBytes) {
+        controller.abort();
+        throw new Error('Remote file too large');
+      }
+      hash.update(chunk);
+      if (keep) chunks.push(chunk);
+    }
+    return { chunks, size, contentType, sha256: hash.digest('hex') };
+  } catch (error) {
+    if (error.name === 'AbortError') throw new Error('Request timeout');
+    throw error;
+  } finally {
+    clearTimeout(timeoutId);
+  }
+}
+
+function bytesToBase64(bytes) {
+  // Chunk to avoid "Maximum call stack size exceeded" on large inputs
+  let binary = '';
+  for (let i = 0; i < bytes.length; i += 0x8000) {
+    binary += String.fromCharCode(...bytes.subarray(i, i + 0x8000));
+  }
+  return btoa(binary);
+}
+
+/**
+ * Base64 of a fetched file, one piece per download chunk
+ * (pieces are 3-byte aligned, so they concatenate into valid base64).
+ */
+export function* fileBase64Pieces(file) {
+  let carry = new Uint8Array(0);
+  for (const chunk of file.chunks) {
+    const bytes = carry.length ? new Uint8Array(carry.length + chunk.length) : chunk;
+    if (carry.length) {
+      bytes.set(carry);
+      bytes.set(chunk, carry.length);
+    }
+    const cut = bytes.length - (bytes.length % 3);
+    if (cut > 0) yield bytesToBase64(bytes.subarray(0, cut));
+    carry = bytes.slice(cut);
+  }
+  if (carry.length) yield bytesToBase64(carry);
+}
+
+export function fileToBase64(file) {
+  return [...fileBase64Pieces(file)].join('');
+}
+
+export function fileToBlob(file, type) {
+  return new Blob(file.chunks, { type });
+}
+
+const INLINE_FILE_PLACEHOLDER = '__AI_INLINE_FILE__';
+
+/**
+ * JSON request body with a file inlined as base64, streamed: `payload` is
+ * serialized with `file` at the position of the value INLINE_FILE and the
+ * base64 pieces are written in place, without building the whole string.
+ */
+export function jsonBodyWithInlineFile(payload, file) {
+  const [head, tail] = JSON.stringify(payload).split(`"${INLINE_FILE_PLACEHOLDER}"`);
+  if (tail === undefined) throw new Error('jsonBodyWithInlineFile: payload has no INLINE_FILE');
+  const encoder = new TextEncoder();
+  const pieces = fileBase64Pieces(file);
+  let stage = 'head';
+  return new ReadableStream({
+    pull(controller) {
+      if (stage === 'head') {
+        controller.enqueue(encoder.encode(`${head}"`));
+        stage = 'file';
+        return;
+      }
+      if (stage === 'file') {
+        const next = pieces.next();
+        if (!next.done) {
+          controller.enqueue(encoder.encode(next.value));
+          return;
+        }
+        controller.enqueue(encoder.encode(`"${tail}`));
+        controller.close();
+        stage = 'done';
+      }
+    },
+  });
+}
+
+export const INLINE_FILE = INLINE_FILE_PLACEHOLDER;
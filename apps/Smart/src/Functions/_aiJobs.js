@@ -0,0 +1,202 @@
+// Async job mode for the AI endpoints. With { async: true } in the payload the
+// endpoint answers 202 { job_id } right away; the model call runs here with
+// bounded concurrency and the client polls /ai/job (long-poll with wait_ms)
+// instead of holding the HTTP connection open for the whole extraction.
+// Job state lives in memory and is mirrored to ai_job
+// (db/seeds/028_ai_result_cache.sql) so any instance can answer a poll.
+
+import { createUnifiedClient } from '../../../../lib/unified-custom-sdk-supabase.js';
+
+const envInt = (name, fallback) => parseInt(Deno.env.get(name) || '', 10) || fallback;
+
+const CONCURRENCY = envInt('AI_JOB_CONCURRENCY', 3);
+const MAX_QUEUE = envInt('AI_JOB_MAX_QUEUE', 100);
+const JOB_TTL_MS = 60 * 60 * 1000;       // finished jobs kept in memory
+const JOB_STALE_MS = 15 * 60 * 1000;     // unfinished job in ai_job not updated → instance died
+const MAX_WAIT_MS = 25000;               // long-poll cap (below proxy timeouts)
+
+const jobs = new Map();          // id -> job
+const jobsByDedupe = new Map();  // dedupeKey -> id (queued/running only)
+const queue = [];
+let running = 0;
+
+const metrics = { enqueued: 0, joined: 0, done: 0, failed: 0, rejected: 0 };
+
+let serviceClient = null;
+let dbDisabled = false;
+
+function db() {
+  if (!serviceClient) serviceClient = createUnifiedClient();
+  return serviceClient.asServiceRole;
+}
+
+function persist(job) {
+  if (dbDisabled) return;
+  const params = {
+    p_id: job.id,
+    p_kind: job.kind,
+    p_status: job.status,
+    p_result: job.result ?? null,
+    p_error: job.error ?? null,
+  };
+  // Chained per job so 'done' never lands before 'running'
+  job.persisted = job.persisted
+    .then(() => dbDisabled ? null : db().rpc('ai_job_put', params))
+    .catch((error) => {
+      if (error?.code === 'PGRST202' || error?.code === '42P01' || error?.code === '42883') dbDisabled = true;
+      console.warn(`⚠️ ai_job_put falló (${error?.message || error})`);
+    });
+}
+
+function snapshot(job) {
+  const out = { job_id: job.id, kind: job.kind, status: job.status };
+  if (job.status === 'done') out.result = job.result;
+  if (job.status === 'error') out.error = job.error;
+  return out;
+}
+
+function setStatus(job, status, fields = {}) {
+  Object.assign(job, fields, { status, updated_at: Date.now() });
+  persist(job);
+  if (status === 'done' || status === 'error') {
+    if (job.dedupeKey && jobsByDedupe.get(job.dedupeKey) === job.id) jobsByDedupe.delete(job.dedupeKey);
+    for (const wake of job.waiters) wake();
+    job.waiters.clear();
+  }
+}
+
+function pump() {
+  while (running < CONCURRENCY && queue.length > 0) {
+    const job = queue.shift();
+    running++;
+    setStatus(job, 'running');
+    runJob(job).finally(() => {
+      running--;
+      pump();
+    });
+  }
+}
+
+async function runJob(job) {
+  try {
+    // run() returns the Response the synchronous endpoint would have sent
+    const res = await job.run();
+    const body = await res.json().catch(() => null);
+    if (res.ok) {
+      metrics.done++;
+      setStatus(job, 'done', { result: body });
+    } else {
+      metrics.failed++;
+      setStatus(job, 'error', { error: body?.error || `HTTP ${res.status}` });
+    }
+  } catch (error) {
+    metrics.failed++;
+    setStatus(job, 'error', { error: error.message || 'AI job failed' });
+  } finally {
+    job.run = null;
+  }
+}
+
+/**
+ * Queue run() as a job. A queued/running job with the same dedupeKey is
+ * returned instead of starting a second model call.
+ * @returns {object|null} job snapshot, or null when the queue is full
+ */
+export function enqueueAiJob(kind, run, { dedupeKey = null } = {}) {
+  const existingId = dedupeKey ? jobsByDedupe.get(dedupeKey) : null;
+  if (existingId && jobs.has(existingId)) {
+    metrics.joined++;
+    return snapshot(jobs.get(existingId));
+  }
+  if (queue.length >= MAX_QUEUE) {
+    metrics.rejected++;
+    return null;
+  }
+
+  const job = {
+    id: crypto.randomUUID(),
+    kind,
+    dedupeKey,
+    run,
+    status: 'queued',
+    result: null,
+    error: null,
+    created_at: Date.now(),
+    updated_at: Date.now(),
+    waiters: new Set(),
+    persisted: Promise.resolve(),
+  };
+  jobs.set(job.id, job);
+  if (dedupeKey) jobsByDedupe.set(dedupeKey, job.id);
+  metrics.enqueued++;
+  persist(job);
+  queue.push(job);
+  pump();
+  return snapshot(job);
+}
+
+/**
+ * Run the endpoint synchronously, or as a job when payload.async is set.
+ */
+export async function respondSyncOrJob(payload, kind, run, { dedupeKey = null } = {}) {
+  if (!payload?.async) return run();
+  const job = enqueueAiJob(kind, run, { dedupeKey });
+  if (!job) {
+    return Response.json({ error: 'Cola de IA llena, intenta de nuevo en unos segundos' }, { status: 503 });
+  }
+  return Response.json(job, { status: 202 });
+}
+
+/**
+ * Current state of a job. wait_ms > 0 waits (up to 25s) for it to finish.
+ * @returns {Promise<object|null>} snapshot, or null if unknown
+ */
+export async function getAiJob(id, waitMs = 0) {
+  const job = jobs.get(id);
+  if (job) {
+    const wait = Math.min(Math.max(0, Number(waitMs) || 0), MAX_WAIT_MS);
+    if (wait > 0 && (job.status === 'queued' || job.status === 'running')) {
+      await new Promise((resolve) => {
+        const timer = setTimeout(() => {
+          job.waiters.delete(wake);
+          resolve();
+        }, wait);
+        const wake = () => {
+          clearTimeout(timer);
+          resolve();
+        };
+        job.waiters.add(wake);
+      });
+    }
+    return snapshot(job);
+  }
+
+  // Accepted by another instance (or before a restart)
+  if (dbDisabled) return null;
+  try {
+    const rows = await db().rpc('ai_job_get', { p_id: id });
+    const row = Array.isArray(rows) ? rows[0] : rows;
+    if (!row) return null;
+    const stale = (row.status === 'queued' || row.status === 'running')
+      && Date.now() - new Date(row.updated_at).getTime() > JOB_STALE_MS;
+    if (stale) {
+      return { job_id: row.id, kind: row.kind, status: 'error', error: 'El job se perdió (servidor reiniciado), vuelve a enviarlo' };
+    }
+    return snapshot(row);
+  } catch (error) {
+    console.warn(`⚠️ ai_job_get falló (${error?.message || error})`);
+    return null;
+  }
+}
+
+export function getAiJobMetrics() {
+  return { queued: queue.length, running, concurrency: CONCURRENCY, max_queue: MAX_QUEUE, ...metrics };
+}
+
+// Periodic GC — finished jobs leave memory after JOB_TTL_MS
+setInterval(() => {
+  const cutoff = Date.now() - JOB_TTL_MS;
+  for (const [id, job] of jobs) {
+    if ((job.status === 'done' || job.status === 'error') && job.updated_at < cutoff) jobs.delete(id);
+  }
+}, 5 * 60 * 1000);
@@ -0,0 +1,21 @@
+// Bounded-concurrency helpers shared by background jobs
+// (processFnTriggerEvents, updateOrderCountdowns, ...).
+
+import { mapWithConcurrency } from '../../../../lib/unified-custom-sdk-supabase.js';
+
+// Same helper the SDK uses for bulk writes
+export { mapWithConcurrency };
+
+/**
+ * Run worker over items with bounded concurrency, never rejecting:
+ * each result is { ok: true, value } or { ok: false, error }.
+ */
+export function settleWithConcurrency(items, limit, worker) {
+  return mapWithConcurrency(items, limit, async (item, i) => {
+    try {
+      return { ok: true, value: await worker(item, i) };
+    } catch (error) {
+      return { ok: false, error };
+    }
+  });
+}
@@ -0,0 +1,275 @@
+// Outbound email queue on communication_queue (type = 'email').
+// enqueueEmails() stores rendered messages with one multi-row INSERT and wakes
+// the drain. The drain leases due rows (email_queue_lease, FOR UPDATE SKIP
+// LOCKED — several instances can drain at once), sends them with Resend's
+// batch endpoint (up to 100 per request, EMAIL_QUEUE_CONCURRENCY requests in
+// flight) and closes the lease with email_queue_complete: sent and finally
+// failed rows go to email_log, the rest are retried with exponential backoff.
+// See db/seeds/029_email_outbound_queue.sql and docs/EMAIL_QUEUE.md.
+
+import { mapWithConcurrency } from './_concurrency.js';
+
+const envInt = (name, fallback) => parseInt(Deno.env.get(name) || '', 10) || fallback;
+
+const RESEND_API_BASE_URL = (Deno.env.get('RESEND_API_BASE_URL') || 'https://api.resend.com').replace(/\/+$/, '');
+const BATCH_SIZE = Math.min(envInt('EMAIL_QUEUE_BATCH_SIZE', 100), 100); // Resend batch limit
+const CONCURRENCY = envInt('EMAIL_QUEUE_CONCURRENCY', 2);
+const MAX_ATTEMPTS = envInt('EMAIL_QUEUE_MAX_ATTEMPTS', 5);
+const BACKOFF_BASE_MS = envInt('EMAIL_QUEUE_BACKOFF_MS', 30000);
+const BACKOFF_MAX_MS = 60 * 60 * 1000;
+const LEASE_SECONDS = envInt('EMAIL_QUEUE_LEASE_SECONDS', 120);
+const POLL_MIN_MS = envInt('EMAIL_QUEUE_POLL_MIN_MS', 5000);
+const POLL_MAX_MS = envInt('EMAIL_QUEUE_POLL_MAX_MS', 60000);
+const REQUEST_TIMEOUT_MS = 30000;
+
+const DEFAULT_FROM_NAME = Deno.env.get('FROM_NAME') || 'SmartFixOS';
+const DEFAULT_FROM_EMAIL = Deno.env.get('FROM_EMAIL') || 'noreply@archillaos.com';
+
+// Identifies this instance's leases
+const LEASE_OWNER = `${Deno.env.get('HOSTNAME') || 'email'}-${crypto.randomUUID().slice(0, 8)}`;
+
+const metrics = {
+  enqueued: 0,
+  sent: 0,
+  retried: 0,
+  failed: 0,
+  requests: 0,
+  batches: 0,
+  last_batch_size: 0,
+  last_batch_ms: 0,
+  draining: false,
+  worker_running: false,
+  poll_interval_ms: POLL_MIN_MS,
+};
+
+let draining = null;
+let drainAgain = false;
+
+export function getEmailQueueMetrics() {
+  return { ...metrics, lease_owner: LEASE_OWNER, batch_size: BATCH_SIZE, concurrency: CONCURRENCY };
+}
+
+/**
+ * Queue emails for delivery.
+ * @param {Array<{ to, subject, html, from_name?, from_email?, tenant_id?, user_id?, meta? }>} messages
+ * @param {Object} options
+ * @param {boolean} options.drain - Start draining right away (default true)
+ * @returns {Promise<number>} rows queued
+ */
+export async function enqueueEmails(base44, messages, { drain = true } = {}) {
+  const rows = (messages || [])
+    .filter((m) => m?.to && m.subject && m.html)
+    .map((m) => ({
+      type: 'email',
+      status: 'pending',
+      user_id: m.user_id || m.to,
+      to_email: m.to,
+      subject: m.subject,
+      body_html: m.html,
+      from_name: m.from_name || null,
+      from_email: m.from_email || null,
+      meta: m.meta || null,
+      tenant_id: m.tenant_id || null,
+    }));
+  if (rows.length === 0) return 0;
+
+  await base44.asServiceRole.entities.CommunicationQueue.bulkCreate(rows, { returning: false });
+  metrics.enqueued += rows.length;
+  if (drain) {
+    drainEmailQueue(base44).catch((error) => console.error('❌ Error drenando la cola de email:', error));
+  }
+  return rows.length;
+}
+
+// ── Sending ──────────────────────────────────────────────────────────
+
+// 401/403 are retried too: a bad or rotated key should not burn the queue
+function isRetryableStatus(status) {
+  return status === 429 || status >= 500 || status === 401 || status === 403;
+}
+
+function parseRetryAfterMs(value) {
+  const seconds = Number(value);
+  return Number.isFinite(seconds) && seconds > 0 ? seconds * 1000 : 0;
+}
+
+function backoffMs(attempts) {
+  const base = Math.min(BACKOFF_BASE_MS * 2 ** Math.max(0, attempts - 1), BACKOFF_MAX_MS);
+  return Math.round(base * (0.8 + Math.random() * 0.4));
+}
+
+function toResendMessage(row) {
+  return {
+    from: `${row.from_name || DEFAULT_FROM_NAME} <${row.from_email || DEFAULT_FROM_EMAIL}>`,
+    to: [row.to_email],
+    subject: row.subject,
+    html: row.body_html,
+  };
+}
+
+async function postResend(path, body) {
+  const apiKey = Deno.env.get('RESEND_API_KEY');
+  if (!apiKey) throw new Error('RESEND_API_KEY not set in Deno environment');
+
+  const controller = new AbortController();
+  const timeoutId = setTimeout(() => controller.abort(), REQUEST_TIMEOUT_MS);
+  try {
+    metrics.requests++;
+    const res = await fetch(`${RESEND_API_BASE_URL}${path}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${apiKey}`,
+      },
+      body: JSON.stringify(body),
+      signal: controller.signal,
+    });
+    const data = await res.json().catch(() => null);
+    return { ok: res.ok, status: res.status, data, retryAfterMs: parseRetryAfterMs(res.headers.get('Retry-After')) };
+  } catch (error) {
+    if (error.name === 'AbortError') throw new Error('Resend request timeout');
+    throw error;
+  } finally {
+    clearTimeout(timeoutId);
+  }
+}
+
+/**
+ * Send up to BATCH_SIZE leased rows in one request.
+ * @returns {Promise<Array<{ row, provider_id?, error?, retryable?, retryAfterMs? }>>}
+ */
+async function sendBatch(rows) {
+  let res;
+  try {
+    res = rows.length === 1
+      ? await postResend('/emails', toResendMessage(rows[0]))
+      : await postResend('/emails/batch', rows.map(toResendMessage));
+  } catch (error) {
+    return rows.map((row) => ({ row, error: error.message, retryable: true }));
+  }
+
+  if (res.ok) {
+    const ids = rows.length === 1 ? [res.data?.id] : (res.data?.data || []).map((d) => d?.id);
+    return rows.map((row, i) => ({ row, provider_id: ids[i] || null }));
+  }
+
+  // The batch is validated as a whole: one bad address rejects all of it →
+  // resend one by one so only that row fails
+  if (rows.length > 1 && !isRetryableStatus(res.status)) {
+    const results = [];
+    for (const row of rows) results.push(...await sendBatch([row]));
+    return results;
+  }
+
+  const error = `Resend ${res.status}: ${res.data?.message || res.data?.error || 'error'}`;
+  return rows.map((row) => ({ row, error, retryable: isRetryableStatus(res.status), retryAfterMs: res.retryAfterMs }));
+}
+
+function toCompletion({ row, provider_id = null, error = null, retryable = false, retryAfterMs = 0 }) {
+  if (!error) {
+    metrics.sent++;
+    return { id: row.id, provider_id, error: null, retry_at: null };
+  }
+  if (retryable && row.attempts < MAX_ATTEMPTS) {
+    metrics.retried++;
+    const delay = Math.max(backoffMs(row.attempts), retryAfterMs);
+    return { id: row.id, error, retry_at: new Date(Date.now() + delay).toISOString() };
+  }
+  metrics.failed++;
+  return { id: row.id, error, retry_at: null };
+}
+
+/**
+ * Lease one round of due emails (BATCH_SIZE × CONCURRENCY) and send it.
+ * @returns {Promise<number>} rows processed (0 when nothing is due)
+ */
+async function processBatch(base44) {
+  const started = Date.now();
+  const rows = await base44.asServiceRole.rpc('email_queue_lease', {
+    p_owner: LEASE_OWNER,
+    p_limit: BATCH_SIZE * CONCURRENCY,
+    p_lease_seconds: LEASE_SECONDS,
+    p_max_attempts: MAX_ATTEMPTS,
+  });
+  if (!rows || rows.length === 0) return 0;
+
+  const chunks = [];
+  for (let i = 0; i < rows.length; i += BATCH_SIZE) chunks.push(rows.slice(i, i + BATCH_SIZE));
+  const outcomes = await mapWithConcurrency(chunks, CONCURRENCY, sendBatch);
+
+  await base44.asServiceRole.rpc('email_queue_complete', {
+    p_owner: LEASE_OWNER,
+    p_results: outcomes.flat().map(toCompletion),
+  });
+
+  metrics.batches++;
+  metrics.last_batch_size = rows.length;
+  metrics.last_batch_ms = Date.now() - started;
+  return rows.length;
+}
+
+/**
+ * Send everything that is due. Calls while a drain is running join it (and
+ * make it look once more for rows queued in the meantime).
+ * @returns {Promise<number>} rows processed
+ */
+export function drainEmailQueue(base44) {
+  if (draining) {
+    drainAgain = true;
+    return draining;
+  }
+  metrics.draining = true;
+  draining = (async () => {
+    let total = 0;
+    do {
+      drainAgain = false;
+      let processed;
+      while ((processed = await processBatch(base44)) > 0) total += processed;
+    } while (drainAgain);
+    return total;
+  })().finally(() => {
+    draining = null;
+    metrics.draining = false;
+  });
+  return draining;
+}
+
+/**
+ * In-process worker: picks up retries whose backoff expired and rows queued
+ * by other instances. Polls every EMAIL_QUEUE_POLL_MIN_MS while there is
+ * work, backing off (doubling) to EMAIL_QUEUE_POLL_MAX_MS when idle.
+ */
+export async function startEmailQueueWorker() {
+  if (metrics.worker_running) return;
+  metrics.worker_running = true;
+
+  let base44;
+  try {
+    const { createUnifiedClient } = await import('../../../../lib/unified-custom-sdk-supabase.js');
+    base44 = createUnifiedClient({
+      entitiesPath: new URL('../Entities', import.meta.url).pathname,
+    });
+  } catch (error) {
+    metrics.worker_running = false;
+    throw error;
+  }
+
+  console.log(`📧 Email queue worker started (${LEASE_OWNER}, batch ${BATCH_SIZE}, concurrency ${CONCURRENCY})`);
+
+  let delay = POLL_MIN_MS;
+  while (metrics.worker_running) {
+    try {
+      const processed = await drainEmailQueue(base44);
+      delay = processed > 0 ? POLL_MIN_MS : Math.min(delay * 2, POLL_MAX_MS);
+    } catch (error) {
+      console.error('Email queue worker error:', error);
+      delay = POLL_MAX_MS;
+    }
+    metrics.poll_interval_ms = delay;
+    await new Promise((resolve) => setTimeout(resolve, delay));
+  }
+}
+
+export function stopEmailQueueWorker() {
+  metrics.worker_running = false;
+}
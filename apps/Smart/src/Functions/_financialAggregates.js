@@ -0,0 +1,110 @@
+// Shared aggregation layer for the financial "virtual views"
+// (getKPIs, getRevenueByMethod, getExpensesByCategory).
+// Date filtering, grouping and sums run in Postgres against the daily rollup
+// tables maintained by triggers (db/seeds/022_financial_aggregates.sql), so
+// cost depends on the number of days requested, not on the tenant's history.
+
+const DAY_MS = 24 * 60 * 60 * 1000;
+
+// Callers without a tenant that may pick one in the body. me() answers
+// service calls (no user token) as the admin "service-user".
+const TENANT_OVERRIDE_ROLES = new Set(['admin', 'super_admin']);
+
+/**
+ * Tenant to aggregate. An authenticated user is always pinned to their own
+ * tenant; only service calls and admins without a tenant may pass tenant_id
+ * in the body. null = all tenants (previous behavior of these endpoints).
+ */
+export function resolveTenantId(user, body = {}) {
+  if (user?.tenant_id) return user.tenant_id;
+  return TENANT_OVERRIDE_ROLES.has(user?.role) ? body.tenant_id || null : null;
+}
+
+/**
+ * Previous period of the same length, immediately before date_from.
+ * Matches the old JS computation (prevEnd = start - 1ms, prevStart = prevEnd - length),
+ * which at day granularity is [from - N days, from - 1 day].
+ */
+export function previousPeriod(dateFrom, dateTo) {
+  const start = Date.parse(dateFrom + 'T00:00:00.000Z');
+  const end = Date.parse(dateTo + 'T00:00:00.000Z');
+  const days = Math.round((end - start) / DAY_MS) + 1;
+  const toDay = (ms) => new Date(ms).toISOString().split('T')[0];
+  return {
+    from: toDay(start - days * DAY_MS),
+    to: toDay(start - DAY_MS),
+  };
+}
+
+function rangeParams(tenantId, dateFrom, dateTo) {
+  return { p_tenant_id: tenantId, p_from: dateFrom, p_to: dateTo };
+}
+
+// numeric columns come back from PostgREST as numbers or strings depending on size
+const num = (v) => Number(v) || 0;
+
+/**
+ * @returns {Promise<{ sales_count: number, sales_total: number }>}
+ */
+export async function fetchSalesSummary(base44, tenantId, dateFrom, dateTo) {
+  const rows = await base44.asServiceRole.rpc('fin_sales_summary', rangeParams(tenantId, dateFrom, dateTo));
+  const row = Array.isArray(rows) ? rows[0] : rows;
+  return {
+    sales_count: num(row?.sales_count),
+    sales_total: num(row?.sales_total),
+  };
+}
+
+/**
+ * @returns {Promise<Record<string, number>>} amount per payment method
+ */
+export async function fetchRevenueByMethod(base44, tenantId, dateFrom, dateTo) {
+  const rows = await base44.asServiceRole.rpc('fin_revenue_by_method', rangeParams(tenantId, dateFrom, dateTo));
+  const byMethod = {};
+  for (const row of rows || []) {
+    byMethod[row.payment_method] = num(row.amount);
+  }
+  return byMethod;
+}
+
+/**
+ * @returns {Promise<Array<{ name: string, qty: number, total: number }>>}
+ */
+export async function fetchTopProducts(base44, tenantId, dateFrom, dateTo, limit = 10) {
+  const rows = await base44.asServiceRole.rpc('fin_top_products', {
+    ...rangeParams(tenantId, dateFrom, dateTo),
+    p_limit: limit,
+  });
+  return (rows || []).map((row) => ({ name: row.name, qty: num(row.qty), total: num(row.total) }));
+}
+
+/**
+ * Transaction + CashDrawerMovement totals for the range, grouped by source/type/category.
+ * @returns {Promise<Array<{ source: string, type: string, category: string, amount: number, row_count: number }>>}
+ */
+export async function fetchLedgerSummary(base44, tenantId, dateFrom, dateTo) {
+  const rows = await base44.asServiceRole.rpc('fin_ledger_summary', rangeParams(tenantId, dateFrom, dateTo));
+  return (rows || []).map((row) => ({
+    source: row.source,
+    type: row.type,
+    category: row.category,
+    amount: num(row.amount),
+    row_count: num(row.row_count),
+  }));
+}
+
+/**
+ * Sum ledger rows matching source/type.
+ * @returns {{ amount: number, count: number }}
+ */
+export function sumLedger(ledger, source, type) {
+  let amount = 0;
+  let count = 0;
+  for (const row of ledger) {
+    if (row.source === source && row.type === type) {
+      amount += row.amount;
+      count += row.row_count;
+    }
+  }
+  return { amount, count };
+}
@@ -24,6 +24,7 @@ export const RATE_LIMITS = {
   '/ai/generate-image':      { max: 30,  windowMs: FIFTEEN_MIN_MS },
   '/ai/gemini-summary':      { max: 30,  windowMs: FIFTEEN_MIN_MS },
   '/ai/categorize-expense':  { max: 60,  windowMs: FIFTEEN_MIN_MS },
+  '/ai/job':                { max: 600, windowMs: FIFTEEN_MIN_MS },  // polling de jobs async
   '/processPayment':         { max: 30,  windowMs: FIFTEEN_MIN_MS },
   '/createStripeCheckout':   { max: 30,  windowMs: FIFTEEN_MIN_MS },
   '/createStripeSubscription': { max: 30, windowMs: FIFTEEN_MIN_MS },
@@ -35,6 +36,7 @@ const EXEMPT_PATHS = new Set([
   '/stripeWebhook',
   '/runScheduledFnTriggers',
   '/processFnTriggerEvents',
+  '/processEmailQueue',
   '/onEntityFnTrigger',
   '/',
   '/health',
@@ -0,0 +1,56 @@
+// Shared client for the Postgres sequence allocator
+// (db/seeds/023_sequence_allocator.sql). One SequenceCounter row per
+// tenant + sequence_type, incremented atomically in the database, so numbers
+// are unique under concurrency without scanning the business tables.
+
+export const SEQUENCE_PREFIXES = {
+  order: 'WO',
+  sale: 'POS',
+  recharge: 'RCG',
+  unlock: 'UNL',
+  customer: 'CLT'
+};
+
+export const SEQUENCE_TYPES = Object.keys(SEQUENCE_PREFIXES);
+
+// Upper bound for a single batch reservation (imports, bulk creation)
+export const MAX_RESERVATION = 10000;
+
+export function formatSequenceNumber(prefix, n) {
+  return `${prefix}-${String(n).padStart(5, '0')}`;
+}
+
+/**
+ * Reserve `count` consecutive numbers for a tenant.
+ * tenantId null = global counter (rows without tenant).
+ * @returns {Promise<{ prefix: string, first: number, last: number, numbers: string[] }>}
+ */
+export async function allocateSequenceNumbers(base44, tenantId, sequenceType, count = 1) {
+  const rows = await base44.asServiceRole.rpc('allocate_sequence_numbers', {
+    p_tenant_id: tenantId,
+    p_sequence_type: sequenceType,
+    p_count: count
+  });
+  const row = Array.isArray(rows) ? rows[0] : rows;
+  const first = Number(row.first_number);
+  const last = Number(row.last_number);
+  const numbers = [];
+  for (let n = first; n <= last; n++) {
+    numbers.push(formatSequenceNumber(row.prefix, n));
+  }
+  return { prefix: row.prefix, first, last, numbers };
+}
+
+/**
+ * Set a tenant's counter to `value` (next number will be value + 1).
+ * value null = resync with the highest number found in the real table.
+ * @returns {Promise<number>} value stored in the counter
+ */
+export async function resetSequenceCounter(base44, tenantId, sequenceType, value = null) {
+  const stored = await base44.asServiceRole.rpc('reset_sequence_counter', {
+    p_tenant_id: tenantId,
+    p_sequence_type: sequenceType,
+    p_value: value
+  });
+  return Number(stored) || 0;
+}
@@ -1,12 +1,17 @@
 // AI Expense Extraction - Reads receipts, bank statements, payroll screenshots, and invoices
 // Uses Gemini Vision (free tier) to extract structured financial data from uploaded documents.
 // Used by JenaiExpenseCapture.jsx (finanzas) y POInvoiceScannerDialog.jsx (inventario/compras).
+// Resultados cacheados por hash (imagen + prompt + modelo) — ver _aiCache.js.
+import { aiCacheKey, fetchFile, jsonBodyWithInlineFile, INLINE_FILE, withAiCache } from './_aiCache.js';
+import { respondSyncOrJob } from './_aiJobs.js';
+
 const GEMINI_API_KEY = Deno.env.get('GEMINI_API_KEY');
 const GEMINI_MODEL = 'gemini-1.5-flash';
-const GEMINI_URL = `https://generativelanguage.googleapis.com/v1beta/models/${GEMINI_MODEL}:generateContent?key=${GEMINI_API_KEY}`;
+// GEMINI_API_BASE_URL apunta a un servidor stub local en pruebas
+const GEMINI_API_BASE = (Deno.env.get('GEMINI_API_BASE_URL') || 'https://generativelanguage.googleapis.com').replace(/\/$/, '');
+const GEMINI_URL = `${GEMINI_API_BASE}/v1beta/models/${GEMINI_MODEL}:generateContent?key=${GEMINI_API_KEY}`;
 
 const MAX_DOWNLOAD_BYTES = 25 * 1024 * 1024; // 25 MB
-const REQUEST_TIMEOUT = 60000;
 
 // Prompts specialized per document type
 const PROMPTS = {
@@ -110,68 +115,18 @@ Responde SOLO con un objeto JSON valido:
 }`,
 };
 
-async function streamDownload(url, maxBytes = MAX_DOWNLOAD_BYTES) {
-  const parsed = new URL(url);
-  if (!['http:', 'https:'].includes(parsed.protocol)) {
-    throw new Error('Only http/https URLs are allowed');
-  }
-  const controller = new AbortController();
-  const timeoutId = setTimeout(() => controller.abort(), REQUEST_TIMEOUT);
-  try {
-    const response = await fetch(url, { signal: controller.signal });
-    clearTimeout(timeoutId);
-    if (!response.ok) throw new Error(`Failed to fetch URL: ${response.statusText}`);
-    const contentType = response.headers.get('Content-Type') || '';
-    const contentLength = response.headers.get('Content-Length');
-    if (contentLength && parseInt(contentLength) > maxBytes) throw new Error('File too large');
-    const reader = response.body.getReader();
-    const chunks = [];
-    let totalBytes = 0;
-    while (true) {
-      const { done, value } = await reader.read();
-      if (done) break;
-      totalBytes += value.length;
-      if (totalBytes > maxBytes) throw new Error('File too large');
-      chunks.push(value);
-    }
-    const allBytes = new Uint8Array(totalBytes);
-    let offset = 0;
-    for (const chunk of chunks) {
-      allBytes.set(chunk, offset);
-      offset += chunk.length;
-    }
-    return { data: allBytes, contentType };
-  } catch (error) {
-    clearTimeout(timeoutId);
-    if (error.name === 'AbortError') throw new Error('Request timeout');
-    throw error;
-  }
-}
-
-function uint8ArrayToBase64(bytes) {
-  // Chunk to avoid "Maximum call stack size exceeded" on large files
-  const chunkSize = 0x8000;
-  let binary = '';
-  for (let i = 0; i < bytes.length; i += chunkSize) {
-    binary += String.fromCharCode(...bytes.subarray(i, i + chunkSize));
-  }
-  return btoa(binary);
-}
-
-async function extractFromImage(fileData, contentType, documentType) {
+async function extractFromImage(file, contentType, documentType) {
   if (!GEMINI_API_KEY) throw new Error('Gemini API not configured');
 
   const prompt = PROMPTS[documentType];
   if (!prompt) throw new Error(`Unknown document_type: ${documentType}`);
 
-  const base64 = uint8ArrayToBase64(fileData);
-
   console.log(`🤖 Extracting ${documentType} with Gemini Vision...`);
   const body = {
     contents: [{
       parts: [
         { text: prompt + '\n\nAnaliza este documento y extrae los datos en el formato JSON especificado.' },
-        { inlineData: { mimeType: contentType, data: base64 } },
+        { inlineData: { mimeType: contentType, data: INLINE_FILE } },
       ],
     }],
     generationConfig: {
@@ -181,10 +136,12 @@ async function extractFromImage(fileData, contentType, documentType) {
     },
   };
 
+  // The base64 image is streamed into the request body chunk by chunk
   const res = await fetch(GEMINI_URL, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(body),
+    body: jsonBodyWithInlineFile(body, file),
+    duplex: 'half',
   });
 
   if (!res.ok) {
@@ -226,9 +183,25 @@ export async function aiExtractExpenseHandler(req) {
 
     console.log(`📨 Extracting ${documentType} from ${fileUrl}`);
 
-    // Download file
-    const { data: fileData, contentType } = await streamDownload(fileUrl);
-    console.log(`✅ Downloaded ${fileData.length} bytes (${contentType})`);
+    // { async: true } → 202 { job_id }, resultado por /ai/job
+    return await respondSyncOrJob(payload, 'extract_expense', () => runExtractExpense(fileUrl, documentType), {
+      dedupeKey: `extract_expense:${documentType}:${fileUrl}`,
+    });
+  } catch (error) {
+    console.error('💥 Error in aiExtractExpense:', error);
+    return Response.json(
+      { error: error.message || 'AI extraction failed' },
+      { status: 500 }
+    );
+  }
+}
+
+async function runExtractExpense(fileUrl, documentType) {
+  try {
+    // Download file (streamed + hashed while it arrives)
+    const file = await fetchFile(fileUrl, { maxBytes: MAX_DOWNLOAD_BYTES });
+    const { contentType } = file;
+    console.log(`✅ Downloaded ${file.size} bytes (${contentType})`);
 
     // Only images supported for now (PDFs need conversion)
     if (!contentType.startsWith('image/')) {
@@ -238,8 +211,18 @@ export async function aiExtractExpenseHandler(req) {
       );
     }
 
-    const result = await extractFromImage(fileData, contentType, documentType);
-    return Response.json(result);
+    const key = aiCacheKey({
+      kind: 'extract_expense',
+      model: GEMINI_MODEL,
+      prompt: PROMPTS[documentType],
+      type: contentType,
+      file: file.sha256,
+    });
+    const { value, cached } = await withAiCache(key, { kind: 'extract_expense', model: GEMINI_MODEL }, () =>
+      extractFromImage(file, contentType, documentType)
+    );
+    if (cached) console.log(`♻️ ${documentType} desde caché (${cached})`);
+    return Response.json(value);
   } catch (error) {
     console.error('💥 Error in aiExtractExpense:', error);
     return Response.json(
@@ -0,0 +1,25 @@
+import { getAiJob } from './_aiJobs.js';
+
+/**
+ * Estado de un job de IA creado con { async: true }
+ * (/extract_file, /ai/extract-expense, /ai/invoke, /ai/gemini-summary).
+ * Body: { job_id, wait_ms? } — wait_ms > 0 espera (máx. 25s) a que termine.
+ * Respuesta: { job_id, kind, status: queued|running|done|error, result?, error? }
+ */
+export async function aiJobHandler(req) {
+  try {
+    const { job_id: jobId, wait_ms: waitMs = 0 } = await req.json().catch(() => ({}));
+    if (!jobId) {
+      return Response.json({ error: 'job_id is required' }, { status: 400 });
+    }
+
+    const job = await getAiJob(jobId, waitMs);
+    if (!job) {
+      return Response.json({ error: 'Job not found' }, { status: 404 });
+    }
+    return Response.json(job);
+  } catch (error) {
+    console.error('💥 Error in aiJob:', error);
+    return Response.json({ error: error.message }, { status: 500 });
+  }
+}
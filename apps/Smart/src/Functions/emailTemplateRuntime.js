@@ -79,195 +79,371 @@ function buildVariables(orderData = {}) {
   };
 }
 
-const _cache = {
-  templates: { data: null, ts: 0 },
-  business: { data: null, ts: 0 },
-};
-const CACHE_TTL_MS = 5 * 60 * 1000; // 5 minutes
-
-export async function sendTemplatedEmailWithBase44(base44, { event_type, order_data = {} }) {
-  const now = Date.now();
-
-  if (!_cache.templates.data || now - _cache.templates.ts > CACHE_TTL_MS) {
-    const [templateSettings, legacyTemplates] = await Promise.all([
-      base44.asServiceRole.entities.AppSettings.filter({ slug: EMAIL_TEMPLATES_SETTINGS_SLUG }).catch(() => []),
-      base44.asServiceRole.entities.EmailTemplate.filter({ enabled: true }).catch(() => [])
-    ]);
-    _cache.templates.data = { templateSettings, legacyTemplates };
-    _cache.templates.ts = now;
-  }
+// ── Compiled templates ───────────────────────────────────────────────
+// Each (tenant, event_type, version) is compiled once into a list of parts:
+// everything that depends only on the template and the tenant's branding /
+// business settings (header, hours, warranty, review, contact, footer) is
+// concatenated at compile time; render(order_data) only fills the per-order
+// pieces. version comes from email_template_version
+// (db/seeds/029_email_outbound_queue.sql), bumped by triggers on
+// email_template / app_settings, and is re-read at most every
+// EMAIL_TEMPLATE_VERSION_CHECK_MS.
 
-  const { templateSettings, legacyTemplates } = _cache.templates.data;
+const BUSINESS_SETTINGS_SLUG = "app-main-settings";
+const BRANDING_SETTINGS_SLUG = "business-branding";
+const VERSION_CHECK_MS = parseInt(Deno.env.get("EMAIL_TEMPLATE_VERSION_CHECK_MS") || "", 10) || 30000;
+const FALLBACK_TTL_MS = 5 * 60 * 1000; // without email_template_version (029 not applied)
+const PAYMENT_EVENT_TYPES = new Set(['deposit_received', 'payment_received', 'sale_completed', 'refund_processed']);
 
-  const configuredTemplates = Array.isArray(templateSettings?.[0]?.payload?.templates)
-    ? templateSettings[0].payload.templates
-    : [];
+// tenantKey ('' = no tenant) -> { version, checkedAt, config, compiled: Map<event_type, compiled | null> }
+const tenantCache = new Map();
+// tenantKey -> Promise: one version check / reload per tenant at a time
+const refreshing = new Map();
+let versionTableAvailable = true;
 
-  const matchingConfiguredTemplates = configuredTemplates.filter(
-    (template) => template?.event_type === event_type && template?.enabled !== false
-  );
+const stats = { version_checks: 0, loads: 0, compiles: 0, renders: 0 };
 
-  const matchingLegacy = legacyTemplates.filter((t) => t.event_type === event_type);
-  const templates = matchingConfiguredTemplates.length > 0 ? matchingConfiguredTemplates : matchingLegacy;
+/**
+ * html`...` → list of parts. Strings are joined at compile time, functions
+ * (ctx → string) run on every render, nested part lists are inlined.
+ */
+function html(strings, ...values) {
+  const parts = [];
+  const push = (value) => {
+    if (typeof value === "function") {
+      parts.push(value);
+    } else if (Array.isArray(value)) {
+      value.forEach(push);
+    } else if (typeof parts[parts.length - 1] === "string") {
+      parts[parts.length - 1] += String(value);
+    } else {
+      parts.push(String(value));
+    }
+  };
+  strings.forEach((s, i) => {
+    push(s);
+    if (i < values.length) push(values[i]);
+  });
+  return parts;
+}
 
-  if (!templates || templates.length === 0) {
-    return { success: false, message: `No hay plantilla activa para: ${event_type}` };
+/** interpolate() split at compile time: "Hola {{customer_name}}" → parts */
+function interp(text) {
+  if (typeof text !== "string") return [String(text)];
+  const parts = [];
+  let last = 0;
+  for (const match of text.matchAll(/{{\s*([^}]+)\s*}}/g)) {
+    if (match.index > last) parts.push(text.slice(last, match.index));
+    const key = match[1].trim();
+    parts.push(({ variables }) => {
+      const value = variables[key];
+      return value === undefined || value === null ? "" : String(value);
+    });
+    last = match.index + match[0].length;
   }
+  if (last < text.length) parts.push(text.slice(last));
+  return parts;
+}
 
-  const template = templates.find((t) => t.is_default) || templates[0];
+function render(parts, ctx) {
+  let out = "";
+  for (const part of parts) out += typeof part === "string" ? part : part(ctx);
+  return out;
+}
 
-  if (!_cache.business.data || now - _cache.business.ts > CACHE_TTL_MS) {
-    const [businessConfigs, brandingConfigs] = await Promise.all([
-      base44.asServiceRole.entities.AppSettings.filter({ slug: "app-main-settings" }),
-      base44.asServiceRole.entities.AppSettings.filter({ slug: "business-branding" })
-    ]);
-    _cache.business.data = { businessConfigs, brandingConfigs };
-    _cache.business.ts = now;
+function isMissingVersionTable(error) {
+  return error?.code === "PGRST202" || error?.code === "42P01" || error?.code === "42883";
+}
+
+async function readTemplateVersion(base44, tenantId, previous) {
+  if (!versionTableAvailable) return Math.floor(Date.now() / FALLBACK_TTL_MS);
+  stats.version_checks++;
+  try {
+    return Number(await base44.asServiceRole.rpc("email_template_version_get", { p_tenant_id: tenantId || null })) || 0;
+  } catch (error) {
+    if (isMissingVersionTable(error)) {
+      versionTableAvailable = false;
+      console.warn("⚠️ email_template_version_get no existe, plantillas con TTL de 5 min");
+      return Math.floor(Date.now() / FALLBACK_TTL_MS);
+    }
+    console.warn(`⚠️ email_template_version_get falló (${error?.message || error})`);
+    // Keep what is compiled; retry on the next check
+    return previous ? previous.version : -1;
   }
+}
 
-  const { businessConfigs, brandingConfigs } = _cache.business.data;
+// Own rows first, then global ones (tenant_id NULL). Without tenant
+// (single-tenant installs) any row, as before.
+function pickForTenant(rows, tenantId) {
+  return rows.find((r) => tenantId && r.tenant_id === tenantId)
+    || rows.find((r) => !r.tenant_id)
+    || (tenantId ? null : rows[0])
+    || null;
+}
 
-  const businessInfo = businessConfigs?.[0]?.payload || {};
-  const branding = brandingConfigs?.[0]?.payload || {};
-  // Logo unificado: usa solo el logo de Branding (no por plantilla)
-  const logoUrl = branding.logo_url || DEFAULT_LOGO_URL;
-  const alertColor = getAlertColorForStatus(event_type);
-  const variables = buildVariables(order_data);
-
-  // 💰 Bloque de "Monto a Pagar al Recoger" — se muestra en ready_for_pickup cuando hay balance o monto
-  const pickupAmountHTML = (() => {
-    if (event_type !== 'ready_for_pickup') return '';
-    const amountNum = parseFloat(variables.amount || '0') || 0;
-    const paidNum = parseFloat(variables.total_paid || '0') || 0;
-    const balanceNum = variables.balance !== ''
-      ? (parseFloat(variables.balance) || 0)
-      : Math.max(0, amountNum - paidNum);
-    if (!amountNum && !balanceNum && !paidNum) return '';
-    const isPaid = balanceNum <= 0.01;
-    const rows = [];
-    if (amountNum > 0) rows.push({ label: 'Total de la reparación', value: `$${amountNum.toFixed(2)}` });
-    if (paidNum > 0) rows.push({ label: 'Ya pagado', value: `$${paidNum.toFixed(2)}`, color: '#059669' });
-    rows.push({
-      label: isPaid ? 'Estado' : 'Balance a pagar al recoger',
-      value: isPaid ? '✅ Totalmente pagado' : `$${balanceNum.toFixed(2)}`,
-      highlight: true,
-      color: isPaid ? '#059669' : '#DC2626'
-    });
-    const rowsHTML = rows.map((row, idx) => {
-      const isLast = idx === rows.length - 1;
-      const valueColor = row.color || (row.highlight ? '#111827' : '#374151');
-      const valueFontWeight = row.highlight ? '800' : '600';
-      const valueFontSize = row.highlight ? '22px' : '16px';
-      return `<div style="display:flex;justify-content:space-between;align-items:center;padding:16px 22px;${isLast ? '' : 'border-bottom:1px solid #F3F4F6;'}">
+async function loadTemplateConfig(base44, tenantId) {
+  const scope = tenantId
+    ? { $or: [{ tenant_id: tenantId }, { tenant_id: { $exists: false } }] }
+    : {};
+  const [settings, legacyTemplates] = await Promise.all([
+    base44.asServiceRole.entities.AppSettings.filter({
+      slug: { $in: [EMAIL_TEMPLATES_SETTINGS_SLUG, BUSINESS_SETTINGS_SLUG, BRANDING_SETTINGS_SLUG] },
+      ...scope
+    }),
+    base44.asServiceRole.entities.EmailTemplate.filter({ enabled: true, ...scope }).catch(() => [])
+  ]);
+  const bySlug = (slug) => pickForTenant((settings || []).filter((s) => s.slug === slug), tenantId);
+
+  const configuredTemplates = bySlug(EMAIL_TEMPLATES_SETTINGS_SLUG)?.payload?.templates;
+  const ownLegacy = tenantId ? (legacyTemplates || []).filter((t) => t.tenant_id === tenantId) : [];
+  return {
+    configuredTemplates: Array.isArray(configuredTemplates) ? configuredTemplates : [],
+    legacyTemplates: ownLegacy.length > 0 ? ownLegacy : (legacyTemplates || []),
+    businessInfo: bySlug(BUSINESS_SETTINGS_SLUG)?.payload || {},
+    branding: bySlug(BRANDING_SETTINGS_SLUG)?.payload || {}
+  };
+}
+
+async function refreshTenant(base44, tenantId, key, previous) {
+  const version = await readTemplateVersion(base44, tenantId, previous);
+  if (previous && previous.version === version) {
+    previous.checkedAt = Date.now();
+    return previous;
+  }
+  const config = await loadTemplateConfig(base44, tenantId);
+  stats.loads++;
+  const state = { version, checkedAt: Date.now(), config, compiled: new Map() };
+  tenantCache.set(key, state);
+  return state;
+}
+
+function getTenantTemplates(base44, tenantId) {
+  const key = tenantId || "";
+  const state = tenantCache.get(key);
+  if (state && Date.now() - state.checkedAt < VERSION_CHECK_MS) return state;
+  if (!refreshing.has(key)) {
+    refreshing.set(key, refreshTenant(base44, tenantId, key, state).finally(() => refreshing.delete(key)));
+  }
+  return refreshing.get(key);
+}
+
+/**
+ * Drop the compiled templates of a tenant (or all) in this instance.
+ * Other instances pick the change up through email_template_version.
+ */
+export function invalidateEmailTemplates(tenantId = undefined) {
+  if (tenantId === undefined) tenantCache.clear();
+  else tenantCache.delete(tenantId || "");
+}
+
+export function getEmailTemplateStats() {
+  let compiled = 0;
+  for (const state of tenantCache.values()) compiled += state.compiled.size;
+  return { tenants: tenantCache.size, compiled, versioned: versionTableAvailable, ...stats };
+}
+
+function selectTemplate(config, event_type) {
+  const matchingConfiguredTemplates = config.configuredTemplates.filter(
+    (template) => template?.event_type === event_type && template?.enabled !== false
+  );
+  const matchingLegacy = config.legacyTemplates.filter((t) => t.event_type === event_type);
+  const templates = matchingConfiguredTemplates.length > 0 ? matchingConfiguredTemplates : matchingLegacy;
+  if (!templates || templates.length === 0) return null;
+  return templates.find((t) => t.is_default) || templates[0];
+}
+
+// 💰 Bloque de "Monto a Pagar al Recoger" — se muestra en ready_for_pickup cuando hay balance o monto
+function renderPickupAmount({ variables }) {
+  const amountNum = parseFloat(variables.amount || '0') || 0;
+  const paidNum = parseFloat(variables.total_paid || '0') || 0;
+  const balanceNum = variables.balance !== ''
+    ? (parseFloat(variables.balance) || 0)
+    : Math.max(0, amountNum - paidNum);
+  if (!amountNum && !balanceNum && !paidNum) return '';
+  const isPaid = balanceNum <= 0.01;
+  const rows = [];
+  if (amountNum > 0) rows.push({ label: 'Total de la reparación', value: `$${amountNum.toFixed(2)}` });
+  if (paidNum > 0) rows.push({ label: 'Ya pagado', value: `$${paidNum.toFixed(2)}`, color: '#059669' });
+  rows.push({
+    label: isPaid ? 'Estado' : 'Balance a pagar al recoger',
+    value: isPaid ? '✅ Totalmente pagado' : `$${balanceNum.toFixed(2)}`,
+    highlight: true,
+    color: isPaid ? '#059669' : '#DC2626'
+  });
+  const rowsHTML = rows.map((row, idx) => {
+    const isLast = idx === rows.length - 1;
+    const valueColor = row.color || (row.highlight ? '#111827' : '#374151');
+    const valueFontWeight = row.highlight ? '800' : '600';
+    const valueFontSize = row.highlight ? '22px' : '16px';
+    return `<div style="display:flex;justify-content:space-between;align-items:center;padding:16px 22px;${isLast ? '' : 'border-bottom:1px solid #F3F4F6;'}">
         <span style="color:#6B7280;font-size:14px;font-weight:600;">${row.label}</span>
         <span style="color:${valueColor};font-size:${valueFontSize};font-weight:${valueFontWeight};">${row.value}</span>
       </div>`;
-    }).join('');
-    const headerTitle = isPaid ? '✅ Tu orden está saldada' : '💰 Monto a Pagar al Recoger';
-    const headerColor = isPaid ? '#065F46' : '#92400E';
-    const bgGradient = isPaid
-      ? 'linear-gradient(135deg,#F0FDF4 0%,#ECFDF5 100%)'
-      : 'linear-gradient(135deg,#FFFBEB 0%,#FEF3C7 100%)';
-    const borderColor = isPaid ? '#10B981' : '#F59E0B';
-    return `
+  }).join('');
+  const headerTitle = isPaid ? '✅ Tu orden está saldada' : '💰 Monto a Pagar al Recoger';
+  const headerColor = isPaid ? '#065F46' : '#92400E';
+  const bgGradient = isPaid
+    ? 'linear-gradient(135deg,#F0FDF4 0%,#ECFDF5 100%)'
+    : 'linear-gradient(135deg,#FFFBEB 0%,#FEF3C7 100%)';
+  const borderColor = isPaid ? '#10B981' : '#F59E0B';
+  return `
     <div style="background:${bgGradient};border-radius:16px;padding:28px;margin:30px 0;border:2px solid ${borderColor};">
       <p style="font-size:20px;font-weight:800;color:${headerColor};margin:0 0 20px 0;text-align:center;">${headerTitle}</p>
       <div style="background:white;border-radius:12px;overflow:hidden;box-shadow:0 2px 8px rgba(0,0,0,0.06);">${rowsHTML}</div>
       ${!isPaid ? `<p style="color:#92400E;font-size:13px;text-align:center;margin:16px 0 0 0;font-style:italic;">Por favor trae este monto al momento de recoger tu equipo.</p>` : ''}
     </div>`;
-  })();
-
-  // Bloque de desglose financiero — solo para eventos de pago
-  const PAYMENT_EVENT_TYPES = new Set(['deposit_received', 'payment_received', 'sale_completed', 'refund_processed']);
-  const paymentSummaryHTML = PAYMENT_EVENT_TYPES.has(event_type) ? (() => {
-    const isRefund  = event_type === 'refund_processed';
-    const isSale    = event_type === 'sale_completed';
-    const isDeposit = event_type === 'deposit_received';
-    const titleMap  = {
-      deposit_received: '🧾 Resumen del Depósito',
-      payment_received: '🧾 Recibo de Pago',
-      sale_completed:   '🧾 Recibo de Venta',
-      refund_processed: '🧾 Detalle del Reembolso',
-    };
-    const rows = [
-      ...(isSale && variables.sale_number ? [{ label: 'Número de venta', value: variables.sale_number, bold: true }] : []),
-      ...(!isRefund && variables.amount    ? [{ label: isSale ? 'Total de la venta' : 'Total de la orden', value: `$${variables.amount}` }] : []),
-      ...(variables.total_paid             ? [{ label: isRefund ? 'Monto reembolsado' : isDeposit ? 'Depósito recibido' : 'Monto pagado', value: `$${variables.total_paid}`, highlight: true }] : []),
-      ...(!isRefund && !isSale && variables.balance !== undefined && variables.balance !== ''
-        ? [{ label: 'Balance pendiente', value: parseFloat(variables.balance) === 0 ? '✅ Saldado' : `$${variables.balance}`, balanceColor: parseFloat(variables.balance) === 0 ? '#059669' : '#DC2626' }]
-        : []),
-      ...(variables.payment_method ? [{ label: isRefund ? 'Método de reembolso' : 'Método de pago', value: variables.payment_method }] : []),
-    ];
-    if (rows.length === 0) return '';
-    const rowsHTML = rows.map((row, idx) => {
-      const isLast = idx === rows.length - 1;
-      const valueColor = row.balanceColor || (row.highlight ? '#059669' : row.bold ? '#111827' : '#374151');
-      const valueFontWeight = (row.highlight || row.bold) ? '800' : '600';
-      const valueFontSize   = (row.highlight || row.bold) ? '18px' : '15px';
-      return `<div style="display:flex;justify-content:space-between;align-items:center;padding:14px 20px;${isLast ? '' : 'border-bottom:1px solid #F3F4F6;'}">
+}
+
+// Bloque de desglose financiero — solo para eventos de pago
+function renderPaymentSummary(event_type, { variables }) {
+  const isRefund  = event_type === 'refund_processed';
+  const isSale    = event_type === 'sale_completed';
+  const isDeposit = event_type === 'deposit_received';
+  const titleMap  = {
+    deposit_received: '🧾 Resumen del Depósito',
+    payment_received: '🧾 Recibo de Pago',
+    sale_completed:   '🧾 Recibo de Venta',
+    refund_processed: '🧾 Detalle del Reembolso',
+  };
+  const rows = [
+    ...(isSale && variables.sale_number ? [{ label: 'Número de venta', value: variables.sale_number, bold: true }] : []),
+    ...(!isRefund && variables.amount    ? [{ label: isSale ? 'Total de la venta' : 'Total de la orden', value: `$${variables.amount}` }] : []),
+    ...(variables.total_paid             ? [{ label: isRefund ? 'Monto reembolsado' : isDeposit ? 'Depósito recibido' : 'Monto pagado', value: `$${variables.total_paid}`, highlight: true }] : []),
+    ...(!isRefund && !isSale && variables.balance !== undefined && variables.balance !== ''
+      ? [{ label: 'Balance pendiente', value: parseFloat(variables.balance) === 0 ? '✅ Saldado' : `$${variables.balance}`, balanceColor: parseFloat(variables.balance) === 0 ? '#059669' : '#DC2626' }]
+      : []),
+    ...(variables.payment_method ? [{ label: isRefund ? 'Método de reembolso' : 'Método de pago', value: variables.payment_method }] : []),
+  ];
+  if (rows.length === 0) return '';
+  const rowsHTML = rows.map((row, idx) => {
+    const isLast = idx === rows.length - 1;
+    const valueColor = row.balanceColor || (row.highlight ? '#059669' : row.bold ? '#111827' : '#374151');
+    const valueFontWeight = (row.highlight || row.bold) ? '800' : '600';
+    const valueFontSize   = (row.highlight || row.bold) ? '18px' : '15px';
+    return `<div style="display:flex;justify-content:space-between;align-items:center;padding:14px 20px;${isLast ? '' : 'border-bottom:1px solid #F3F4F6;'}">
         <span style="color:#6B7280;font-size:14px;font-weight:500;">${row.label}</span>
         <span style="color:${valueColor};font-size:${valueFontSize};font-weight:${valueFontWeight};">${row.value}</span>
       </div>`;
-    }).join('');
-    return `
+  }).join('');
+  return `
     <div style="background:linear-gradient(135deg,#F0FDF4 0%,#ECFDF5 100%);border-radius:16px;padding:28px;margin:30px 0;border:2px solid #10B981;">
       <p style="font-size:18px;font-weight:800;color:#065F46;margin:0 0 20px 0;text-align:center;">${titleMap[event_type]}</p>
       <div style="background:white;border-radius:12px;overflow:hidden;box-shadow:0 2px 8px rgba(0,0,0,0.06);">${rowsHTML}</div>
     </div>`;
-  })() : '';
+}
 
-  const nextStepsHTML = template.show_next_steps && template.next_steps_items?.length ? `
-    <div style="background: #F0F9FF; border-radius: 16px; padding: 24px; margin: 30px 0; border: 2px solid #BFDBFE;">
-      <h3 style="color: #1E40AF; font-size: 18px; font-weight: 800; margin: 0 0 16px 0;">🔄 Próximos Pasos</h3>
-      <ol style="margin: 0; padding-left: 20px; color: #1E3A8A; font-size: 15px; line-height: 1.8;">
-        ${template.next_steps_items.map((step) => `<li style="margin: 8px 0;">${interpolate(step, variables)}</li>`).join("")}
-      </ol>
+// Condiciones Verificadas — siempre se muestra si show_checklist está activado
+function renderChecklist({ variables, order_data }) {
+  if (order_data.checklist_items?.length) {
+    return `
+    <div style="background: #F0F9FF; border-radius: 16px; padding: 28px; margin: 35px 0; border: 2px solid #0EA5E9;">
+      <p style="font-size: 20px; font-weight: 800; color: #075985; margin: 0 0 20px 0; text-align: center;">✅ Condiciones Verificadas</p>
+      <div style="background: white; border-radius: 12px; padding: 20px;">
+        <div style="display: grid; gap: 12px;">
+          ${order_data.checklist_items.map((item) => {
+            const label = typeof item === "string" ? item : item?.label || "";
+            return `<div style="display: flex; align-items: center; gap: 10px; padding: 12px; background: #ECFEFF; border-radius: 8px;">
+              <span style="color: #10B981; font-size: 20px; font-weight: bold;">✓</span>
+              <span style="color: #0E7490; font-weight: 600;">${interpolate(label, variables)}</span>
+            </div>`;
+          }).join("")}
+        </div>
+      </div>
+      <p style="color: #0369A1; font-size: 13px; text-align: center; margin: 16px 0 0 0; font-style: italic;">* Verificación realizada al recibir tu equipo</p>
     </div>
-  ` : "";
+  `;
+  }
+  // Sección genérica cuando la orden no tiene items específicos
+  return `
+    <div style="background: #F0F9FF; border-radius: 16px; padding: 28px; margin: 35px 0; border: 2px solid #0EA5E9;">
+      <p style="font-size: 20px; font-weight: 800; color: #075985; margin: 0 0 16px 0; text-align: center;">✅ Condiciones Verificadas</p>
+      <p style="color: #0369A1; font-size: 14px; text-align: center; margin: 0; font-style: italic;">Las condiciones del equipo han sido verificadas por nuestro equipo técnico al momento de la recepción.</p>
+    </div>
+  `;
+}
+
+function renderPhotos({ order_data }) {
+  if (!order_data.photos_metadata?.length) return "";
+  return `
+    <div style="background: #F5F3FF; border-radius: 16px; padding: 28px; margin: 35px 0; border: 2px solid #A78BFA;">
+      <p style="font-size: 20px; font-weight: 800; color: #5B21B6; margin: 0 0 20px 0; text-align: center;">📸 Fotos del Equipo</p>
+      <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); gap: 12px;">
+        ${order_data.photos_metadata.filter((p) => p.visible_to_customer !== false).slice(0, 6).map((photo) => `
+          <div style="aspect-ratio: 1; border-radius: 12px; overflow: hidden; background: #EDE9FE;">
+            <img src="${photo.thumbUrl || photo.publicUrl || photo.url}" alt="Foto del equipo" style="width: 100%; height: 100%; object-fit: cover;" />
+          </div>
+        `).join("")}
+      </div>
+    </div>
+  `;
+}
 
-  // Horario de Recogida — usa custom_hours de la plantilla o el horario del negocio
-  const hoursHTML = (() => {
-    if (!template.show_hours) return "";
-    if (template.custom_hours) {
-      return `
+// Horario de Recogida — usa custom_hours de la plantilla o el horario del negocio
+function buildHoursHTML(template, businessInfo) {
+  if (!template.show_hours) return "";
+  if (template.custom_hours) {
+    return `
     <div style="background: #ECFDF5; border-radius: 16px; padding: 28px; margin: 35px 0; text-align: center; border: 2px solid #10B981;">
       <p style="font-size: 20px; font-weight: 800; color: #065F46; margin: 0 0 16px 0;">🕐 Horario de Recogida</p>
       <p style="color: #047857; font-size: 16px; font-weight: 600; margin: 0; line-height: 1.6; white-space: pre-line;">${template.custom_hours}</p>
     </div>
   `;
-    }
-    const days = [
-      { key: "hours_monday", label: "Lunes" },
-      { key: "hours_tuesday", label: "Martes" },
-      { key: "hours_wednesday", label: "Miércoles" },
-      { key: "hours_thursday", label: "Jueves" },
-      { key: "hours_friday", label: "Viernes" },
-      { key: "hours_saturday", label: "Sábado" },
-      { key: "hours_sunday", label: "Domingo" }
-    ];
-    const hasSpecificHours = days.some((d) => businessInfo[d.key]);
-    if (!hasSpecificHours) {
-      return `
+  }
+  const days = [
+    { key: "hours_monday", label: "Lunes" },
+    { key: "hours_tuesday", label: "Martes" },
+    { key: "hours_wednesday", label: "Miércoles" },
+    { key: "hours_thursday", label: "Jueves" },
+    { key: "hours_friday", label: "Viernes" },
+    { key: "hours_saturday", label: "Sábado" },
+    { key: "hours_sunday", label: "Domingo" }
+  ];
+  const hasSpecificHours = days.some((d) => businessInfo[d.key]);
+  if (!hasSpecificHours) {
+    return `
     <div style="background: #ECFDF5; border-radius: 16px; padding: 28px; margin: 35px 0; text-align: center; border: 2px solid #10B981;">
       <p style="font-size: 20px; font-weight: 800; color: #065F46; margin: 0 0 16px 0;">🕐 Horario de Recogida</p>
       <p style="color: #047857; font-size: 18px; font-weight: 700; margin: 0;">${businessInfo.hours_weekdays || "9:00 AM - 5:00 PM"}</p>
     </div>
   `;
-    }
-    const hoursLines = days
-      .filter((d) => businessInfo[d.key])
-      .map((d) => `<div style="display: flex; justify-content: space-between; padding: 8px 0; border-bottom: 1px solid rgba(5,150,105,0.1);"><span style="font-weight: 600; color: #047857;">${d.label}:</span><span style="color: #065F46;">${businessInfo[d.key]}</span></div>`)
-      .join("");
-    return `
+  }
+  const hoursLines = days
+    .filter((d) => businessInfo[d.key])
+    .map((d) => `<div style="display: flex; justify-content: space-between; padding: 8px 0; border-bottom: 1px solid rgba(5,150,105,0.1);"><span style="font-weight: 600; color: #047857;">${d.label}:</span><span style="color: #065F46;">${businessInfo[d.key]}</span></div>`)
+    .join("");
+  return `
     <div style="background: #ECFDF5; border-radius: 16px; padding: 28px; margin: 35px 0; border: 2px solid #10B981;">
       <p style="font-size: 20px; font-weight: 800; color: #065F46; margin: 0 0 20px 0; text-align: center;">🕐 Horario de Recogida</p>
       <div style="max-width: 400px; margin: 0 auto;">${hoursLines}</div>
     </div>
   `;
-  })();
+}
+
+/**
+ * Compile one template with the tenant's branding/business settings.
+ * @returns {{ template, html: Array, subject: Array, adminEmail: string|null, toCustomer: boolean }}
+ */
+function compileTemplate(template, event_type, { businessInfo, branding }) {
+  // Logo unificado: usa solo el logo de Branding (no por plantilla)
+  const logoUrl = branding.logo_url || DEFAULT_LOGO_URL;
+  const alertColor = getAlertColorForStatus(event_type);
+
+  const pickupAmountHTML = event_type === 'ready_for_pickup' ? renderPickupAmount : '';
+  const paymentSummaryHTML = PAYMENT_EVENT_TYPES.has(event_type) ? (ctx) => renderPaymentSummary(event_type, ctx) : '';
+
+  const nextStepsHTML = template.show_next_steps && template.next_steps_items?.length ? html`
+    <div style="background: #F0F9FF; border-radius: 16px; padding: 24px; margin: 30px 0; border: 2px solid #BFDBFE;">
+      <h3 style="color: #1E40AF; font-size: 18px; font-weight: 800; margin: 0 0 16px 0;">🔄 Próximos Pasos</h3>
+      <ol style="margin: 0; padding-left: 20px; color: #1E3A8A; font-size: 15px; line-height: 1.8;">
+        ${template.next_steps_items.map((step) => html`<li style="margin: 8px 0;">${interp(step)}</li>`)}
+      </ol>
+    </div>
+  ` : "";
+
+  const hoursHTML = buildHoursHTML(template, businessInfo);
 
   const warrantyText = template.custom_warranty || (template.warranty_type === "sales" ? branding.warranty_sales : branding.warranty_repairs);
-  const warrantyHTML = template.show_warranty && warrantyText ? `
+  const warrantyHTML = template.show_warranty && warrantyText ? html`
     <div style="background: #EFF6FF; border-radius: 16px; padding: 28px; margin: 35px 0; border: 2px solid #3B82F6;">
       <div style="text-align: center; margin-bottom: 20px;">
         <div style="display: inline-block; background: linear-gradient(135deg, #3B82F6, #1D4ED8); padding: 12px 24px; border-radius: 12px;">
@@ -275,7 +451,7 @@ export async function sendTemplatedEmailWithBase44(base44, { event_type, order_d
         </div>
       </div>
       <p style="color: #1E40AF; font-size: 15px; line-height: 1.8; margin: 0; text-align: center; font-weight: 500;">
-        ${interpolate(warrantyText, variables)}
+        ${interp(warrantyText)}
       </p>
     </div>
   ` : "";
@@ -302,51 +478,10 @@ export async function sendTemplatedEmailWithBase44(base44, { event_type, order_d
     </div>
   `;
 
-  // Condiciones Verificadas — siempre se muestra si show_checklist está activado
-  const checklistHTML = (() => {
-    if (!template.show_checklist) return "";
-    if (order_data.checklist_items?.length) {
-      return `
-    <div style="background: #F0F9FF; border-radius: 16px; padding: 28px; margin: 35px 0; border: 2px solid #0EA5E9;">
-      <p style="font-size: 20px; font-weight: 800; color: #075985; margin: 0 0 20px 0; text-align: center;">✅ Condiciones Verificadas</p>
-      <div style="background: white; border-radius: 12px; padding: 20px;">
-        <div style="display: grid; gap: 12px;">
-          ${order_data.checklist_items.map((item) => {
-            const label = typeof item === "string" ? item : item?.label || "";
-            return `<div style="display: flex; align-items: center; gap: 10px; padding: 12px; background: #ECFEFF; border-radius: 8px;">
-              <span style="color: #10B981; font-size: 20px; font-weight: bold;">✓</span>
-              <span style="color: #0E7490; font-weight: 600;">${interpolate(label, variables)}</span>
-            </div>`;
-          }).join("")}
-        </div>
-      </div>
-      <p style="color: #0369A1; font-size: 13px; text-align: center; margin: 16px 0 0 0; font-style: italic;">* Verificación realizada al recibir tu equipo</p>
-    </div>
-  `;
-    }
-    // Sección genérica cuando la orden no tiene items específicos
-    return `
-    <div style="background: #F0F9FF; border-radius: 16px; padding: 28px; margin: 35px 0; border: 2px solid #0EA5E9;">
-      <p style="font-size: 20px; font-weight: 800; color: #075985; margin: 0 0 16px 0; text-align: center;">✅ Condiciones Verificadas</p>
-      <p style="color: #0369A1; font-size: 14px; text-align: center; margin: 0; font-style: italic;">Las condiciones del equipo han sido verificadas por nuestro equipo técnico al momento de la recepción.</p>
-    </div>
-  `;
-  })();
-
-  const photosHTML = template.show_photos && order_data.photos_metadata?.length ? `
-    <div style="background: #F5F3FF; border-radius: 16px; padding: 28px; margin: 35px 0; border: 2px solid #A78BFA;">
-      <p style="font-size: 20px; font-weight: 800; color: #5B21B6; margin: 0 0 20px 0; text-align: center;">📸 Fotos del Equipo</p>
-      <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); gap: 12px;">
-        ${order_data.photos_metadata.filter((p) => p.visible_to_customer !== false).slice(0, 6).map((photo) => `
-          <div style="aspect-ratio: 1; border-radius: 12px; overflow: hidden; background: #EDE9FE;">
-            <img src="${photo.thumbUrl || photo.publicUrl || photo.url}" alt="Foto del equipo" style="width: 100%; height: 100%; object-fit: cover;" />
-          </div>
-        `).join("")}
-      </div>
-    </div>
-  ` : "";
+  const checklistHTML = template.show_checklist ? renderChecklist : "";
+  const photosHTML = template.show_photos ? renderPhotos : "";
 
-  const emailHTML = `
+  const emailHTML = html`
     <!DOCTYPE html>
     <html lang="es">
     <head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0"></head>
@@ -354,23 +489,23 @@ export async function sendTemplatedEmailWithBase44(base44, { event_type, order_d
       <div style="font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; max-width: 650px; margin: 0 auto; background: #ffffff;">
         <div style="background: ${getHeaderGradient(event_type)}; padding: 60px 30px; text-align: center; border-radius: 20px 20px 0 0;">
           <img src="${logoUrl}" alt="${businessInfo.business_name || 'Archilla OS'}" style="height: 120px; width: auto; margin: 0 auto; display: block;" />
-          <h1 style="color: white; margin: 20px 0 0 0; font-size: 32px; font-weight: 800;">${interpolate(template.header_title, variables)}</h1>
-          <p style="color: rgba(255,255,255,0.98); margin: 12px 0 0 0; font-size: 18px; font-weight: 600;">${interpolate(template.header_subtitle || "", variables)}</p>
+          <h1 style="color: white; margin: 20px 0 0 0; font-size: 32px; font-weight: 800;">${interp(template.header_title)}</h1>
+          <p style="color: rgba(255,255,255,0.98); margin: 12px 0 0 0; font-size: 18px; font-weight: 600;">${interp(template.header_subtitle || "")}</p>
         </div>
         <div style="background: white; padding: 50px 40px; border-radius: 0 0 20px 20px;">
-          <p style="font-size: 20px; color: #111827; margin: 0 0 30px 0; font-weight: 600;">Hola <strong>${variables.customer_name}</strong> 👋</p>
+          <p style="font-size: 20px; color: #111827; margin: 0 0 30px 0; font-weight: 600;">Hola <strong>${({ variables }) => variables.customer_name}</strong> 👋</p>
           <div style="border-radius: 16px; padding: 24px; margin: 30px 0; border-left: 6px solid; background: ${alertColor.bg}; border-left-color: ${alertColor.border};">
-            <p style="margin: 0; color: ${alertColor.title}; font-size: 22px; font-weight: 800;">${interpolate(template.alert_title, variables)}</p>
-            <p style="margin: 12px 0 0 0; color: ${alertColor.text}; font-size: 16px; line-height: 1.6;">${interpolate(template.alert_message, variables)}</p>
+            <p style="margin: 0; color: ${alertColor.title}; font-size: 22px; font-weight: 800;">${interp(template.alert_title)}</p>
+            <p style="margin: 12px 0 0 0; color: ${alertColor.text}; font-size: 16px; line-height: 1.6;">${interp(template.alert_message)}</p>
           </div>
           <div style="background: #F9FAFB; border-radius: 16px; padding: 28px; margin: 30px 0; border: 2px solid #E5E7EB;">
-            ${variables.order_number ? `<div style="margin-bottom: 24px;"><p style="color: #6B7280; font-size: 12px; font-weight: 700; margin: 0 0 6px 0;">ORDEN</p><p style="color: #111827; font-size: 24px; font-weight: 800; margin: 0;">${variables.order_number}</p></div>` : ""}
-            ${variables.device_info ? `<div><p style="color: #6B7280; font-size: 12px; font-weight: 700; margin: 0 0 6px 0;">EQUIPO</p><p style="color: #111827; font-size: 18px; font-weight: 600; margin: 0;">${variables.device_info}</p></div>` : ""}
+            ${({ variables }) => variables.order_number ? `<div style="margin-bottom: 24px;"><p style="color: #6B7280; font-size: 12px; font-weight: 700; margin: 0 0 6px 0;">ORDEN</p><p style="color: #111827; font-size: 24px; font-weight: 800; margin: 0;">${variables.order_number}</p></div>` : ""}
+            ${({ variables }) => variables.device_info ? `<div><p style="color: #6B7280; font-size: 12px; font-weight: 700; margin: 0 0 6px 0;">EQUIPO</p><p style="color: #111827; font-size: 18px; font-weight: 600; margin: 0;">${variables.device_info}</p></div>` : ""}
           </div>
           ${pickupAmountHTML}
           ${paymentSummaryHTML}
           ${nextStepsHTML}${hoursHTML}${checklistHTML}${photosHTML}${warrantyHTML}${reviewHTML}
-          ${template.main_message ? `<p style="color: #374151; line-height: 1.8; font-size: 16px; margin: 20px 0;">${interpolate(template.main_message, variables)}</p>` : ""}
+          ${template.main_message ? html`<p style="color: #374151; line-height: 1.8; font-size: 16px; margin: 20px 0;">${interp(template.main_message)}</p>` : ""}
           ${contactHTML}
           <div style="margin-top: 50px; padding-top: 30px; border-top: 2px solid #E5E7EB; text-align: center;">
             <img src="${logoUrl}" alt="${businessInfo.business_name || 'Archilla OS'}" style="height: 60px; width: auto; margin: 0 auto 20px; opacity: 0.7;" />
@@ -384,17 +519,76 @@ export async function sendTemplatedEmailWithBase44(base44, { event_type, order_d
     </html>
   `;
 
-  const subjectBase = interpolate(template.header_title || template.name || "Actualización de tu orden", variables);
-  const subject = variables.order_number ? `${subjectBase} - ${variables.order_number}` : subjectBase;
+  stats.compiles++;
+  return {
+    template,
+    html: emailHTML,
+    subject: interp(template.header_title || template.name || "Actualización de tu orden"),
+    toCustomer: template.send_to === "customer" || template.send_to === "both",
+    adminEmail: template.send_to === "admin" || template.send_to === "both"
+      ? businessInfo.business_email || "admin@archillaos.com"
+      : null
+  };
+}
 
-  const recipients = [];
-  if (template.send_to === "customer" || template.send_to === "both") {
-    if (order_data.customer_email) recipients.push(order_data.customer_email);
+/**
+ * Render the email of `event_type` for one order with the tenant's compiled
+ * template (compiled on first use, recompiled when the version changes).
+ * @returns {Promise<{ success: true, template_used, template_id, subject, html, recipients: string[] } | { success: false, message }>}
+ */
+export async function renderTemplatedEmail(base44, { event_type, order_data = {}, tenant_id = null }) {
+  const tenantId = tenant_id || order_data.tenant_id || null;
+  const state = await getTenantTemplates(base44, tenantId);
+
+  let compiled = state.compiled.get(event_type);
+  if (compiled === undefined) {
+    const template = selectTemplate(state.config, event_type);
+    compiled = template ? compileTemplate(template, event_type, state.config) : null;
+    state.compiled.set(event_type, compiled);
   }
-  if (template.send_to === "admin" || template.send_to === "both") {
-    recipients.push(businessInfo.business_email || "admin@archillaos.com");
+  if (!compiled) {
+    return { success: false, message: `No hay plantilla activa para: ${event_type}` };
   }
 
+  const ctx = { variables: buildVariables(order_data), order_data };
+  const subjectBase = render(compiled.subject, ctx);
+  const recipients = [];
+  if (compiled.toCustomer && order_data.customer_email) recipients.push(order_data.customer_email);
+  if (compiled.adminEmail) recipients.push(compiled.adminEmail);
+  stats.renders++;
+
+  return {
+    success: true,
+    template_used: compiled.template.name,
+    template_id: compiled.template.id,
+    subject: ctx.variables.order_number ? `${subjectBase} - ${ctx.variables.order_number}` : subjectBase,
+    html: render(compiled.html, ctx),
+    recipients
+  };
+}
+
+/**
+ * Render and queue the email of `event_type` (see _emailQueue.js).
+ * @returns {Promise<Array<object>>} queue messages (empty when there is no template or recipient)
+ */
+export async function buildTemplatedEmailMessages(base44, { event_type, order_data = {}, tenant_id = null }) {
+  const rendered = await renderTemplatedEmail(base44, { event_type, order_data, tenant_id });
+  if (!rendered.success) return [];
+  return rendered.recipients.map((to) => ({
+    to,
+    subject: rendered.subject,
+    html: rendered.html,
+    tenant_id: tenant_id || order_data.tenant_id || null,
+    meta: { event_type, template_id: rendered.template_id, order_number: order_data.order_number || null }
+  }));
+}
+
+export async function sendTemplatedEmailWithBase44(base44, { event_type, order_data = {}, tenant_id = null }) {
+  const rendered = await renderTemplatedEmail(base44, { event_type, order_data, tenant_id });
+  if (!rendered.success) return rendered;
+
+  const { subject, html: emailHTML, recipients } = rendered;
+  const tenantId = tenant_id || order_data.tenant_id || null;
   const results = [];
   for (const recipient of recipients) {
     try {
@@ -410,12 +604,13 @@ export async function sendTemplatedEmailWithBase44(base44, { event_type, order_d
         body_html: emailHTML,
         status: "sent",
         sent_at: new Date().toISOString(),
-        metadata: { event_type, template_id: template.id, order_number: order_data.order_number || null }
+        ...(tenantId ? { tenant_id: tenantId } : {}),
+        metadata: { event_type, template_id: rendered.template_id, order_number: order_data.order_number || null }
       });
     } catch (error) {
       results.push({ recipient, success: false, error: error.message });
     }
   }
 
-  return { success: true, template_used: template.name, subject, results };
+  return { success: true, template_used: rendered.template_used, subject, results };
 }
@@ -1,14 +1,18 @@
 import OpenAI from 'npm:openai@^4.0.0';
+import { aiCacheKey, fetchFile, fileToBase64, fileToBlob, withAiCache } from './_aiCache.js';
+import { respondSyncOrJob } from './_aiJobs.js';
 
 const openai_api_key = Deno.env.get('OPENAI_API_KEY');
 if (!openai_api_key) {
   console.warn('⚠️ Warning: OPENAI_API_KEY not found in environment variables');
 }
 
-const openai = openai_api_key ? new OpenAI({ apiKey: openai_api_key }) : null;
+// OPENAI_BASE_URL apunta a un servidor stub local en pruebas
+const OPENAI_BASE_URL = (Deno.env.get('OPENAI_BASE_URL') || 'https://api.openai.com/v1').replace(/\/$/, '');
+const openai = openai_api_key ? new OpenAI({ apiKey: openai_api_key, baseURL: OPENAI_BASE_URL }) : null;
 
+const OCR_MODEL = 'gpt-4o';
 const MAX_DOWNLOAD_BYTES = 100 * 1024 * 1024; // 100 MB
-const REQUEST_TIMEOUT = 60000; // 60 seconds
 
 /**
  * Extract file extension from URL
@@ -40,90 +44,12 @@ function safeExtFromMime(mime, defaultExt = '.pdf') {
   return mimeMap[baseMime] || defaultExt;
 }
 
-/**
- * Stream download with size limit
- */
-async function streamDownload(url, maxBytes = MAX_DOWNLOAD_BYTES) {
-  const parsed = new URL(url);
-  if (!['http:', 'https:'].includes(parsed.protocol)) {
-    throw new Error('Only http/https URLs are allowed');
-  }
-
-  const controller = new AbortController();
-  const timeoutId = setTimeout(() => controller.abort(), REQUEST_TIMEOUT);
-
-  try {
-    const response = await fetch(url, {
-      signal: controller.signal,
-      headers: {
-        'Accept': 'application/pdf,image/*,application/octet-stream'
-      }
-    });
-
-    clearTimeout(timeoutId);
-
-    if (!response.ok) {
-      throw new Error(`Failed to fetch URL: ${response.statusText}`);
-    }
-
-    const contentType = response.headers.get('Content-Type') || '';
-    const contentLength = response.headers.get('Content-Length');
-
-    if (contentLength && parseInt(contentLength) > maxBytes) {
-      throw new Error('Remote file too large');
-    }
-
-    const reader = response.body.getReader();
-    const chunks = [];
-    let totalBytes = 0;
-
-    while (true) {
-      const { done, value } = await reader.read();
-      if (done) break;
-
-      totalBytes += value.length;
-      if (totalBytes > maxBytes) {
-        throw new Error('Remote file too large');
-      }
-
-      chunks.push(value);
-    }
-
-    // Combine chunks into a single Uint8Array
-    const allBytes = new Uint8Array(totalBytes);
-    let offset = 0;
-    for (const chunk of chunks) {
-      allBytes.set(chunk, offset);
-      offset += chunk.length;
-    }
-
-    return {
-      data: allBytes,
-      contentType
-    };
-  } catch (error) {
-    clearTimeout(timeoutId);
-    if (error.name === 'AbortError') {
-      throw new Error('Request timeout');
-    }
-    throw error;
-  }
-}
-
-/**
- * Convert Uint8Array to base64 string (Deno-compatible)
- */
-function uint8ArrayToBase64(bytes) {
-  // Convert to base64 using Deno's built-in encoder
-  return btoa(String.fromCharCode(...bytes));
-}
-
 /**
  * Extract text from PDF/image using OpenAI API
  * For images: Uses Vision API
  * For PDFs: Uses file upload + Assistants API or falls back to URL if publicly accessible
  */
-async function extractTextWithOpenAI(fileUrl, fileData = null, contentType = 'application/pdf') {
+async function extractTextWithOpenAI(fileUrl, file = null, contentType = 'application/pdf') {
   if (!openai) {
     throw new Error('OpenAI API not configured');
   }
@@ -142,10 +68,9 @@ async function extractTextWithOpenAI(fileUrl, fileData = null, contentType = 'ap
     // For PDFs, if URL is publicly accessible, use it directly
     // Otherwise, we'd need to upload first (simplified approach: use URL if available)
     
-    if (isImage && fileData) {
+    if (isImage && file) {
       // For images, create a data URL
-      const base64 = uint8ArrayToBase64(fileData);
-      contentUrl = `data:${contentType};base64,${base64}`;
+      contentUrl = `data:${contentType};base64,${fileToBase64(file)}`;
     } else if (isPdf) {
       // For PDFs, OpenAI Vision API doesn't support PDFs directly
       // We'll use a workaround: use the URL if it's accessible, or upload the file
@@ -163,17 +88,17 @@ async function extractTextWithOpenAI(fileUrl, fileData = null, contentType = 'ap
       // Then use it with the Assistants API or chat completion
       let fileId = null;
       
-      if (fileData) {
-        // Upload file data as a file
-        const blob = new Blob([fileData], { type: 'application/pdf' });
-        const file = new File([blob], 'document.pdf', { type: 'application/pdf' });
+      if (file) {
+        // Upload the downloaded chunks as a file (no concatenated copy)
+        const blob = fileToBlob(file, 'application/pdf');
+        const upload = new File([blob], 'document.pdf', { type: 'application/pdf' });
         
         const formData = new FormData();
-        formData.append('file', file);
+        formData.append('file', upload);
         formData.append('purpose', 'vision');
         
         // Use OpenAI's file upload endpoint
-        const uploadResponse = await fetch('https://api.openai.com/v1/files', {
+        const uploadResponse = await fetch(`${OPENAI_BASE_URL}/files`, {
           method: 'POST',
           headers: {
             'Authorization': `Bearer ${openai_api_key}`
@@ -198,7 +123,7 @@ async function extractTextWithOpenAI(fileUrl, fileData = null, contentType = 'ap
         console.log('📄 Using URL-based approach for PDF (limited functionality)');
         
         const response = await openai.chat.completions.create({
-          model: 'gpt-4o',
+          model: OCR_MODEL,
           messages: [
             {
               role: 'system',
@@ -242,7 +167,7 @@ async function extractTextWithOpenAI(fileUrl, fileData = null, contentType = 'ap
     
     // For images, use Vision API directly
     const response = await openai.chat.completions.create({
-      model: 'gpt-4o',
+      model: OCR_MODEL,
       messages: [
         {
           role: 'system',
@@ -323,13 +248,31 @@ export async function extractFileHandler(req) {
       );
     }
 
-    // Download file if it's a URL
+    // { async: true } → 202 { job_id }, resultado por /ai/job
+    return await respondSyncOrJob(payload, 'extract_file', () => runExtractFile(fileUrl), {
+      dedupeKey: `extract_file:${fileUrl}`,
+    });
+  } catch (error) {
+    console.error('💥 Error in extract_file:', error);
+    return Response.json(
+      { error: error.message || 'OCR extraction failed' },
+      { status: 500 }
+    );
+  }
+}
+
+async function runExtractFile(fileUrl) {
+  try {
+    // Download file (streamed + hashed while it arrives)
     console.log('⬇️ Downloading file from URL...');
-    const { data: fileData, contentType } = await streamDownload(fileUrl);
-    console.log(`✅ Downloaded ${fileData.length} bytes`);
+    const file = await fetchFile(fileUrl, {
+      maxBytes: MAX_DOWNLOAD_BYTES,
+      accept: 'application/pdf,image/*,application/octet-stream',
+    });
+    console.log(`✅ Downloaded ${file.size} bytes`);
 
     // Determine file type
-    const mimeType = contentType || 'application/pdf';
+    const mimeType = file.contentType || 'application/pdf';
     const isPdf = mimeType.includes('pdf') || fileUrl.toLowerCase().endsWith('.pdf');
     const isImage = mimeType.startsWith('image/');
 
@@ -337,12 +280,15 @@ export async function extractFileHandler(req) {
       console.warn(`⚠️ Unsupported file type: ${mimeType}`);
     }
 
-    // Extract text using OpenAI Vision API
+    // Same bytes → same OCR result, whatever URL they were uploaded under
+    const key = aiCacheKey({ kind: 'extract_file', model: OCR_MODEL, type: isPdf ? 'pdf' : mimeType, file: file.sha256 });
     console.log('🔄 Running OCR extraction...');
-    const result = await extractTextWithOpenAI(fileUrl, fileData, mimeType);
-    console.log('✅ OCR extraction completed');
+    const { value, cached } = await withAiCache(key, { kind: 'extract_file', model: OCR_MODEL }, () =>
+      extractTextWithOpenAI(fileUrl, file, mimeType)
+    );
+    console.log(cached ? `♻️ OCR desde caché (${cached})` : '✅ OCR extraction completed');
 
-    return Response.json(result);
+    return Response.json({ ...value, _metadata: { ...value._metadata, file_path: fileUrl } });
   } catch (error) {
     console.error('💥 Error in extract_file:', error);
     return Response.json(
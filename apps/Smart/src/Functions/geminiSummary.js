@@ -1,11 +1,31 @@
+import { aiCacheKey, withAiCache } from './_aiCache.js';
+import { respondSyncOrJob } from './_aiJobs.js';
+
 const GEMINI_API_KEY = Deno.env.get('GEMINI_API_KEY');
-const GEMINI_URL = `https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key=${GEMINI_API_KEY}`;
+const GEMINI_MODEL = 'gemini-1.5-flash';
+// GEMINI_API_BASE_URL apunta a un servidor stub local en pruebas
+const GEMINI_API_BASE = (Deno.env.get('GEMINI_API_BASE_URL') || 'https://generativelanguage.googleapis.com').replace(/\/$/, '');
+const GEMINI_URL = `${GEMINI_API_BASE}/v1beta/models/${GEMINI_MODEL}:generateContent?key=${GEMINI_API_KEY}`;
+// Mismos datos del período → mismo resumen; expira antes que la caché de archivos
+const SUMMARY_CACHE_TTL_MS = 60 * 60 * 1000;
 
 export async function geminiSummaryHandler(req) {
   if (!GEMINI_API_KEY) {
     return Response.json({ error: 'GEMINI_API_KEY not configured' }, { status: 500 });
   }
 
+  try {
+    const payload = await req.json();
+    return await respondSyncOrJob(payload, 'gemini_summary', () => runSummary(payload), {
+      dedupeKey: `gemini_summary:${aiCacheKey({ ...payload, async: undefined })}`,
+    });
+  } catch (error) {
+    console.error('geminiSummary error:', error);
+    return Response.json({ error: error.message }, { status: 500 });
+  }
+}
+
+async function runSummary(payload) {
   try {
     const {
       totalIncome = 0,
@@ -16,7 +36,7 @@ export async function geminiSummaryHandler(req) {
       topCategories = [],
       paymentBreakdown = [],
       avgTicket = 0,
-    } = await req.json();
+    } = payload;
 
     const prompt = `
 Eres el asistente financiero de Archilla OS, un sistema para talleres de reparación.
@@ -50,24 +70,27 @@ Sé breve y directo. Máximo 120 palabras en total.
       }
     };
 
-    const res = await fetch(GEMINI_URL, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(body),
-    });
+    const key = aiCacheKey({ kind: 'gemini_summary', model: GEMINI_MODEL, prompt });
+    const { value: text } = await withAiCache(key, { kind: 'gemini_summary', model: GEMINI_MODEL, ttlMs: SUMMARY_CACHE_TTL_MS }, async () => {
+      const res = await fetch(GEMINI_URL, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body),
+      });
 
-    if (!res.ok) {
-      const err = await res.text();
-      console.error('Gemini error:', err);
-      return Response.json({ error: 'Gemini API error', details: err }, { status: 500 });
-    }
+      if (!res.ok) {
+        const err = await res.text();
+        console.error('Gemini error:', err);
+        throw Object.assign(new Error('Gemini API error'), { details: err });
+      }
 
-    const data = await res.json();
-    const text = data?.candidates?.[0]?.content?.parts?.[0]?.text || '';
+      const data = await res.json();
+      return data?.candidates?.[0]?.content?.parts?.[0]?.text || '';
+    });
 
     return Response.json({ summary: text });
   } catch (error) {
     console.error('geminiSummary error:', error);
-    return Response.json({ error: error.message }, { status: 500 });
+    return Response.json({ error: error.message, details: error.details }, { status: 500 });
   }
 }
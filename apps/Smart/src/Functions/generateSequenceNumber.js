@@ -1,9 +1,14 @@
 import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supabase.js';
+import { SEQUENCE_TYPES, MAX_RESERVATION, allocateSequenceNumbers } from './_sequenceAllocator.js';
 
 /**
- * ✨ SISTEMA SIMPLIFICADO DE NUMERACIÓN SECUENCIAL
- * NO USA CONTADORES - CUENTA DIRECTAMENTE LOS REGISTROS REALES
+ * ✨ NUMERACIÓN SECUENCIAL ATÓMICA
+ * Un contador por tenant y tipo en SequenceCounter, incrementado en Postgres
+ * (allocate_sequence_numbers). O(1), sin colisiones entre cajeros concurrentes.
  * Formatos: WO-00001, POS-00001, RCG-00001, etc.
+ *
+ * Body: { sequence_type, reserve? }
+ *   reserve = N → reserva N números consecutivos de una vez (importaciones)
  */
 export async function generateSequenceNumberHandler(req) {
   console.log("🦕 generateSequenceNumber called");
@@ -13,85 +18,39 @@ export async function generateSequenceNumberHandler(req) {
     const { sequence_type } = body;
 
     // Validar tipo de secuencia
-    const validTypes = ['order', 'sale', 'recharge', 'unlock', 'customer'];
-    if (!validTypes.includes(sequence_type)) {
+    if (!SEQUENCE_TYPES.includes(sequence_type)) {
       return Response.json({
         success: false,
-        error: `sequence_type debe ser uno de: ${validTypes.join(', ')}`
+        error: `sequence_type debe ser uno de: ${SEQUENCE_TYPES.join(', ')}`
       }, { status: 400 });
     }
 
-    console.log('🔢 Generando número para:', sequence_type);
-
-    // Configuración por tipo
-    const config = {
-      order: { entity: 'Order', field: 'order_number', prefix: 'WO' },
-      sale: { entity: 'Sale', field: 'sale_number', prefix: 'POS' },
-      recharge: { entity: 'Recharge', field: 'recharge_number', prefix: 'RCG' },
-      unlock: { entity: 'Order', field: 'order_number', prefix: 'UNL' },
-      customer: { entity: 'Customer', field: 'customer_number', prefix: 'CLT' }
-    }[sequence_type];
-
-    const { entity, field, prefix } = config;
-
-    // ========== BUSCAR MÁXIMO NÚMERO VÁLIDO ==========
-    let maxNumber = 0;
-    let retries = 3;
-
-    while (retries > 0) {
-      try {
-        const allRecords = await base44.asServiceRole.entities[entity].list(null, 10000);
-        
-        if (allRecords?.length) {
-          for (const record of allRecords) {
-            const numStr = record[field];
-            if (numStr && numStr.startsWith(prefix + '-')) {
-              const numPart = numStr.replace(prefix + '-', '');
-              const num = parseInt(numPart, 10);
-              // Solo números válidos (1 a 99999)
-              if (!isNaN(num) && num >= 1 && num < 100000 && num > maxNumber) {
-                maxNumber = num;
-              }
-            }
-          }
-        }
-
-        console.log(`📊 Máximo número válido: ${maxNumber}`);
-        break;
-      } catch (error) {
-        console.warn('⚠️ Retry buscando máximo...', error.message);
-        retries--;
-        if (retries === 0) throw error;
-        await new Promise(resolve => setTimeout(resolve, 150));
-      }
+    const reserve = body.reserve === undefined ? 1 : Number(body.reserve);
+    if (!Number.isInteger(reserve) || reserve < 1 || reserve > MAX_RESERVATION) {
+      return Response.json({
+        success: false,
+        error: `reserve debe ser un entero entre 1 y ${MAX_RESERVATION}`
+      }, { status: 400 });
     }
 
-    // ========== GENERAR SIGUIENTE NÚMERO ==========
-    const nextNumber = maxNumber + 1;
-    const paddedNumber = nextNumber.toString().padStart(5, '0');
-    const generatedNumber = `${prefix}-${paddedNumber}`;
+    // Usuario con tenant → siempre su tenant. Solo llamadas internas (me() las
+    // resuelve como admin "service-user") y admins sin tenant pueden indicar tenant_id
+    const user = await base44.auth.me().catch(() => null);
+    const canPickTenant = user?.role === 'admin' || user?.role === 'super_admin';
+    const tenantId = user?.tenant_id || (canPickTenant ? body.tenant_id : null) || null;
 
-    console.log(`✅ Número generado: ${generatedNumber}`);
+    console.log('🔢 Generando número para:', sequence_type, reserve > 1 ? `(x${reserve})` : '');
 
-    // Verificar colisiones (doble check)
-    const existing = await base44.asServiceRole.entities[entity].filter({
-      [field]: generatedNumber
-    });
+    const { prefix, first, last, numbers } = await allocateSequenceNumbers(base44, tenantId, sequence_type, reserve);
 
-    if (existing.length > 0) {
-      console.error('❌ COLISIÓN DETECTADA:', generatedNumber);
-      return Response.json({
-        success: false,
-        error: `Número ${generatedNumber} ya existe`,
-        collision: true
-      }, { status: 409 });
-    }
+    console.log(`✅ Número generado: ${numbers[0]}${reserve > 1 ? ` … ${numbers[numbers.length - 1]}` : ''}`);
 
     return Response.json({
       success: true,
-      number: generatedNumber,
-      count: nextNumber,
-      prefix
+      number: numbers[0],
+      count: first,
+      prefix,
+      ...(reserve > 1 ? { numbers, last_count: last } : {})
     });
 
   } catch (error) {
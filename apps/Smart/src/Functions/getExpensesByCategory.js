@@ -1,10 +1,12 @@
 import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supabase.js';
+import { resolveTenantId, fetchLedgerSummary } from './_financialAggregates.js';
 
 /**
  * Vista Virtual: Expenses by Category
  * 
  * Agrupa gastos por categoría en un rango de fechas.
  * Incluye Transaction(type=expense) + CashDrawerMovement(type=expense).
+ * Los totales salen de los rollups diarios en Postgres (_financialAggregates.js).
  * 
  * @param {string} date_from - Fecha inicio (YYYY-MM-DD)
  * @param {string} date_to - Fecha fin (YYYY-MM-DD)
@@ -56,75 +58,34 @@ export async function getExpensesByCategoryHandler(req) {
 
     console.log(`💸 [getExpensesByCategory] Calculando gastos: ${date_from} a ${date_to}`);
 
-    // Convertir a timestamps
-    const startDate = new Date(date_from + 'T00:00:00.000Z');
-    const endDate = new Date(date_to + 'T23:59:59.999Z');
+    // Agregación en Postgres (rollups diarios, ver 022_financial_aggregates.sql)
+    const tenantId = resolveTenantId(user, body);
+    const ledger = await fetchLedgerSummary(base44, tenantId, date_from, date_to);
 
-    // Obtener todas las transacciones y movimientos (service role)
-    const [allTransactions, allMovements] = await Promise.all([
-      base44.asServiceRole.entities.Transaction.list('-created_date', 5000),
-      base44.asServiceRole.entities.CashDrawerMovement.list('-created_date', 5000)
-    ]);
-
-    // Filtrar transacciones de tipo expense en el rango
-    const expenseTransactions = allTransactions.filter(tx => {
-      if (tx.type !== 'expense') return false;
-      
-      try {
-        const txDate = new Date(tx.created_date);
-        return txDate >= startDate && txDate <= endDate;
-      } catch {
-        return false;
-      }
-    });
-
-    // Filtrar movimientos de tipo expense en el rango
-    const expenseMovements = allMovements.filter(mov => {
-      if (mov.type !== 'expense') return false;
-      
-      try {
-        const movDate = new Date(mov.created_date);
-        return movDate >= startDate && movDate <= endDate;
-      } catch {
-        return false;
-      }
-    });
-
-    console.log(`✅ [getExpensesByCategory] ${expenseTransactions.length} transacciones + ${expenseMovements.length} movimientos`);
-
-    // Inicializar contadores por categoría
     const expensesByCategory = {};
     let totalExpenses = 0;
-    let expenseCount = 0;
-
-    // Procesar transacciones
-    expenseTransactions.forEach(tx => {
-      const amount = tx.amount || 0;
-      const category = tx.category || 'other_expense';
-      
-      if (!expensesByCategory[category]) {
-        expensesByCategory[category] = 0;
+    let transactionCount = 0;
+    let movementCount = 0;
+
+    ledger.forEach(row => {
+      if (row.type !== 'expense') return;
+
+      // Los movimientos de caja no tienen category
+      const category = row.source === 'cash_drawer_movement'
+        ? 'cash_drawer_expense'
+        : (row.category || 'other_expense');
+
+      expensesByCategory[category] = (expensesByCategory[category] || 0) + row.amount;
+      totalExpenses += row.amount;
+      if (row.source === 'cash_drawer_movement') {
+        movementCount += row.row_count;
+      } else {
+        transactionCount += row.row_count;
       }
-      
-      expensesByCategory[category] += amount;
-      totalExpenses += amount;
-      expenseCount++;
     });
+    const expenseCount = transactionCount + movementCount;
 
-    // Procesar movimientos de caja
-    expenseMovements.forEach(mov => {
-      const amount = mov.amount || 0;
-      // Los movimientos no tienen category, usar descripción o "other_expense"
-      const category = 'cash_drawer_expense';
-      
-      if (!expensesByCategory[category]) {
-        expensesByCategory[category] = 0;
-      }
-      
-      expensesByCategory[category] += amount;
-      totalExpenses += amount;
-      expenseCount++;
-    });
+    console.log(`✅ [getExpensesByCategory] ${transactionCount} transacciones + ${movementCount} movimientos`);
 
     // Ordenar por monto descendente
     const sortedCategories = Object.entries(expensesByCategory)
@@ -155,8 +116,8 @@ export async function getExpensesByCategoryHandler(req) {
           to: date_to
         },
         sources: {
-          transactions: expenseTransactions.length,
-          movements: expenseMovements.length
+          transactions: transactionCount,
+          movements: movementCount
         }
       },
       message: `Gastos calculados para ${expenseCount} registros`
@@ -1,4 +1,13 @@
 import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supabase.js';
+import {
+  resolveTenantId,
+  previousPeriod,
+  fetchSalesSummary,
+  fetchRevenueByMethod,
+  fetchTopProducts,
+  fetchLedgerSummary,
+  sumLedger
+} from './_financialAggregates.js';
 
 /**
  * Vista Virtual: Financial KPIs
@@ -12,6 +21,8 @@ import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supa
  * - Revenue by Method
  * - Top Products
  * - Growth vs Previous Period
+ *
+ * Los totales salen de los rollups diarios en Postgres (_financialAggregates.js).
  * 
  * @param {string} date_from - Fecha inicio (YYYY-MM-DD)
  * @param {string} date_to - Fecha fin (YYYY-MM-DD)
@@ -48,141 +59,64 @@ export async function getKPIsHandler(req) {
 
     console.log(`📈 [getKPIs] Calculando KPIs: ${date_from} a ${date_to}`);
 
-    // Convertir a timestamps
-    const startDate = new Date(date_from + 'T00:00:00.000Z');
-    const endDate = new Date(date_to + 'T23:59:59.999Z');
-
-    // Calcular periodo anterior si se solicita comparación
-    let prevStartDate, prevEndDate;
-    if (compare_previous) {
-      const periodLength = endDate - startDate;
-      prevEndDate = new Date(startDate - 1);
-      prevStartDate = new Date(prevEndDate - periodLength);
-    }
-
-    // Obtener datos (service role para performance)
-    const [allSales, allTransactions] = await Promise.all([
-      base44.asServiceRole.entities.Sale.list('-created_date', 5000),
-      base44.asServiceRole.entities.Transaction.list('-created_date', 5000)
-    ]);
+    // Agregación en Postgres (rollups diarios, ver 022_financial_aggregates.sql)
+    const tenantId = resolveTenantId(user, body);
+
+    const loadPeriod = async (from, to) => {
+      const [salesSummary, ledger] = await Promise.all([
+        fetchSalesSummary(base44, tenantId, from, to),
+        fetchLedgerSummary(base44, tenantId, from, to)
+      ]);
+      const revenue = sumLedger(ledger, 'transaction', 'revenue');
+      const expenses = sumLedger(ledger, 'transaction', 'expense');
+      const transactionsCount = ledger
+        .filter(row => row.source === 'transaction')
+        .reduce((sum, row) => sum + row.row_count, 0);
+      return {
+        totalRevenue: revenue.amount,
+        totalExpenses: expenses.amount,
+        salesCount: salesSummary.sales_count,
+        transactionsCount
+      };
+    };
 
     // ========================================
     // CALCULAR KPIs DEL PERIODO ACTUAL
     // ========================================
 
-    // Filtrar ventas del periodo (no anuladas)
-    const salesInPeriod = allSales.filter(sale => {
-      if (sale.voided) return false;
-      try {
-        const saleDate = new Date(sale.created_date);
-        return saleDate >= startDate && saleDate <= endDate;
-      } catch {
-        return false;
-      }
-    });
-
-    // Filtrar transacciones del periodo
-    const transactionsInPeriod = allTransactions.filter(tx => {
-      try {
-        const txDate = new Date(tx.created_date);
-        return txDate >= startDate && txDate <= endDate;
-      } catch {
-        return false;
-      }
-    });
+    const prev = compare_previous ? previousPeriod(date_from, date_to) : null;
 
-    // Calcular ingresos
-    const revenueTransactions = transactionsInPeriod.filter(tx => tx.type === 'revenue');
-    const totalRevenue = revenueTransactions.reduce((sum, tx) => sum + (tx.amount || 0), 0);
+    const [current, revenueByMethod, topProducts, previous] = await Promise.all([
+      loadPeriod(date_from, date_to),
+      fetchRevenueByMethod(base44, tenantId, date_from, date_to),
+      fetchTopProducts(base44, tenantId, date_from, date_to, 10),
+      prev ? loadPeriod(prev.from, prev.to) : null
+    ]);
 
-    // Calcular gastos
-    const expenseTransactions = transactionsInPeriod.filter(tx => tx.type === 'expense');
-    const totalExpenses = expenseTransactions.reduce((sum, tx) => sum + (tx.amount || 0), 0);
+    const { totalRevenue, totalExpenses, salesCount } = current;
 
     // Calcular utilidad neta
     const netProfit = totalRevenue - totalExpenses;
 
-    // Cantidad de ventas
-    const salesCount = salesInPeriod.length;
-
     // Ticket promedio
     const avgTicket = salesCount > 0 ? totalRevenue / salesCount : 0;
 
-    // Ingresos por método
-    const revenueByMethod = {};
-    salesInPeriod.forEach(sale => {
-      const method = sale.payment_method || 'unknown';
-      const total = sale.total || 0;
-      
-      if (method === 'mixed' && sale.payment_details?.methods) {
-        sale.payment_details.methods.forEach(m => {
-          const key = m.method;
-          const amt = m.amount || 0;
-          revenueByMethod[key] = (revenueByMethod[key] || 0) + amt;
-        });
-      } else {
-        revenueByMethod[method] = (revenueByMethod[method] || 0) + total;
-      }
-    });
-
-    // Top productos vendidos
-    const productSales = {};
-    salesInPeriod.forEach(sale => {
-      (sale.items || []).forEach(item => {
-        const key = item.name || 'Sin nombre';
-        if (!productSales[key]) {
-          productSales[key] = { name: key, qty: 0, total: 0 };
-        }
-        productSales[key].qty += item.quantity || 1;
-        productSales[key].total += (item.price || 0) * (item.quantity || 1);
-      });
-    });
-
-    const topProducts = Object.values(productSales)
-      .sort((a, b) => b.total - a.total)
-      .slice(0, 10);
-
     // ========================================
     // COMPARACIÓN CON PERIODO ANTERIOR
     // ========================================
 
     let comparison = null;
-    if (compare_previous) {
-      const prevSales = allSales.filter(sale => {
-        if (sale.voided) return false;
-        try {
-          const saleDate = new Date(sale.created_date);
-          return saleDate >= prevStartDate && saleDate <= prevEndDate;
-        } catch {
-          return false;
-        }
-      });
-
-      const prevTransactions = allTransactions.filter(tx => {
-        try {
-          const txDate = new Date(tx.created_date);
-          return txDate >= prevStartDate && txDate <= prevEndDate;
-        } catch {
-          return false;
-        }
-      });
-
-      const prevRevenue = prevTransactions
-        .filter(tx => tx.type === 'revenue')
-        .reduce((sum, tx) => sum + (tx.amount || 0), 0);
-
-      const prevExpenses = prevTransactions
-        .filter(tx => tx.type === 'expense')
-        .reduce((sum, tx) => sum + (tx.amount || 0), 0);
-
+    if (previous) {
+      const prevRevenue = previous.totalRevenue;
+      const prevExpenses = previous.totalExpenses;
       const prevNetProfit = prevRevenue - prevExpenses;
-      const prevSalesCount = prevSales.length;
+      const prevSalesCount = previous.salesCount;
       const prevAvgTicket = prevSalesCount > 0 ? prevRevenue / prevSalesCount : 0;
 
       comparison = {
         previous_period: {
-          from: prevStartDate.toISOString().split('T')[0],
-          to: prevEndDate.toISOString().split('T')[0],
+          from: prev.from,
+          to: prev.to,
           total_revenue: prevRevenue,
           total_expenses: prevExpenses,
           net_profit: prevNetProfit,
@@ -219,12 +153,12 @@ export async function getKPIsHandler(req) {
       period: {
         from: date_from,
         to: date_to,
-        days: Math.ceil((endDate - startDate) / (1000 * 60 * 60 * 24))
+        days: Math.ceil((Date.parse(date_to + 'T23:59:59.999Z') - Date.parse(date_from + 'T00:00:00.000Z')) / (1000 * 60 * 60 * 24))
       },
       comparison: comparison,
       metadata: {
-        sales_processed: salesInPeriod.length,
-        transactions_processed: transactionsInPeriod.length,
+        sales_processed: salesCount,
+        transactions_processed: current.transactionsCount,
         calculated_at: new Date().toISOString()
       }
     });
@@ -1,10 +1,12 @@
 import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supabase.js';
+import { resolveTenantId, fetchRevenueByMethod, fetchSalesSummary } from './_financialAggregates.js';
 
 /**
  * Vista Virtual: Revenue by Payment Method
  * 
  * Agrupa ventas por método de pago en un rango de fechas.
  * Incluye desglose de ventas "mixed" desde payment_details.methods.
+ * Los totales salen de los rollups diarios en Postgres (_financialAggregates.js).
  * 
  * @param {string} date_from - Fecha inicio (YYYY-MM-DD)
  * @param {string} date_to - Fecha fin (YYYY-MM-DD)
@@ -54,53 +56,16 @@ export async function getRevenueByMethodHandler(req) {
 
     console.log(`📊 [getRevenueByMethod] Calculando ingresos: ${date_from} a ${date_to}`);
 
-    // Convertir a timestamps
-    const startDate = new Date(date_from + 'T00:00:00.000Z');
-    const endDate = new Date(date_to + 'T23:59:59.999Z');
+    // Agregación en Postgres (rollups diarios, ver 022_financial_aggregates.sql)
+    const tenantId = resolveTenantId(user, body);
+    const [revenueByMethod, salesSummary] = await Promise.all([
+      fetchRevenueByMethod(base44, tenantId, date_from, date_to),
+      fetchSalesSummary(base44, tenantId, date_from, date_to)
+    ]);
+    const totalRevenue = salesSummary.sales_total;
+    const salesCount = salesSummary.sales_count;
 
-    // Obtener todas las ventas (usar service role para performance)
-    const allSales = await base44.asServiceRole.entities.Sale.list('-created_date', 5000);
-
-    // Filtrar por rango de fechas y excluir anuladas
-    const salesInRange = allSales.filter(sale => {
-      if (sale.voided) return false;
-      
-      try {
-        const saleDate = new Date(sale.created_date);
-        return saleDate >= startDate && saleDate <= endDate;
-      } catch {
-        return false;
-      }
-    });
-
-    console.log(`✅ [getRevenueByMethod] ${salesInRange.length} ventas en el periodo`);
-
-    // Inicializar contadores dinámicos
-    const revenueByMethod = {};
-    let totalRevenue = 0;
-
-    // Procesar cada venta
-    salesInRange.forEach(sale => {
-      const saleTotal = sale.total || 0;
-      totalRevenue += saleTotal;
-
-      const method = sale.payment_method || 'unknown';
-
-      if (method === 'mixed' && sale.payment_details?.methods) {
-        // Desglosar ventas mixtas
-        sale.payment_details.methods.forEach(m => {
-          const methodKey = m.method || 'unknown';
-          const amount = m.amount || 0;
-          
-          if (!revenueByMethod[methodKey]) revenueByMethod[methodKey] = 0;
-          revenueByMethod[methodKey] += amount;
-        });
-      } else {
-        // Venta simple
-        if (!revenueByMethod[method]) revenueByMethod[method] = 0;
-        revenueByMethod[method] += saleTotal;
-      }
-    });
+    console.log(`✅ [getRevenueByMethod] ${salesCount} ventas en el periodo`);
 
     // Calcular porcentajes
     const percentages = {};
@@ -117,13 +82,13 @@ export async function getRevenueByMethodHandler(req) {
       percentages: percentages,
       summary: {
         total_revenue: totalRevenue,
-        sales_count: salesInRange.length,
+        sales_count: salesCount,
         period: {
           from: date_from,
           to: date_to
         }
       },
-      message: `Ingresos calculados para ${salesInRange.length} ventas`
+      message: `Ingresos calculados para ${salesCount} ventas`
     });
 
   } catch (error) {
@@ -64,6 +64,7 @@ export async function handleOrderStatusChangeHandler(req) {
         // Send the templated email (fetches template from DB, renders HTML, logs result)
         const emailResult = await sendTemplatedEmailWithBase44(base44, {
             event_type: newStatus,
+            tenant_id: freshOrder.tenant_id,
             order_data
         });
 
@@ -1,4 +1,6 @@
 import OpenAI from 'npm:openai@^4.0.0';
+import { aiCacheKey, fetchFile, withAiCache } from './_aiCache.js';
+import { respondSyncOrJob } from './_aiJobs.js';
 
 // Redeploy forzado — confirmar que GEMINI_API_KEY guardada en Render
 // se recoge en un build fresco.
@@ -7,11 +9,20 @@ if (!openai_api_key) {
   console.warn('⚠️ Warning: OPENAI_API_KEY not found in environment variables');
 }
 
-const openai = openai_api_key ? new OpenAI({ apiKey: openai_api_key }) : null;
+// OPENAI_BASE_URL / GEMINI_API_BASE_URL apuntan a un servidor stub local en pruebas
+const openai = openai_api_key
+  ? new OpenAI({ apiKey: openai_api_key, baseURL: Deno.env.get('OPENAI_BASE_URL') || undefined })
+  : null;
 
 const gemini_api_key = Deno.env.get('GEMINI_API_KEY');
 const GEMINI_MODEL = 'gemini-2.0-flash';
-const GEMINI_URL = `https://generativelanguage.googleapis.com/v1beta/models/${GEMINI_MODEL}:generateContent`;
+const GEMINI_API_BASE = (Deno.env.get('GEMINI_API_BASE_URL') || 'https://generativelanguage.googleapis.com').replace(/\/$/, '');
+const GEMINI_URL = `${GEMINI_API_BASE}/v1beta/models/${GEMINI_MODEL}:generateContent`;
+
+const OPENAI_MODEL = 'gpt-4o';
+// Archivos de file_urls: solo se hashean (streaming, sin guardar bytes);
+// OpenAI sigue descargándolos por URL
+const MAX_HASH_BYTES = 50 * 1024 * 1024;
 
 function stripForGemini(schema) {
   if (!schema || typeof schema !== 'object') return schema;
@@ -213,6 +224,151 @@ function parseResponse(response, hasSchema = false) {
   return text;
 }
 
+/**
+ * sha256 de cada archivo (descarga en streaming, bytes descartados).
+ * null si alguno no se puede leer: se sigue sin caché.
+ */
+async function hashFileUrls(fileUrls) {
+  try {
+    const files = await Promise.all(fileUrls.map((url) => fetchFile(url, { maxBytes: MAX_HASH_BYTES, keep: false })));
+    return files.map((f) => f.sha256);
+  } catch (error) {
+    console.warn(`⚠️ No se pudo hashear file_urls (${error.message}), sin caché`);
+    return null;
+  }
+}
+
+/**
+ * OpenAI chat completion (texto o con imágenes por URL).
+ * Devuelve el body de la respuesta del endpoint.
+ */
+async function completeWithOpenAI(prompt, responseJsonSchema, fileUrls) {
+  // Build messages array
+  const messages = [
+    {
+      role: 'system',
+      content: responseJsonSchema
+        ? 'You are a helpful assistant. Return your answer strictly as JSON that matches the provided schema. No prose outside JSON.'
+        : 'You are a helpful assistant.'
+    }
+  ];
+
+  // Build user message content
+  const userContent = [];
+  userContent.push({
+    type: 'text',
+    text: prompt
+  });
+
+  // Add file URLs as image_url content if provided
+  for (const fileUrl of fileUrls) {
+    userContent.push({
+      type: 'image_url',
+      image_url: {
+        url: fileUrl,
+        detail: 'high'
+      }
+    });
+  }
+
+  messages.push({
+    role: 'user',
+    content: userContent
+  });
+
+  // If we have a schema, use structured outputs
+  if (responseJsonSchema) {
+    console.log('🔧 Using structured outputs with schema');
+    const normalizedSchema = normalizeSchema(responseJsonSchema);
+    console.log(`📋 Normalized schema keys: ${Object.keys(normalizedSchema)}`);
+
+    try {
+      console.log('🤖 Attempting OpenAI Chat Completion API call with JSON mode...');
+      
+      const response = await openai.chat.completions.create({
+        model: OPENAI_MODEL,
+        messages: messages,
+        response_format: {
+          type: 'json_schema',
+          json_schema: {
+            name: 'assessment_response',
+            schema: normalizedSchema,
+            strict: false
+          }
+        }
+      });
+
+      console.log('✅ OpenAI Chat Completion API call successful');
+
+      const parsedContent = parseResponse(response, true);
+      console.log('✅ Successfully parsed JSON');
+      console.log(`📊 Result keys: ${typeof parsedContent === 'object' ? Object.keys(parsedContent) : 'Not an object'}`);
+
+      const responseData = {
+        data: {
+          message: parsedContent
+        }
+      };
+      console.log('🎯 Returning structured response');
+      return responseData;
+    } catch (error) {
+      console.error(`⚠️ Structured output failed, trying fallback: ${error.message}`);
+      console.log('🤖 Attempting OpenAI Chat Completion API call with json_object mode...');
+
+      const response = await openai.chat.completions.create({
+        model: OPENAI_MODEL,
+        messages: messages,
+        response_format: { type: 'json_object' }
+      });
+
+      console.log('✅ OpenAI Chat Completion API call successful');
+      const content = response.choices[0].message.content;
+      console.log(`📝 Received content length: ${content.length} characters`);
+
+      try {
+        console.log('🔄 Attempting to parse JSON response...');
+        const parsedContent = JSON.parse(content);
+        console.log('✅ Successfully parsed JSON');
+
+        const responseData = {
+          data: {
+            message: parsedContent
+          }
+        };
+        console.log('🎯 Returning fallback structured response');
+        return responseData;
+      } catch (jsonError) {
+        console.warn(`⚠️ JSON parsing failed: ${jsonError.message}`);
+        console.log('📝 Returning raw content');
+        return {
+          data: {
+            message: content
+          }
+        };
+      }
+    }
+  } else {
+    // Regular text response
+    console.log('💬 Using regular text response (no schema)');
+    console.log('🤖 Making OpenAI Chat Completion API call...');
+
+    const response = await openai.chat.completions.create({
+      model: OPENAI_MODEL,
+      messages: messages
+    });
+
+    console.log('✅ OpenAI API call successful');
+    const content = response.choices[0].message.content;
+    console.log(`📝 Received response length: ${content.length} characters`);
+
+    const responseData = {
+      response: content
+    };
+    console.log('🎯 Returning text response');
+    return responseData;
+  }
+}
+
 export async function invokeLLMHandler(req) {
   console.log('🚀 /ai/invoke endpoint called');
 
@@ -220,6 +376,21 @@ export async function invokeLLMHandler(req) {
     const payload = await req.json();
     console.log(`📨 Received payload keys: ${Object.keys(payload)}`);
 
+    // { async: true } → 202 { job_id }, resultado por /ai/job
+    return await respondSyncOrJob(payload, 'invoke', () => runInvoke(payload), {
+      dedupeKey: `invoke:${aiCacheKey({ ...payload, async: undefined })}`,
+    });
+  } catch (error) {
+    console.error('💥 Unexpected error in LLM invocation:', error);
+    return Response.json(
+      { error: `LLM invocation failed: ${error.message}` },
+      { status: 500 }
+    );
+  }
+}
+
+async function runInvoke(payload) {
+  try {
     // Transcripcion de audio (dictado) — Gemini nativo, sin pasar por
     // OpenAI en absoluto. Va PRIMERO, antes del guard de `openai`
     // abajo, porque este camino no lo necesita.
@@ -287,130 +458,19 @@ export async function invokeLLMHandler(req) {
       console.log('↪️ Gemini no disponible o fallo, sigue con OpenAI');
     }
 
-    // Build messages array
-    const messages = [
-      {
-        role: 'system',
-        content: responseJsonSchema
-          ? 'You are a helpful assistant. Return your answer strictly as JSON that matches the provided schema. No prose outside JSON.'
-          : 'You are a helpful assistant.'
-      }
-    ];
-
-    // Build user message content
-    const userContent = [];
-    userContent.push({
-      type: 'text',
-      text: prompt
-    });
-
-    // Add file URLs as image_url content if provided
-    for (const fileUrl of fileUrls) {
-      userContent.push({
-        type: 'image_url',
-        image_url: {
-          url: fileUrl,
-          detail: 'high'
-        }
-      });
+    // Con archivos: resultado cacheado por hash de contenido (mismo PDF +
+    // mismo prompt = misma respuesta, sin volver a facturar el reintento)
+    const fileHashes = fileUrls.length > 0 ? await hashFileUrls(fileUrls) : null;
+    if (fileHashes) {
+      const key = aiCacheKey({ kind: 'invoke', model: OPENAI_MODEL, prompt, schema: responseJsonSchema ?? null, files: fileHashes });
+      const { value, cached } = await withAiCache(key, { kind: 'invoke', model: OPENAI_MODEL }, () =>
+        completeWithOpenAI(prompt, responseJsonSchema, fileUrls)
+      );
+      if (cached) console.log(`♻️ Respuesta desde caché (${cached})`);
+      return Response.json(value);
     }
 
-    messages.push({
-      role: 'user',
-      content: userContent
-    });
-
-    // If we have a schema, use structured outputs
-    if (responseJsonSchema) {
-      console.log('🔧 Using structured outputs with schema');
-      const normalizedSchema = normalizeSchema(responseJsonSchema);
-      console.log(`📋 Normalized schema keys: ${Object.keys(normalizedSchema)}`);
-
-      try {
-        console.log('🤖 Attempting OpenAI Chat Completion API call with JSON mode...');
-        
-        const response = await openai.chat.completions.create({
-          model: 'gpt-4o',
-          messages: messages,
-          response_format: {
-            type: 'json_schema',
-            json_schema: {
-              name: 'assessment_response',
-              schema: normalizedSchema,
-              strict: false
-            }
-          }
-        });
-
-        console.log('✅ OpenAI Chat Completion API call successful');
-
-        const parsedContent = parseResponse(response, true);
-        console.log('✅ Successfully parsed JSON');
-        console.log(`📊 Result keys: ${typeof parsedContent === 'object' ? Object.keys(parsedContent) : 'Not an object'}`);
-
-        const responseData = {
-          data: {
-            message: parsedContent
-          }
-        };
-        console.log('🎯 Returning structured response');
-        return Response.json(responseData);
-      } catch (error) {
-        console.error(`⚠️ Structured output failed, trying fallback: ${error.message}`);
-        console.log('🤖 Attempting OpenAI Chat Completion API call with json_object mode...');
-
-        const response = await openai.chat.completions.create({
-          model: 'gpt-4o',
-          messages: messages,
-          response_format: { type: 'json_object' }
-        });
-
-        console.log('✅ OpenAI Chat Completion API call successful');
-        const content = response.choices[0].message.content;
-        console.log(`📝 Received content length: ${content.length} characters`);
-
-        try {
-          console.log('🔄 Attempting to parse JSON response...');
-          const parsedContent = JSON.parse(content);
-          console.log('✅ Successfully parsed JSON');
-
-          const responseData = {
-            data: {
-              message: parsedContent
-            }
-          };
-          console.log('🎯 Returning fallback structured response');
-          return Response.json(responseData);
-        } catch (jsonError) {
-          console.warn(`⚠️ JSON parsing failed: ${jsonError.message}`);
-          console.log('📝 Returning raw content');
-          return Response.json({
-            data: {
-              message: content
-            }
-          });
-        }
-      }
-    } else {
-      // Regular text response
-      console.log('💬 Using regular text response (no schema)');
-      console.log('🤖 Making OpenAI Chat Completion API call...');
-
-      const response = await openai.chat.completions.create({
-        model: 'gpt-4o',
-        messages: messages
-      });
-
-      console.log('✅ OpenAI API call successful');
-      const content = response.choices[0].message.content;
-      console.log(`📝 Received response length: ${content.length} characters`);
-
-      const responseData = {
-        response: content
-      };
-      console.log('🎯 Returning text response');
-      return Response.json(responseData);
-    }
+    return Response.json(await completeWithOpenAI(prompt, responseJsonSchema, fileUrls));
   } catch (error) {
     console.error('💥 Unexpected error in LLM invocation:', error);
     console.error(`🔍 Error type: ${error.constructor.name}`);
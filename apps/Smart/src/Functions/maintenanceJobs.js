@@ -9,6 +9,10 @@
 
 import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supabase.js';
 
+// Filas por lote y lotes máximos por ejecución (acota la duración del job)
+const MAINTENANCE_BATCH_SIZE = 1000;
+const MAINTENANCE_MAX_BATCHES = 50;
+
 /**
  * Job principal de mantenimiento
  * Ejecuta todas las tareas de limpieza y optimización
@@ -34,44 +38,34 @@ export async function maintenanceJobsHandler(req) {
       jobs: []
     };
 
+    // Lotes set-based: cada llamada archiva/borra/actualiza hasta
+    // MAINTENANCE_BATCH_SIZE filas en un solo statement (db/seeds/025_due_jobs.sql)
+    const runBatches = async (fnName, before = null) => {
+      let total = 0;
+      for (let i = 0; i < MAINTENANCE_MAX_BATCHES; i++) {
+        const params = { p_limit: MAINTENANCE_BATCH_SIZE };
+        if (before) params.p_before = before.toISOString();
+        const count = Number(await base44.asServiceRole.rpc(fnName, params)) || 0;
+        total += count;
+        if (count < MAINTENANCE_BATCH_SIZE) break;
+      }
+      return total;
+    };
+
     // ============================================
-    // JOB 1: Limpiar AuditLog antiguo (>365 días)
+    // JOB 1: Archivar AuditLog antiguo (>365 días)
     // ============================================
     try {
       const archiveThresholdDate = new Date();
       archiveThresholdDate.setDate(archiveThresholdDate.getDate() - 365);
 
-      const oldLogs = await base44.asServiceRole.entities.AuditLog.filter({
-        severity: { $ne: 'critical' } // No archivar logs críticos
-      });
-
-      // Filtrar en memoria logs > 365 días
-      const logsToArchive = oldLogs.filter(log => {
-        const logDate = new Date(log.created_date);
-        return logDate < archiveThresholdDate;
-      });
-
-      let archived = 0;
-      for (const log of logsToArchive.slice(0, 100)) { // Máximo 100 por ejecución
-        try {
-          await base44.asServiceRole.entities.AuditLog.update(log.id, {
-            metadata: {
-              ...log.metadata,
-              archived: true,
-              archived_at: new Date().toISOString()
-            }
-          });
-          archived++;
-        } catch (err) {
-          console.error('Error archiving log:', err);
-        }
-      }
+      // No archiva logs críticos
+      const archived = await runBatches('maintenance_archive_audit_logs', archiveThresholdDate);
 
       results.jobs.push({
         name: 'Archive AuditLog',
         status: 'completed',
-        archived,
-        total: logsToArchive.length
+        archived
       });
 
     } catch (error) {
@@ -83,37 +77,18 @@ export async function maintenanceJobsHandler(req) {
     }
 
     // ============================================
-    // JOB 2: Limpiar notificaciones antiguas (>90 días)
+    // JOB 2: Limpiar notificaciones leídas antiguas (>90 días)
     // ============================================
     try {
       const deleteThresholdDate = new Date();
       deleteThresholdDate.setDate(deleteThresholdDate.getDate() - 90);
 
-      const oldNotifs = await base44.asServiceRole.entities.Notification.filter({
-        is_read: true
-      });
-
-      // Filtrar en memoria notificaciones > 90 días
-      const notifsToDelete = oldNotifs.filter(notif => {
-        const notifDate = new Date(notif.created_date);
-        return notifDate < deleteThresholdDate;
-      });
-
-      let deleted = 0;
-      for (const notif of notifsToDelete.slice(0, 100)) { // Máximo 100 por ejecución
-        try {
-          await base44.asServiceRole.entities.Notification.delete(notif.id);
-          deleted++;
-        } catch (err) {
-          console.error('Error deleting notification:', err);
-        }
-      }
+      const deleted = await runBatches('maintenance_delete_read_notifications', deleteThresholdDate);
 
       results.jobs.push({
         name: 'Clean Notifications',
         status: 'completed',
-        deleted,
-        total: notifsToDelete.length
+        deleted
       });
 
     } catch (error) {
@@ -125,37 +100,18 @@ export async function maintenanceJobsHandler(req) {
     }
 
     // ============================================
-    // JOB 3: Limpiar EmailLog antiguo (>365 días)
+    // JOB 3: Limpiar EmailLog enviado antiguo (>365 días)
     // ============================================
     try {
       const deleteThresholdDate = new Date();
       deleteThresholdDate.setDate(deleteThresholdDate.getDate() - 365);
 
-      const oldEmails = await base44.asServiceRole.entities.EmailLog.filter({
-        status: 'sent'
-      });
-
-      // Filtrar en memoria emails > 365 días
-      const emailsToDelete = oldEmails.filter(email => {
-        const emailDate = new Date(email.created_date);
-        return emailDate < deleteThresholdDate;
-      });
-
-      let deleted = 0;
-      for (const email of emailsToDelete.slice(0, 100)) {
-        try {
-          await base44.asServiceRole.entities.EmailLog.delete(email.id);
-          deleted++;
-        } catch (err) {
-          console.error('Error deleting email log:', err);
-        }
-      }
+      const deleted = await runBatches('maintenance_delete_sent_email_logs', deleteThresholdDate);
 
       results.jobs.push({
         name: 'Clean EmailLog',
         status: 'completed',
-        deleted,
-        total: emailsToDelete.length
+        deleted
       });
 
     } catch (error) {
@@ -170,18 +126,16 @@ export async function maintenanceJobsHandler(req) {
     // JOB 4: Verificar órdenes huérfanas (sin customer)
     // ============================================
     try {
-      const orders = await base44.asServiceRole.entities.Order.filter({
-        deleted: false
-      });
-
-      const orphanedOrders = orders.filter(o => !o.customer_id || o.customer_id.trim() === '');
+      const rows = await base44.asServiceRole.rpc('maintenance_orphaned_orders');
+      const row = Array.isArray(rows) ? rows[0] : rows;
+      const orphaned = Number(row?.orphaned) || 0;
 
       results.jobs.push({
         name: 'Check Orphaned Orders',
         status: 'completed',
-        orphaned: orphanedOrders.length,
-        total: orders.length,
-        warning: orphanedOrders.length > 0 ? 'Found orders without customer_id' : null
+        orphaned,
+        total: Number(row?.total) || 0,
+        warning: orphaned > 0 ? 'Found orders without customer_id' : null
       });
 
     } catch (error) {
@@ -196,30 +150,13 @@ export async function maintenanceJobsHandler(req) {
     // JOB 5: Actualizar loyalty points de clientes
     // ============================================
     try {
-      const customers = await base44.asServiceRole.entities.Customer.list('name', 100);
-      
-      let updated = 0;
-      for (const customer of customers) {
-        // Recalcular loyalty points basado en total_spent
-        const expectedPoints = Math.floor((customer.total_spent || 0) / 10); // 1 punto por cada $10
-        
-        if (customer.loyalty_points !== expectedPoints) {
-          try {
-            await base44.asServiceRole.entities.Customer.update(customer.id, {
-              loyalty_points: expectedPoints
-            });
-            updated++;
-          } catch (err) {
-            console.error('Error updating customer:', err);
-          }
-        }
-      }
+      // 1 punto por cada $10; solo toca clientes desincronizados, por lotes
+      const updated = await runBatches('maintenance_sync_loyalty_points');
 
       results.jobs.push({
         name: 'Update Loyalty Points',
         status: 'completed',
-        updated,
-        total: customers.length
+        updated
       });
 
     } catch (error) {
@@ -1,4 +1,5 @@
 import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supabase.js';
+import { resetSequenceCounter } from './_sequenceAllocator.js';
 
 /**
  * ⚠️ FUNCIÓN DE MIGRACIÓN UNA SOLA VEZ
@@ -18,6 +19,9 @@ export async function migrateOrderNumbersHandler(req) {
       }, { status: 403 });
     }
 
+    const body = await req.json().catch(() => ({}));
+    const tenantId = user.tenant_id || body.tenant_id || null;
+
     const results = {
       orders: { migrated: 0, errors: 0 },
       sales: { migrated: 0, errors: 0 },
@@ -28,155 +32,92 @@ export async function migrateOrderNumbersHandler(req) {
 
     // ========== 1. MIGRAR ÓRDENES ==========
     console.log('🔄 Migrando órdenes...');
-    const orders = await base44.asServiceRole.entities.Order.filter(
-      { deleted: false },
-      'created_date',
-      10000
-    );
-
-    for (let i = 0; i < orders.length; i++) {
-      const order = orders[i];
-      const newNumber = `WO-${String(i + 1).padStart(2, '0')}`;
-      
-      try {
-        await base44.asServiceRole.entities.Order.update(order.id, {
-          order_number: newNumber
-        });
-        results.orders.migrated++;
-      } catch (err) {
-        console.error(`❌ Error migrando orden ${order.id}:`, err.message);
-        results.orders.errors++;
+    // Páginas keyset por (created_at, id): solo ids, sin tope de filas
+    let orderIndex = 0;
+    for await (const page of base44.asServiceRole.entities.Order.stream({ deleted: false }, { fields: ['id'] })) {
+      for (const order of page) {
+        const newNumber = `WO-${String(++orderIndex).padStart(2, '0')}`;
+
+        try {
+          await base44.asServiceRole.entities.Order.update(order.id, {
+            order_number: newNumber
+          });
+          results.orders.migrated++;
+        } catch (err) {
+          console.error(`❌ Error migrando orden ${order.id}:`, err.message);
+          results.orders.errors++;
+        }
       }
     }
 
-    // Actualizar contador
-    const orderCounters = await base44.asServiceRole.entities.SequenceCounter.filter({
-      sequence_type: 'order'
-    });
-    if (orderCounters.length > 0) {
-      await base44.asServiceRole.entities.SequenceCounter.update(orderCounters[0].id, {
-        current_count: orders.length
-      });
-    } else {
-      await base44.asServiceRole.entities.SequenceCounter.create({
-        sequence_type: 'order',
-        period_type: 'continuous',
-        period_key: 'global',
-        current_count: orders.length,
-        last_incremented_at: new Date().toISOString()
-      });
-    }
+    // Resincronizar contador con el máximo real
+    results.orders.counter = await resetSequenceCounter(base44, tenantId, 'order');
 
     // ========== 2. MIGRAR VENTAS ==========
     console.log('🔄 Migrando ventas...');
-    const sales = await base44.asServiceRole.entities.Sale.list('created_date', 10000);
-
-    for (let i = 0; i < sales.length; i++) {
-      const sale = sales[i];
-      const newNumber = `POS-${String(i + 1).padStart(2, '0')}`;
-      
-      try {
-        await base44.asServiceRole.entities.Sale.update(sale.id, {
-          sale_number: newNumber
-        });
-        results.sales.migrated++;
-      } catch (err) {
-        console.error(`❌ Error migrando venta ${sale.id}:`, err.message);
-        results.sales.errors++;
+    let saleIndex = 0;
+    for await (const page of base44.asServiceRole.entities.Sale.stream({}, { fields: ['id'] })) {
+      for (const sale of page) {
+        const newNumber = `POS-${String(++saleIndex).padStart(2, '0')}`;
+
+        try {
+          await base44.asServiceRole.entities.Sale.update(sale.id, {
+            sale_number: newNumber
+          });
+          results.sales.migrated++;
+        } catch (err) {
+          console.error(`❌ Error migrando venta ${sale.id}:`, err.message);
+          results.sales.errors++;
+        }
       }
     }
 
-    // Actualizar contador
-    const saleCounters = await base44.asServiceRole.entities.SequenceCounter.filter({
-      sequence_type: 'sale'
-    });
-    if (saleCounters.length > 0) {
-      await base44.asServiceRole.entities.SequenceCounter.update(saleCounters[0].id, {
-        current_count: sales.length
-      });
-    } else {
-      await base44.asServiceRole.entities.SequenceCounter.create({
-        sequence_type: 'sale',
-        period_type: 'continuous',
-        period_key: 'global',
-        current_count: sales.length,
-        last_incremented_at: new Date().toISOString()
-      });
-    }
+    // Resincronizar contador con el máximo real
+    results.sales.counter = await resetSequenceCounter(base44, tenantId, 'sale');
 
     // ========== 3. MIGRAR RECARGAS ==========
     console.log('🔄 Migrando recargas...');
-    const recharges = await base44.asServiceRole.entities.Recharge.list('created_date', 10000);
-
-    for (let i = 0; i < recharges.length; i++) {
-      const recharge = recharges[i];
-      const newNumber = `RCG-${String(i + 1).padStart(2, '0')}`;
-      
-      try {
-        await base44.asServiceRole.entities.Recharge.update(recharge.id, {
-          recharge_number: newNumber
-        });
-        results.recharges.migrated++;
-      } catch (err) {
-        console.error(`❌ Error migrando recarga ${recharge.id}:`, err.message);
-        results.recharges.errors++;
+    let rechargeIndex = 0;
+    for await (const page of base44.asServiceRole.entities.Recharge.stream({}, { fields: ['id'] })) {
+      for (const recharge of page) {
+        const newNumber = `RCG-${String(++rechargeIndex).padStart(2, '0')}`;
+
+        try {
+          await base44.asServiceRole.entities.Recharge.update(recharge.id, {
+            recharge_number: newNumber
+          });
+          results.recharges.migrated++;
+        } catch (err) {
+          console.error(`❌ Error migrando recarga ${recharge.id}:`, err.message);
+          results.recharges.errors++;
+        }
       }
     }
 
-    // Actualizar contador
-    const rechargeCounters = await base44.asServiceRole.entities.SequenceCounter.filter({
-      sequence_type: 'recharge'
-    });
-    if (rechargeCounters.length > 0) {
-      await base44.asServiceRole.entities.SequenceCounter.update(rechargeCounters[0].id, {
-        current_count: recharges.length
-      });
-    } else {
-      await base44.asServiceRole.entities.SequenceCounter.create({
-        sequence_type: 'recharge',
-        period_type: 'continuous',
-        period_key: 'global',
-        current_count: recharges.length,
-        last_incremented_at: new Date().toISOString()
-      });
-    }
+    // Resincronizar contador con el máximo real
+    results.recharges.counter = await resetSequenceCounter(base44, tenantId, 'recharge');
 
     // ========== 4. MIGRAR CLIENTES ==========
     console.log('🔄 Migrando clientes...');
-    const customers = await base44.asServiceRole.entities.Customer.list('created_date', 10000);
-
-    for (let i = 0; i < customers.length; i++) {
-      const customer = customers[i];
-      const newNumber = `CLT-${String(i + 1).padStart(2, '0')}`;
-      
-      try {
-        await base44.asServiceRole.entities.Customer.update(customer.id, {
-          customer_number: newNumber
-        });
-        results.customers.migrated++;
-      } catch (err) {
-        console.error(`❌ Error migrando cliente ${customer.id}:`, err.message);
-        results.customers.errors++;
+    let customerIndex = 0;
+    for await (const page of base44.asServiceRole.entities.Customer.stream({}, { fields: ['id'] })) {
+      for (const customer of page) {
+        const newNumber = `CLT-${String(++customerIndex).padStart(2, '0')}`;
+
+        try {
+          await base44.asServiceRole.entities.Customer.update(customer.id, {
+            customer_number: newNumber
+          });
+          results.customers.migrated++;
+        } catch (err) {
+          console.error(`❌ Error migrando cliente ${customer.id}:`, err.message);
+          results.customers.errors++;
+        }
       }
     }
 
-    // Actualizar contador
-    const customerCounters = await base44.asServiceRole.entities.SequenceCounter.filter({
-      sequence_type: 'customer'
-    });
-    if (customerCounters.length > 0) {
-      await base44.asServiceRole.entities.SequenceCounter.update(customerCounters[0].id, {
-        current_count: customers.length
-      });
-    } else {
-      await base44.asServiceRole.entities.SequenceCounter.create({
-        sequence_type: 'customer',
-        period_type: 'continuous',
-        period_key: 'global',
-        current_count: customers.length,
-        last_incremented_at: new Date().toISOString()
-      });
-    }
+    // Resincronizar contador con el máximo real
+    results.customers.counter = await resetSequenceCounter(base44, tenantId, 'customer');
 
     console.log('✅ MIGRACIÓN COMPLETADA');
     return Response.json({
@@ -1,4 +1,5 @@
 import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supabase.js';
+import { enqueueEmails } from './_emailQueue.js';
 
 export async function notifyPickupReminderHandler(req) {
   console.log("🦕 notifyPickupReminder called");
@@ -23,6 +24,7 @@ export async function notifyPickupReminderHandler(req) {
 
     const now = new Date();
     const notified = [];
+    const messages = [];
 
     for (const order of orders) {
       try {
@@ -76,10 +78,12 @@ export async function notifyPickupReminderHandler(req) {
             </div>
           `;
 
-          await base44.integrations.Core.SendEmail({
+          messages.push({
             to: customer,
             subject,
-            body
+            html: body,
+            tenant_id: freshOrder.tenant_id,
+            meta: { event_type: 'pickup_reminder_15', order_number: freshOrder.order_number }
           });
 
           notified.push(freshOrder.order_number);
@@ -89,6 +93,9 @@ export async function notifyPickupReminderHandler(req) {
       }
     }
 
+    // Un solo INSERT en la cola; _emailQueue.js los envía en batch
+    await enqueueEmails(base44, messages);
+
     return Response.json({ 
       message: `Procesadas ${orders.length} órdenes`,
       notified: notified.length,
@@ -0,0 +1,31 @@
+import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supabase.js';
+import { drainEmailQueue, getEmailQueueMetrics } from './_emailQueue.js';
+
+const CRON_SECRET = Deno.env.get('CRON_SECRET');
+
+/**
+ * Drain the outbound email queue (communication_queue, type = 'email').
+ * Call from cron when EMAIL_QUEUE_WORKER is off; safe to call while the
+ * worker is running. GET or POST /processEmailQueue
+ */
+export async function processEmailQueueHandler(req) {
+  if (CRON_SECRET && req.headers.get('x-cron-secret') !== CRON_SECRET) {
+    return Response.json({ error: 'Unauthorized' }, { status: 401 });
+  }
+
+  try {
+    const base44 = createClientFromRequest(req, {
+      functionsBaseUrl: Deno.env.get('VITE_FUNCTION_URL'),
+      entitiesPath: new URL('../Entities', import.meta.url).pathname,
+    });
+
+    const processed = await drainEmailQueue(base44);
+    const rows = await base44.asServiceRole.rpc('email_queue_stats').catch(() => null);
+    const queue = Array.isArray(rows) ? rows[0] : rows;
+
+    return Response.json({ processed, queue, metrics: getEmailQueueMetrics() });
+  } catch (error) {
+    console.error('❌ Error en processEmailQueue:', error);
+    return Response.json({ error: error.message, processed: 0 }, { status: 500 });
+  }
+}
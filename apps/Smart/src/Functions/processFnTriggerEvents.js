@@ -1,6 +1,20 @@
+import { mapWithConcurrency } from './_concurrency.js';
+
 const FUNCTIONS_BASE_URL = Deno.env.get('VITE_FUNCTION_URL') || 'http://localhost:8585';
 const CRON_SECRET = Deno.env.get('CRON_SECRET');
 
+// Queue tuning (see db/seeds/024_fn_trigger_queue.sql)
+const BATCH_SIZE = parseInt(Deno.env.get('FN_TRIGGER_BATCH_SIZE') || '50', 10);
+const CONCURRENCY = parseInt(Deno.env.get('FN_TRIGGER_CONCURRENCY') || '8', 10);
+const LEASE_SECONDS = parseInt(Deno.env.get('FN_TRIGGER_LEASE_SECONDS') || '300', 10);
+const POLL_MIN_MS = parseInt(Deno.env.get('FN_TRIGGER_POLL_MIN_MS') || '1000', 10);
+const POLL_MAX_MS = parseInt(Deno.env.get('FN_TRIGGER_POLL_MAX_MS') || '30000', 10);
+const STATS_INTERVAL_MS = parseInt(Deno.env.get('FN_TRIGGER_STATS_INTERVAL_MS') || '15000', 10);
+const RULE_CACHE_TTL_MS = 5 * 60 * 1000;
+
+// Identifies this instance's leases
+const LEASE_OWNER = `${Deno.env.get('HOSTNAME') || 'fn'}-${crypto.randomUUID().slice(0, 8)}`;
+
 function tableNameToEntityName(tableName) {
   if (!tableName || typeof tableName !== 'string') return '';
   return tableName.split('_').map((s) => s.charAt(0).toUpperCase() + s.slice(1).toLowerCase()).join('');
@@ -16,8 +30,218 @@ function isCronAuthorized(req) {
   return req.headers.get('x-cron-secret') === CRON_SECRET;
 }
 
+// ── Metrics ──────────────────────────────────────────────────────────
+const metrics = {
+  queue_depth: 0,
+  leased: 0,
+  lag_seconds: 0,
+  oldest_pending_at: null,
+  stats_refreshed_at: null,
+  processed_total: 0,
+  failed_total: 0,
+  batches: 0,
+  last_batch_size: 0,
+  last_batch_ms: 0,
+  rule_cache_reloads: 0,
+  rules_version: null,
+  worker_running: false,
+  poll_interval_ms: POLL_MIN_MS,
+};
+
+/**
+ * Queue depth, lag and throughput counters of this instance.
+ */
+export function getFnTriggerMetrics() {
+  return { ...metrics, lease_owner: LEASE_OWNER };
+}
+
+// fn_trigger_queue_stats counts every pending event, so its cost grows with
+// the backlog: refreshed at most every FN_TRIGGER_STATS_INTERVAL_MS instead
+// of on every poll. Leasing does not depend on it.
+let statsRefreshedAt = 0;
+
+async function refreshQueueStats(base44) {
+  if (Date.now() - statsRefreshedAt < STATS_INTERVAL_MS) return;
+  statsRefreshedAt = Date.now();
+  const rows = await base44.asServiceRole.rpc('fn_trigger_queue_stats');
+  const row = Array.isArray(rows) ? rows[0] : rows;
+  metrics.queue_depth = Number(row?.pending) || 0;
+  metrics.leased = Number(row?.leased) || 0;
+  metrics.lag_seconds = Math.round(Number(row?.lag_seconds) || 0);
+  metrics.oldest_pending_at = row?.oldest_pending_at || null;
+  metrics.stats_refreshed_at = new Date(statsRefreshedAt).toISOString();
+}
+
+async function fetchRulesVersion(base44) {
+  const version = await base44.asServiceRole.rpc('fn_trigger_rules_version');
+  return Number(Array.isArray(version) ? version[0] : version) || 0;
+}
+
+// ── Rule cache ───────────────────────────────────────────────────────
+// Active entity rules grouped by entity_name. Reloaded when
+// fn_trigger_rule_version changes (config edits) or after RULE_CACHE_TTL_MS.
+const ruleCache = { version: null, loadedAt: 0, byEntity: new Map() };
+
+async function getRulesByEntity(base44, rulesVersion) {
+  const fresh = ruleCache.version === rulesVersion && Date.now() - ruleCache.loadedAt < RULE_CACHE_TTL_MS;
+  if (fresh) return ruleCache.byEntity;
+
+  const rules = await base44.asServiceRole.entities.FnTriggerRule.filter({
+    automation_type: 'entity',
+    is_active: true,
+    is_archived: false,
+  });
+  const byEntity = new Map();
+  for (const r of rules || []) {
+    if (!r.entity_name || !r.function_name) continue;
+    if (!byEntity.has(r.entity_name)) byEntity.set(r.entity_name, []);
+    byEntity.get(r.entity_name).push(r);
+  }
+  ruleCache.version = rulesVersion;
+  ruleCache.loadedAt = Date.now();
+  ruleCache.byEntity = byEntity;
+  metrics.rule_cache_reloads++;
+  metrics.rules_version = rulesVersion;
+  return byEntity;
+}
+
+// ── Processing ───────────────────────────────────────────────────────
+async function runRule(rule, payload) {
+  try {
+    const res = await fetch(`${FUNCTIONS_BASE_URL}/${rule.function_name}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(payload),
+    });
+    if (res.ok) {
+      await res.body?.cancel();
+      return { ok: true };
+    }
+    const text = await res.text();
+    return { ok: false, error: text.slice(0, 500) };
+  } catch (err) {
+    return { ok: false, error: err.message };
+  }
+}
+
+function recordRun(runStats, ruleId, ok) {
+  const s = runStats.get(ruleId) || { id: ruleId, ok: 0, failed: 0, last_ok: true, trailing_failures: 0 };
+  if (ok) {
+    s.ok++;
+    s.trailing_failures = 0;
+  } else {
+    s.failed++;
+    s.trailing_failures++;
+  }
+  s.last_ok = ok;
+  runStats.set(ruleId, s);
+}
+
+async function processEvent(ev, rulesByEntity, runStats) {
+  const entityName = tableNameToEntityName(ev.table_name);
+  const eventType = pgEventToEventType(ev.event_type);
+  const rules = (rulesByEntity.get(entityName) || []).filter(
+    (r) => !r.event_types?.length || (Array.isArray(r.event_types) && r.event_types.includes(eventType))
+  );
+
+  const payload = {
+    event: { type: eventType },
+    data: ev.new_record ?? null,
+    old_data: ev.old_record ?? null,
+  };
+
+  // Rules of one event are independent → run them together
+  const outcomes = await Promise.all(rules.map((r) => runRule(r, payload)));
+
+  let lastError = null;
+  outcomes.forEach((o, i) => {
+    recordRun(runStats, rules[i].id, o.ok);
+    if (!o.ok) lastError = o.error;
+  });
+
+  return { id: ev.id, table: ev.table_name, event: eventType, automations_run: rules.length, error: lastError || undefined };
+}
+
+/**
+ * Lease and process one batch. Events of the same record keep their order;
+ * different records run with bounded concurrency.
+ * @returns {Promise<Array<Object>>} per-event results (empty when the queue is idle)
+ */
+async function processBatch(base44) {
+  try {
+    await refreshQueueStats(base44);
+  } catch (e) {
+    console.error('Failed to refresh fn-trigger queue stats:', e);
+  }
+
+  const started = Date.now();
+  const events = await base44.asServiceRole.rpc('fn_trigger_lease_events', {
+    p_owner: LEASE_OWNER,
+    p_limit: BATCH_SIZE,
+    p_lease_seconds: LEASE_SECONDS,
+  });
+  if (!events || events.length === 0) return [];
+
+  let rulesByEntity;
+  try {
+    rulesByEntity = await getRulesByEntity(base44, await fetchRulesVersion(base44));
+  } catch (e) {
+    // Close the batch with the error (same behavior as before)
+    await base44.asServiceRole.rpc('fn_trigger_complete_events', {
+      p_owner: LEASE_OWNER,
+      p_results: events.map((ev) => ({ id: ev.id, error: e.message })),
+    });
+    metrics.failed_total += events.length;
+    return events.map((ev) => ({ id: ev.id, status: 'error', error: e.message }));
+  }
+
+  // Group by record so updates of the same order are delivered in order
+  // (UPDATE ... RETURNING does not preserve the lease ORDER BY)
+  events.sort((a, b) => String(a.created_at).localeCompare(String(b.created_at)));
+  const groups = new Map();
+  for (const ev of events) {
+    const recordId = ev.new_record?.id ?? ev.old_record?.id ?? ev.id;
+    const key = `${ev.table_name}:${recordId}`;
+    if (!groups.has(key)) groups.set(key, []);
+    groups.get(key).push(ev);
+  }
+
+  const runStats = new Map();
+  const results = [];
+  await mapWithConcurrency([...groups.values()], CONCURRENCY, async (group) => {
+    for (const ev of group) {
+      try {
+        results.push(await processEvent(ev, rulesByEntity, runStats));
+      } catch (e) {
+        results.push({ id: ev.id, status: 'error', error: e.message });
+      }
+    }
+  });
+
+  if (runStats.size > 0) {
+    try {
+      await base44.asServiceRole.rpc('fn_trigger_record_runs', { p_runs: [...runStats.values()] });
+    } catch (e) {
+      console.error('Failed to record fn-trigger rule runs:', e);
+    }
+  }
+
+  await base44.asServiceRole.rpc('fn_trigger_complete_events', {
+    p_owner: LEASE_OWNER,
+    p_results: results.map((r) => ({ id: r.id, error: r.error || null })),
+  });
+
+  metrics.batches++;
+  metrics.last_batch_size = results.length;
+  metrics.last_batch_ms = Date.now() - started;
+  metrics.processed_total += results.length;
+  metrics.failed_total += results.filter((r) => r.error).length;
+  return results;
+}
+
 /**
  * Process fn_trigger_event queue (Supabase). Call from cron. GET or POST /processFnTriggerEvents
+ * Processes a single leased batch; safe to call while the worker is running.
  */
 export async function processFnTriggerEventsHandler(req) {
   if (!isCronAuthorized(req)) {
@@ -29,97 +253,59 @@ export async function processFnTriggerEventsHandler(req) {
     entitiesPath: new URL('../Entities', import.meta.url).pathname,
   });
 
-  let events;
+  let results;
   try {
-    events = await base44.asServiceRole.entities.FnTriggerEvent.filter(
-      { processed_at: { $null: true } },
-      'created_at',
-      50
-    );
+    results = await processBatch(base44);
   } catch (e) {
-    console.error('Failed to load fn_trigger_event:', e);
+    console.error('Failed to process fn_trigger_event:', e);
     return Response.json({ error: e.message, processed: 0 }, { status: 500 });
   }
 
-  if (!events || events.length === 0) {
-    return Response.json({ processed: 0, message: 'No pending events' });
+  if (results.length === 0) {
+    return Response.json({ processed: 0, message: 'No pending events', metrics: getFnTriggerMetrics() });
   }
+  return Response.json({ processed: results.length, results, metrics: getFnTriggerMetrics() });
+}
 
-  const results = [];
+/**
+ * In-process worker with adaptive polling: drains back-to-back while there is
+ * a backlog, then backs off (doubling) up to FN_TRIGGER_POLL_MAX_MS when idle.
+ * Several instances can run it at once; leases prevent double processing.
+ */
+export async function startFnTriggerWorker() {
+  if (metrics.worker_running) return;
+  metrics.worker_running = true;
 
-  for (const ev of events) {
-    const entityName = tableNameToEntityName(ev.table_name);
-    const eventType = pgEventToEventType(ev.event_type);
+  let base44;
+  try {
+    const { createUnifiedClient } = await import('../../../../lib/unified-custom-sdk-supabase.js');
+    base44 = createUnifiedClient({
+      functionsBaseUrl: FUNCTIONS_BASE_URL,
+      entitiesPath: new URL('../Entities', import.meta.url).pathname,
+    });
+  } catch (e) {
+    metrics.worker_running = false;
+    throw e;
+  }
 
-    let rules;
+  console.log(`📋 Fn-trigger worker started (${LEASE_OWNER}, batch ${BATCH_SIZE}, concurrency ${CONCURRENCY})`);
+
+  let delay = POLL_MIN_MS;
+  while (metrics.worker_running) {
     try {
-      rules = await base44.asServiceRole.entities.FnTriggerRule.filter({
-        automation_type: 'entity',
-        is_active: true,
-        is_archived: false,
-        entity_name: entityName,
-      });
+      const results = await processBatch(base44);
+      delay = results.length > 0 ? 0 : Math.min(Math.max(delay * 2, POLL_MIN_MS), POLL_MAX_MS);
     } catch (e) {
-      await base44.asServiceRole.entities.FnTriggerEvent.update(ev.id, {
-        processed_at: new Date().toISOString(),
-        error: e.message,
-      });
-      results.push({ id: ev.id, status: 'error', error: e.message });
-      continue;
+      console.error('Fn-trigger worker error:', e);
+      delay = POLL_MAX_MS;
     }
-
-    const payload = {
-      event: { type: eventType },
-      data: ev.new_record ?? null,
-      old_data: ev.old_record ?? null,
-    };
-
-    let lastError = null;
-    let ran = 0;
-
-    for (const r of rules || []) {
-      const allowed = !r.event_types?.length || (Array.isArray(r.event_types) && r.event_types.includes(eventType));
-      if (!allowed || !r.function_name) continue;
-
-      try {
-        const res = await fetch(`${FUNCTIONS_BASE_URL}/${r.function_name}`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify(payload),
-        });
-        const ok = res.ok;
-        ran++;
-        await base44.asServiceRole.entities.FnTriggerRule.update(r.id, {
-          last_run_at: new Date().toISOString(),
-          last_run_status: ok ? 'success' : 'failure',
-          total_runs: (r.total_runs || 0) + 1,
-          successful_runs: ok ? (r.successful_runs || 0) + 1 : (r.successful_runs || 0),
-          failed_runs: ok ? (r.failed_runs || 0) : (r.failed_runs || 0) + 1,
-          consecutive_failures: ok ? 0 : (r.consecutive_failures || 0) + 1,
-        });
-        if (!ok) {
-          const text = await res.text();
-          lastError = text.slice(0, 500);
-        }
-      } catch (err) {
-        lastError = err.message;
-        ran++;
-        await base44.asServiceRole.entities.FnTriggerRule.update(r.id, {
-          last_run_at: new Date().toISOString(),
-          last_run_status: 'failure',
-          total_runs: (r.total_runs || 0) + 1,
-          failed_runs: (r.failed_runs || 0) + 1,
-          consecutive_failures: (r.consecutive_failures || 0) + 1,
-        });
-      }
+    metrics.poll_interval_ms = delay;
+    if (delay > 0) {
+      await new Promise((resolve) => setTimeout(resolve, delay));
     }
-
-    await base44.asServiceRole.entities.FnTriggerEvent.update(ev.id, {
-      processed_at: new Date().toISOString(),
-      error: lastError || null,
-    });
-    results.push({ id: ev.id, table: ev.table_name, event: eventType, automations_run: ran, error: lastError || undefined });
   }
+}
 
-  return Response.json({ processed: results.length, results });
+export function stopFnTriggerWorker() {
+  metrics.worker_running = false;
 }
@@ -1,10 +1,12 @@
 import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supabase.js';
+import { SEQUENCE_TYPES, SEQUENCE_PREFIXES, formatSequenceNumber, resetSequenceCounter } from './_sequenceAllocator.js';
 
 /**
  * HERRAMIENTA DE REPARACIÓN: Resincroniza todos los contadores de secuencia
  * con los números reales más altos en la base de datos.
  * 
  * Uso: POST /resetSequenceCounters con body {}
+ * Resincroniza los contadores del tenant del admin.
  * SOLO ACCESO ADMIN
  */
 export async function resetSequenceCountersHandler(req) {
@@ -20,67 +22,26 @@ export async function resetSequenceCountersHandler(req) {
       );
     }
 
-    const sequence_types = [
-      { type: 'order', entity: 'Order', field: 'order_number', prefix: 'WO' },
-      { type: 'sale', entity: 'Sale', field: 'sale_number', prefix: 'POS' },
-      { type: 'recharge', entity: 'Recharge', field: 'recharge_number', prefix: 'RCG' },
-      { type: 'unlock', entity: 'Order', field: 'order_number', prefix: 'UNL' },
-      { type: 'customer', entity: 'Customer', field: 'customer_number', prefix: 'CLT' }
-    ];
+    // Contadores del tenant del admin (o el indicado en body para llamadas internas)
+    const body = await req.json().catch(() => ({}));
+    const tenantId = user.tenant_id || body.tenant_id || null;
 
     const results = {};
 
-    for (const config of sequence_types) {
+    for (const type of SEQUENCE_TYPES) {
+      const prefix = SEQUENCE_PREFIXES[type];
       try {
-        // 1️⃣ Buscar número máximo real
-        const allRecords = await base44.asServiceRole.entities[config.entity].list(null, 50000);
-        let maxNumber = 0;
+        // Máximo real calculado en Postgres y guardado en el contador
+        const maxNumber = await resetSequenceCounter(base44, tenantId, type);
 
-        if (allRecords && allRecords.length > 0) {
-          for (const record of allRecords) {
-            const numberStr = record[config.field];
-            if (numberStr && numberStr.startsWith(config.prefix + '-')) {
-              const numPart = numberStr.replace(config.prefix + '-', '');
-              const num = parseInt(numPart, 10);
-              if (!isNaN(num) && num > maxNumber) {
-                maxNumber = num;
-              }
-            }
-          }
-        }
-
-        // 2️⃣ Actualizar o crear contador con el máximo real
-        const existingCounters = await base44.asServiceRole.entities.SequenceCounter.filter({
-          sequence_type: config.type,
-          period_key: 'global'
-        });
-
-        if (existingCounters.length > 0) {
-          await base44.asServiceRole.entities.SequenceCounter.update(
-            existingCounters[0].id,
-            {
-              current_count: maxNumber,
-              last_incremented_at: new Date().toISOString()
-            }
-          );
-        } else {
-          await base44.asServiceRole.entities.SequenceCounter.create({
-            sequence_type: config.type,
-            period_type: 'continuous',
-            period_key: 'global',
-            current_count: maxNumber,
-            last_incremented_at: new Date().toISOString()
-          });
-        }
-
-        results[config.type] = {
+        results[type] = {
           success: true,
           max_found: maxNumber,
           next_will_be: maxNumber + 1,
-          message: `✅ ${config.prefix}: ${maxNumber} → próximo será ${config.prefix}-${String(maxNumber + 1).padStart(2, '0')}`
+          message: `✅ ${prefix}: ${maxNumber} → próximo será ${formatSequenceNumber(prefix, maxNumber + 1)}`
         };
       } catch (error) {
-        results[config.type] = {
+        results[type] = {
           success: false,
           error: error.message
         };
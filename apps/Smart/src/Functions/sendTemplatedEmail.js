@@ -11,8 +11,9 @@ export async function sendTemplatedEmailHandler(req) {
 
     // Auth: verificar sesión cuando sea posible, pero no bloquear el envío
     // si el token no puede validarse (función interna llamada desde el frontend autenticado)
+    let user = null;
     try {
-      const user = await base44.auth.me();
+      user = await base44.auth.me();
       if (!user) {
         console.warn("[sendTemplatedEmail] No se pudo verificar el usuario, continuando con service role");
       }
@@ -20,12 +21,17 @@ export async function sendTemplatedEmailHandler(req) {
       console.warn("[sendTemplatedEmail] Auth check failed, continuando:", authErr?.message);
     }
 
-    const { event_type, order_data } = await req.json();
+    const { event_type, order_data, tenant_id } = await req.json();
     if (!event_type) {
       return Response.json({ error: 'event_type es requerido' }, { status: 400 });
     }
 
-    const result = await sendTemplatedEmailWithBase44(base44, { event_type, order_data });
+    // Plantillas y branding del tenant del usuario
+    const result = await sendTemplatedEmailWithBase44(base44, {
+      event_type,
+      order_data,
+      tenant_id: user?.tenant_id || tenant_id || order_data?.tenant_id || null
+    });
     if (result?.success === false) {
       return Response.json(result);
     }
@@ -8,7 +8,10 @@ import { aiChatHandler } from './aiChat.js';
 import { sendEmailInternalHandler } from './sendEmailInternal.js';
 import { runScheduledFnTriggersHandler } from './runScheduledFnTriggers.js';
 import { onEntityFnTriggerHandler } from './onEntityFnTrigger.js';
-import { processFnTriggerEventsHandler } from './processFnTriggerEvents.js';
+import { processFnTriggerEventsHandler, startFnTriggerWorker, getFnTriggerMetrics } from './processFnTriggerEvents.js';
+import { processEmailQueueHandler } from './processEmailQueue.js';
+import { startEmailQueueWorker, getEmailQueueMetrics } from './_emailQueue.js';
+import { getEmailTemplateStats } from './emailTemplateRuntime.js';
 import { sendEmailHandler } from './sendEmail.js';
 import { uploadFileHandler } from './uploadFile.js';
 import { generateSequenceNumberHandler } from './generateSequenceNumber.js';
@@ -52,9 +55,12 @@ import { processPayrollHandler } from './processPayroll.js';
 import { verifyAdminOtpHandler } from './verifyAdminOtp.js';
 import { trackParcelHandler } from './trackParcel.js';
 import { geminiSummaryHandler } from './geminiSummary.js';
+import { aiJobHandler } from './aiJob.js';
+import { getAiCacheStats } from './_aiCache.js';
+import { getAiJobMetrics } from './_aiJobs.js';
 import { geminiCategorizeExpenseHandler } from './geminiCategorizeExpense.js';
 import { gaccDataProxyHandler } from './gaccDataProxy.js';
-import { setRequestAuthToken, clearRequestAuthToken } from '../../../../lib/unified-custom-sdk-supabase.js';
+import { runWithRequestAuth, getClientPoolStats } from '../../../../lib/unified-custom-sdk-supabase.js';
 import { checkRateLimit } from './_rateLimit.js';
 import { sanitizeRequest } from './_sanitize.js';
 
@@ -76,6 +82,7 @@ const unwrappedRoutes = new Set([
   '/ai/gemini-summary',
   '/ai/categorize-expense',
   '/ai/generate-image',
+  '/ai/job',
   '/sendEmailInternal',
   '/stripeWebhook',     // Stripe espera respuesta directa sin wrapper
   '/registerTenant',    // Maneja su propio JSON — el wrapper rompe el error handling del SDK
@@ -95,6 +102,7 @@ const routes = {
 '/runScheduledFnTriggers': runScheduledFnTriggersHandler,
 '/onEntityFnTrigger': onEntityFnTriggerHandler,
 '/processFnTriggerEvents': processFnTriggerEventsHandler,
+'/processEmailQueue': processEmailQueueHandler,
   '/sendEmail': sendEmailHandler,
   '/uploadFile': uploadFileHandler,
   '/generateSequenceNumber': generateSequenceNumberHandler,
@@ -139,6 +147,7 @@ const routes = {
   '/trackParcel': trackParcelHandler,
   '/ai/gemini-summary': geminiSummaryHandler,
   '/ai/categorize-expense': geminiCategorizeExpenseHandler,
+  '/ai/job': aiJobHandler,
 };
 // In production, silence console.log/info/debug to reduce log noise (~221 calls
 // across handlers). Keep console.error and console.warn for visibility into
@@ -152,7 +161,15 @@ if (Deno.env.get("DENO_ENV") === "production") {
 
 const port = parseInt(Deno.env.get("FUNCTIONS_PORT") || "8686");
 console.log(`🌐 Functions server port is ${port}`);
-Deno.serve({ port, hostname: "::" }, async (req) => {
+// Each request runs in its own auth context (AsyncLocalStorage), so concurrent
+// requests never see each other's token.
+Deno.serve({ port, hostname: "::" }, (req) => {
+  const authHeader = req.headers.get('Authorization');
+  const token = authHeader && authHeader.startsWith('Bearer ') ? authHeader.substring(7) : null;
+  return runWithRequestAuth(token, () => handleRequest(req));
+});
+
+async function handleRequest(req) {
   const url = new URL(req.url);
   const path = url.pathname;
 
@@ -184,12 +201,6 @@ const isDev = Deno.env.get("DENO_ENV") !== "production";
     );
   }
 
-  // Extract auth token from Authorization header for unified auth
-  const authHeader = req.headers.get('Authorization');
-  if (authHeader && authHeader.startsWith('Bearer ')) {
-    setRequestAuthToken(authHeader.substring(7));
-  }
-
   // GACC data proxy (SuperAdmin panel) — prefix route, not exact-match,
   // because Supabase REST/Storage paths are dynamic per table/bucket
   // (/gaccdata/rest/v1/<table>). See gaccDataProxy.js for the auth model.
@@ -264,15 +275,12 @@ const isDev = Deno.env.get("DENO_ENV") !== "production";
           headers: { ...corsHeaders, 'Content-Type': 'application/json' }
         }
       );
-    } finally {
-      // Clear auth token after request processing
-      clearRequestAuthToken();
     }
   }
 
   // Health check (Render requires 2xx on healthCheckPath)
   if (path === '/' || path === '/health') {
-    return new Response(JSON.stringify({ status: 'ok', service: 'Archilla OS Functions' }), {
+    return new Response(JSON.stringify({ status: 'ok', service: 'Archilla OS Functions', clientPool: getClientPoolStats(), fnTriggers: getFnTriggerMetrics(), aiCache: getAiCacheStats(), aiJobs: getAiJobMetrics(), emailQueue: getEmailQueueMetrics(), emailTemplates: getEmailTemplateStats() }), {
       status: 200,
       headers: { ...corsHeaders, 'Content-Type': 'application/json' },
     });
@@ -286,9 +294,18 @@ const isDev = Deno.env.get("DENO_ENV") !== "production";
       headers: { ...corsHeaders, 'Content-Type': 'application/json' }
     }
   );
-});
+}
 
 console.log(` Functions server started on http://localhost:${port}` );
+
+// Fn-trigger queue worker (replaces the fixed cron for /processFnTriggerEvents)
+if (Deno.env.get("FN_TRIGGER_WORKER") === "true") {
+  startFnTriggerWorker().catch((error) => console.error('💥 Fn-trigger worker stopped:', error));
+}
+// Outbound email queue worker (retries + rows queued by other instances)
+if (Deno.env.get("EMAIL_QUEUE_WORKER") === "true") {
+  startEmailQueueWorker().catch((error) => console.error('💥 Email queue worker stopped:', error));
+}
 console.log("📋 Available routes:");
 console.log(`   🔧 /sendEmail: http://localhost:$${port}/sendEmail` );
 console.log(`   🔧 /uploadFile: http://localhost:$${port}/uploadFile` );
@@ -332,3 +349,4 @@ console.log(`   📧 /sendEmail: http://localhost:${port}/sendEmail` );
 console.log(`   ⏰ /runScheduledFnTriggers: http://localhost:${port}/runScheduledFnTriggers` );
 console.log(`   📬 /onEntityFnTrigger: http://localhost:${port}/onEntityFnTrigger` );
 console.log(`   📋 /processFnTriggerEvents: http://localhost:${port}/processFnTriggerEvents` );
+console.log(`   📧 /processEmailQueue: http://localhost:${port}/processEmailQueue` );
@@ -1,9 +1,13 @@
 import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supabase.js';
+import { enqueueEmails } from './_emailQueue.js';
 
 // 📧 NOTIFICACIONES DE TRIAL AUTOMÁTICAS
 // 1. Recordatorio 7 días antes de expirar
 // 2. Notificación de expiración
 // 3. Mensaje post-activación de plan
+// Los emails salen por la cola (_emailQueue.js); checkAndNotifyAll junta los
+// de todos los tenants y los encola con un solo INSERT; lo que registra cada
+// email (Notification, flags del tenant) se escribe solo después de encolarlo.
 
 export async function trialNotificationServiceHandler(req) {
   console.log("🦕 trialNotificationService called");
@@ -34,8 +38,19 @@ export async function trialNotificationServiceHandler(req) {
   }
 };
 
+// record() escribe lo que marca el email como enviado. Con outbox espera al
+// INSERT de checkAndNotifyAll: si falla, ningún tenant queda marcado
+async function queueEmail(base44, message, outbox, record) {
+  if (outbox) {
+    outbox.push({ message, record });
+    return;
+  }
+  await enqueueEmails(base44, [message]);
+  await record();
+}
+
 // 📧 Recordatorio 7 días antes de expirar
-async function sendTrialReminder(base44, tenantId) {
+async function sendTrialReminder(base44, tenantId, outbox = null) {
   const tenant = await base44.entities.Tenant.get(tenantId);
   
   if (!tenant || !tenant.trial_end_date) {
@@ -64,27 +79,30 @@ async function sendTrialReminder(base44, tenantId) {
     </div>
   `;
 
-  await base44.integrations.Core.SendEmail({
+  await queueEmail(base44, {
     to: tenant.email,
     subject: '⏰ Tu prueba gratuita vence en 7 días',
-    body: emailBody,
-    from_name: 'Archilla OS'
-  });
-
-  // Log notification
-  await base44.entities.Notification.create({
-    to_email: tenant.email,
-    subject: 'Trial reminder (7 days)',
-    type: 'trial_reminder',
+    html: emailBody,
+    from_name: 'Archilla OS',
     tenant_id: tenantId,
-    sent_at: new Date().toISOString(),
+    meta: { type: 'trial_reminder' }
+  }, outbox, async () => {
+    // Log notification
+    await base44.entities.Notification.create({
+      to_email: tenant.email,
+      subject: 'Trial reminder (7 days)',
+      type: 'trial_reminder',
+      tenant_id: tenantId,
+      sent_at: new Date().toISOString(),
+    });
+    await base44.entities.Tenant.update(tenantId, { trial_reminder_sent: true });
   });
 
   return Response.json({ success: true, message: 'Trial reminder sent' });
 }
 
 // 📧 Notificación de expiración
-async function sendTrialExpiration(base44, tenantId) {
+async function sendTrialExpiration(base44, tenantId, outbox = null) {
   const tenant = await base44.entities.Tenant.get(tenantId);
   
   if (!tenant) {
@@ -110,33 +128,35 @@ async function sendTrialExpiration(base44, tenantId) {
     </div>
   `;
 
-  await base44.integrations.Core.SendEmail({
+  await queueEmail(base44, {
     to: tenant.email,
     subject: '⚠️ Tu período de prueba ha expirado',
-    body: emailBody,
-    from_name: 'Archilla OS'
-  });
-
-  // Log notification
-  await base44.entities.Notification.create({
-    to_email: tenant.email,
-    subject: 'Trial expired notification',
-    type: 'trial_expired',
+    html: emailBody,
+    from_name: 'Archilla OS',
     tenant_id: tenantId,
-    sent_at: new Date().toISOString(),
-  });
-
-  // Update tenant
-  await base44.entities.Tenant.update(tenantId, {
-    trial_status: 'expired',
-    subscription_status: 'inactive'
+    meta: { type: 'trial_expired' }
+  }, outbox, async () => {
+    // Log notification
+    await base44.entities.Notification.create({
+      to_email: tenant.email,
+      subject: 'Trial expired notification',
+      type: 'trial_expired',
+      tenant_id: tenantId,
+      sent_at: new Date().toISOString(),
+    });
+
+    // Update tenant
+    await base44.entities.Tenant.update(tenantId, {
+      trial_status: 'expired',
+      subscription_status: 'inactive'
+    });
   });
 
   return Response.json({ success: true, message: 'Trial expiration notification sent' });
 }
 
 // 📧 Confirmación post-activación
-async function sendActivationConfirmation(base44, tenantId) {
+async function sendActivationConfirmation(base44, tenantId, outbox = null) {
   const tenant = await base44.entities.Tenant.get(tenantId);
   
   if (!tenant) {
@@ -164,20 +184,22 @@ async function sendActivationConfirmation(base44, tenantId) {
     </div>
   `;
 
-  await base44.integrations.Core.SendEmail({
+  await queueEmail(base44, {
     to: tenant.email,
     subject: '✅ Tu plan en Archilla OS está activo',
-    body: emailBody,
-    from_name: 'Archilla OS'
-  });
-
-  // Log notification
-  await base44.entities.Notification.create({
-    to_email: tenant.email,
-    subject: 'Plan activated',
-    type: 'plan_activated',
+    html: emailBody,
+    from_name: 'Archilla OS',
     tenant_id: tenantId,
-    sent_at: new Date().toISOString(),
+    meta: { type: 'plan_activated' }
+  }, outbox, async () => {
+    // Log notification
+    await base44.entities.Notification.create({
+      to_email: tenant.email,
+      subject: 'Plan activated',
+      type: 'plan_activated',
+      tenant_id: tenantId,
+      sent_at: new Date().toISOString(),
+    });
   });
 
   return Response.json({ success: true, message: 'Activation confirmation sent' });
@@ -187,6 +209,7 @@ async function sendActivationConfirmation(base44, tenantId) {
 async function checkAndNotifyAll(base44) {
   const tenants = await base44.entities.Tenant.list("-created_date", 1000);
   const results = { reminders: 0, expirations: 0, errors: 0 };
+  const outbox = [];
 
   for (const tenant of tenants) {
     try {
@@ -198,14 +221,13 @@ async function checkAndNotifyAll(base44) {
 
       // Reminder at 7 days
       if (daysLeft === 7 && !tenant.trial_reminder_sent) {
-        await sendTrialReminder(base44, tenant.id);
-        await base44.entities.Tenant.update(tenant.id, { trial_reminder_sent: true });
+        await sendTrialReminder(base44, tenant.id, outbox);
         results.reminders++;
       }
 
       // Expiration notice
       if (daysLeft === 0 && tenant.trial_status !== 'expired') {
-        await sendTrialExpiration(base44, tenant.id);
+        await sendTrialExpiration(base44, tenant.id, outbox);
         results.expirations++;
       }
     } catch (error) {
@@ -214,5 +236,15 @@ async function checkAndNotifyAll(base44) {
     }
   }
 
+  // Primero el INSERT; los flags solo se marcan si los emails quedaron en cola
+  await enqueueEmails(base44, outbox.map((entry) => entry.message));
+  for (const entry of outbox) {
+    try {
+      await entry.record();
+    } catch (error) {
+      console.error(`Error registrando ${entry.message.meta?.type} de ${entry.message.tenant_id}:`, error);
+      results.errors++;
+    }
+  }
   return Response.json({ success: true, results });
 }
@@ -1,152 +1,101 @@
 import { createClientFromRequest } from '../../../../lib/unified-custom-sdk-supabase.js';
-import { sendTemplatedEmailWithBase44 } from './emailTemplateRuntime.js';
+import { buildTemplatedEmailMessages } from './emailTemplateRuntime.js';
+import { enqueueEmails } from './_emailQueue.js';
+
+const DUE_PAGE_SIZE = 500;
+const MAX_PAGES = 20;
+
+// kind (order_countdowns_due) → email y flags que cierra
+const COUNTDOWN_ACTIONS = {
+  pickup_reminder_15: { field: 'pickup', email: 'pickup_reminder_15', days_elapsed: 15, flags: { reminder_15_sent: true } },
+  pickup_reminder_3: { field: 'pickup', email: 'pickup_reminder_3', days_elapsed: 27, flags: { reminder_15_sent: true, reminder_3_sent: true } },
+  pickup_expired: { field: 'pickup', email: null, flags: { reminder_15_sent: true, reminder_3_sent: true, expired: true } },
+  warranty_check_15: { field: 'warranty', email: 'warranty_check_15', days_elapsed: 15, flags: { checkup_15_sent: true } },
+  warranty_expired: { field: 'warranty', email: 'warranty_expired', days_elapsed: 30, flags: { checkup_15_sent: true, expiry_notice_sent: true, expired: true } }
+};
 
 /**
- * Función diaria que actualiza los contadores de pickup y warranty
- * Envía emails automáticos según los días transcurridos
+ * Función diaria de contadores de pickup y warranty.
+ * days_remaining se calcula al leer (started_at + 30 días); aquí solo se
+ * procesan las órdenes que cruzaron un umbral y no tienen el flag
+ * (order_countdowns_due, db/seeds/025_due_jobs.sql). Los emails se renderizan
+ * con las plantillas compiladas del tenant y se encolan en un solo INSERT por
+ * lote (_emailQueue.js envía en batch); los flags se marcan en un solo UPDATE.
  */
 export async function updateOrderCountdownsHandler(req) {
   console.log("🦕 updateOrderCountdowns called");
   try {
     const base44 = createClientFromRequest(req,{functionsBaseUrl: Deno.env.get('VITE_FUNCTION_URL'),entitiesPath:new URL('../Entities', import.meta.url).pathname});
 
-    // Cargar términos y condiciones una vez
-    let termsHtml = "";
-    try {
-      const termsConfig = await base44.asServiceRole.entities.WorkOrderWizardConfig.filter({ key: "default" });
-      if (termsConfig?.length > 0 && termsConfig[0].terms_text?.es) {
-        const termsText = termsConfig[0].terms_text.es.replace(/\n/g, '<br/>');
-        termsHtml = `
-          <div style="background: #f9fafb; border: 1px solid #e5e7eb; padding: 20px; margin: 25px 0; border-radius: 8px;">
-            <h3 style="color: #374151; font-size: 14px; font-weight: bold; margin-bottom: 10px;">📋 Términos y Condiciones</h3>
-            <div style="color: #6b7280; font-size: 12px; line-height: 1.6;">
-              ${termsText}
-            </div>
-          </div>
-        `;
-      }
-    } catch (err) {
-      console.error("Error cargando términos:", err);
-    }
-
-    // Obtener todas las órdenes con contadores activos
-    const allOrders = await base44.asServiceRole.entities.Order.filter({});
-
-    for (const order of allOrders) {
-      const now = new Date();
-      let needsUpdate = false;
-      const updates = {};
-
-      // ==================== CONTADOR DE PICKUP ====================
-      if (order.status === 'ready_for_pickup' && order.pickup_countdown?.started_at) {
-        const startDate = new Date(order.pickup_countdown.started_at);
-        const daysPassed = Math.floor((now - startDate) / (1000 * 60 * 60 * 24));
-        const daysRemaining = Math.max(0, 30 - daysPassed);
-
-        updates.pickup_countdown = {
-          ...order.pickup_countdown,
-          days_remaining: daysRemaining,
-          expired: daysRemaining === 0
-        };
-        needsUpdate = true;
-
-        // Recordatorio a los 15 días (15 días restantes)
-        if (daysRemaining === 15 && !order.pickup_countdown.reminder_15_sent && order.customer_email) {
-          await sendTemplatedEmailWithBase44(base44, {
-            event_type: 'pickup_reminder_15',
-            order_data: {
-              order_number: order.order_number,
-              customer_name: order.customer_name || 'Cliente',
-              customer_email: order.customer_email,
-              device_info: `${order.device_brand || ''} ${order.device_model || ''}`.trim(),
-              days_remaining: 15,
-              days_elapsed: 15,
-              initial_problem: order.initial_problem || ''
-            }
-          });
-
-          updates.pickup_countdown.reminder_15_sent = true;
-        }
-
-        // Recordatorio urgente a los 3 días (27 días pasados)
-        if (daysRemaining === 3 && !order.pickup_countdown.reminder_3_sent && order.customer_email) {
-          await sendTemplatedEmailWithBase44(base44, {
-            event_type: 'pickup_reminder_3',
-            order_data: {
-              order_number: order.order_number,
-              customer_name: order.customer_name || 'Cliente',
-              customer_email: order.customer_email,
-              device_info: `${order.device_brand || ''} ${order.device_model || ''}`.trim(),
-              days_remaining: 3,
-              days_elapsed: 27,
-              initial_problem: order.initial_problem || ''
-            }
-          });
-
-          updates.pickup_countdown.reminder_3_sent = true;
+    let processed = 0;
+    let emailsQueued = 0;
+    let emailsFailed = 0;
+    // Órdenes cuyo email falló en este run: siguen vencidas (primeras por
+    // started) y se saltan en las páginas siguientes en vez de reintentarlas
+    const failedIds = new Set();
+
+    for (let page = 0; page < MAX_PAGES; page++) {
+      const limit = DUE_PAGE_SIZE + failedIds.size;
+      const due = await base44.asServiceRole.rpc('order_countdowns_due', { p_limit: limit });
+      if (!due || due.length === 0) break;
+      const pending = due.filter((order) => !failedIds.has(order.id));
+      if (pending.length === 0) break;
+
+      // Render por orden (plantilla ya compilada); un fallo deja la orden pendiente
+      const messages = [];
+      const marks = [];
+      for (const order of pending) {
+        const action = COUNTDOWN_ACTIONS[order.kind];
+        if (!action) continue;
+        if (action.email && !order.stale && order.customer_email) {
+          try {
+            const orderMessages = await buildTemplatedEmailMessages(base44, {
+              event_type: action.email,
+              tenant_id: order.tenant_id,
+              order_data: {
+                order_number: order.order_number,
+                customer_name: order.customer_name || 'Cliente',
+                customer_email: order.customer_email,
+                device_info: `${order.device_brand || ''} ${order.device_model || ''}`.trim(),
+                days_remaining: order.days_remaining,
+                days_elapsed: action.days_elapsed,
+                initial_problem: order.initial_problem || ''
+              }
+            });
+            messages.push(...orderMessages);
+          } catch (error) {
+            emailsFailed++;
+            failedIds.add(order.id);
+            console.error(`❌ Email ${order.kind} para ${order.order_number}:`, error?.message || error);
+            continue;
+          }
         }
+        marks.push({
+          id: order.id,
+          pickup: action.field === 'pickup' ? action.flags : null,
+          warranty: action.field === 'warranty' ? action.flags : null
+        });
       }
 
-      // ==================== CONTADOR DE GARANTÍA ====================
-      if ((order.status === 'delivered' || order.status === 'completed') && order.warranty_countdown?.started_at) {
-        const startDate = new Date(order.warranty_countdown.started_at);
-        const daysPassed = Math.floor((now - startDate) / (1000 * 60 * 60 * 24));
-        const daysRemaining = Math.max(0, 30 - daysPassed);
-
-        updates.warranty_countdown = {
-          ...order.warranty_countdown,
-          days_remaining: daysRemaining,
-          expired: daysRemaining === 0
-        };
-        needsUpdate = true;
+      // Encolar antes de marcar: si el INSERT falla el lote queda pendiente
+      emailsQueued += await enqueueEmails(base44, messages);
 
-        // Checkup a los 15 días
-        if (daysRemaining === 15 && !order.warranty_countdown.checkup_15_sent && order.customer_email) {
-          await sendTemplatedEmailWithBase44(base44, {
-            event_type: 'warranty_check_15',
-            order_data: {
-              order_number: order.order_number,
-              customer_name: order.customer_name || 'Cliente',
-              customer_email: order.customer_email,
-              device_info: `${order.device_brand || ''} ${order.device_model || ''}`.trim(),
-              days_remaining: 15,
-              days_elapsed: 15,
-              initial_problem: order.initial_problem || ''
-            }
-          });
-
-          updates.warranty_countdown.checkup_15_sent = true;
-        }
-
-        // Aviso de expiración de garantía (día 0)
-        if (daysRemaining === 0 && !order.warranty_countdown.expiry_notice_sent && order.customer_email) {
-          await sendTemplatedEmailWithBase44(base44, {
-            event_type: 'warranty_expired',
-            order_data: {
-              order_number: order.order_number,
-              customer_name: order.customer_name || 'Cliente',
-              customer_email: order.customer_email,
-              device_info: `${order.device_brand || ''} ${order.device_model || ''}`.trim(),
-              days_remaining: 0,
-              days_elapsed: 30,
-              initial_problem: order.initial_problem || ''
-            }
-          });
-
-          updates.warranty_countdown.expiry_notice_sent = true;
-        }
+      if (marks.length > 0) {
+        await base44.asServiceRole.rpc('order_countdowns_mark', { p_marks: marks });
       }
+      processed += pending.length;
 
-      // Actualizar la orden si hubo cambios
-      if (needsUpdate && Object.keys(updates).length > 0) {
-        await base44.asServiceRole.entities.Order.update(order.id, updates);
-      }
+      // Última página, o todas fallaron (p.ej. plantilla rota) → no seguir
+      if (due.length < limit || marks.length === 0) break;
     }
 
     return Response.json({
       success: true,
       message: 'Contadores actualizados exitosamente',
-      processed: allOrders.length
+      processed,
+      emails_queued: emailsQueued,
+      emails_sent: emailsQueued, // nombre anterior a la cola; se mantiene para clientes existentes
+      emails_failed: emailsFailed
     });
 
   } catch (error) {
@@ -2,6 +2,7 @@ import React, { createContext, useContext } from "react";
 import { Capacitor } from '@capacitor/core';
 import { useNavigate, useLocation } from 'react-router-dom';
 import { dataClient } from "@/components/api/dataClient";
+import { clearEntityCache } from "../../../../lib/unified-custom-sdk-supabase.js";
 
 export const AuthContext = createContext(null);
 export const useAuth = () => useContext(AuthContext);
@@ -79,6 +80,8 @@ async function clearAllSessions(forceLogout = false) {
   
   sessionStorage.removeItem("911-session");
   localStorage.removeItem(BG_TS_KEY);
+  // Datos en caché del empleado anterior (la sesión de Supabase puede seguir)
+  clearEntityCache();
 }
 
 function isPublicPath(path = window.location.pathname) {
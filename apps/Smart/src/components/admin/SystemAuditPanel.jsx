@@ -21,8 +21,9 @@ export default function SystemAuditPanel() {
     };
 
     try {
+      // Solo columnas escalares ("@list"); ventas necesita items, va completa
       // 1. AUDITAR ÓRDENES
-      const orders = await dataClient.entities.Order.list("-created_date", 500);
+      const orders = await dataClient.entities.Order.list("-created_date", 500, 0, "@list");
       results.orders.total = orders.length;
 
       const orderNumbers = new Set();
@@ -85,7 +86,7 @@ export default function SystemAuditPanel() {
       }
 
       // 3. AUDITAR TRANSACCIONES
-      const transactions = await dataClient.entities.Transaction.list("-created_date", 500);
+      const transactions = await dataClient.entities.Transaction.list("-created_date", 500, 0, "@list");
       results.transactions.total = transactions.length;
 
       const orphanedTx = [];
@@ -108,7 +109,7 @@ export default function SystemAuditPanel() {
       }
 
       // 4. AUDITAR CLIENTES
-      const customers = await dataClient.entities.Customer.list("-created_date", 500);
+      const customers = await dataClient.entities.Customer.list("-created_date", 500, 0, "@list");
       results.customers.total = customers.length;
 
       const invalidContacts = [];
@@ -137,7 +138,7 @@ export default function SystemAuditPanel() {
       }
 
       // 5. AUDITAR PRODUCTOS
-      const products = await dataClient.entities.Product.list("-created_date", 500);
+      const products = await dataClient.entities.Product.list("-created_date", 500, 0, "@list");
       results.products.total = products.length;
 
       const lowStock = [];
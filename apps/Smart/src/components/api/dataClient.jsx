@@ -50,6 +50,7 @@ function getTenantId() {
  * Envuelve una entidad del SDK para inyectar tenant_id automáticamente en:
  *   - list()   → convierte en filter({ tenant_id }) cuando hay sesión
  *   - filter() → agrega tenant_id al objeto de condiciones
+ *   - page() / stream() → igual que filter()
  *   - create() → agrega tenant_id al objeto de datos
  * get / update / delete no cambian (operan por id, no necesitan filtro de tenant).
  *
@@ -65,21 +66,39 @@ function tenantScoped(entity) {
     update: (id, data)     => entity.update(id, data),
     delete: (id)           => entity.delete(id),
     // Métodos que SÍ inyectan tenant_id
-    list(order, limit) {
+    list(order, limit, skip, fields) {
       const tid = getTenantId();
-      if (tid) return entity.filter({ tenant_id: tid }, order, limit);
-      return entity.list(order, limit);
+      if (tid) return entity.filter({ tenant_id: tid }, order, limit, skip, fields);
+      return entity.list(order, limit, skip, fields);
     },
-    filter(q = {}, order, limit) {
+    filter(q = {}, order, limit, skip, fields) {
       const tid = getTenantId();
-      if (tid) return entity.filter({ ...q, tenant_id: tid }, order, limit);
-      return entity.filter(q, order, limit);
+      if (tid) return entity.filter({ ...q, tenant_id: tid }, order, limit, skip, fields);
+      return entity.filter(q, order, limit, skip, fields);
     },
+    // Paginación keyset (created_at, id): { rows, nextCursor }
+    page(q = {}, options) {
+      const tid = getTenantId();
+      return entity.page(tid ? { ...q, tenant_id: tid } : q, options);
+    },
+    // Recorre todas las filas página a página (for await ... of)
+    stream(q = {}, options) {
+      const tid = getTenantId();
+      return entity.stream(tid ? { ...q, tenant_id: tid } : q, options);
+    },
+    projection: (name) => entity.projection(name),
     create(data) {
       const tid = getTenantId();
       if (tid && !data?.tenant_id) return entity.create({ ...data, tenant_id: tid });
       return entity.create(data);
     },
+    // Consulta en vivo (caché compartida + realtime) en lugar de setInterval
+    watch(query = {}, callback, options) {
+      const tid = getTenantId();
+      if (tid) return entity.watch({ ...query, filter: { ...(query.filter || {}), tenant_id: tid } }, callback, options);
+      return entity.watch(query, callback, options);
+    },
+    invalidate: () => entity.invalidate(),
   };
 }
 
@@ -161,6 +180,14 @@ const appClientAdapter = {
       create: (data) => appClient.entities.SystemConfig.create(data),
       update: (id, data) => appClient.entities.SystemConfig.update(id, data),
     },
+    // CommunicationQueue — notificaciones in-app del usuario (NotificationPanel).
+    // Se filtran por user_id; no todas las filas tienen tenant_id.
+    CommunicationQueue: {
+      filter: (q, order, limit) => appClient.entities.CommunicationQueue.filter(q, order, limit),
+      update: (id, data)        => appClient.entities.CommunicationQueue.update(id, data),
+      delete: (id)              => appClient.entities.CommunicationQueue.delete(id),
+      watch:  (query, callback, options) => appClient.entities.CommunicationQueue.watch(query, callback, options),
+    },
     // AppUpdate — novedades del sistema, visibles en PinAccess (sin tenant filter)
     AppUpdate: {
       list:   (order, limit) => appClient.entities.AppUpdate.list(order, limit),
@@ -47,35 +47,26 @@ let cashRegisterCache = {
 };
 
 const listeners = [];
-let pollingInterval = null;
-let visibilityHandler = null;
+let stopWatching = null;
 
 // ✅ NOTIFICAR A TODOS LOS LISTENERS
 function notifyListeners() {
   listeners.forEach(fn => fn(cashRegisterCache));
 }
 
+// Cajas abiertas en vivo (realtime de cash_register); el polling de 60s
+// queda solo como respaldo mientras el canal no está conectado.
 function startPolling() {
-  if (pollingInterval) return; // ya corriendo
-
-  // Only poll when tab is visible to save energy
-  const startIv = () => { if (!pollingInterval) pollingInterval = setInterval(() => checkCashRegisterStatus(), 60_000); };
-  const stopIv = () => { if (pollingInterval) { clearInterval(pollingInterval); pollingInterval = null; } };
-
-  visibilityHandler = () => {
-    if (document.visibilityState === "visible") { startIv(); checkCashRegisterStatus(); }
-    else stopIv();
-  };
-  document.addEventListener("visibilitychange", visibilityHandler);
-  if (!document.hidden) startIv();
+  if (stopWatching) return; // ya corriendo
+  stopWatching = dataClient.entities.CashRegister.watch(
+    { filter: { status: "open" } },
+    () => checkCashRegisterStatus(),
+    { pollMs: 60_000 }
+  );
 }
 
 function stopPolling() {
-  if (pollingInterval) { clearInterval(pollingInterval); pollingInterval = null; }
-  if (visibilityHandler) {
-    document.removeEventListener("visibilitychange", visibilityHandler);
-    visibilityHandler = null;
-  }
+  if (stopWatching) { stopWatching(); stopWatching = null; }
 }
 
 // ✅ SUSCRIBIRSE A CAMBIOS
@@ -154,9 +154,12 @@ Reglas:
 
   let raw;
   try {
+    // Job asíncrono: el PDF puede tardar decenas de segundos; el servidor
+    // responde con job_id y el SDK consulta /ai/job hasta que termina
     raw = await base44.integrations.Core.InvokeLLM({
       prompt,
       file_urls: [fileUrl],
+      async: true,
     });
   } catch (err) {
     throw new Error(
@@ -694,32 +697,40 @@ export default function ImportPODialog({ open, onClose, suppliers = [], products
     if (!ok) return;
     setBulkCreating(true);
     const supplier = suppliers.find((s) => s.id === supplierId);
-    const created = [];
-    let failed = 0;
-    for (const { row, idx } of toCreate) {
+    const payload = toCreate.map(({ row }) => {
       const cost = Number(row.unit_cost || 0);
       const price = cost > 0 ? Math.round(cost * (1 + bulkMarginPct / 100) * 100) / 100 : 0;
-      try {
-        const product = await base44.entities.Product.create({
-          name: row.raw_name.trim(),
-          type: "product",
-          cost,
-          price,
-          stock: 0,
-          min_stock: 5,
-          active: true,
-          supplier_id: supplier?.id || "",
-          supplier_name: supplier?.name || extracted?.supplier_name || "",
-          category: row.ai_category || "other",
-          tipo_principal: "dispositivos",
-        });
+      return {
+        name: row.raw_name.trim(),
+        type: "product",
+        cost,
+        price,
+        stock: 0,
+        min_stock: 5,
+        active: true,
+        supplier_id: supplier?.id || "",
+        supplier_name: supplier?.name || extracted?.supplier_name || "",
+        category: row.ai_category || "other",
+        tipo_principal: "dispositivos",
+      };
+    });
+    const created = [];
+    let failed = 0;
+    try {
+      // Un solo INSERT multi-fila; las filas que fallen se reportan una a una
+      const { results, errors } = await base44.entities.Product.bulkCreate(payload, { continueOnError: true });
+      results.forEach((product, i) => {
         if (product?.id) {
-          created.push({ idx, product });
+          created.push({ idx: toCreate[i].idx, product });
         }
-      } catch (err) {
-        console.warn(`No se pudo crear ${row.raw_name}:`, err);
-        failed++;
+      });
+      for (const err of errors) {
+        console.warn(`No se pudo crear ${toCreate[err.row - 1]?.row.raw_name}:`, err.message);
       }
+      failed = toCreate.length - created.length;
+    } catch (err) {
+      console.warn("No se pudieron crear los productos:", err);
+      failed = toCreate.length;
     }
     // Aplicar los matches
     setLiveProducts((list) => [...created.map((c) => c.product), ...list]);
@@ -3,6 +3,7 @@ import { useNavigate } from "react-router-dom";
 import appClient from "@/api/appClient";
 import { dataClient } from "@/components/api/dataClient";
 import { supabase } from "../../../../../lib/supabase-client.js";
+import { clearEntityCache } from "../../../../../lib/unified-custom-sdk-supabase.js";
 import {
   Dialog,
   DialogContent,
@@ -559,6 +560,7 @@ export default function UserMenuModal({ open, onClose, user }) {
       localStorage.removeItem("employee_session");
       sessionStorage.removeItem("911-session");
       sessionStorage.removeItem("timeEntryId");
+      clearEntityCache();
       
       navigate("/PinAccess", { replace: true });
     } catch (error) {
@@ -19,39 +19,20 @@ export default function NotificationDropdown({ user, onClose }) {
   const navigate = useNavigate();
 
   useEffect(() => {
-    loadNotifications();
+    if (!user?.id) return;
 
-    let interval = null;
-    const start = () => { if (!interval) interval = setInterval(loadNotifications, 60000); };
-    const stop = () => { if (interval) { clearInterval(interval); interval = null; } };
-    const onVis = () => { document.hidden ? stop() : (start(), loadNotifications()); };
-    if (!document.hidden) start();
-    document.addEventListener("visibilitychange", onVis);
-    return () => { stop(); document.removeEventListener("visibilitychange", onVis); };
+    // Realtime vía caché de entidades; polling solo si el canal no conecta
+    return dataClient.entities.Notification.watch(
+      { filter: { user_id: user.id, is_read: false }, orderBy: "-created_date", limit: 50 },
+      (data, { error }) => {
+        if (error) console.error("Error loading notifications:", error);
+        else setNotifications(data || []);
+        setLoading(false);
+      },
+      { pollMs: 60000 }
+    );
   }, [user?.id]);
 
-  const loadNotifications = async () => {
-    if (!user?.id) return;
-    
-    try {
-      // ✅ SOLO CARGAR NOTIFICACIONES NO LEÍDAS
-      // 👈 MIGRACIÓN: Usar dataClient
-      const data = await dataClient.entities.Notification.filter(
-        { 
-          user_id: user.id,
-          is_read: false
-        },
-        "-created_date",
-        50
-      );
-      setNotifications(data || []);
-    } catch (error) {
-      console.error("Error loading notifications:", error);
-    } finally {
-      setLoading(false);
-    }
-  };
-
   const handleMarkAsRead = async (notification) => {
     try {
       // 👈 MIGRACIÓN: Usar dataClient
@@ -23,19 +23,25 @@ export default function NotificationPanel() {
 
   useEffect(() => {
     if (!user) return;
-    loadData();
 
-    // Pause polling when the screen is hidden / phone locked to save battery.
-    let interval = null;
-    const start = () => { if (!interval) interval = setInterval(loadData, 60000); };
-    const stop = () => { if (interval) { clearInterval(interval); interval = null; } };
-    const onVis = () => {
-      if (document.hidden) stop();
-      else { start(); loadData(); }
+    // Recargar cuando cambian anuncios o notificaciones in-app. announcement
+    // está en la publicación realtime (polling solo como respaldo);
+    // communication_queue no (también es la cola de emails), así que sus
+    // notificaciones siguen llegando por el polling de 60s.
+    const stopAnnouncements = dataClient.entities.Announcement.watch(
+      { filter: { active: true }, orderBy: "-sent_at", limit: 10 },
+      () => loadData(),
+      { pollMs: 60000 }
+    );
+    const stopNotifications = dataClient.entities.CommunicationQueue.watch(
+      { filter: { user_id: user.id, type: "in_app" }, orderBy: "-created_date", limit: 20 },
+      () => loadData(),
+      { pollMs: 60000 }
+    );
+    return () => {
+      stopAnnouncements();
+      stopNotifications();
     };
-    if (!document.hidden) start();
-    document.addEventListener("visibilitychange", onVis);
-    return () => { stop(); document.removeEventListener("visibilitychange", onVis); };
   }, [user]);
 
   const loadUser = async () => {
@@ -1,11 +1,13 @@
 import React, { useMemo } from "react";
 import { Clock, AlertTriangle, Shield } from "lucide-react";
+import { getPickupDaysRemaining, getWarrantyDaysRemaining } from "@/components/utils/orderCountdowns";
 
 export default function CountdownBadge({ order }) {
   const countdown = useMemo(() => {
     // Contador de Garantía (Mostrar incluso si status es warranty)
-    if (order.warranty_countdown?.days_remaining !== undefined) {
-      const days = order.warranty_countdown.days_remaining;
+    const warrantyDays = getWarrantyDaysRemaining(order);
+    if (warrantyDays !== undefined) {
+      const days = warrantyDays;
       return {
         type: 'warranty',
         days,
@@ -17,8 +19,9 @@ export default function CountdownBadge({ order }) {
     }
 
     // Contador de Pickup (Listo para recoger)
-    if (order.status === 'ready_for_pickup' && order.pickup_countdown?.days_remaining !== undefined) {
-      const days = order.pickup_countdown.days_remaining;
+    const pickupDays = getPickupDaysRemaining(order);
+    if (order.status === 'ready_for_pickup' && pickupDays !== undefined) {
+      const days = pickupDays;
       return {
         type: 'pickup',
         days,
@@ -10,6 +10,15 @@ import {
 import { toast } from "sonner";
 import { format } from 'date-fns';
 
+// Exporta todas las filas por páginas keyset (más recientes primero), sin tope fijo
+async function collectAll(entity) {
+  const rows = [];
+  for await (const page of entity.stream({}, { direction: "desc" })) {
+    rows.push(...page);
+  }
+  return rows;
+}
+
 export default function ImportExportTab() {
   const [exportType, setExportType] = useState("orders");
   const [exportFormat, setExportFormat] = useState("csv");
@@ -24,19 +33,19 @@ export default function ImportExportTab() {
 
       switch (exportType) {
         case "orders":
-          data = await base44.entities.Order.list("-created_date", 1000);
+          data = await collectAll(base44.entities.Order);
           filename = `orders_${format(new Date(), 'yyyy-MM-dd')}.${exportFormat}`;
           break;
         case "customers":
-          data = await base44.entities.Customer.list("-created_date", 1000);
+          data = await collectAll(base44.entities.Customer);
           filename = `customers_${format(new Date(), 'yyyy-MM-dd')}.${exportFormat}`;
           break;
         case "products":
-          data = await base44.entities.Product.list("-created_date", 1000);
+          data = await collectAll(base44.entities.Product);
           filename = `products_${format(new Date(), 'yyyy-MM-dd')}.${exportFormat}`;
           break;
         case "sales":
-          data = await base44.entities.Sale.list("-created_date", 1000);
+          data = await collectAll(base44.entities.Sale);
           filename = `sales_${format(new Date(), 'yyyy-MM-dd')}.${exportFormat}`;
           break;
       }
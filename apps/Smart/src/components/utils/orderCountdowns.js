@@ -0,0 +1,43 @@
+// ──────────────────────────────────────────────────────────────────────────
+// Order countdowns (pickup / warranty) — derived at read time.
+//
+// The daily updateOrderCountdowns job no longer rewrites days_remaining on
+// every order; it only sends reminders and sets the *_sent / expired flags.
+// Days remaining are computed here from countdown.started_at (30-day window),
+// falling back to the stored days_remaining for rows without started_at.
+// ──────────────────────────────────────────────────────────────────────────
+
+export const COUNTDOWN_DAYS = 30;
+
+const DAY_MS = 24 * 60 * 60 * 1000;
+
+/**
+ * Days remaining for a countdown object, or undefined when there is none.
+ * @param {{started_at?: string, days_remaining?: number}|null|undefined} countdown
+ * @param {Date} [now]
+ * @returns {number|undefined}
+ */
+export function getCountdownDaysRemaining(countdown, now = new Date()) {
+  if (!countdown) return undefined;
+  if (countdown.started_at) {
+    const started = new Date(countdown.started_at).getTime();
+    if (Number.isFinite(started)) {
+      const daysPassed = Math.floor((now.getTime() - started) / DAY_MS);
+      return Math.max(0, COUNTDOWN_DAYS - daysPassed);
+    }
+  }
+  return countdown.days_remaining;
+}
+
+export function getPickupDaysRemaining(order, now) {
+  return getCountdownDaysRemaining(order?.pickup_countdown, now);
+}
+
+export function getWarrantyDaysRemaining(order, now) {
+  return getCountdownDaysRemaining(order?.warranty_countdown, now);
+}
+
+export function isWarrantyExpired(order, now) {
+  if (order?.warranty_countdown?.expired === true) return true;
+  return getWarrantyDaysRemaining(order, now) === 0;
+}
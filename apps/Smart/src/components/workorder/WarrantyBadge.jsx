@@ -1,15 +1,17 @@
 import React, { useMemo } from "react";
 import { Shield, AlertTriangle, Clock } from "lucide-react";
+import { getWarrantyDaysRemaining } from "@/components/utils/orderCountdowns";
 
 export default function WarrantyBadge({ order }) {
   const warranty = useMemo(() => {
     // Mostrar garantía si el status es "warranty" O si hay warranty_countdown activo
     const hasWarrantyStatus = order?.status === 'warranty';
-    const hasWarrantyCountdown = order?.warranty_countdown?.days_remaining !== undefined;
+    const warrantyDays = getWarrantyDaysRemaining(order);
+    const hasWarrantyCountdown = warrantyDays !== undefined;
     
     if (!hasWarrantyStatus && !hasWarrantyCountdown) return null;
 
-    const days = order?.warranty_countdown?.days_remaining ?? 30;
+    const days = warrantyDays ?? 30;
     
     return {
       days,
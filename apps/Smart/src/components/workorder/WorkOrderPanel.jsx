@@ -1944,7 +1944,7 @@ export default function WorkOrderPanel({ orderId, onClose, onUpdate, onDelete, p
     }
   }, [order?.id, loadEventsCallback]);
 
-  // Auto-refresh: only when tab is visible, every 2 min
+  // Auto-refresh: realtime on the order row (2 min polling only as fallback)
   // Uses ref to avoid stale closures with loadEventsCallback
   const loadEventsRef = useRef(loadEventsCallback);
   useEffect(() => { loadEventsRef.current = loadEventsCallback; }, [loadEventsCallback]);
@@ -1952,12 +1952,11 @@ export default function WorkOrderPanel({ orderId, onClose, onUpdate, onDelete, p
   useEffect(() => {
     if (!orderId || loading) return;
 
-    let iv = null;
     const lastUpdatedRef = { current: order?.updated_date };
-    const refresh = async () => {
-      if (document.hidden) return;
-      try {
-        const fresh = await base44.entities.Order.get(orderId);
+    return base44.entities.Order.watch(
+      { filter: { id: orderId }, limit: 1 },
+      (rows) => {
+        const fresh = rows?.[0];
         if (fresh && fresh.updated_date !== lastUpdatedRef.current) {
           lastUpdatedRef.current = fresh.updated_date;
           setOrder(fresh);
@@ -1965,16 +1964,9 @@ export default function WorkOrderPanel({ orderId, onClose, onUpdate, onDelete, p
           clearEventCache(orderId);
           loadEventsRef.current?.(true);
         }
-      } catch {
-        // silent
-      }
-    };
-    const start = () => { if (!iv) iv = setInterval(refresh, 120000); };
-    const stop = () => { if (iv) { clearInterval(iv); iv = null; } };
-    const onVis = () => { document.hidden ? stop() : start(); };
-    if (!document.hidden) start();
-    document.addEventListener("visibilitychange", onVis);
-    return () => { stop(); document.removeEventListener("visibilitychange", onVis); };
+      },
+      { pollMs: 120000 }
+    );
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [orderId, loading]);
 
@@ -10,6 +10,7 @@ import { getStatusConfig, normalizeStatusId } from "@/components/utils/statusReg
 import { triggerHaptic } from "@/lib/capacitor";
 import { base44 } from "@/api/base44Client";
 import { toast } from "sonner";
+import { getWarrantyDaysRemaining } from "@/components/utils/orderCountdowns";
 
 const QUICK_ACTIONS = [
   { id: "checkout", icon: DollarSign, label: "Checkout", color: "text-emerald-400", badgeKey: "balance" },
@@ -120,7 +121,7 @@ export default function MobileAccionesTab({
     if (balance > 0.01) b.balance = true;
     const photos = o.photos_metadata || o.device_photos || [];
     if (photos.length === 0 && normalizeStatusId(status) === "intake") b.photos = true;
-    if (o.warranty_countdown?.days_remaining <= 3) b.warranty = true;
+    if (getWarrantyDaysRemaining(o) <= 3) b.warranty = true;
     return b;
   }, [o, status]);
 
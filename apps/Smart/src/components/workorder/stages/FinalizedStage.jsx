@@ -22,6 +22,7 @@ import WorkOrderUnifiedHub from "@/components/workorder/WorkOrderUnifiedHub";
 import AddItemModal from "@/components/workorder/AddItemModal";
 import { Button } from "@/components/ui/button";
 import { createPageUrl } from "@/components/utils/helpers";
+import { getWarrantyDaysRemaining } from "@/components/utils/orderCountdowns";
 
 export default function FinalizedStage({ order, onUpdate, onPaymentClick, compact }) {
   const o = order || {};
@@ -69,7 +70,7 @@ export default function FinalizedStage({ order, onUpdate, onPaymentClick, compac
         subtitle: "La entrega ya ocurrió. Aquí debe quedar un resumen final fácil de leer, no una pantalla de cobro ni edición pesada."
       };
 
-  const warrantyDays = Number(o?.warranty_countdown?.days_remaining ?? -1);
+  const warrantyDays = Number(getWarrantyDaysRemaining(o) ?? -1);
   const warrantyActive = warrantyDays >= 0 && o?.warranty_countdown?.expired !== true;
 
   const finalCards = [
@@ -10,6 +10,7 @@ import { toast } from "sonner";
 import { base44 } from "@/api/base44Client";
 import WorkOrderUnifiedHub from "@/components/workorder/WorkOrderUnifiedHub";
 import SharedItemsSection from "@/components/workorder/SharedItemsSection";
+import { getWarrantyDaysRemaining, isWarrantyExpired } from "@/components/utils/orderCountdowns";
 
 // ── Opciones de veredicto ─────────────────────────────────────────────────────
 const VERDICTS = [
@@ -62,8 +63,8 @@ export default function WarrantyStage({
   // ── Datos de garantía ────────────────────────────────────────────────────
   const claimReason    = String(o?.warranty_mode?.warranty_reason || "").trim();
   const originalProblem = String(o?.initial_problem || "").trim();
-  const daysRemaining  = Number(o?.warranty_countdown?.days_remaining ?? -1);
-  const warrantyExpired = o?.warranty_countdown?.expired === true || daysRemaining === 0;
+  const daysRemaining  = Number(getWarrantyDaysRemaining(o) ?? -1);
+  const warrantyExpired = isWarrantyExpired(o);
 
   const phone  = o.customer_phone || "";
   const email  = o.customer_email || "";
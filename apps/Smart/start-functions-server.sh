@@ -42,13 +42,21 @@ echo "🚀 Starting functions server..."
 # Export the correct port so Deno's server.js uses it via Deno.env.get("FUNCTIONS_PORT")
 export FUNCTIONS_PORT="${PORT}"
 
+# In-process fn-trigger queue worker (adaptive polling). Set FN_TRIGGER_WORKER=false
+# to fall back to draining /processFnTriggerEvents from the cron loop below.
+export FN_TRIGGER_WORKER="${FN_TRIGGER_WORKER:-true}"
+# In-process outbound email queue worker (retries with backoff). Set
+# EMAIL_QUEUE_WORKER=false to drain /processEmailQueue from the cron loop instead.
+export EMAIL_QUEUE_WORKER="${EMAIL_QUEUE_WORKER:-true}"
+
 # Start the server with deno run (server.js uses Deno.serve() internally)
 deno run --env --allow-ffi --allow-net --allow-env --allow-read ./server.js &
 
 # Store the process ID
 echo $! > "${PIDFILE}"
 
-# Fn-trigger cron loop: periodically call runScheduledFnTriggers and processFnTriggerEvents
+# Fn-trigger cron loop: periodically call runScheduledFnTriggers (and processFnTriggerEvents
+# when the in-process worker is disabled)
 CRON_PIDFILE="/tmp/deno_${APP_NAME}_cron_${PORT}.pid"
 FN_CRON_INTERVAL="${FN_TRIGGER_CRON_INTERVAL:-120}"
 BASE_URL="http://localhost:${PORT}"
@@ -56,7 +64,12 @@ BASE_URL="http://localhost:${PORT}"
     sleep 10
     while true; do
         curl -sS -o /dev/null -X POST -H "x-cron-secret: ${CRON_SECRET:-}" "${BASE_URL}/runScheduledFnTriggers" || true
-        curl -sS -o /dev/null -X POST -H "x-cron-secret: ${CRON_SECRET:-}" "${BASE_URL}/processFnTriggerEvents" || true
+        if [ "${FN_TRIGGER_WORKER}" != "true" ]; then
+            curl -sS -o /dev/null -X POST -H "x-cron-secret: ${CRON_SECRET:-}" "${BASE_URL}/processFnTriggerEvents" || true
+        fi
+        if [ "${EMAIL_QUEUE_WORKER}" != "true" ]; then
+            curl -sS -o /dev/null -X POST -H "x-cron-secret: ${CRON_SECRET:-}" "${BASE_URL}/processEmailQueue" || true
+        fi
         sleep "${FN_CRON_INTERVAL}"
     done
 ) &
@@ -67,7 +80,11 @@ disown "${CRON_LOOP_PID}" 2>/dev/null || true
 echo ""
 echo "✅ ${APP_NAME} Functions Server started!"
 echo "🌐 Server URL: http://localhost:${PORT}"
-echo "⏰ Fn-trigger cron: every ${FN_CRON_INTERVAL}s → /runScheduledFnTriggers, /processFnTriggerEvents"
+if [ "${FN_TRIGGER_WORKER}" = "true" ]; then
+    echo "⏰ Fn-trigger cron: every ${FN_CRON_INTERVAL}s → /runScheduledFnTriggers (events: in-process worker)"
+else
+    echo "⏰ Fn-trigger cron: every ${FN_CRON_INTERVAL}s → /runScheduledFnTriggers, /processFnTriggerEvents"
+fi
 echo ""
 
 # If running standalone (not from start.sh), keep monitoring
@@ -0,0 +1,109 @@
+// Browser request metrics for Supabase traffic.
+// Counts requests and response bytes per screen (location.pathname) and per
+// table, plus entity-cache hits, so a screen can be measured before/after a change:
+//   window.__smartfixRequestMetrics.get()    → snapshot
+//   window.__smartfixRequestMetrics.reset()  → start a new measurement
+
+const isBrowser = typeof window !== "undefined";
+
+let screens = new Map();
+let startedAt = new Date().toISOString();
+
+function currentScreen() {
+  return isBrowser && window.location ? window.location.pathname || "/" : "server";
+}
+
+function screenStats(screen) {
+  let s = screens.get(screen);
+  if (!s) {
+    s = { requests: 0, bytes: 0, cache_hits: 0, errors: 0, tables: {} };
+    screens.set(screen, s);
+  }
+  return s;
+}
+
+function tableStats(s, table) {
+  if (!s.tables[table]) s.tables[table] = { requests: 0, bytes: 0, cache_hits: 0 };
+  return s.tables[table];
+}
+
+function tableFromUrl(url) {
+  try {
+    const { pathname } = new URL(String(url));
+    const m = pathname.match(/\/(rest|storage|functions)\/v1\/(?:rpc\/)?([^/?]+)/);
+    if (!m) return pathname.split("/").filter(Boolean)[0] || "other";
+    if (m[1] !== "rest") return m[1];
+    return pathname.includes("/rpc/") ? `rpc:${m[2]}` : m[2];
+  } catch {
+    return "other";
+  }
+}
+
+/**
+ * Wrap a fetch implementation so every call is counted for the current screen.
+ * Body size comes from Content-Length when present, otherwise from a clone of
+ * the response read in the background (never delays the caller).
+ */
+export function meteredFetch(fetchImpl = (url, options) => fetch(url, options)) {
+  return async (url, options) => {
+    const screen = currentScreen();
+    const table = tableFromUrl(typeof url === "string" ? url : url?.url);
+    const s = screenStats(screen);
+    const t = tableStats(s, table);
+    s.requests++;
+    t.requests++;
+
+    let res;
+    try {
+      res = await fetchImpl(url, options);
+    } catch (err) {
+      s.errors++;
+      throw err;
+    }
+    if (!res.ok) s.errors++;
+
+    const addBytes = (n) => {
+      if (!Number.isFinite(n) || n <= 0) return;
+      s.bytes += n;
+      t.bytes += n;
+    };
+    const length = Number(res.headers.get("content-length"));
+    if (length > 0) {
+      addBytes(length);
+    } else if (res.body) {
+      res.clone().arrayBuffer().then((buf) => addBytes(buf.byteLength), () => {});
+    }
+    return res;
+  };
+}
+
+/**
+ * Count a read served by the entity cache (no network request).
+ */
+export function recordCacheHit(table) {
+  const s = screenStats(currentScreen());
+  s.cache_hits++;
+  tableStats(s, table).cache_hits++;
+}
+
+export function getRequestMetrics() {
+  const byScreen = {};
+  const totals = { requests: 0, bytes: 0, cache_hits: 0, errors: 0 };
+  for (const [screen, s] of screens) {
+    byScreen[screen] = { ...s, tables: { ...s.tables } };
+    totals.requests += s.requests;
+    totals.bytes += s.bytes;
+    totals.cache_hits += s.cache_hits;
+    totals.errors += s.errors;
+  }
+  return { since: startedAt, totals, screens: byScreen };
+}
+
+export function resetRequestMetrics() {
+  screens = new Map();
+  startedAt = new Date().toISOString();
+}
+
+if (isBrowser && !window.__smartfixRequestMetrics) {
+  window.__smartfixRequestMetrics = { get: getRequestMetrics, reset: resetRequestMetrics };
+}
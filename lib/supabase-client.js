@@ -1,4 +1,5 @@
 import { createClient } from '@supabase/supabase-js'
+import { meteredFetch } from './request-metrics.js'
 
 // Handle both Vite (import.meta.env) and Node.js (process.env) environments
 const getEnvVar = (key, defaultValue) => {
@@ -29,7 +30,9 @@ const createSupabaseSingleton = () => {
       autoRefreshToken: true,
       detectSessionInUrl: true,
       storage: typeof window !== 'undefined' ? window.localStorage : undefined
-    }
+    },
+    // Requests / bytes per screen (window.__smartfixRequestMetrics)
+    global: { fetch: meteredFetch() }
   });
   
   if (typeof window !== 'undefined') {
@@ -2,6 +2,8 @@
 // Detects environment and handles Supabase operations accordingly
 // This is the merged version of custom-sdk.js and unified-custom-sdk.js
 
+import { meteredFetch, recordCacheHit } from "./request-metrics.js";
+
 // Detect environment
 const isDeno = typeof Deno !== "undefined";
 const isBrowser = typeof window !== "undefined";
@@ -36,8 +38,92 @@ const getEnvVar = (key, defaultValue) => {
 // Performance: Check if we're in production mode
 const isProduction = getEnvVar("DENO_ENV", "") === "production" || getEnvVar("NODE_ENV", "") === "production";
 
-// Global client cache to avoid creating multiple Supabase clients
-const globalClientCache = new Map();
+/**
+ * Small LRU map with hit/miss/eviction counters.
+ * Map keeps insertion order, so re-inserting on access moves a key to the end
+ * and the first key is always the least recently used one.
+ */
+class LruCache {
+  constructor(maxSize, onEvict = null) {
+    this.maxSize = maxSize;
+    this.onEvict = onEvict;
+    this.map = new Map();
+    this.hits = 0;
+    this.misses = 0;
+    this.evictions = 0;
+  }
+
+  has(key) {
+    return this.map.has(key);
+  }
+
+  get(key) {
+    if (!this.map.has(key)) {
+      this.misses++;
+      return undefined;
+    }
+    const value = this.map.get(key);
+    this.map.delete(key);
+    this.map.set(key, value);
+    this.hits++;
+    return value;
+  }
+
+  set(key, value) {
+    if (this.map.has(key)) {
+      this.map.delete(key);
+    } else if (this.map.size >= this.maxSize) {
+      const [oldKey, oldValue] = this.map.entries().next().value;
+      this.map.delete(oldKey);
+      this.evictions++;
+      if (this.onEvict) this.onEvict(oldKey, oldValue);
+    }
+    this.map.set(key, value);
+    return this;
+  }
+
+  delete(key) {
+    return this.map.delete(key);
+  }
+
+  clear() {
+    this.map.clear();
+  }
+
+  stats() {
+    return {
+      size: this.map.size,
+      max: this.maxSize,
+      hits: this.hits,
+      misses: this.misses,
+      evictions: this.evictions,
+    };
+  }
+}
+
+// Global client cache to avoid creating multiple Supabase clients.
+// Shared clients (service role / anon, one per schema) are kept for the life
+// of the process. Per-user token clients (Deno, see initializeSupabaseClient)
+// go to a separate bounded LRU, so user traffic can never evict the
+// service-role client.
+const sharedClientCache = new Map();
+const CLIENT_POOL_SIZE = parseInt(getEnvVar("SUPABASE_CLIENT_POOL_SIZE", "200"), 10) || 200;
+const userClientCache = new LruCache(CLIENT_POOL_SIZE);
+const testedClients = new Set();
+
+// Deno: users resolved by UnifiedUserEntity.me(), keyed by access token (60s TTL)
+const authUserCache = new LruCache(CLIENT_POOL_SIZE);
+
+/**
+ * Hit/eviction counters of the client pool and the per-token user cache.
+ */
+export function getClientPoolStats() {
+  return {
+    clients: userClientCache.stats(),
+    shared: sharedClientCache.size,
+    users: authUserCache.stats(),
+  };
+}
 function getClientCacheKey(useServiceRole, schema) {
   return `${useServiceRole ? 'service' : 'anon'}_${schema || 'public'}`;
 }
@@ -99,6 +185,9 @@ async function getSupabaseClient() {
 const API_BASE_URL = getEnvVar("VITE_API_URL", PROD_API_BASE_URL)
 // Functions base URL - single server approach
 const FUNCTIONS_BASE_URL = getEnvVar("VITE_FUNCTION_URL", PROD_FUNCTIONS_BASE_URL);
+// Backoff between /ai/job polls answered without waiting (see waitForAiJob)
+const AI_JOB_POLL_MIN_MS = 1000;
+const AI_JOB_POLL_MAX_MS = 15000;
 
 // App URL (Vercel serverless functions host). Usado para prefijar /api/* cuando
 // corremos dentro de Capacitor nativo (iOS/Android), donde "/api/..." resuelve
@@ -133,17 +222,53 @@ function getDbSchema() {
 
 /**
  * Request-scoped auth token storage for Deno functions.
- * Set by server.js from Authorization header, used by UnifiedUserEntity.me()
+ * server.js runs each request inside runWithRequestAuth(), backed by
+ * AsyncLocalStorage, so concurrent requests under Deno.serve never see each
+ * other's token. Clients built by createClientFromRequest additionally bind
+ * their token explicitly (see UnifiedUserEntity).
  */
-let currentRequestAuthToken = null;
+let requestAuthStorage = null;
+let requestAuthStorageReady = null;
+
+// Fallback for code running outside runWithRequestAuth (one-off scripts)
+let fallbackRequestAuthToken = null;
+
+// One storage for the whole process. The import is memoized as a promise: the
+// first burst of requests after boot all wait for the same storage instead of
+// each creating one (and all but the last losing their token).
+function getRequestAuthStorage() {
+  if (!requestAuthStorageReady) {
+    requestAuthStorageReady = import("node:async_hooks").then(({ AsyncLocalStorage }) => {
+      requestAuthStorage = new AsyncLocalStorage();
+      return requestAuthStorage;
+    });
+  }
+  return requestAuthStorageReady;
+}
+
+/**
+ * Run fn with its own auth context (Deno only).
+ * Everything awaited inside fn sees `token` through getRequestAuthToken().
+ */
+export async function runWithRequestAuth(token, fn) {
+  if (!isDeno) {
+    return fn();
+  }
+  const storage = await getRequestAuthStorage();
+  return storage.run({ token: token || null }, fn);
+}
 
 /**
  * Set the auth token for the current request (Deno only).
- * Called by server.js when processing requests.
+ * Inside runWithRequestAuth it only affects the current request.
  */
 export function setRequestAuthToken(token) {
-  if (isDeno) {
-    currentRequestAuthToken = token;
+  if (!isDeno) return;
+  const store = requestAuthStorage?.getStore();
+  if (store) {
+    store.token = token;
+  } else {
+    fallbackRequestAuthToken = token;
   }
 }
 
@@ -151,16 +276,16 @@ export function setRequestAuthToken(token) {
  * Get the auth token for the current request (Deno only).
  */
 function getRequestAuthToken() {
-  return isDeno ? currentRequestAuthToken : null;
+  if (!isDeno) return null;
+  const store = requestAuthStorage?.getStore();
+  return store ? store.token : fallbackRequestAuthToken;
 }
 
 /**
  * Clear the auth token after request processing (Deno only).
  */
 export function clearRequestAuthToken() {
-  if (isDeno) {
-    currentRequestAuthToken = null;
-  }
+  setRequestAuthToken(null);
 }
 
 /**
@@ -224,7 +349,8 @@ async function initializeSupabaseClient(useServiceRole = false, accessToken = nu
     actualUseServiceRole = false;
   }
   
-  if (isDeno && accessToken && !useServiceRole) {
+  const useUserToken = isDeno && accessToken && !useServiceRole;
+  if (useUserToken) {
     // Use the provided access token to create a user-scoped client
     key = supabaseAnonKey; // Use anon key, but with the user's token
     actualUseServiceRole = false;
@@ -249,7 +375,7 @@ async function initializeSupabaseClient(useServiceRole = false, accessToken = nu
         };
         return fetch(url, fetchOptions);
       }
-    } : undefined,
+    } : { fetch: meteredFetch() },
   } : {
     auth: {
       autoRefreshToken: !isDeno, // Don't auto-refresh in Deno (no session storage)
@@ -268,18 +394,26 @@ async function initializeSupabaseClient(useServiceRole = false, accessToken = nu
         };
         return fetch(url, fetchOptions);
       }
-    } : undefined,
+    } : { fetch: meteredFetch() },
   };
 
+  // User-scoped client (Deno): PostgREST sees the caller's JWT, so RLS applies.
+  // One pooled client per token; the LRU bound keeps the pool from growing with traffic.
+  if (useUserToken) {
+    options.global = { ...options.global, headers: { Authorization: `Bearer ${accessToken}` } };
+  }
+
   if (isDeno && !isProduction) {
     console.log(`🔧 Using database schema: ${dbSchema}`);
-    // Note: accessToken is no longer used here - token validation happens in UnifiedUserEntity.me()
   }
 
   // Performance: Use global client cache to reuse connections
-  const cacheKey = getClientCacheKey(actualUseServiceRole, dbSchema);
-  if (globalClientCache.has(cacheKey)) {
-    return globalClientCache.get(cacheKey);
+  const cacheKey = useUserToken
+    ? `user_${dbSchema}_${accessToken}`
+    : getClientCacheKey(actualUseServiceRole, dbSchema);
+  const clientCache = useUserToken ? userClientCache : sharedClientCache;
+  if (clientCache.has(cacheKey)) {
+    return clientCache.get(cacheKey);
   }
 
   // ── Reusar el singleton principal del app si estamos en browser ──────────
@@ -290,7 +424,7 @@ async function initializeSupabaseClient(useServiceRole = false, accessToken = nu
   // Solo aplica cuando NO es service role (service role necesita su propio
   // cliente con auth deshabilitada).
   if (isBrowser && !actualUseServiceRole && typeof window !== 'undefined' && window.supabaseInstance) {
-    globalClientCache.set(cacheKey, window.supabaseInstance);
+    clientCache.set(cacheKey, window.supabaseInstance);
     return window.supabaseInstance;
   }
 
@@ -304,8 +438,7 @@ async function initializeSupabaseClient(useServiceRole = false, accessToken = nu
   // Test the connection only once in development
   if (isDeno && useServiceRole && !isProduction) {
     // Only test connection in dev mode, and only once per client type
-    const testCacheKey = `tested_${cacheKey}`;
-    if (!globalClientCache.has(testCacheKey)) {
+    if (!testedClients.has(cacheKey)) {
       console.log("🔧 Testing Supabase connection with service role...");
       try {
         const { data, error } = await client.from(USERS_TABLE_NAME).select("id").limit(1);
@@ -317,12 +450,12 @@ async function initializeSupabaseClient(useServiceRole = false, accessToken = nu
       } catch (err) {
         console.warn("⚠️ Supabase connection test failed:", err.message);
       }
-      globalClientCache.set(testCacheKey, true);
+      testedClients.add(cacheKey);
     }
   }
   
   // Cache the client for reuse
-  globalClientCache.set(cacheKey, client);
+  clientCache.set(cacheKey, client);
   return client;
 }
 
@@ -342,6 +475,114 @@ function setColumnTypesByTable(tableName, colTypes) {
   columnTypeByTable.set(tableName, colTypes);
 }
 
+// Projection presets per table: { list: [...fieldNames], <custom>: [...] }.
+// "list" defaults to the scalar columns of the entity schema (no jsonb/arrays);
+// an entity JSON can override or add presets under "projections", where the
+// token "$scalar" expands to that default.
+const projectionsByTable = new Map();
+const SCALAR_FIELD_TYPES = new Set(["string", "number", "integer", "boolean"]);
+const PROJECTION_BASE_FIELDS = ["id", "created_date", "updated_date"];
+
+function buildProjections(schema) {
+  const scalar = [...PROJECTION_BASE_FIELDS];
+  for (const [fieldName, prop] of Object.entries(schema.properties)) {
+    if (prop && SCALAR_FIELD_TYPES.has(prop.type) && !scalar.includes(fieldName)) scalar.push(fieldName);
+  }
+  const projections = { list: scalar };
+  for (const [name, fields] of Object.entries(schema.projections || {})) {
+    if (!Array.isArray(fields)) continue;
+    const expanded = [...PROJECTION_BASE_FIELDS];
+    for (const f of fields) {
+      for (const field of f === "$scalar" ? scalar : [f]) {
+        if (!expanded.includes(field)) expanded.push(field);
+      }
+    }
+    projections[name] = expanded;
+  }
+  return projections;
+}
+
+/**
+ * Remove the column named in a Postgres "column ... does not exist" error from a
+ * preset, so a schema JSON ahead of/behind the table only costs one retry.
+ * Returns the new column list (null = select *).
+ */
+function dropProjectionColumn(entity, preset, message) {
+  const m = String(message || "").match(/column (?:"?\w+"?\.)?"?(\w+)"? does not exist/);
+  const presets = projectionsByTable.get(entity.tableName);
+  const current = presets?.[preset];
+  if (!m || !current) return null;
+  const next = current.filter((f) => entity.mapFieldName(f) !== m[1]);
+  if (next.length === current.length) return null;
+  console.warn(`Projection @${preset} of ${entity.tableName}: column ${m[1]} does not exist, dropped`);
+  presets[preset] = next;
+  return [...next];
+}
+
+// Keyset cursor: opaque base64 of the last row's (created_at, id)
+function encodeKeysetCursor({ created_at, id }) {
+  return btoa(JSON.stringify({ c: created_at, i: id }));
+}
+
+function decodeKeysetCursor(cursor) {
+  if (!cursor) return null;
+  try {
+    const { c, i } = JSON.parse(atob(cursor));
+    return c != null && i != null ? { created_at: c, id: i } : null;
+  } catch {
+    throw new Error("Invalid page cursor");
+  }
+}
+
+// Row mappers (db column -> field name) compiled once per table and row shape,
+// instead of resolving every key of every row through the field map.
+const REVERSE_TIMESTAMP_FIELDS = [["created_at", "created_date"], ["updated_at", "updated_date"]];
+const REVERSE_FIELD_MAPPINGS = {
+  created_at: "created_date",
+  updated_at: "updated_date",
+  created_by_id: "created_by_id",
+  created_by: "created_by",
+};
+const EMPTY_FIELD_MAP = {};
+const rowMappersByTable = new Map();
+
+function compileRowMapper(fieldMap, keys) {
+  const pairs = keys.map((key) => [
+    key,
+    key in REVERSE_FIELD_MAPPINGS ? REVERSE_FIELD_MAPPINGS[key] : (fieldMap[key] ?? key),
+  ]);
+  // Real DB timestamps (created_at, updated_at) always win over same-named text
+  // columns (e.g. order has both created_at timestamptz AND created_date text)
+  const timestamps = REVERSE_TIMESTAMP_FIELDS.filter(([src]) => keys.includes(src));
+  return (obj) => {
+    const mapped = {};
+    for (let i = 0; i < pairs.length; i++) mapped[pairs[i][1]] = obj[pairs[i][0]];
+    for (let i = 0; i < timestamps.length; i++) {
+      const value = obj[timestamps[i][0]];
+      if (value != null) mapped[timestamps[i][1]] = value;
+    }
+    return mapped;
+  };
+}
+
+function getRowMapper(tableName, obj) {
+  const fieldMap = fieldNameToOriginalByTable.get(tableName) || EMPTY_FIELD_MAP;
+  let cached = rowMappersByTable.get(tableName);
+  if (!cached || cached.fieldMap !== fieldMap) {
+    // Field maps load lazily; drop mappers compiled against an older one
+    cached = { fieldMap, mappers: new Map() };
+    rowMappersByTable.set(tableName, cached);
+  }
+  const keys = Object.keys(obj);
+  const shape = keys.join(",");
+  let mapper = cached.mappers.get(shape);
+  if (!mapper) {
+    mapper = compileRowMapper(fieldMap, keys);
+    if (cached.mappers.size < 64) cached.mappers.set(shape, mapper);
+  }
+  return mapper;
+}
+
 /**
  * Coerce payload values to match schema types so Supabase (strict types) does not fail.
  * Uses entity schema types: empty/invalid for number|integer -> null; string that parses as number -> number; etc.
@@ -378,6 +619,603 @@ function coerceDataForSupabase(tableName, data) {
  * Base Entity class that provides CRUD operations
  * Also exported as CustomEntity for backward compatibility
  */
+// Bulk writes: rows per multi-row INSERT/UPSERT and chunks in flight at once
+const DEFAULT_BULK_BATCH_SIZE = 500;
+const DEFAULT_BULK_CONCURRENCY = 4;
+
+/**
+ * Run worker(item, index) over items with at most `limit` calls in flight.
+ * Results keep the input order. Also used by the functions server
+ * (apps/Smart/src/Functions/_concurrency.js).
+ */
+export async function mapWithConcurrency(items, limit, worker) {
+  const results = new Array(items.length);
+  let next = 0;
+  const runners = Array.from({ length: Math.max(1, Math.min(limit, items.length)) }, async () => {
+    while (next < items.length) {
+      const i = next++;
+      results[i] = await worker(items[i], i);
+    }
+  });
+  await Promise.all(runners);
+  return results;
+}
+
+function chunkArray(items, size) {
+  const chunks = [];
+  for (let i = 0; i < items.length; i += size) {
+    chunks.push(items.slice(i, i + size));
+  }
+  return chunks;
+}
+
+/**
+ * Decode a byte ReadableStream into text chunks.
+ */
+async function* readableStreamText(stream) {
+  const reader = stream.getReader();
+  const decoder = new TextDecoder();
+  try {
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      const text = typeof value === "string" ? value : decoder.decode(value, { stream: true });
+      if (text) yield text;
+    }
+    const tail = decoder.decode();
+    if (tail) yield tail;
+  } finally {
+    reader.releaseLock();
+  }
+}
+
+/**
+ * Text chunks of a File/Blob: streamed when supported, otherwise read at once.
+ */
+async function* fileTextChunks(file) {
+  if (typeof file.stream === "function") {
+    yield* readableStreamText(file.stream());
+  } else if (typeof file.text === "function") {
+    yield await file.text();
+  } else {
+    yield new TextDecoder().decode(await file.arrayBuffer());
+  }
+}
+
+/**
+ * Streaming CSV parser (RFC 4180): quoted fields may contain commas, newlines
+ * and escaped quotes (""). Accepts a string, a byte ReadableStream or an
+ * (async) iterable of text chunks, and yields one array of fields per record,
+ * so large files are never materialized in memory. Blank lines are skipped.
+ * @param {string|ReadableStream|AsyncIterable<string>|Iterable<string>} source
+ * @returns {AsyncGenerator<string[]>}
+ */
+export async function* parseCSVStream(source) {
+  const chunks = typeof source === "string"
+    ? [source]
+    : typeof source?.getReader === "function" ? readableStreamText(source) : source;
+
+  let row = [];
+  let field = "";
+  let inQuotes = false;
+  let quotePending = false; // saw a quote inside a quoted field: closing or escaped ""
+  let skipLF = false; // previous record ended with \r
+  let first = true;
+
+  for await (let chunk of chunks) {
+    if (first && chunk) {
+      if (chunk.charCodeAt(0) === 0xfeff) chunk = chunk.slice(1);
+      first = false;
+    }
+    for (let i = 0; i < chunk.length; i++) {
+      const c = chunk[i];
+      if (skipLF) {
+        skipLF = false;
+        if (c === "\n") continue;
+      }
+      if (inQuotes) {
+        if (quotePending) {
+          quotePending = false;
+          if (c === '"') {
+            field += '"';
+            continue;
+          }
+          inQuotes = false; // closing quote; handle c below
+        } else {
+          if (c === '"') quotePending = true;
+          else field += c;
+          continue;
+        }
+      }
+      if (c === '"' && field === "") {
+        inQuotes = true;
+      } else if (c === ",") {
+        row.push(field);
+        field = "";
+      } else if (c === "\n" || c === "\r") {
+        skipLF = c === "\r";
+        if (row.length > 0 || field !== "") {
+          row.push(field);
+          yield row;
+        }
+        row = [];
+        field = "";
+      } else {
+        field += c;
+      }
+    }
+  }
+  if (row.length > 0 || field !== "") {
+    row.push(field);
+    yield row;
+  }
+}
+
+// ── Browser entity query cache ─────────────────────────────────────────────
+// Shared by every screen that reads through appClient.entities: identical
+// list()/filter() calls (same tenant, table and query) share one request and
+// one result. SDK writes and realtime events (subscribe()) mark entries dirty;
+// the next read re-syncs only what changed (ids from events + rows with
+// updated_at >= the newest cached row) and merges it, instead of reloading.
+// That delta cannot see rows deleted or filtered out elsewhere, so it is only
+// used while the table's realtime channel is live (deletes arrive as events)
+// or for ids this tab wrote; any other revalidation is a full reload.
+const ENTITY_CACHE_ENABLED = isBrowser && getEnvVar("VITE_ENTITY_CACHE", "true") !== "false";
+const ENTITY_CACHE_SIZE = parseInt(getEnvVar("VITE_ENTITY_CACHE_SIZE", "200"), 10) || 200;
+// Reads inside this window are served without any request
+const ENTITY_CACHE_FRESH_MS = parseInt(getEnvVar("VITE_ENTITY_CACHE_FRESH_MS", "5000"), 10) || 5000;
+// Clean entries of a table with a live realtime channel stay valid this long
+// (see REALTIME_PUBLISHED_TABLES)
+const ENTITY_CACHE_LIVE_MS = parseInt(getEnvVar("VITE_ENTITY_CACHE_LIVE_MS", "120000"), 10) || 120000;
+// Full reload at least this often, even with realtime live: catches rows whose
+// updated_at (now() at transaction start, or the writer's clock) is older than
+// the delta window below by the time they commit, and events lost on reconnects
+const ENTITY_CACHE_MAX_AGE_MS = 10 * 60 * 1000;
+// Deltas ask for updated_at >= newest cached row minus this overlap, for rows
+// committed after the last fetch with an earlier timestamp
+const ENTITY_CACHE_DELTA_OVERLAP_MS = 60 * 1000;
+// Larger deltas fall back to a full reload
+const ENTITY_CACHE_MAX_DELTA_ROWS = 500;
+// Never cached: auth data and counters that must always be read fresh
+const ENTITY_CACHE_EXEMPT_TABLES = new Set(['users', 'sequence_counter']);
+// Tables in the supabase_realtime publication (db/seeds/026_realtime_publication.sql).
+// A channel reports SUBSCRIBED for any table, published or not, so only these
+// (or a table whose channel has delivered an event) count as live.
+const REALTIME_PUBLISHED_TABLES = new Set([
+  'order', 'sale', 'transaction', 'customer', 'notification',
+  'cash_register', 'cash_drawer_movement', 'work_order_event',
+  'product', 'service', 'announcement', 'time_entry',
+]);
+
+const ISO_DATE_RE = /^\d{4}-\d{2}-\d{2}/;
+
+function stableStringify(value) {
+  if (Array.isArray(value)) return `[${value.map(stableStringify).join(",")}]`;
+  if (value && typeof value === "object") {
+    return `{${Object.keys(value).sort().map((k) => `${JSON.stringify(k)}:${stableStringify(value[k])}`).join(",")}}`;
+  }
+  return JSON.stringify(value) ?? "null";
+}
+
+function newestUpdatedAt(rows) {
+  let newest = null;
+  for (const r of rows) {
+    const v = r?.updated_date;
+    if (typeof v === "string" && (!newest || v > newest)) newest = v;
+  }
+  return newest;
+}
+
+/**
+ * Comparator matching ORDER BY for client-side merges, or null when the sort
+ * column is not safely comparable in JS (only numbers and ISO dates are;
+ * text collation differs from Postgres).
+ */
+function rowComparator(orderBy, rows) {
+  if (!orderBy) return null;
+  const desc = orderBy.startsWith("-");
+  let field = desc ? orderBy.slice(1) : orderBy;
+  field = { created_at: "created_date", updated_at: "updated_date" }[field] || field;
+  const comparable = rows.every((r) => {
+    const v = r[field];
+    return v == null || typeof v === "number" || (typeof v === "string" && ISO_DATE_RE.test(v));
+  });
+  if (!comparable) return null;
+  // Postgres: NULLS LAST for ASC, NULLS FIRST for DESC
+  return (a, b) => {
+    const x = a[field];
+    const y = b[field];
+    if (x == null || y == null) return x == null && y == null ? 0 : (x == null) === desc ? -1 : 1;
+    const c = x < y ? -1 : x > y ? 1 : 0;
+    return desc ? -c : c;
+  };
+}
+
+class EntityQueryCache {
+  constructor(maxSize) {
+    this.entries = new LruCache(maxSize, (key, entry) => this._release(entry));
+    // Entries with watchers survive LRU eviction
+    this.pinned = new Map();
+    // tableName -> { keys: Set, connected: boolean, sawEvent: boolean, unsubscribe, timer }
+    // The realtime channel is closed when the table has no cached queries left
+    this.tables = new Map();
+    this.counters = { requests: 0, full_loads: 0, deltas: 0, deduped: 0, fresh_hits: 0, realtime_events: 0 };
+
+    if (typeof document !== "undefined") {
+      document.addEventListener("visibilitychange", () => {
+        if (document.hidden) return;
+        for (const entry of this.pinned.values()) this._refresh(entry);
+      });
+    }
+
+    // Cached rows belong to the signed-in user: drop them on sign-out
+    getSupabaseClient().then(
+      (client) => client?.auth?.onAuthStateChange?.((event) => {
+        if (event === "SIGNED_OUT") this.clear();
+      }),
+      () => {}
+    );
+  }
+
+  _tenantId() {
+    return typeof localStorage !== "undefined" ? localStorage.getItem("smartfix_tenant_id") || "" : "";
+  }
+
+  _entry(entity, query) {
+    const key = `${this._tenantId()}|${entity.tableName}|${entity.useServiceRole ? "service" : "anon"}|${stableStringify(query)}`;
+    let entry = this.entries.get(key);
+    if (!entry) {
+      entry = this.pinned.get(key) || {
+        key,
+        entity,
+        query,
+        data: null,
+        version: 0,
+        fetchedAt: 0,
+        loadedAt: 0,
+        dirty: false,
+        reload: false,
+        changedIds: new Set(),
+        promise: null,
+        watchers: new Set(),
+      };
+      this.entries.set(key, entry);
+      this._attachTable(entity).keys.add(key);
+    }
+    return entry;
+  }
+
+  _lookup(key) {
+    return this.entries.map.get(key) || this.pinned.get(key);
+  }
+
+  _attachTable(entity) {
+    let table = this.tables.get(entity.tableName);
+    if (table) return table;
+    table = { keys: new Set(), connected: false, sawEvent: false, unsubscribe: null, timer: null };
+    this.tables.set(entity.tableName, table);
+    table.unsubscribe = entity.subscribe(
+      (event) => this._onRealtime(entity.tableName, event),
+      (status) => {
+        table.connected = status === "SUBSCRIBED";
+      }
+    );
+    return table;
+  }
+
+  _detachTable(tableName) {
+    const table = this.tables.get(tableName);
+    if (!table) return;
+    if (table.timer) clearTimeout(table.timer);
+    table.unsubscribe?.();
+    this.tables.delete(tableName);
+  }
+
+  /** Entry left the LRU: forget its key unless it is still watched. */
+  _release(entry) {
+    if (this.pinned.has(entry.key)) return;
+    const table = this.tables.get(entry.entity.tableName);
+    if (!table) return;
+    table.keys.delete(entry.key);
+    if (table.keys.size === 0) this._detachTable(entry.entity.tableName);
+  }
+
+  /** Connected channel on a table that actually emits events. */
+  _isLive(tableName) {
+    const table = this.tables.get(tableName);
+    return !!table?.connected && (REALTIME_PUBLISHED_TABLES.has(tableName) || table.sawEvent);
+  }
+
+  _isFresh(entry) {
+    if (!entry.data || entry.dirty || entry.reload) return false;
+    const age = Date.now() - entry.fetchedAt;
+    if (age < ENTITY_CACHE_FRESH_MS) return true;
+    return this._isLive(entry.entity.tableName) && age < ENTITY_CACHE_LIVE_MS;
+  }
+
+  /**
+   * Cached list()/filter(): fresh → cached rows; in flight → same promise;
+   * otherwise delta sync (or full load) through the uncached query methods.
+   */
+  async read(entity, query) {
+    const entry = this._entry(entity, query);
+    const data = await this._readEntry(entry);
+    return data.slice();
+  }
+
+  _readEntry(entry) {
+    if (entry.promise) {
+      this.counters.deduped++;
+      recordCacheHit(entry.entity.tableName);
+      return entry.promise;
+    }
+    if (this._isFresh(entry)) {
+      this.counters.fresh_hits++;
+      recordCacheHit(entry.entity.tableName);
+      return Promise.resolve(entry.data);
+    }
+    // Expired without a live channel: other clients' deletes and status
+    // changes are invisible to a delta
+    if (entry.data && !this._isLive(entry.entity.tableName) && Date.now() - entry.fetchedAt >= ENTITY_CACHE_FRESH_MS) {
+      entry.reload = true;
+    }
+    return this._sync(entry);
+  }
+
+  _sync(entry) {
+    const ids = [...entry.changedIds];
+    const reload = entry.reload;
+    entry.changedIds.clear();
+    entry.dirty = false;
+    entry.reload = false;
+
+    entry.promise = (async () => {
+      try {
+        this.counters.requests++;
+        let data = null;
+        if (!reload && this._canDelta(entry, ids)) {
+          data = await this._delta(entry, ids);
+          if (data) this.counters.deltas++;
+        }
+        if (!data) {
+          data = await this._load(entry);
+          entry.loadedAt = Date.now();
+          this.counters.full_loads++;
+        }
+        if (data !== entry.data) {
+          entry.data = data;
+          entry.version++;
+        }
+        entry.fetchedAt = Date.now();
+        return entry.data;
+      } catch (err) {
+        // Keep pending changes for the next attempt
+        for (const id of ids) entry.changedIds.add(id);
+        entry.dirty = entry.dirty || ids.length > 0;
+        entry.reload = entry.reload || reload;
+        throw err;
+      } finally {
+        entry.promise = null;
+      }
+    })();
+    return entry.promise;
+  }
+
+  _load(entry) {
+    const { conditions, orderBy, limit, fields } = entry.query;
+    return conditions
+      ? entry.entity._filterFromServer(conditions, orderBy, limit, null, fields)
+      : entry.entity._listFromServer(orderBy, limit, null, fields);
+  }
+
+  _canDelta(entry, ids) {
+    if (!entry.data || entry.query.fields != null) return false;
+    if (Date.now() - entry.loadedAt >= ENTITY_CACHE_MAX_AGE_MS) return false;
+    // Not live: only this tab's own writes (known ids) can be merged
+    if (ids.length === 0 && !this._isLive(entry.entity.tableName)) return false;
+    return entry.data.length === 0 || entry.data[0]?.id != null;
+  }
+
+  /**
+   * Fetch only changed rows and merge them into the cached result.
+   * @returns {Promise<Array|null>} merged rows, or null when a full reload is needed
+   */
+  async _delta(entry, ids) {
+    const { conditions, orderBy, limit } = entry.query;
+    const newest = this._isLive(entry.entity.tableName) ? newestUpdatedAt(entry.data) : null;
+    const changed = [];
+    if (ids.length > 0) changed.push({ id: { $in: ids } });
+    if (newest) {
+      const t = Date.parse(newest);
+      const since = Number.isNaN(t) ? newest : new Date(t - ENTITY_CACHE_DELTA_OVERLAP_MS).toISOString();
+      changed.push({ updated_at: { $gte: since } });
+    }
+    if (changed.length === 0) return null;
+
+    const rows = await entry.entity._filterFromServer(
+      { $and: [conditions || {}, { $or: changed }] },
+      orderBy,
+      ENTITY_CACHE_MAX_DELTA_ROWS + 1
+    );
+    if (rows.length > ENTITY_CACHE_MAX_DELTA_ROWS) return null;
+
+    const byId = new Map(entry.data.map((r) => [String(r.id), r]));
+    const returned = new Set();
+    let changedRows = 0;
+    for (const r of rows) {
+      const id = String(r.id);
+      returned.add(id);
+      if (stableStringify(byId.get(id)) !== stableStringify(r)) changedRows++;
+      byId.set(id, r);
+    }
+    // Ids from events that no longer match the query (deleted or filtered out)
+    let removed = 0;
+    for (const id of ids) {
+      if (!returned.has(id) && byId.delete(id)) removed++;
+    }
+    if (changedRows === 0 && removed === 0) return entry.data;
+
+    let merged = [...byId.values()];
+    const cmp = rowComparator(orderBy, merged);
+    if (!cmp) return null;
+    merged.sort(cmp);
+    if (limit && merged.length > limit) {
+      merged = merged.slice(0, limit);
+    } else if (limit && removed > 0 && entry.data.length >= limit) {
+      // A full page lost rows; reload so the next ones fill it
+      return null;
+    }
+    return merged;
+  }
+
+  _onRealtime(tableName, event) {
+    const table = this.tables.get(tableName);
+    if (!table) return;
+    table.sawEvent = true;
+    const tenantId = this._tenantId();
+    const rowTenant = event?.data?.tenant_id;
+    if (tenantId && rowTenant && rowTenant !== tenantId) return;
+    this.counters.realtime_events++;
+    this._markTable(tableName, event?.id != null ? [event.id] : null);
+  }
+
+  /**
+   * Mark every cached query of a table as changed.
+   * @param {Array<string>|null} ids - changed row ids, or null when unknown (forces a full reload)
+   */
+  _markTable(tableName, ids) {
+    const table = this.tables.get(tableName);
+    if (!table) return;
+    for (const key of table.keys) {
+      const entry = this._lookup(key);
+      if (!entry) {
+        table.keys.delete(key);
+        continue;
+      }
+      entry.dirty = true;
+      if (ids) ids.forEach((id) => entry.changedIds.add(String(id)));
+      else entry.reload = true;
+    }
+    // Coalesce bursts (bulk writes, several events) into one refresh of watched queries
+    if (table.timer) return;
+    table.timer = setTimeout(() => {
+      table.timer = null;
+      for (const key of table.keys) {
+        const entry = this.pinned.get(key);
+        if (entry) this._refresh(entry);
+      }
+    }, 250);
+  }
+
+  noteWrite(entity, ids) {
+    this._markTable(entity.tableName, ids);
+  }
+
+  invalidate(tableName) {
+    this._markTable(tableName, null);
+  }
+
+  _refresh(entry) {
+    return this._readEntry(entry).then(
+      () => {
+        if (entry.notifiedVersion !== entry.version) this._notify(entry);
+      },
+      (error) => {
+        for (const w of entry.watchers) w.callback(null, { stale: true, error });
+      }
+    );
+  }
+
+  _notify(entry) {
+    entry.notifiedVersion = entry.version;
+    for (const w of entry.watchers) {
+      try {
+        w.callback(entry.data.slice(), { stale: false });
+      } catch (err) {
+        console.error("[EntityQueryCache] watch callback error:", err);
+      }
+    }
+  }
+
+  watch(entity, query, callback, options = {}) {
+    const entry = this._entry(entity, query);
+    const watcher = { callback, poll: null };
+    entry.watchers.add(watcher);
+    this.pinned.set(entry.key, entry);
+
+    // Stale-while-revalidate: cached rows now, fresh rows after the refresh
+    if (entry.data) callback(entry.data.slice(), { stale: !this._isFresh(entry) });
+    entry.notifiedVersion = entry.data ? entry.version : -1;
+    this._refresh(entry);
+
+    // Polling only as a fallback while the realtime channel is not live
+    if (options.pollMs > 0) {
+      watcher.poll = setInterval(() => {
+        if (typeof document !== "undefined" && document.hidden) return;
+        if (this._isLive(entity.tableName)) return;
+        entry.reload = true; // like the polling it replaces: a delta misses deletes
+        this._refresh(entry);
+      }, options.pollMs);
+    }
+
+    return () => {
+      if (watcher.poll) clearInterval(watcher.poll);
+      entry.watchers.delete(watcher);
+      if (entry.watchers.size === 0) {
+        this.pinned.delete(entry.key);
+        if (!this.entries.has(entry.key)) this._release(entry);
+      }
+    };
+  }
+
+  stats() {
+    const liveTables = [];
+    for (const name of this.tables.keys()) if (this._isLive(name)) liveTables.push(name);
+    return { ...this.entries.stats(), ...this.counters, watched: this.pinned.size, live_tables: liveTables };
+  }
+
+  /**
+   * Drop every cached result (logout / user switch). Watched queries stay
+   * registered but reload from the server on their next read; channels of
+   * tables left without queries are closed.
+   */
+  clear() {
+    this.entries.clear();
+    for (const entry of this.pinned.values()) {
+      entry.data = null;
+      entry.reload = true;
+      entry.changedIds.clear();
+    }
+    for (const [name, table] of [...this.tables]) {
+      for (const key of table.keys) {
+        if (!this.pinned.has(key)) table.keys.delete(key);
+      }
+      if (table.keys.size === 0) this._detachTable(name);
+    }
+  }
+}
+
+const entityQueryCache = ENTITY_CACHE_ENABLED ? new EntityQueryCache(ENTITY_CACHE_SIZE) : null;
+
+function cachesTable(tableName) {
+  return !!entityQueryCache && !ENTITY_CACHE_EXEMPT_TABLES.has(tableName);
+}
+
+/**
+ * Entity cache counters (hits, requests, deltas, full loads, realtime events).
+ */
+export function getEntityCacheStats() {
+  return entityQueryCache ? entityQueryCache.stats() : null;
+}
+
+/**
+ * Drop all cached entity results. Called on sign-out; PIN logouts that keep
+ * the Supabase session call it directly.
+ */
+export function clearEntityCache() {
+  entityQueryCache?.clear();
+}
+
 export class UnifiedEntity {
   constructor(tableName, useServiceRole = false) {
     this.tableName = tableName;
@@ -414,8 +1252,8 @@ export class UnifiedEntity {
       // Use global cache instead of instance cache for better connection reuse
       const schema = getDbSchema();
       const cacheKey = getClientCacheKey(true, schema);
-      if (globalClientCache.has(cacheKey)) {
-        return globalClientCache.get(cacheKey);
+      if (sharedClientCache.has(cacheKey)) {
+        return sharedClientCache.get(cacheKey);
       }
       if (!isProduction) {
         console.log(`🔧 Initializing Supabase client for ${this.tableName} (serviceRole: true in Deno)`);
@@ -480,40 +1318,13 @@ export class UnifiedEntity {
 
   mapResultFields(data) {
     if (!data) return data;
-    const reverseFieldMappings = {
-      created_at: "created_date",
-      updated_at: "updated_date",
-      created_by_id: "created_by_id",
-      created_by: "created_by",
-    };
-    // console.log("🦕 this.tableName", this.tableName);
-    // console.log("🦕 this.fieldNameToOriginal", getFieldNameToOriginalByTable(this.tableName) ?? {});
-
-    const mapObject = (obj) => {
-      const mapped = {};
-      for (const [key, value] of Object.entries(obj)) {
-        // 1) Explicit mapping, 2) client-seen key (from mapDataFields/filter/orderBy), 3) snake_to_camel fallback
-        const mappedKey = key in reverseFieldMappings
-          ? reverseFieldMappings[key]
-          : (getFieldNameToOriginalByTable(this.tableName)[key] ?? key);
-        mapped[mappedKey] = value;
-      }
-      // Second pass: real DB timestamps (created_at, updated_at) always win over
-      // any same-named text columns (e.g. order table has both created_at timestamptz
-      // AND created_date text — the text column must not overwrite the real timestamp)
-      for (const [srcKey, dstKey] of Object.entries(reverseFieldMappings)) {
-        if (srcKey in obj && obj[srcKey] != null) {
-          mapped[dstKey] = obj[srcKey];
-        }
-      }
-      return mapped;
-    };
-
     if (Array.isArray(data)) {
-      return data.map(mapObject);
-    } else {
-      return mapObject(data);
+      if (data.length === 0) return [];
+      // PostgREST returns the same keys for every row of one select
+      const mapper = getRowMapper(this.tableName, data[0]);
+      return data.map(mapper);
     }
+    return getRowMapper(this.tableName, data)(data);
   }
 
   /**
@@ -524,51 +1335,14 @@ export class UnifiedEntity {
    * @param {string[]|null} fields - Optional list of field names to return (client-side names)
    */
   async list(orderBy = "-created_at", limit = null, skip = null, fields = null) {
-    const client = await this.getClient();
-    const selectCols = fields != null
-      ? (Array.isArray(fields) ? fields : [fields]).map((f) => this.mapFieldName(f)).join(",")
-      : "*";
-    let query = client.from(this.tableName).select(selectCols);
-
-    // Auto-inject tenant_id for browser queries to enforce tenant isolation
-    if (isBrowser && !this.useServiceRole && !TENANT_EXEMPT_TABLES.has(this.tableName)) {
-      const tenantId = typeof localStorage !== 'undefined' ? localStorage.getItem('smartfix_tenant_id') : null;
-      if (tenantId) {
-        if (TENANT_SHARED_TABLES.has(this.tableName)) {
-          // Show global records (tenant_id IS NULL) + own records
-          query = query.or(`tenant_id.is.null,tenant_id.eq.${tenantId}`);
-        } else {
-          query = query.eq('tenant_id', tenantId);
-        }
-      }
-    }
-
-    if (orderBy) {
-      if (orderBy.startsWith("-")) {
-        const field = this.mapFieldName(orderBy.substring(1));
-        query = query.order(field, { ascending: false });
-      } else {
-        const field = this.mapFieldName(orderBy);
-        query = query.order(field, { ascending: true });
-      }
-    }
-
-    if (skip != null && skip > 0) {
-      const end = limit != null ? skip + limit - 1 : skip + 999999;
-      query = query.range(skip, end);
-    } else if (limit) {
-      query = query.limit(limit);
+    if (cachesTable(this.tableName) && !(skip > 0)) {
+      return entityQueryCache.read(this, { conditions: null, orderBy, limit, fields });
     }
+    return this._listFromServer(orderBy, limit, skip, fields);
+  }
 
-    const { data, error } = await query;
-    if (error) {
-      if (error.code === "PGRST205" && error.message.includes("Could not find the table")) {
-        console.warn(`Table ${this.tableName} does not exist, returning empty array`);
-        return [];
-      }
-      throw error;
-    }
-    return this.mapResultFields(data) || [];
+  async _listFromServer(orderBy, limit, skip, fields) {
+    return this._select({ conditions: null, orderBy, limit, skip, fields });
   }
 
   /**
@@ -814,15 +1588,74 @@ export class UnifiedEntity {
    * @param {string[]|null} fields - Optional list of field names to return (client-side names)
    */
   async filter(conditions = {}, orderBy = "created_at", limit = null, skip = null, fields = null) {
+    if (cachesTable(this.tableName) && !(skip > 0)) {
+      return entityQueryCache.read(this, { conditions: conditions || {}, orderBy, limit, fields });
+    }
+    return this._filterFromServer(conditions, orderBy, limit, skip, fields);
+  }
+
+  async _filterFromServer(conditions = {}, orderBy = "created_at", limit = null, skip = null, fields = null) {
+    return this._select({ conditions, orderBy, limit, skip, fields });
+  }
+
+  /**
+   * Column list of a projection preset (entity JSON "projections", or the
+   * scalar columns for "list"), or null when the entity has no schema.
+   * Pass the preset to list/filter/page/stream as fields: "@<name>".
+   * @param {string} name - Preset name (default "list")
+   * @returns {string[]|null}
+   */
+  projection(name = "list") {
+    const preset = projectionsByTable.get(this.tableName)?.[name];
+    return preset ? [...preset] : null;
+  }
+
+  _selectColumns(fields) {
+    if (fields == null) return "*";
+    return (Array.isArray(fields) ? fields : [fields]).map((f) => this.mapFieldName(f)).join(",");
+  }
+
+  /**
+   * Shared SELECT behind list(), filter() and page().
+   * fields may be a column list or a projection preset ("@list"). Preset columns
+   * come from the entity JSON and can lag the table; a column the table lacks
+   * is dropped from the preset and the query retried.
+   * keyset = { after: { created_at, id } | null, asc } orders by (created_at, id)
+   * and starts after the cursor.
+   */
+  async _select({ conditions = null, orderBy = null, limit = null, skip = null, fields = null, keyset = null }) {
     const client = await this.getClient();
-    const selectCols = fields != null
-      ? (Array.isArray(fields) ? fields : [fields]).map((f) => this.mapFieldName(f)).join(",")
-      : "*";
-    
     await this._bridgeRlsToken(client);
 
-    let query = client.from(this.tableName).select(selectCols);
-    query = this._applyConditionsToQuery(query, conditions);
+    const preset = typeof fields === "string" && fields.startsWith("@") ? fields.slice(1) : null;
+    let columns = preset ? this.projection(preset) : fields;
+    if (keyset && Array.isArray(columns)) {
+      // The cursor is read from the last row
+      for (const f of ["id", "created_date"]) if (!columns.includes(f)) columns = [...columns, f];
+    }
+
+    for (let attempt = 0; ; attempt++) {
+      const { data, error } = await this._buildSelect(client, { conditions, orderBy, limit, skip, columns, keyset });
+      if (!error) {
+        return this.mapResultFields(data) || [];
+      }
+      if (error.code === "PGRST205" && error.message.includes("Could not find the table")) {
+        console.warn(`Table ${this.tableName} does not exist, returning empty array`);
+        return [];
+      }
+      if (preset && columns && error.code === "42703" && attempt < 10) {
+        columns = dropProjectionColumn(this, preset, error.message);
+        continue;
+      }
+      throw error;
+    }
+  }
+
+  _buildSelect(client, { conditions, orderBy, limit, skip, columns, keyset }) {
+    let query = client.from(this.tableName).select(this._selectColumns(columns));
+    if (conditions) {
+      query = this._applyConditionsToQuery(query, conditions);
+    }
 
     // Auto-inject tenant_id for browser queries when not already in conditions
     if (isBrowser && !this.useServiceRole && !TENANT_EXEMPT_TABLES.has(this.tableName)) {
@@ -843,7 +1676,20 @@ export class UnifiedEntity {
       }
     }
 
-    if (orderBy) {
+    if (keyset) {
+      const op = keyset.asc ? "gt" : "lt";
+      if (keyset.after) {
+        const c = `"${keyset.after.created_at}"`;
+        const id = `"${String(keyset.after.id).replace(/"/g, '""')}"`;
+        // PostgREST has no row comparison; the redundant bound on created_at
+        // gives Postgres an index range start the OR alone does not
+        query = keyset.asc
+          ? query.gte("created_at", keyset.after.created_at)
+          : query.lte("created_at", keyset.after.created_at);
+        query = query.or(`created_at.${op}.${c},and(created_at.eq.${c},id.${op}.${id})`);
+      }
+      query = query.order("created_at", { ascending: keyset.asc }).order("id", { ascending: keyset.asc });
+    } else if (orderBy) {
       if (orderBy.startsWith("-")) {
         const field = this.mapFieldName(orderBy.substring(1));
         query = query.order(field, { ascending: false });
@@ -859,16 +1705,47 @@ export class UnifiedEntity {
     } else if (limit) {
       query = query.limit(limit);
     }
+    return query;
+  }
 
-    const { data, error } = await query;
-    if (error) {
-      if (error.code === "PGRST205" && error.message.includes("Could not find the table")) {
-        console.warn(`Table ${this.tableName} does not exist, returning empty array`);
-        return [];
-      }
-      throw error;
-    }
-    return this.mapResultFields(data) || [];
+  /**
+   * Keyset page ordered by (created_at, id). Unlike skip/offset, each page is an
+   * index range scan from the cursor, so deep pages cost the same as the first.
+   * @param {Object} conditions - Filter conditions (same shape as filter())
+   * @param {Object} options - limit (default 100), cursor (nextCursor of the previous
+   *                           page), direction ("desc" default | "asc"), fields (list or "@preset")
+   * @returns {Promise<{ rows: Array<Object>, nextCursor: string|null }>}
+   */
+  async page(conditions = {}, options = {}) {
+    const { limit = 100, cursor = null, direction = "desc", fields = null } = options;
+    const rows = await this._select({
+      conditions,
+      limit,
+      fields,
+      keyset: { after: decodeKeysetCursor(cursor), asc: direction === "asc" },
+    });
+    const last = rows[rows.length - 1];
+    const nextCursor = rows.length === limit && last
+      ? encodeKeysetCursor({ created_at: last.created_date, id: last.id })
+      : null;
+    return { rows, nextCursor };
+  }
+
+  /**
+   * Iterate all matching rows page by page (keyset on (created_at, id)).
+   *   for await (const rows of Order.stream({ deleted: false }, { fields: ["id"] })) { ... }
+   * @param {Object} conditions - Filter conditions (same shape as filter())
+   * @param {Object} options - pageSize (default 500), direction ("asc" default | "desc"), fields
+   * @returns {AsyncGenerator<Array<Object>>} one array per page
+   */
+  async *stream(conditions = {}, options = {}) {
+    const { pageSize = 500, direction = "asc", fields = null } = options;
+    let cursor = null;
+    do {
+      const { rows, nextCursor } = await this.page(conditions, { limit: pageSize, cursor, direction, fields });
+      if (rows.length > 0) yield rows;
+      cursor = nextCursor;
+    } while (cursor);
   }
 
   async get(id) {
@@ -986,17 +1863,246 @@ console.log("[RLS debug] campaign INSERT policies (with_check):",
       
       throw error;
     }
+    this._noteWrite([result.id]);
     return this.mapResultFields(result);
   }
 
-  async bulkCreate(dataList) {
+  /**
+   * Let cached queries of this table pick up an SDK write on their next read.
+   * @param {Array<string>|null} ids - written row ids (null: unknown, reload)
+   */
+  _noteWrite(ids = null) {
+    if (cachesTable(this.tableName)) entityQueryCache.noteWrite(this, ids);
+  }
+
+  /**
+   * Drop cached results of this table (e.g. after a server function changed it).
+   */
+  invalidate() {
+    if (cachesTable(this.tableName)) entityQueryCache.invalidate(this.tableName);
+  }
+
+  /**
+   * Browser-only per-batch write context: current user (created_by) and tenant.
+   * Resolved once per bulk call instead of once per row.
+   */
+  async _getWriteContext(client) {
+    const ctx = { user: null, tenantId: null };
+    if (isBrowser && !this.useServiceRole) {
+      try {
+        const { data: { user } } = await client.auth.getUser();
+        ctx.user = user || null;
+      } catch (_) {
+        // no-op: rows are created without created_by
+      }
+      if (!TENANT_EXEMPT_TABLES.has(this.tableName) && typeof localStorage !== 'undefined') {
+        ctx.tenantId = localStorage.getItem('smartfix_tenant_id');
+      }
+    }
+    return ctx;
+  }
+
+  _prepareCreateRow(data, ctx) {
+    const mappedData = this.mapDataFields(data);
+    if (ctx.user) {
+      mappedData['created_by_id'] = ctx.user.id;
+      mappedData['created_by'] = ctx.user.email;
+    }
+    if (ctx.tenantId && !mappedData['tenant_id']) {
+      mappedData['tenant_id'] = ctx.tenantId;
+    }
+    coerceDataForSupabase(this.tableName, mappedData);
+    return mappedData;
+  }
+
+  /**
+   * Insert (or upsert) one chunk with a single request. If the chunk fails,
+   * retry its rows one by one so each bad row gets its own error.
+   * Never throws.
+   * @returns {Promise<{ results: Array<Object|true|null>, errors: Array<{ row: number, message: string }> }>}
+   *          results aligned with rows (true when returning is off, null when the row failed)
+   */
+  async _writeChunk(client, rows, offset, ctx, options) {
+    const { upsert = false, onConflict = 'id', ignoreDuplicates = false, returning = true } = options;
+    const results = new Array(rows.length).fill(null);
+    const errors = [];
+
+    const prepared = [];
+    const positions = [];
+    rows.forEach((row, i) => {
+      try {
+        prepared.push(this._prepareCreateRow(row, ctx));
+        positions.push(i);
+      } catch (e) {
+        errors.push({ row: offset + i + 1, message: e?.message || String(e) });
+      }
+    });
+
+    const send = (payload) => {
+      let q = upsert
+        ? client.from(this.tableName).upsert(payload, { onConflict, ignoreDuplicates, defaultToNull: false })
+        : client.from(this.tableName).insert(payload, { defaultToNull: false });
+      return returning ? q.select() : q;
+    };
+
+    if (prepared.length > 0) {
+      const { data, error } = await send(prepared);
+      if (!error) {
+        positions.forEach((pos, j) => {
+          results[pos] = returning ? this.mapResultFields(data?.[j]) : true;
+        });
+      } else if (prepared.length === 1) {
+        errors.push({ row: offset + positions[0] + 1, message: error.message || String(error) });
+      } else {
+        for (let j = 0; j < prepared.length; j++) {
+          const { data: one, error: oneError } = await send([prepared[j]]);
+          if (oneError) {
+            errors.push({ row: offset + positions[j] + 1, message: oneError.message || String(oneError) });
+          } else {
+            results[positions[j]] = returning ? this.mapResultFields(one?.[0]) : true;
+          }
+        }
+      }
+    }
+
+    errors.sort((a, b) => a.row - b.row);
+    return { results, errors };
+  }
+
+  /**
+   * Create many rows with multi-row INSERTs (or UPSERTs).
+   * @param {Array<Object>} dataList
+   * @param {Object} options
+   * @param {number} options.batchSize - Rows per request (default 500)
+   * @param {number} options.concurrency - Requests in flight (default 4)
+   * @param {boolean} options.upsert - INSERT ... ON CONFLICT DO UPDATE
+   * @param {string} options.onConflict - Conflict columns for upsert (default 'id')
+   * @param {boolean} options.ignoreDuplicates - Upsert: skip existing rows instead of updating
+   * @param {boolean} options.returning - Return created rows (default true)
+   * @param {boolean} options.continueOnError - Return { results, errors } instead of throwing
+   * @returns {Promise<Array<Object>|{ results: Array<Object|null>, errors: Array<{ row: number, message: string }> }>}
+   */
+  async bulkCreate(dataList, options = {}) {
     if (!Array.isArray(dataList)) {
       throw new Error('bulkCreate expects an array of rows');
     }
-    const results = [];
-    for (const row of dataList) {
-      const created = await this.create(row);
-      results.push(created);
+    const {
+      batchSize = DEFAULT_BULK_BATCH_SIZE,
+      concurrency = DEFAULT_BULK_CONCURRENCY,
+      continueOnError = false,
+    } = options;
+
+    const client = await this.getClient();
+    await this._bridgeRlsToken(client);
+    const ctx = await this._getWriteContext(client);
+
+    const chunks = chunkArray(dataList, batchSize);
+    const outcomes = await mapWithConcurrency(chunks, concurrency, (chunk, i) =>
+      this._writeChunk(client, chunk, i * batchSize, ctx, options)
+    );
+
+    const results = outcomes.flatMap((o) => o.results);
+    const errors = outcomes.flatMap((o) => o.errors);
+    const writtenIds = results.filter((r) => r?.id != null).map((r) => r.id);
+    this._noteWrite(writtenIds.length > 0 ? writtenIds : null);
+
+    if (continueOnError) {
+      return { results, errors };
+    }
+    if (errors.length > 0) {
+      const error = new Error(`bulkCreate failed for ${errors.length} row(s): row ${errors[0].row}: ${errors[0].message}`);
+      error.errors = errors;
+      error.results = results;
+      throw error;
+    }
+    return results;
+  }
+
+  /**
+   * Update many rows. Rows that share the same changes are sent as one
+   * UPDATE ... WHERE id IN (...) per batch; the rest go one by one with
+   * bounded parallelism.
+   * @param {Array<Object>} updates - [{ id, ...fields }]
+   * @param {Object} options - batchSize, concurrency, continueOnError (same as bulkCreate)
+   * @returns {Promise<Array<Object|null>|{ results: Array<Object|null>, errors: Array<{ row: number, message: string }> }>}
+   *          results aligned with updates (null when the row was not found or failed)
+   */
+  async bulkUpdate(updates, options = {}) {
+    if (!Array.isArray(updates)) {
+      throw new Error('bulkUpdate expects an array of { id, ...fields }');
+    }
+    const {
+      batchSize = DEFAULT_BULK_BATCH_SIZE,
+      concurrency = DEFAULT_BULK_CONCURRENCY,
+      continueOnError = false,
+    } = options;
+
+    const client = await this.getClient();
+    await this._bridgeRlsToken(client);
+
+    const results = new Array(updates.length).fill(null);
+    const errors = [];
+    const now = new Date().toISOString();
+
+    // Group rows by identical payload
+    const groups = new Map();
+    updates.forEach((item, i) => {
+      const { id, ...data } = item || {};
+      if (!id) {
+        errors.push({ row: i + 1, message: 'bulkUpdate: missing id' });
+        return;
+      }
+      try {
+        const mappedData = this.mapDataFields(data);
+        coerceDataForSupabase(this.tableName, mappedData);
+        const key = JSON.stringify(mappedData);
+        if (!groups.has(key)) groups.set(key, { data: mappedData, items: [] });
+        groups.get(key).items.push({ id, index: i });
+      } catch (e) {
+        errors.push({ row: i + 1, message: e?.message || String(e) });
+      }
+    });
+
+    const tasks = [];
+    for (const { data, items } of groups.values()) {
+      for (const chunk of chunkArray(items, batchSize)) {
+        tasks.push({ data, items: chunk });
+      }
+    }
+
+    const tenantId = isBrowser && !this.useServiceRole && TENANT_SHARED_TABLES.has(this.tableName) && typeof localStorage !== 'undefined'
+      ? localStorage.getItem('smartfix_tenant_id')
+      : null;
+
+    await mapWithConcurrency(tasks, concurrency, async ({ data, items }) => {
+      let q = client.from(this.tableName).update({ ...data, updated_at: now });
+      q = items.length === 1 ? q.eq('id', items[0].id) : q.in('id', items.map((it) => it.id));
+      // For shared catalog tables, restrict updates to own records only (not globals)
+      if (tenantId) q = q.eq('tenant_id', tenantId);
+      const { data: rows, error } = await q.select();
+      if (error) {
+        for (const it of items) {
+          errors.push({ row: it.index + 1, message: error.message || String(error) });
+        }
+        return;
+      }
+      const byId = new Map((rows || []).map((r) => [String(r.id), r]));
+      for (const it of items) {
+        const row = byId.get(String(it.id));
+        results[it.index] = row ? this.mapResultFields(row) : null;
+      }
+    });
+
+    errors.sort((a, b) => a.row - b.row);
+    this._noteWrite(updates.map((u) => u?.id).filter((id) => id != null));
+    if (continueOnError) {
+      return { results, errors };
+    }
+    if (errors.length > 0) {
+      const error = new Error(`bulkUpdate failed for ${errors.length} row(s): row ${errors[0].row}: ${errors[0].message}`);
+      error.errors = errors;
+      error.results = results;
+      throw error;
     }
     return results;
   }
@@ -1023,6 +2129,7 @@ console.log("[RLS debug] campaign INSERT policies (with_check):",
     if (error) {
       throw error;
     }
+    this._noteWrite([id]);
 
     if (!result) {
       return null;
@@ -1047,6 +2154,7 @@ console.log("[RLS debug] campaign INSERT policies (with_check):",
     if (error) {
       throw error;
     }
+    this._noteWrite([id]);
   }
 
   /**
@@ -1060,60 +2168,118 @@ console.log("[RLS debug] campaign INSERT policies (with_check):",
     q = this._applyConditionsToQuery(q, query);
     const { count, error } = await q.select("*", { count: "exact", head: true });
     if (error) throw error;
+    this._noteWrite(null);
     return { deletedCount: count ?? 0 };
   }
 
   /**
-   * Import entities from a File (CSV or JSON). Parses the file and bulk-inserts rows.
-   * @param {File} file - Browser File or (Deno) file object with name and arrayBuffer/text
+   * Import entities from a File (CSV or JSON) with batched inserts.
+   * CSV is parsed as a stream (quoted commas/newlines supported) and written in
+   * chunks as it is read, so only batchSize * concurrency rows are held in memory.
+   * @param {File} file - Browser File or (Deno) file object with name and stream/arrayBuffer/text
+   * @param {Object} options - batchSize, concurrency, upsert, onConflict (see bulkCreate)
    * @returns {Promise<{ imported: number, errors?: Array<{ row?: number, message: string }> }>}
    */
-  async importEntities(file) {
+  async importEntities(file, options = {}) {
     if (!file || (typeof File !== "undefined" && !(file instanceof File)) && typeof file?.arrayBuffer !== "function" && typeof file?.text !== "function") {
       throw new Error("importEntities expects a File or object with arrayBuffer/text");
     }
-    const raw = typeof file.text === "function" ? await file.text() : await (await file.arrayBuffer()).then((ab) => new TextDecoder().decode(ab));
+    const {
+      batchSize = DEFAULT_BULK_BATCH_SIZE,
+      concurrency = DEFAULT_BULK_CONCURRENCY,
+    } = options;
+    const writeOptions = { ...options, returning: false };
+
+    const client = await this.getClient();
+    await this._bridgeRlsToken(client);
+    const ctx = await this._getWriteContext(client);
+
+    let imported = 0;
+    const errors = [];
+    const inFlight = new Set();
+
+    const flush = async (rows, offset) => {
+      const task = this._writeChunk(client, rows, offset, ctx, writeOptions).then((outcome) => {
+        imported += outcome.results.filter(Boolean).length;
+        errors.push(...outcome.errors);
+      });
+      inFlight.add(task);
+      const done = () => inFlight.delete(task);
+      task.then(done, done);
+      if (inFlight.size >= concurrency) {
+        await Promise.race(inFlight);
+      }
+    };
+
+    // Peek the first chunk to tell JSON from CSV (same rule as before)
     const name = (file.name || "").toLowerCase();
-    let rows = [];
-    if (name.endsWith(".json") || raw.trim().startsWith("[")) {
+    const chunks = fileTextChunks(file);
+    let head = "";
+    let next = await chunks.next();
+    while (!next.done && !head.trim()) {
+      head += next.value;
+      next = await chunks.next();
+    }
+    async function* rest() {
+      if (head) yield head;
+      while (!next.done) {
+        yield next.value;
+        next = await chunks.next();
+      }
+    }
+
+    if (name.endsWith(".json") || head.trim().startsWith("[")) {
+      let raw = "";
+      for await (const text of rest()) raw += text;
       const parsed = JSON.parse(raw);
-      rows = Array.isArray(parsed) ? parsed : [parsed];
+      const rows = Array.isArray(parsed) ? parsed : [parsed];
+      for (let i = 0; i < rows.length; i += batchSize) {
+        await flush(rows.slice(i, i + batchSize), i);
+      }
     } else {
-      const lines = raw.split(/\r?\n/).filter((line) => line.trim());
-      if (lines.length === 0) return { imported: 0 };
-      const header = lines[0].split(",").map((h) => h.trim().replace(/^"|"$/g, ""));
-      for (let i = 1; i < lines.length; i++) {
-        const values = lines[i].split(",").map((v) => v.trim().replace(/^"|"$/g, ""));
+      let header = null;
+      let batch = [];
+      let offset = 0;
+      for await (const record of parseCSVStream(rest())) {
+        if (!header) {
+          header = record.map((h) => h.trim());
+          continue;
+        }
         const row = {};
-        header.forEach((k, j) => { row[k] = values[j] ?? ""; });
-        rows.push(row);
+        header.forEach((k, j) => { row[k] = (record[j] ?? "").trim(); });
+        batch.push(row);
+        if (batch.length >= batchSize) {
+          await flush(batch, offset);
+          offset += batch.length;
+          batch = [];
+        }
       }
-    }
-    const results = [];
-    const errors = [];
-    for (let i = 0; i < rows.length; i++) {
-      try {
-        const created = await this.create(rows[i]);
-        results.push(created);
-      } catch (e) {
-        errors.push({ row: i + 1, message: e?.message || String(e) });
+      if (batch.length > 0) {
+        await flush(batch, offset);
       }
     }
-    return { imported: results.length, errors: errors.length ? errors : undefined };
+
+    await Promise.all(inFlight);
+    errors.sort((a, b) => a.row - b.row);
+    if (imported > 0) this._noteWrite(null);
+    return { imported, errors: errors.length ? errors : undefined };
   }
 
   /**
    * Subscribe to realtime changes on this entity table. Calls callback with { type, data, id, timestamp }.
    * @param {Function} callback - (event: { type: 'INSERT'|'UPDATE'|'DELETE', data: T, id?: string, timestamp: string }) => void
+   * @param {Function} [onStatus] - (status: 'SUBSCRIBED'|'CHANNEL_ERROR'|'TIMED_OUT'|'CLOSED') => void
    * @returns {() => void} Unsubscribe function
    */
-  subscribe(callback) {
-    const ref = { channel: null };
+  subscribe(callback, onStatus = null) {
+    const ref = { client: null, channel: null, closed: false };
     const schema = getDbSchema();
     const table = this.tableName;
     (async () => {
       try {
         const client = await this.getClient();
+        if (ref.closed) return;
+        ref.client = client;
         ref.channel = client.channel(`entity:${schema}:${table}`);
         ref.channel.on(
           "postgres_changes",
@@ -1134,13 +2300,68 @@ console.log("[RLS debug] campaign INSERT policies (with_check):",
             }
           }
         );
-        await ref.channel.subscribe();
+        await ref.channel.subscribe((status) => {
+          if (onStatus) onStatus(status);
+        });
       } catch (err) {
         console.error("[UnifiedEntity] subscribe setup error:", err);
+        if (onStatus) onStatus("CHANNEL_ERROR");
       }
     })();
     return () => {
-      if (ref.channel) ref.channel.unsubscribe();
+      ref.closed = true;
+      if (!ref.channel) return;
+      // removeChannel also drops it from the client, so the topic can be reused
+      if (typeof ref.client?.removeChannel === "function") ref.client.removeChannel(ref.channel);
+      else ref.channel.unsubscribe();
+    };
+  }
+
+  /**
+   * Live query, meant to replace setInterval polling. callback(rows, { stale, error })
+   * runs with cached rows right away (stale-while-revalidate), again once they are
+   * revalidated, and whenever realtime events or SDK writes change the result.
+   * @param {Object} query - { filter?: Object, orderBy?: string, limit?: number, fields?: string[] }
+   *                         (no filter → list())
+   * @param {Function} callback - (rows: Array|null, meta: { stale: boolean, error?: Error }) => void
+   * @param {Object} options - pollMs: fallback polling interval while realtime is not connected
+   * @returns {() => void} Stop watching
+   */
+  watch(query = {}, callback, options = {}) {
+    const hasFilter = query.filter != null;
+    const normalized = {
+      conditions: hasFilter ? query.filter : null,
+      orderBy: query.orderBy !== undefined ? query.orderBy : hasFilter ? "created_at" : "-created_at",
+      limit: query.limit ?? null,
+      fields: query.fields ?? null,
+    };
+    if (cachesTable(this.tableName)) {
+      return entityQueryCache.watch(this, normalized, callback, options);
+    }
+
+    // Uncached (Deno / cache disabled): reload on every change, coalescing bursts
+    let active = true;
+    let timer = null;
+    const load = () => {
+      const rows = hasFilter
+        ? this._filterFromServer(normalized.conditions, normalized.orderBy, normalized.limit, null, normalized.fields)
+        : this._listFromServer(normalized.orderBy, normalized.limit, null, normalized.fields);
+      rows.then(
+        (data) => active && callback(data, { stale: false }),
+        (error) => active && callback(null, { stale: true, error })
+      );
+    };
+    const schedule = () => {
+      if (!timer) timer = setTimeout(() => { timer = null; load(); }, 250);
+    };
+    load();
+    const unsubscribe = this.subscribe(schedule);
+    const poll = options.pollMs > 0 ? setInterval(load, options.pollMs) : null;
+    return () => {
+      active = false;
+      if (timer) clearTimeout(timer);
+      if (poll) clearInterval(poll);
+      unsubscribe();
     };
   }
 }
@@ -1163,18 +2384,26 @@ function normalizeToRelativePath(input) {
  * Also exported as UserEntity for backward compatibility
  */
 export class UnifiedUserEntity extends UnifiedEntity {
-  constructor() {
+  /**
+   * @param {string|null} authToken - (Deno) token bound to this client; falls back to the request context
+   */
+  constructor(authToken = null) {
     super(USERS_TABLE_NAME, true); // Always use service role for user operations
+    this._authToken = authToken;
+  }
+
+  _getAuthToken() {
+    return this._authToken || getRequestAuthToken();
   }
 
   async me() {
     if (isDeno) {
       // For Deno functions, try to use the frontend user's auth token
-      const accessToken = getRequestAuthToken();
+      const accessToken = this._getAuthToken();
       
-      // Performance: Cache user data per token to avoid redundant API calls
-      const userCacheKey = `user_${accessToken?.substring(0, 20)}`;
-      const cachedUser = globalClientCache.get(userCacheKey);
+      // Performance: Cache user data per token to avoid redundant API calls.
+      // Keyed by the full token: a prefix would be the JWT header, shared by every user.
+      const cachedUser = accessToken ? authUserCache.get(accessToken) : undefined;
       if (cachedUser && cachedUser.cachedAt > Date.now() - 60000) { // Cache for 60 seconds
         return cachedUser.data;
       }
@@ -1328,7 +2557,7 @@ export class UnifiedUserEntity extends UnifiedEntity {
         }
 
         const mappedUser = this.mapResultFields(data);
-        globalClientCache.set(userCacheKey, { data: mappedUser, cachedAt: Date.now() });
+        authUserCache.set(accessToken, { data: mappedUser, cachedAt: Date.now() });
         return mappedUser;
       } catch (error) {
         if (!isProduction) {
@@ -1857,6 +3086,7 @@ export class UnifiedUserEntity extends UnifiedEntity {
     const { error } = await browserSupabase.auth.signOut();
 
     if (error) throw error;
+    clearEntityCache();
     console.log("Logging out, redirecting to:", returnUrl);
     window.location.href = returnUrl;
     // window.location.reload();
@@ -1870,7 +3100,7 @@ export class UnifiedUserEntity extends UnifiedEntity {
   async isAuthenticated() {
     if (!isBrowser) {
       // In Deno, check if we have a token
-      return getRequestAuthToken() !== null;
+      return !!this._getAuthToken();
     }
     
     const browserSupabase = await getSupabaseClient();
@@ -2072,6 +3302,7 @@ function loadFieldMapsFromEntitySchemas(entitySchemas, cacheKey = null) {
     }
     setFieldNameToOriginalByTable(tableName, map);
     setColumnTypesByTable(tableName, colTypes);
+    projectionsByTable.set(tableName, buildProjections(schema));
   }
   
   // CRITICAL: Mark as loaded if cache key provided
@@ -2084,10 +3315,10 @@ function loadFieldMapsFromEntitySchemas(entitySchemas, cacheKey = null) {
  * Determine if an entity should use service role based on environment and patterns.
  * In Deno, if we have a request auth token, prefer user token over service role.
  */
-function shouldUseServiceRole(entityName) {
+function shouldUseServiceRole(entityName, authToken = null) {
 
   if (isDeno) {
-    const token = getRequestAuthToken();
+    const token = authToken || getRequestAuthToken();
     if (token) {
       return false;
     }
@@ -2105,7 +3336,7 @@ function shouldUseServiceRole(entityName) {
 /**
  * Create entities proxy
  */
-function createEntitiesProxy(forceServiceRole = false) {
+function createEntitiesProxy(forceServiceRole = false, authToken = null) {
   const entityCache = new Map();
 
   return new Proxy({}, {
@@ -2122,7 +3353,7 @@ function createEntitiesProxy(forceServiceRole = false) {
       }
 
       const tableName = entityNameToTableName(entityName);
-      const useServiceRole = forceServiceRole || shouldUseServiceRole(entityName);
+      const useServiceRole = forceServiceRole || shouldUseServiceRole(entityName, authToken);
       const entity = new UnifiedEntity(tableName, useServiceRole);
 
       entityCache.set(entityName, entity);
@@ -2152,6 +3383,30 @@ function createEntitiesProxy(forceServiceRole = false) {
 }
 
 
+/**
+ * Call a Postgres function through PostgREST (supabase.rpc).
+ * In Deno, calls run as the request user (pooled per-token client, RLS applies) when a
+ * token is available, otherwise with the service role client.
+ * @param {string} fnName - SQL function name
+ * @param {Object} params - Named arguments (SQL parameter names)
+ * @param {boolean} useServiceRole - Use the service role client
+ * @param {string|null} authToken - (Deno) token bound to the calling client
+ */
+async function invokeRpc(fnName, params = {}, useServiceRole = false, authToken = null) {
+  let client;
+  if (isDeno) {
+    const token = useServiceRole ? null : (authToken || getRequestAuthToken());
+    client = await initializeSupabaseClient(!token, token);
+  } else {
+    client = (!useServiceRole && await getSupabaseClient()) || await initializeSupabaseClient(useServiceRole, null);
+  }
+  const { data, error } = await client.rpc(fnName, params);
+  if (error) {
+    throw error;
+  }
+  return data;
+}
+
 export function createClientFromRequest(request, options = {}) {
   if (!isDeno) {
     throw new Error("createClientFromRequest can only be used in Deno environment");
@@ -2168,16 +3423,13 @@ export function createClientFromRequest(request, options = {}) {
     userToken = authHeader.split(" ")[1];
   }
   
-  // Set the token for this request (used by UnifiedEntity and UnifiedUserEntity)
-  if (userToken) {
-    setRequestAuthToken(userToken);
-  }
-  
   // Merge options with default functionsBaseUrl from environment
   const finalOptions = {
     functionsBaseUrl: options.functionsBaseUrl || getEnvVar('VITE_FUNCTION_URL', FUNCTIONS_BASE_URL),
     functions: options.functions || {},
-    ...options
+    ...options,
+    // Bind the token to this client explicitly (no shared module state)
+    token: options.token || userToken,
   };
   
   // Create client with the token from request
@@ -2213,10 +3465,8 @@ export function createUnifiedClient(options = {}) {
     const schemas = loadEntitySchemasFromPath(entitiesPath);
     loadFieldMapsFromEntitySchemas(schemas, entitiesPath);
   }
-  // If explicit token provided (e.g., from createClientFromRequest), set it
-  if (isDeno && explicitToken) {
-    setRequestAuthToken(explicitToken);
-  }
+  // Explicit token (e.g., from createClientFromRequest) is bound to this client's
+  // auth, entities and rpc below; the request context is only a fallback.
 
   // Debug logging (uncomment for debugging)
   // if (isDeno) {
@@ -2374,6 +3624,51 @@ export function createUnifiedClient(options = {}) {
     };
   });
 
+  // Async AI jobs ({ async: true } → 202 { job_id }): long-poll /ai/job until
+  // the job finishes, so no single request stays open for the whole model call.
+  // Only the instance running the job can hold the poll open; any other one
+  // answers right away with the stored status. Polls that come back early
+  // (and 429s) back off exponentially instead of looping.
+  async function waitForAiJob(job, { timeoutMs = 10 * 60 * 1000 } = {}) {
+    const deadline = Date.now() + timeoutMs;
+    const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+    let current = job;
+    let backoff = 0;
+    while (current.status === "queued" || current.status === "running") {
+      if (Date.now() > deadline) {
+        throw new Error(`AI job ${job.job_id} timed out`);
+      }
+      const started = Date.now();
+      const response = await fetch(`${FUNCTIONS_BASE_URL}/ai/job`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ job_id: job.job_id, wait_ms: 20000 }),
+      });
+      if (response.status === 429) {
+        await response.body?.cancel();
+        backoff = Math.min(Math.max(backoff * 2, AI_JOB_POLL_MIN_MS), AI_JOB_POLL_MAX_MS);
+        const retryAfter = parseInt(response.headers.get('Retry-After') || '', 10) * 1000;
+        await sleep(Math.max(backoff, retryAfter || 0));
+        continue;
+      }
+      if (!response.ok) {
+        throw new Error(`AI job ${job.job_id} failed: ${response.statusText}`);
+      }
+      current = await response.json();
+      if (current.status !== "queued" && current.status !== "running") break;
+      if (Date.now() - started >= AI_JOB_POLL_MIN_MS) {
+        backoff = 0; // the server held the poll: ask again right away
+        continue;
+      }
+      backoff = Math.min(Math.max(backoff * 1.5, AI_JOB_POLL_MIN_MS), AI_JOB_POLL_MAX_MS);
+      await sleep(backoff * (0.75 + Math.random() * 0.5));
+    }
+    if (current.status === "error") {
+      throw new Error(`LLM invocation failed: ${current.error}`);
+    }
+    return current.result;
+  }
+
   const integrationsModule = {
     Core: {
       InvokeLLM: async ({
@@ -2381,6 +3676,7 @@ export function createUnifiedClient(options = {}) {
         add_context_from_internet = false,
         response_json_schema = null,
         file_urls = null,
+        async: runAsync = false, // large files: run as a server job and poll
       }) => {
         console.log("InvokeLLM called with:", {
           prompt,
@@ -2399,7 +3695,8 @@ export function createUnifiedClient(options = {}) {
               prompt,
               add_context_from_internet,
               response_json_schema,
-              file_urls
+              file_urls,
+              async: runAsync || undefined,
             })
           });
 
@@ -2407,7 +3704,10 @@ export function createUnifiedClient(options = {}) {
             throw new Error(`LLM invocation failed: ${response.statusText}`);
           }
 
-          const data = await response.json();
+          let data = await response.json();
+          if (response.status === 202) {
+            data = await waitForAiJob(data);
+          }
           if (response_json_schema) {
             return data.data.message;
           }
@@ -2641,13 +3941,15 @@ finalFileUrl = `${supabaseUrl.replace(/\/$/, "")}/storage/v1/object/public/${fil
     },
   }
   const client = {
-    entities: createEntitiesProxy(),
-    auth: new UnifiedUserEntity(),
+    entities: createEntitiesProxy(false, explicitToken),
+    auth: new UnifiedUserEntity(explicitToken),
     asServiceRole: {
       entities: createEntitiesProxy(true), // Force service role
       functions: functions,
       integrations: integrationsModule, // Add integrations to asServiceRole (matches base44)
+      rpc: (fnName, params) => invokeRpc(fnName, params, true),
     },
+    rpc: (fnName, params) => invokeRpc(fnName, params, false, explicitToken),
     functions,
     integrations: integrationsModule,
   };